@@ -0,0 +1,135 @@
+"""
+Задержка записи во время резервного копирования большой базы. Пока в
+отдельном процессе идут короткие транзакции, как у бота (новый заказ плюс
+смена статуса, коммит на каждую), базу копируют:
+
+  * VACUUM INTO — одна читающая транзакция, копия сразу без пустых страниц;
+  * backup API одним шагом;
+  * backup API шагами с паузой — как задача database_backup
+    (bot.services.backup.snapshot_database).
+
+Для каждого способа — время копии, сколько транзакций успел сделать писатель,
+p50/p99/max их задержки и до какого размера вырос WAL. Копирование файла
+через cp не меряется: под записью оно даёт рваную копию.
+
+    python -m bench.backup --size-gb 3
+    python -m bench.backup --size-gb 1 --pages 1024 --pause 0.005   # копия быстрее, задержки выше
+
+База засевается заказами (bench.seed) и добивается до --size-gb таблицей со
+случайными данными; она остаётся в bench_data/ и переиспользуется.
+"""
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.replay import percentile  # noqa: E402
+from bench.seed import seed  # noqa: E402
+
+
+def pad(db_path: str, size_gb: float) -> None:
+    """Добивает базу до size_gb таблицей bench_padding с несжимаемыми строками по 4 КБ."""
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_padding (id INTEGER PRIMARY KEY, data BLOB)")
+    missing = int((size_gb * 2**30 - os.path.getsize(db_path)) // 4096)
+    while missing > 0:
+        step = min(missing, 50_000)
+        conn.execute(
+            "WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < ?) "
+            "INSERT INTO bench_padding (data) SELECT randomblob(4000) FROM n", (step,),
+        )
+        conn.commit()
+        missing -= step
+        print(f"  {os.path.getsize(db_path) / 2**30:.2f} ГБ", file=sys.stderr)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+
+
+def writer(db_path: str, stop, results) -> None:
+    """Транзакции по одной, как у хендлеров; задержка — от BEGIN до конца COMMIT."""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute("PRAGMA busy_timeout = 10000")
+    conn.execute("CREATE TABLE IF NOT EXISTS bench_writes (id INTEGER PRIMARY KEY, payload TEXT, at REAL)")
+    max_order = conn.execute("SELECT max(rowid) FROM orders").fetchone()[0] or 1
+    latencies, wal_max, i = [], 0, 0
+    wal_path = f"{db_path}-wal"
+    while not stop.is_set():
+        i += 1
+        started = time.perf_counter()
+        conn.execute("BEGIN IMMEDIATE")
+        conn.execute("INSERT INTO bench_writes (payload, at) VALUES (?, ?)", ("x" * 400, time.time()))
+        conn.execute("UPDATE orders SET status = status WHERE rowid = ?", (i * 7919 % max_order + 1,))
+        conn.execute("COMMIT")
+        latencies.append(time.perf_counter() - started)
+        if i % 100 == 0 and os.path.exists(wal_path):
+            wal_max = max(wal_max, os.path.getsize(wal_path))
+        time.sleep(0.002)
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.close()
+    results.send((latencies, wal_max))
+
+
+def run_phase(db_path: str, name: str, backup) -> None:
+    stop = multiprocessing.Event()
+    receiver, sender = multiprocessing.Pipe(duplex=False)
+    proc = multiprocessing.Process(target=writer, args=(db_path, stop, sender))
+    proc.start()
+    time.sleep(1.0)  # писатель разогнался
+    started = time.perf_counter()
+    backup()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    latencies, wal_max = receiver.recv()
+    proc.join()
+    ms = [v * 1000 for v in latencies]
+    print(f"{name:<26} {elapsed:>8.1f} {len(ms):>8} {percentile(ms, 0.50):>7.1f} {percentile(ms, 0.99):>7.1f} "
+          f"{max(ms):>8.1f} {wal_max / 2**20:>7.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench_data/backup.sqlite")
+    parser.add_argument("--size-gb", type=float, default=3.0)
+    parser.add_argument("--orders", type=int, default=500_000)
+    parser.add_argument("--pages", type=int, default=256, help="страниц за шаг backup")
+    parser.add_argument("--pause", type=float, default=0.01, help="пауза между шагами, с")
+    parser.add_argument("--baseline", type=float, default=5.0, help="сколько секунд мерить запись без копии")
+    args = parser.parse_args()
+
+    db_path = os.path.abspath(args.db)
+    seed(db_path, users=10_000, orders=args.orders)
+    pad(db_path, args.size_gb)
+
+    from bot.services.backup import snapshot_database
+
+    target = Path(db_path).with_name("backup_copy.sqlite")
+
+    def vacuum_into():
+        conn = sqlite3.connect(db_path)
+        conn.execute("VACUUM INTO ?", (str(target),))
+        conn.close()
+
+    print(f"база {os.path.getsize(db_path) / 2**30:.2f} ГБ; шаг {args.pages} страниц, пауза {args.pause * 1000:.0f} мс\n")
+    print(f"{'способ':<26} {'копия, с':>8} {'записей':>8} {'p50мс':>7} {'p99мс':>7} {'maxмс':>8} {'WAL МБ':>7}")
+    phases = [
+        ("без копии", lambda: time.sleep(args.baseline)),
+        ("VACUUM INTO", vacuum_into),
+        ("backup одним шагом", lambda: snapshot_database(db_path, target, pages=-1, pause=0)),
+        ("backup шагами", lambda: snapshot_database(db_path, target, pages=args.pages, pause=args.pause)),
+    ]
+    for name, backup in phases:
+        target.unlink(missing_ok=True)
+        run_phase(db_path, name, backup)
+    target.unlink(missing_ok=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Холостой прогон рассылки: BroadcastRunner против фейковой сессии Bot API
+на временной базе с большим числом пользователей. Часть пользователей
+«заблокировала» бота (Forbidden), сессия изображает флуд-контроль Telegram
+(RetryAfter при превышении лимита в секунду).
+
+    python -m bench.broadcast --users 1000000                    # пропускная способность движка
+    python -m bench.broadcast --users 100000 --rate 25 --flood-limit 30
+    python -m bench.broadcast --users 200000 --crash-after 50000 --checkpoint-interval 0.5
+
+После --crash-after прогон обрывается без финального чекпоинта, как при
+падении процесса, и новый BroadcastRunner продолжает рассылку. В конце
+считаются повторные доставки (их не больше, чем доставлено после последнего
+записанного чекпоинта) и пропущенные получатели (должно быть 0).
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TELEGRAM_BASE = 10_000_000
+
+
+def seed_users(users: int):
+    from db.database import engine, init_db
+
+    init_db()
+    now = datetime.utcnow().isoformat(sep=" ")
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=OFF")
+        cur.executemany(
+            "INSERT INTO users (id, telegram_id, username, full_name, accepted_policy, first_order_paid, "
+            "is_active, created_at) VALUES (?, ?, ?, 'Тест Пользователь', 1, 0, ?, ?)",
+            # каждый 97-й уже отключён прошлой рассылкой и не должен получить сообщение
+            ((uid, TELEGRAM_BASE + uid, f"user{uid}", uid % 97 != 0, now) for uid in range(1, users + 1)),
+        )
+        raw.commit()
+    finally:
+        raw.close()
+
+
+def make_session(users: int, blocked_every: int, flood_limit: int, latency: float):
+    from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+    from aiogram.methods import SendMessage
+
+    from bench.fake_bot import FakeSession
+
+    class BroadcastSession(FakeSession):
+        """Считает доставки по каждому получателю и изображает ответы Telegram на рассылку."""
+
+        def __init__(self):
+            super().__init__(latency=latency)
+            self.deliveries = bytearray(users + 1)
+            self.delivered = 0
+            self.retry_after = 0
+            self._second = 0
+            self._in_second = 0
+
+        async def make_request(self, bot, method, timeout=None):
+            if not isinstance(method, SendMessage):
+                return await super().make_request(bot, method, timeout)
+            if latency:
+                await asyncio.sleep(latency)
+            uid = int(method.chat_id) - TELEGRAM_BASE
+
+            if flood_limit:
+                second = int(time.monotonic())
+                if second != self._second:
+                    self._second, self._in_second = second, 0
+                self._in_second += 1
+                if self._in_second > flood_limit:
+                    self.retry_after += 1
+                    raise TelegramRetryAfter(method=method, message="Too Many Requests: retry after 1", retry_after=1)
+            if blocked_every and uid % blocked_every == 0:
+                raise TelegramForbiddenError(method=method, message="Forbidden: bot was blocked by the user")
+
+            self.deliveries[uid] = min(self.deliveries[uid] + 1, 255)
+            self.delivered += 1
+            return self._message(bot, int(method.chat_id), method.text)
+
+    return BroadcastSession()
+
+
+async def run(args) -> int:
+    from sqlalchemy import text
+
+    from bot.services.broadcast import BroadcastRunner, create_broadcast
+    from db.database import SessionLocal
+    from main import create_bot
+
+    session = make_session(args.users, args.blocked_every, args.flood_limit, args.latency)
+    bot = create_bot(session=session)
+    broadcast_id = create_broadcast("Скидка 20% на печать фото до конца недели!")
+
+    def runner():
+        return BroadcastRunner(bot, broadcast_id, rate=args.rate, workers=args.workers,
+                               batch_size=args.batch, checkpoint_interval=args.checkpoint_interval)
+
+    started = time.perf_counter()
+    replay_bound = 0
+    if args.crash_after:
+        first = runner()
+        task = asyncio.create_task(first.run())
+        while session.delivered < args.crash_after and not task.done():
+            await asyncio.sleep(0.01)
+        task.cancel()  # «падение»: без финального чекпоинта
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        db = SessionLocal()
+        checkpointed = db.execute(text("SELECT sent FROM broadcasts WHERE id = :id"), {"id": broadcast_id}).scalar()
+        db.close()
+        replay_bound = session.delivered - checkpointed
+        print(f"обрыв после {session.delivered:,} доставок, в последнем чекпоинте {checkpointed:,} "
+              f"(чекпоинтов записано {first.checkpoints})")
+
+    stats = await runner().run()
+    elapsed = time.perf_counter() - started
+
+    db = SessionLocal()
+    expected = db.execute(text("SELECT count(*) FROM users WHERE id % 97 != 0")).scalar()
+    still_active = db.execute(text("SELECT count(*) FROM users WHERE is_active")).scalar()
+    row = db.execute(text("SELECT status, sent, failed, deactivated FROM broadcasts WHERE id = :id"),
+                     {"id": broadcast_id}).one()
+    db.close()
+
+    deliveries = session.deliveries
+    duplicates = sum(c - 1 for c in deliveries if c > 1)
+    should_get = [
+        uid for uid in range(1, args.users + 1)
+        if uid % 97 != 0 and not (args.blocked_every and uid % args.blocked_every == 0)
+    ]
+    missing = sum(1 for uid in should_get if deliveries[uid] == 0)
+    leaked = sum(1 for uid in range(97, args.users + 1, 97) if deliveries[uid])
+
+    print(f"получателей {expected:,}: доставлено {session.delivered:,} за {elapsed:.1f} с "
+          f"({session.delivered / elapsed:,.0f} сообщ/с), RetryAfter {session.retry_after}, "
+          f"чекпоинтов {stats['checkpoints']}")
+    print(f"рассылка #{broadcast_id}: {row.status}, sent={row.sent:,} failed={row.failed} "
+          f"deactivated={row.deactivated:,}; активных пользователей осталось {still_active:,}")
+    print(f"повторных доставок: {duplicates} (допустимо до {replay_bound:,}), "
+          f"пропущено: {missing}, отправлено отключённым: {leaked}")
+    await bot.session.close()
+    return 1 if missing or leaked or duplicates > replay_bound else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000_000)
+    parser.add_argument("--rate", type=float, default=1_000_000, help="лимит ведра токенов (сообщ/с)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=1000)
+    parser.add_argument("--checkpoint-interval", type=float, default=2.0)
+    parser.add_argument("--blocked-every", type=int, default=50, help="каждый N-й заблокировал бота")
+    parser.add_argument("--flood-limit", type=int, default=0, help="RetryAfter, если больше N сообщений в секунду")
+    parser.add_argument("--latency", type=float, default=0.0, help="задержка ответа Bot API, с")
+    parser.add_argument("--crash-after", type=int, default=0, help="оборвать прогон после N доставок")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix="broadcast_bench_")
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.join(tmp, 'broadcast.sqlite')}"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:BROADCAST-BENCHMARK"
+    sys.path.insert(0, ROOT)
+
+    started = time.perf_counter()
+    seed_users(args.users)
+    print(f"засеяно {args.users:,} пользователей за {time.perf_counter() - started:.1f} с ({tmp})")
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Кластерный режим на нескольких локальных процессах с одной базой SQLite.
+
+    python -m bench.cluster leases --processes 4 --ttl 3 --kills 2
+    python -m bench.cluster shards --processes 1 2 4 --chats 4000
+
+leases — процессы соревнуются за аренду тестовой задачи, которая пишет
+«тики» в базу; лидера убивают SIGKILL. Проверяется, что тики разных
+владельцев не перемежаются (задача ни в какой момент не шла в двух
+процессах) и что аренду подхватили не позже чем через TTL.
+
+shards — процесс-роутер раскладывает апдейты /start по шардам (chat_id % N),
+шарды — настоящий main.run_shard с фейковой сессией Bot API. Меряется
+пропускная способность в зависимости от числа процессов и проверяется,
+что каждая фоновая задача досталась ровно одному шарду.
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_TOKEN = "123456:CLUSTER-BENCHMARK"
+
+
+def _env(db_path: str):
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    os.environ["FSM_SNAPSHOT_FILE"] = os.path.join(os.path.dirname(db_path), "fsm_snapshot.json")
+    os.environ["TELEGRAM_BOT_TOKEN"] = BENCH_TOKEN
+    sys.path.insert(0, ROOT)
+
+
+# ─── leases ──────────────────────────────────────────────────────────────────
+
+def _lease_process(db_path: str, ttl: float):
+    _env(db_path)
+    from bot.services.lease import lease_owner, run_leased
+
+    owner = lease_owner()
+
+    async def tick_job():
+        conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+        while True:
+            conn.execute("INSERT INTO bench_ticks (owner, at) VALUES (?, ?)", (owner, time.time()))
+            await asyncio.sleep(0.05)
+
+    asyncio.run(run_leased("bench_tick", tick_job, ttl=ttl))
+
+
+def bench_leases(args) -> bool:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="cluster_bench_"), "cluster.sqlite")
+    _env(db_path)
+    from db.database import init_db
+
+    init_db()
+    conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+    conn.execute("CREATE TABLE bench_ticks (id INTEGER PRIMARY KEY, owner TEXT, at REAL)")
+
+    ctx = multiprocessing.get_context("spawn")
+    processes = {}
+
+    def spawn():
+        p = ctx.Process(target=_lease_process, args=(db_path, args.ttl), daemon=True)
+        p.start()
+        processes[p.pid] = p
+
+    for _ in range(args.processes):
+        spawn()
+
+    kills = []
+    time.sleep(args.ttl * 2)  # время на импорт и первый захват
+    for _ in range(args.kills):
+        row = conn.execute("SELECT owner FROM job_leases WHERE name = 'bench_tick'").fetchone()
+        pid = int(row[0].rsplit(":", 1)[1])
+        os.kill(pid, signal.SIGKILL)
+        kills.append(time.time())
+        print(f"убит лидер pid {pid}")
+        processes.pop(pid).join()
+        spawn()
+        time.sleep(args.ttl * 2)
+
+    for p in processes.values():
+        p.kill()
+    ticks = conn.execute("SELECT owner, at FROM bench_ticks ORDER BY at").fetchall()
+
+    # владелец может смениться только после убийства, и прежний не должен вернуться
+    runs, overlaps = [], 0
+    for owner, at in ticks:
+        if runs and runs[-1][0] == owner:
+            runs[-1][2] = at
+        else:
+            if any(r[0] == owner for r in runs):
+                overlaps += 1
+            runs.append([owner, at, at])
+    gaps = [runs[i + 1][1] - runs[i][2] for i in range(len(runs) - 1)]
+
+    print(f"процессов {args.processes}, TTL {args.ttl} с, тиков {len(ticks)}, смен лидера {len(runs) - 1}")
+    for owner, first, last in runs:
+        print(f"  {owner:<28} {last - first:6.1f} с")
+    if gaps:
+        print(f"перехват аренды: {', '.join(f'{g:.1f}' for g in gaps)} с (не больше TTL + TTL/3)")
+    ok = overlaps == 0 and len(runs) == args.kills + 1 and all(g <= args.ttl * 4 / 3 + 0.5 for g in gaps)
+    print("OK" if ok else f"ОШИБКА: перемежений {overlaps}")
+    return ok
+
+
+# ─── shards ──────────────────────────────────────────────────────────────────
+
+def _shard_process(index: int, total: int, updates, results, db_path: str):
+    _env(db_path)
+    import main
+    from bench.fake_bot import FakeSession
+
+    stats = asyncio.run(main.run_shard(index, total, updates, session=FakeSession()))
+    results.put(stats)
+
+
+def _start_update(update_id: int, chat_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Cluster"},
+            "text": "/start",
+            "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        },
+    }
+
+
+def bench_shards(args) -> bool:
+    db_path = os.path.join(tempfile.mkdtemp(prefix="cluster_bench_"), "cluster.sqlite")
+    _env(db_path)
+    from db.database import init_db
+    from bot.cluster import ShardRouter
+
+    init_db()
+    ctx = multiprocessing.get_context("spawn")
+    ok = True
+    print(f"{'процессов':>9} {'апдейтов':>9} {'апд/с':>8}  по шардам")
+    for total in args.processes:
+        queues = [ctx.Queue() for _ in range(total)]
+        results = ctx.Queue()
+        shards = [ctx.Process(target=_shard_process, args=(i, total, q, results, db_path)) for i, q in enumerate(queues)]
+        for p in shards:
+            p.start()
+        # шарды импортируют бота и готовят базу; ждём, пока каждый возьмёт первый апдейт
+        router = ShardRouter(queues)
+        warmup = [_start_update(i, 9_000_000 + i) for i in range(total * 4)]
+        for u in warmup:
+            router.submit(u)
+        while any(q.qsize() for q in queues):
+            time.sleep(0.1)
+
+        conn = sqlite3.connect(db_path)
+        leases = conn.execute("SELECT name, owner FROM job_leases WHERE owner IS NOT NULL ORDER BY name").fetchall()
+        conn.close()
+
+        updates = [_start_update(100 + i, 1_000_000 + i % args.chats) for i in range(args.chats * 2)]
+        started = time.perf_counter()
+        for u in updates:
+            while not router.submit(u):
+                time.sleep(0.001)
+        asyncio.run(router.stop())
+        stats = sorted((results.get() for _ in shards), key=lambda s: s["shard"])
+        elapsed = time.perf_counter() - started
+        for p in shards:
+            p.join()
+
+        processed = sum(s["processed"] for s in stats) - len(warmup)
+        failed = sum(s["failed"] for s in stats)
+        print(f"{total:>9} {processed:>9,} {processed / elapsed:>8,.0f}  "
+              f"{[s['processed'] for s in stats]}{f'  ошибок {failed}' if failed else ''}")
+        print(f"{'':>9} фоновые задачи: {', '.join(f'{name}→{owner}' for name, owner in leases)}")
+        ok &= failed == 0 and processed == len(updates)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("leases")
+    p.add_argument("--processes", type=int, default=4)
+    p.add_argument("--ttl", type=float, default=3.0)
+    p.add_argument("--kills", type=int, default=2)
+
+    p = sub.add_parser("shards")
+    p.add_argument("--processes", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--chats", type=int, default=4000)
+
+    args = parser.parse_args()
+    ok = bench_leases(args) if args.command == "leases" else bench_shards(args)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
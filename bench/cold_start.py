@@ -0,0 +1,124 @@
+"""
+Время до первого апдейта: от запуска процесса до ответа на первый /start.
+Каждый прогон — новый интерпретатор, который проходит путь main.start():
+импорты, подготовка базы и справочников, getMe через фейковую сессию
+с задержкой сети, сборка Dispatcher и обработка одного апдейта.
+
+    python -m bench.cold_start --runs 5 --api-latency-ms 150
+
+Сценарии:
+    first      — пустая база: create_all, сиды, запись app_meta
+    full-init  — перезапуск, но app_meta очищена: create_all и проверки сидов, как раньше
+    restart    — обычный перезапуск: версия схемы совпала, один SELECT
+С --sequential база готовится до getMe, а не параллельно с ним.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCENARIOS = ("first", "full-init", "restart")
+
+
+async def _child(api_latency: float, sequential: bool) -> dict:
+    t0 = float(os.environ["COLD_START_T0"])
+    stamps = {"interpreter": time.time() - t0}
+
+    import main
+    from aiogram.types import Update
+    from bench.fake_bot import FakeSession
+    stamps["imports"] = time.time() - t0
+
+    bot = main.create_bot(session=FakeSession(latency=api_latency))
+    if sequential:
+        await asyncio.to_thread(main.prepare_database)
+        await bot.me()
+    else:
+        await asyncio.gather(asyncio.to_thread(main.prepare_database), bot.me())
+    stamps["ready"] = time.time() - t0
+
+    dp = main.create_dispatcher()
+    update = Update.model_validate(
+        {
+            "update_id": 1,
+            "message": {
+                "message_id": 1,
+                "date": int(time.time()),
+                "chat": {"id": 42, "type": "private"},
+                "from": {"id": 42, "is_bot": False, "first_name": "Cold"},
+                "text": "/start",
+            },
+        },
+        context={"bot": bot},
+    )
+    await dp.feed_update(bot, update)
+    stamps["first_update"] = time.time() - t0
+    await bot.session.close()
+    return stamps
+
+
+def _run_once(db_path: str, workdir: str, args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "DATABASE_URL": f"sqlite:///{db_path}",
+        "TELEGRAM_BOT_TOKEN": "123456:COLD-START",
+        "PYTHONPATH": ROOT,
+        "COLD_START_T0": repr(time.time()),
+    })
+    cmd = [sys.executable, "-m", "bench.cold_start", "--child", "--api-latency-ms", str(args.api_latency_ms)]
+    if args.sequential:
+        cmd.append("--sequential")
+    out = subprocess.run(cmd, env=env, cwd=workdir, check=True, capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _clear_meta(db_path: str):
+    conn = sqlite3.connect(db_path)
+    conn.execute("DELETE FROM app_meta")
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--api-latency-ms", type=float, default=150.0, help="задержка ответа getMe")
+    parser.add_argument("--sequential", action="store_true", help="готовить базу до getMe, а не параллельно")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        stamps = asyncio.run(_child(args.api_latency_ms / 1000, args.sequential))
+        print(json.dumps(stamps))
+        return
+
+    results: dict[str, list[dict]] = {s: [] for s in SCENARIOS}
+    with tempfile.TemporaryDirectory(prefix="photoexpress-cold-") as workdir:
+        for i in range(args.runs):
+            db_path = os.path.join(workdir, f"run{i}.sqlite")
+            results["first"].append(_run_once(db_path, workdir, args))
+            _clear_meta(db_path)
+            results["full-init"].append(_run_once(db_path, workdir, args))
+            results["restart"].append(_run_once(db_path, workdir, args))
+
+    mode = "последовательно" if args.sequential else "параллельно с getMe"
+    print(f"база готовится {mode}, задержка getMe {args.api_latency_ms:.0f} мс, прогонов: {args.runs}\n")
+    print(f"{'сценарий':<10} {'интерпр.':>9} {'импорты':>9} {'готов':>9} {'1-й апдейт':>11}   (медиана, мс)")
+    for scenario, runs in results.items():
+        med = {
+            k: sorted(r[k] for r in runs)[len(runs) // 2] * 1000
+            for k in ("interpreter", "imports", "ready", "first_update")
+        }
+        print(f"{scenario:<10} {med['interpreter']:>9.0f} {med['imports']:>9.0f} "
+              f"{med['ready']:>9.0f} {med['first_update']:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
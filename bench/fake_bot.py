@@ -0,0 +1,90 @@
+# bench/fake_bot.py
+
+import asyncio
+import itertools
+import time
+from collections import defaultdict
+from typing import Any, AsyncGenerator
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import (
+    AnswerCallbackQuery,
+    EditMessageText,
+    GetFile,
+    GetMe,
+    SendMessage,
+    TelegramMethod,
+)
+from aiogram.types import File, InlineKeyboardMarkup, Message, User
+
+FAKE_TOKEN = "123456:REPLAY-BENCHMARK"
+
+# «JPEG» для скачивания документов: заголовок + паддинг
+FAKE_PHOTO = b"\xff\xd8\xff\xe0" + b"\x00" * (256 * 1024)
+
+
+class FakeSession(BaseSession):
+    """
+    Сессия Bot API без сети. Отвечает правдоподобными объектами на методы,
+    которые вызывают хендлеры, и запоминает последнюю inline-клавиатуру
+    в каждом чате, чтобы сценарии могли «нажимать» кнопки.
+    """
+
+    def __init__(self, latency: float = 0.0, photo: bytes = FAKE_PHOTO):
+        super().__init__()
+        self.latency = latency
+        self.photo = photo
+        self.calls: dict[str, int] = defaultdict(int)
+        self.last_markup: dict[int, InlineKeyboardMarkup] = {}
+        self._message_ids = itertools.count(1_000_000)
+
+    def _message(self, bot: Bot, chat_id: int, text: str | None) -> Message:
+        return Message.model_validate(
+            {
+                "message_id": next(self._message_ids),
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"},
+                "text": text,
+            },
+            context={"bot": bot},
+        )
+
+    async def make_request(self, bot: Bot, method: TelegramMethod, timeout: int | None = None) -> Any:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        self.calls[type(method).__name__] += 1
+
+        if isinstance(method, (SendMessage, EditMessageText)):
+            chat_id = int(method.chat_id or 0)
+            if isinstance(method.reply_markup, InlineKeyboardMarkup):
+                self.last_markup[chat_id] = method.reply_markup
+            return self._message(bot, chat_id, method.text)
+        if isinstance(method, AnswerCallbackQuery):
+            return True
+        if isinstance(method, GetFile):
+            return File(file_id=method.file_id, file_unique_id=method.file_id, file_path=f"documents/{method.file_id}.jpg")
+        if isinstance(method, GetMe):
+            return User(id=123456, is_bot=True, first_name="PhotoExpress", username="photoexpress_bench_bot")
+        return True
+
+    async def stream_content(
+        self,
+        url: str,
+        headers: dict[str, Any] | None = None,
+        timeout: int = 30,
+        chunk_size: int = 65536,
+        raise_for_status: bool = True,
+    ) -> AsyncGenerator[bytes, None]:
+        for i in range(0, len(self.photo), chunk_size):
+            yield self.photo[i:i + chunk_size]
+
+    async def close(self) -> None:
+        pass
+
+    def buttons(self, chat_id: int) -> list[str]:
+        """callback_data всех кнопок последней inline-клавиатуры в чате."""
+        markup = self.last_markup.get(chat_id)
+        if not markup:
+            return []
+        return [b.callback_data for row in markup.inline_keyboard for b in row if b.callback_data]
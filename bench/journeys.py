@@ -0,0 +1,146 @@
+# bench/journeys.py
+
+import itertools
+import time
+
+from aiogram.types import Update
+
+from bench.fake_bot import FakeSession
+
+_update_ids = itertools.count(1)
+_message_ids = itertools.count(1)
+
+
+class VirtualUser:
+    """
+    Пользователь, который шлёт апдейты в диспетчер. Каждое действие —
+    именованный шаг, по которому агрегируются задержки и число запросов.
+    """
+
+    def __init__(self, runner, telegram_id: int, phone: str | None = None, first_order_done: bool = False):
+        self.runner = runner
+        self.telegram_id = telegram_id
+        self.phone = phone or f"+7999{telegram_id % 10_000_000:07d}"
+        self.first_order_done = first_order_done
+        self._user = {"id": telegram_id, "is_bot": False, "first_name": "Replay", "username": f"u{telegram_id}"}
+        self._chat = {"id": telegram_id, "type": "private"}
+        self._last_message_id = 0
+
+    @property
+    def session(self) -> FakeSession:
+        return self.runner.bot.session
+
+    def _message(self, **payload) -> dict:
+        self._last_message_id = next(_message_ids)
+        return {
+            "message_id": self._last_message_id,
+            "date": int(time.time()),
+            "chat": self._chat,
+            "from": self._user,
+            **payload,
+        }
+
+    async def _feed(self, step: str, payload: dict):
+        update = Update.model_validate(
+            {"update_id": next(_update_ids), **payload},
+            context={"bot": self.runner.bot},
+        )
+        await self.runner.feed(step, update)
+
+    async def text(self, step: str, text: str):
+        await self._feed(step, {"message": self._message(text=text)})
+
+    async def contact(self, step: str):
+        await self._feed(step, {"message": self._message(contact={
+            "phone_number": self.phone, "first_name": "Replay", "user_id": self.telegram_id,
+        })})
+
+    async def document(self, step: str, filename: str):
+        file_id = f"doc{next(_message_ids)}"
+        await self._feed(step, {"message": self._message(document={
+            "file_id": file_id,
+            "file_unique_id": file_id,
+            "file_name": filename,
+            "mime_type": "image/jpeg",
+            "file_size": len(self.session.photo),
+        })})
+
+    async def press(self, step: str, data: str):
+        await self._feed(step, {"callback_query": {
+            "id": str(next(_update_ids)),
+            "from": self._user,
+            "chat_instance": str(self.telegram_id),
+            "data": data,
+            "message": {
+                "message_id": self._last_message_id or next(_message_ids),
+                "date": int(time.time()),
+                "chat": self._chat,
+                "text": "…",
+            },
+        }})
+
+    def button(self, prefix: str) -> str | None:
+        return next((b for b in self.session.buttons(self.telegram_id) if b.startswith(prefix)), None)
+
+
+# ─── Сценарии ────────────────────────────────────────────────────────────────
+
+async def onboarding(u: VirtualUser):
+    await u.text("onboarding.start", "/start")
+    await u.text("onboarding.agree", "✅ Согласен")
+    await u.contact("onboarding.phone")
+    await u.text("onboarding.full_name", "Иван Петров")
+
+
+async def upload_order(u: VirtualUser, photos: int = 3, promo: str | None = "TEST10"):
+    formats = ["10x15", "15x21", "21x30 (A4)"]
+    await u.text("upload.start", "📂 Загрузить фото")
+    for i in range(photos):
+        await u.document("upload.document", f"IMG_{i:04d}.jpg")
+        await u.text("upload.format", formats[i % len(formats)])
+        await u.text("upload.copies", str(1 + i % 3))
+        if i < photos - 1:
+            await u.text("upload.more", "➕ Добавить ещё фото")
+    await u.text("upload.finish", "✅ Завершить и оформить заказ")
+    await u.text("upload.comment", "Без комментариев")
+
+    # первый заказ сразу получает скидку 30%, для остальных спрашивается промокод
+    if u.first_order_done:
+        if promo:
+            await u.text("promo.enter", promo)
+        await u.text("promo.skip", "Пропустить")
+    u.first_order_done = True
+
+    await u.text("pickup.list", "📋 Показать список")
+    await u.press("pickup.select", u.button("select_pp:") or "select_pp:1")
+
+
+async def browse_and_pay(u: VirtualUser):
+    await u.text("orders.menu", "📦 Мои заказы")
+    await u.press("orders.status", "status:new")
+    if u.button("page:"):
+        await u.press("orders.next", "page:next")
+        await u.press("orders.prev", "page:prev")
+    pay = u.button("pay:")
+    if pay:
+        await u.press("orders.pay", pay)
+
+
+async def new_customer(u: VirtualUser):
+    """Новый клиент: регистрация, первый заказ, второй заказ с промокодом, оплата."""
+    await onboarding(u)
+    await upload_order(u, photos=3)
+    await upload_order(u, photos=2, promo="TEST10")
+    await browse_and_pay(u)
+
+
+async def returning_customer(u: VirtualUser):
+    """Клиент из засеянной базы: просматривает заказы и оплачивает."""
+    await u.text("returning.start", "/start")
+    await browse_and_pay(u)
+
+
+JOURNEYS = {
+    "new_customer": new_customer,
+    "returning_customer": returning_customer,
+}
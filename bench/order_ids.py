@@ -0,0 +1,111 @@
+"""
+Ключи заказов: uuid4 в TEXT PRIMARY KEY (как было) против Snowflake-ключа
+в INTEGER PRIMARY KEY (rowid). Меряются скорость вставки, размер таблицы
+с индексами и поиск заказа по ключу.
+
+    python -m bench.order_ids --orders 2000000
+
+У uuid-варианта кроме самой таблицы есть автоиндекс первичного ключа и
+order_search_keys — таблица, через которую FTS-индекс связывался с заказом.
+Snowflake-ключ и есть rowid, поэтому ни того, ни другого не нужно.
+Базы создаются заново в bench_data/ и удаляются после замера.
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bot.services.order_ids import SnowflakeGenerator  # noqa: E402
+
+SCHEMAS = {
+    "uuid TEXT": (
+        "CREATE TABLE orders (order_id TEXT PRIMARY KEY, user_id INTEGER, photos TEXT, price REAL, created_at TEXT)",
+        "CREATE TABLE order_search_keys (id INTEGER PRIMARY KEY, order_id TEXT NOT NULL UNIQUE)",
+        "CREATE INDEX ix_orders_created_at ON orders (created_at)",
+    ),
+    "Snowflake INTEGER": (
+        "CREATE TABLE orders (order_id INTEGER PRIMARY KEY, number INTEGER UNIQUE, user_id INTEGER, "
+        "photos TEXT, price REAL, created_at TEXT)",
+        "CREATE INDEX ix_orders_created_at ON orders (created_at)",
+    ),
+}
+
+
+def _photos(i: int) -> str:
+    # строка примерно той же длины, что JSON одного-двух фото у настоящего заказа
+    return f'[{{"path": "uploads/{i}/IMG_{i % 10000:04d}.jpg", "format": "10x15", "copies": 1}}]'
+
+
+def fill(db_path: str, kind: str, orders: int, batch: int) -> tuple[float, list]:
+    """Вставляет заказы пачками по batch в одной транзакции на пачку; возвращает время и ключи."""
+    conn = sqlite3.connect(db_path)
+    for ddl in SCHEMAS[kind]:
+        conn.execute(ddl)
+    gen = SnowflakeGenerator(worker_id=1)
+    keys = []
+    started = time.perf_counter()
+    for start in range(0, orders, batch):
+        rng = range(start, min(start + batch, orders))
+        created = time.strftime("%Y-%m-%d %H:%M:%S")
+        if kind == "uuid TEXT":
+            ids = [str(uuid.uuid4()) for _ in rng]
+            conn.executemany(
+                "INSERT INTO orders VALUES (?, ?, ?, 100.0, ?)",
+                [(k, i % 10_000, _photos(i), created) for k, i in zip(ids, rng)],
+            )
+            conn.executemany("INSERT INTO order_search_keys (order_id) VALUES (?)", [(k,) for k in ids])
+        else:
+            ids = [gen.next_id() for _ in rng]
+            conn.executemany(
+                "INSERT INTO orders VALUES (?, ?, ?, ?, 100.0, ?)",
+                [(k, i + 1, i % 10_000, _photos(i), created) for k, i in zip(ids, rng)],
+            )
+        conn.commit()
+        keys.extend(ids)
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed, keys
+
+
+def lookups(db_path: str, keys: list, count: int) -> float:
+    """Среднее время поиска заказа по ключу, мкс."""
+    conn = sqlite3.connect(db_path)
+    sample = random.Random(1).sample(keys, min(count, len(keys)))
+    started = time.perf_counter()
+    for key in sample:
+        conn.execute("SELECT price FROM orders WHERE order_id = ?", (key,)).fetchone()
+    elapsed = time.perf_counter() - started
+    conn.close()
+    return elapsed / len(sample) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders", type=int, default=2_000_000)
+    parser.add_argument("--batch", type=int, default=10_000)
+    parser.add_argument("--lookups", type=int, default=100_000)
+    args = parser.parse_args()
+
+    os.makedirs(os.path.join(ROOT, "bench_data"), exist_ok=True)
+    print(f"заказов: {args.orders:,}, пачка: {args.batch:,}\n")
+    print(f"{'ключ':<18} {'вставка, с':>11} {'заказов/с':>10} {'размер, МБ':>11} {'поиск, мкс':>11}")
+    for kind in SCHEMAS:
+        db_path = os.path.join(ROOT, "bench_data", f"order_ids_{kind.split()[0].lower()}.sqlite")
+        if os.path.exists(db_path):
+            os.remove(db_path)
+        elapsed, keys = fill(db_path, kind, args.orders, args.batch)
+        size_mb = os.path.getsize(db_path) / 2**20
+        lookup_us = lookups(db_path, keys, args.lookups)
+        print(f"{kind:<18} {elapsed:>11.1f} {args.orders / elapsed:>10,.0f} {size_mb:>11.0f} {lookup_us:>11.1f}")
+        os.remove(db_path)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,208 @@
+"""
+Приём подтверждений оплаты: заглушка платёжного провайдера шлёт подписанные
+события на вебхук бота всплесками и с повторами (как настоящий провайдер
+при таймаутах), бенчмарк меряет подтверждений в секунду с групповой
+записью в базу и без неё и проверяет, что каждый заказ оплачен ровно один раз.
+
+    python -m bench.payments --payments 20000 --duplicates 0.2 --concurrency 200
+    python -m bench.payments --events-per-request 10     # провайдер шлёт пачками
+
+Заглушку можно направить и на запущенного бота (PAYMENTS_PORT, PAYMENTS_SECRET):
+
+    python -m bench.payments --url http://127.0.0.1:8081/payments/webhook --secret s3cret --pay <order_id> --amount 480
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET = "bench-secret"
+
+
+class StubPaymentProvider:
+    """
+    Заглушка провайдера: подписывает события HMAC-SHA256 и доставляет их
+    на вебхук, повторяя доставку при ошибке или таймауте.
+    """
+
+    def __init__(self, session: aiohttp.ClientSession, url: str, secret: str | None, retries: int = 5):
+        self.session = session
+        self.url = url
+        self.secret = secret
+        self.retries = retries
+        self.requests = 0
+        self.redeliveries = 0
+
+    async def deliver(self, events: list[dict]) -> list[dict]:
+        from bot.payment_webhook import SIGNATURE_HEADER, sign_payload
+
+        body = json.dumps({"events": events}).encode()
+        headers = {"Content-Type": "application/json"}
+        if self.secret:
+            headers[SIGNATURE_HEADER] = sign_payload(self.secret, body)
+        for attempt in range(self.retries):
+            self.requests += 1
+            try:
+                async with self.session.post(self.url, data=body, headers=headers) as response:
+                    if response.status == 200:
+                        return (await response.json())["results"]
+            except aiohttp.ClientError:
+                pass
+            self.redeliveries += 1
+            await asyncio.sleep(0.05 * 2 ** attempt)
+        raise RuntimeError(f"провайдер не смог доставить {len(events)} событий")
+
+
+def prepare_db(orders: int) -> str:
+    cached = os.path.join(ROOT, "bench_data", f"payments_{orders}o.sqlite")
+    if not os.path.exists(cached):
+        subprocess.run(
+            [sys.executable, "-m", "bench.seed", "--db", cached, "--users", "5000", "--orders", str(orders)],
+            cwd=ROOT, check=True,
+        )
+    db_path = os.path.join(tempfile.mkdtemp(prefix="payments_bench_"), "payments.sqlite")
+    shutil.copy(cached, db_path)
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE orders SET paid = 0")
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+async def run_scenario(args, max_batch: int, port: int) -> dict:
+    from aiohttp import web
+
+    from bot.payment_webhook import create_payment_app
+    from bot.services.payment import PaymentIngestor
+    from db.database import SessionLocal, PaymentConfirmation, Order
+
+    db = SessionLocal()
+    db.query(PaymentConfirmation).delete()
+    db.query(Order).update({Order.paid: False})
+    db.commit()
+    targets = [(o, float(p)) for o, p in db.query(Order.order_id, Order.price).limit(args.payments)]
+    db.close()
+
+    applied_callbacks = 0
+
+    async def on_applied(results):
+        nonlocal applied_callbacks
+        applied_callbacks += len(results)
+
+    ingestor = PaymentIngestor(max_batch=max_batch, on_applied=on_applied)
+    runner = web.AppRunner(create_payment_app(ingestor, "stub", secret=SECRET), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    ingestor.start()
+
+    rng = random.Random(7)
+    events = [
+        {"id": f"pay_{i}", "order_id": order_id, "amount": price, "status": "succeeded"}
+        for i, (order_id, price) in enumerate(targets)
+    ]
+    # провайдер повторяет часть событий (не дождался ответа) и шлёт их вперемешку
+    deliveries = events + [e for e in events if rng.random() < args.duplicates]
+    rng.shuffle(deliveries)
+    requests = [deliveries[i:i + args.events_per_request]
+                for i in range(0, len(deliveries), args.events_per_request)]
+
+    outcomes: dict[str, int] = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        provider = StubPaymentProvider(session, f"http://127.0.0.1:{port}/payments/webhook", SECRET)
+
+        async def send(chunk):
+            async with semaphore:
+                for r in await provider.deliver(chunk):
+                    outcomes[r["outcome"]] = outcomes.get(r["outcome"], 0) + 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(chunk) for chunk in requests))
+        elapsed = time.perf_counter() - started
+
+    await runner.cleanup()
+    await ingestor.stop()
+
+    db = SessionLocal()
+    paid = db.query(Order).filter(Order.paid == True).count()
+    recorded = db.query(PaymentConfirmation).count()
+    db.close()
+    return {
+        "deliveries": len(deliveries),
+        "elapsed": elapsed,
+        "outcomes": outcomes,
+        "batches": ingestor.batches,
+        "paid": paid,
+        "recorded": recorded,
+        "unique": len(events),
+        "applied_callbacks": applied_callbacks,
+        "redeliveries": provider.redeliveries,
+    }
+
+
+async def pay_one(args):
+    async with aiohttp.ClientSession() as session:
+        provider = StubPaymentProvider(session, args.url, args.secret)
+        event = {"id": f"stub_{int(time.time() * 1000)}", "order_id": args.pay, "amount": args.amount,
+                 "status": "succeeded"}
+        print(await provider.deliver([event]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--payments", type=int, default=20_000, help="уникальных платежей")
+    parser.add_argument("--duplicates", type=float, default=0.2, help="доля событий, доставленных повторно")
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременных запросов провайдера")
+    parser.add_argument("--events-per-request", type=int, default=1)
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--url", help="вебхук запущенного бота — только с --pay")
+    parser.add_argument("--secret")
+    parser.add_argument("--pay", help="отправить одно подтверждение оплаты этого заказа")
+    parser.add_argument("--amount", type=float)
+    args = parser.parse_args()
+
+    if args.pay:
+        if not args.url or not args.secret or args.amount is None:
+            sys.exit("--pay требует --url, --secret и --amount")
+        asyncio.run(pay_one(args))
+        return
+
+    db_path = prepare_db(max(args.payments, 10_000))
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    from db.database import init_db
+    init_db()
+
+    print(f"платежей {args.payments:,}, повторов {args.duplicates:.0%}, "
+          f"параллельно {args.concurrency}, событий в запросе {args.events_per_request}\n")
+    print(f"{'запись':<18} {'подтв/с':>9} {'транзакций':>11} {'в пачке':>8}  исходы")
+    failed = False
+    for title, max_batch in (("по одному", 1), ("групповая", 200)):
+        r = asyncio.run(run_scenario(args, max_batch, args.port))
+        per_batch = r["deliveries"] / max(r["batches"], 1)
+        print(f"{title:<18} {r['deliveries'] / r['elapsed']:>9,.0f} {r['batches']:>11,} {per_batch:>8.1f}  "
+              f"{dict(sorted(r['outcomes'].items()))}")
+        ok = r["paid"] == r["unique"] == r["recorded"] == r["outcomes"].get("applied", 0) == r["applied_callbacks"]
+        if not ok:
+            failed = True
+            print(f"  ✗ оплачено {r['paid']}, записей {r['recorded']}, уникальных {r['unique']}, "
+                  f"applied-колбэков {r['applied_callbacks']}")
+    shutil.rmtree(os.path.dirname(db_path), ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+Пересчёт цен пачки заказов: как считали раньше — ORM-объекты Order и цикл
+по фото со словарём цен — против order_copy_counts (только order_id и
+photos, векторы копий по id формата) и PriceTable.price_batch (скалярное
+произведение на вектор цен). Заодно проверяется, что обе схемы дают
+одинаковые суммы.
+
+    python -m bench.pricing --orders 200000 --batch 500 --repeat 3
+
+База засевается bench.seed и переиспользуется между запусками:
+bench_data/pricing_<users>u_<orders>o.sqlite.
+"""
+
+import argparse
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def legacy_prices(order_ids: list[str]) -> dict[str, tuple[float, float, float]]:
+    """Как calculate_order_price до версий прайс-листа: по фото, со словарём PRICES."""
+    from db.database import SessionLocal, Order
+    from bot.services.pricing import DEFAULT_UNIT_PRICE, DISCOUNT_THRESHOLDS, PRICES
+
+    db = SessionLocal()
+    try:
+        orders = db.query(Order).filter(Order.order_id.in_(order_ids)).all()
+    finally:
+        db.close()
+    result = {}
+    for order in orders:
+        raw_total, total_copies = 0.0, 0
+        for p in order.photos or []:
+            copies = p.get("copies", 1)
+            raw_total += PRICES.get(p.get("format", "10x15"), DEFAULT_UNIT_PRICE) * copies
+            total_copies += copies
+        mult = 1.0
+        for threshold in sorted(DISCOUNT_THRESHOLDS):
+            if total_copies >= threshold:
+                mult = DISCOUNT_THRESHOLDS[threshold]
+        discounted = round(raw_total * mult, 2)
+        result[order.order_id] = (raw_total, discounted, round(raw_total - discounted, 2))
+    return result
+
+
+def batch_prices(order_ids: list[str], table) -> dict[str, tuple[float, float, float]]:
+    from db.database import SessionLocal
+    from bot.services.repricing import order_copy_counts
+
+    db = SessionLocal()
+    try:
+        counts = order_copy_counts(db, order_ids)
+    finally:
+        db.close()
+    return dict(zip(counts, table.price_batch(counts.values())))
+
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=200_000)
+    parser.add_argument("--batch", type=int, default=500, help="заказов в пачке, как у reprice_orders")
+    parser.add_argument("--batches", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    db_path = os.path.join(ROOT, "bench_data", f"pricing_{args.users}u_{args.orders}o.sqlite")
+    if not os.path.exists(db_path):
+        subprocess.run(
+            [sys.executable, "-m", "bench.seed", "--db", db_path, "--users", str(args.users), "--orders", str(args.orders)],
+            cwd=ROOT, check=True,
+        )
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, ROOT)
+
+    from db.database import init_db
+    from bot.services.pricing import get_price_table
+
+    init_db()
+    table = get_price_table(1)   # засеянные заказы посчитаны по исходному прайс-листу
+    conn = sqlite3.connect(db_path)
+    ids = [r[0] for r in conn.execute("SELECT order_id FROM orders ORDER BY created_at DESC LIMIT ?",
+                                      (args.batch * args.batches,))]
+    conn.close()
+    batches = [ids[i:i + args.batch] for i in range(0, len(ids), args.batch)]
+
+    def run(fn):
+        result = {}
+        for b in batches:
+            result.update(fn(b))
+        return result
+
+    legacy, expected = timed(lambda: run(lambda b: legacy_prices(b)), args.repeat)
+    batch, got = timed(lambda: run(lambda b: batch_prices(b, table)), args.repeat)
+
+    mismatched = [order_id for order_id in expected if expected[order_id] != got.get(order_id)]
+    print(f"заказов {len(ids):,} пачками по {args.batch}, лучшее из {args.repeat}")
+    print(f"  ORM + цикл по фото            {legacy * 1000:8.1f} мс  {len(ids) / legacy:>10,.0f} заказов/с")
+    print(f"  копии по форматам + батч      {batch * 1000:8.1f} мс  {len(ids) / batch:>10,.0f} заказов/с"
+          f"   {legacy / batch:.1f}×")
+    print("OK" if not mismatched and len(got) == len(ids) else f"ОШИБКА: суммы расходятся у {len(mismatched)} заказов")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Симулятор очереди печати: один принтер, заказы приходят случайно (поток
+Пуассона), фото — как у bench.seed. Сравнивает две политики на одном и том
+же потоке заказов:
+
+  * FIFO — задания печатаются в порядке прихода заказов, бумага меняется
+    всякий раз, когда меняется формат;
+  * план — bot.services.print_queue.sequence_jobs: когда принтер свободен,
+    план пересобирается по всем ждущим заданиям и печатается первый прогон.
+
+    python -m bench.print_queue --orders-per-hour 10 --orders-per-hour 25 --hours 72
+
+Для каждой политики — смены бумаги (и сколько часов на них ушло), заданий
+на прогон, загрузка принтера, время от оформления заказа до печати его
+последнего фото (p50/p95/макс) и заказы, не успевшие к сроку due_at —
+отправке в ПВЗ минус упаковка. Время заданий — по SECONDS_PER_COPY, смена
+бумаги — PRINT_CHANGEOVER; база не нужна.
+"""
+
+import argparse
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.seed import PICKUP_POINTS, _photos  # noqa: E402
+from bot.services.print_queue import (  # noqa: E402
+    PRINT_CHANGEOVER,
+    QueuedJob,
+    dispatch_times,
+    due_at,
+    print_time,
+    sequence_jobs,
+    split_by_format,
+)
+
+# отправки в ПВЗ у точек bench.seed — по Москве
+DISPATCH = dict(zip(PICKUP_POINTS, ("12:00,17:00", "11:00,16:00", "14:00,19:00", "10:00,15:00,20:00", "13:00")))
+
+# 05:00 UTC — 08:00 по Москве
+START = datetime(2026, 1, 12, 5, 0)
+
+
+def make_orders(rate: float, hours: float, seed: int) -> list[tuple[int, datetime, list[QueuedJob]]]:
+    rng = random.Random(seed)
+    orders = []
+    t = 0.0
+    while True:
+        t += rng.expovariate(rate / 3600)
+        if t >= hours * 3600:
+            return orders
+        order_id = len(orders) + 1
+        created_at = START + timedelta(seconds=t)
+        due = due_at(created_at, created_at, dispatch_times(DISPATCH[rng.choice(PICKUP_POINTS)]))
+        jobs = [
+            QueuedJob(order_id, fmt, count, copies, due, created_at)
+            for fmt, (count, copies) in split_by_format(_photos(rng, order_id)).items()
+        ]
+        orders.append((order_id, created_at, jobs))
+
+
+class Printer:
+    """Принтер и учёт: когда допечатано каждое задание, смены бумаги, прогоны."""
+
+    def __init__(self):
+        self.t = START
+        self.paper = None
+        self.changeovers = 0
+        self.runs = 0
+        self.jobs = 0
+        self.busy = timedelta()
+        self.done: dict[int, datetime] = {}
+
+    def print_run(self, fmt: str, jobs) -> None:
+        if fmt != self.paper:
+            self.paper = fmt
+            self.changeovers += 1
+            self.t += PRINT_CHANGEOVER
+        self.runs += 1
+        for job in jobs:
+            took = print_time(job.format, job.copies)
+            self.t += took
+            self.busy += took
+            self.jobs += 1
+            self.done[job.order_id] = self.t
+
+
+def fifo(orders) -> Printer:
+    printer = Printer()
+    for _, created_at, jobs in orders:
+        printer.t = max(printer.t, created_at)
+        for job in jobs:
+            printer.print_run(job.format, [job])
+    # подряд идущие задания одного формата — один прогон
+    printer.runs = printer.changeovers
+    return printer
+
+
+def planned(orders) -> Printer:
+    printer = Printer()
+    pending: list[QueuedJob] = []
+    arrived = 0
+    while arrived < len(orders) or pending:
+        if not pending:
+            printer.t = max(printer.t, orders[arrived][1])
+        while arrived < len(orders) and orders[arrived][1] <= printer.t:
+            pending.extend(orders[arrived][2])
+            arrived += 1
+        run = sequence_jobs(pending, printer.t, printer.paper)[0]
+        printer.print_run(run.format, run.jobs)
+        taken = set(run.jobs)
+        pending = [job for job in pending if job not in taken]
+    return printer
+
+
+def percentile(values: list[float], q: float) -> float:
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def report(name: str, printer: Printer, orders) -> None:
+    latency = sorted((printer.done[order_id] - created_at).total_seconds() / 60 for order_id, created_at, _ in orders)
+    late = sum(printer.done[order_id] > jobs[0].due_at for order_id, _, jobs in orders)
+    span = printer.t - START
+    print(f"  {name:<6} {printer.changeovers:>6} {printer.changeovers * PRINT_CHANGEOVER / timedelta(hours=1):>7.1f} "
+          f"{printer.jobs / max(printer.runs, 1):>8.1f} {printer.busy / span:>9.0%} "
+          f"{percentile(latency, 0.5):>7.0f} {percentile(latency, 0.95):>7.0f} {latency[-1]:>7.0f} "
+          f"{late:>6} {late / len(orders):>6.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--orders-per-hour", type=float, action="append", help="можно несколько раз")
+    parser.add_argument("--hours", type=float, default=72, help="сколько часов приходят заказы")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"{'':8} {'смен':>6} {'часов':>7} {'заданий':>8} {'загрузка':>9} "
+          f"{'p50 мин':>7} {'p95 мин':>7} {'макс':>7} {'опозд.':>6} {'':>6}")
+    for rate in args.orders_per_hour or [4, 10, 20]:
+        orders = make_orders(rate, args.hours, args.seed)
+        print(f"{rate:g} заказов/ч, {len(orders)} заказов, "
+              f"{sum(len(jobs) for _, _, jobs in orders)} заданий")
+        report("FIFO", fifo(orders), orders)
+        report("план", planned(orders), orders)
+        print()
+
+
+if __name__ == "__main__":
+    main()
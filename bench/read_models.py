@@ -0,0 +1,158 @@
+"""
+Память на страницу «Моих заказов»: что загружается для карточек и сколько
+из этого живёт до отправки сообщения. Три способа загрузить ту же страницу:
+
+  * ORM-объекты Order — как до union с архивом (db.query(Order)..., архив
+    не читается, поэтому по времени он не сравним с двумя другими);
+  * строки со всеми полями Order — bot.services.archive.user_orders;
+  * OrderCard — только поля карточки (bot.services.order_cards).
+
+Для каждого — объекты (блоки памяти, sys.getallocatedblocks) и байты
+(tracemalloc), которые остаются от загруженной страницы после db.close(),
+пик памяти за загрузку и отрисовку текста, время на страницу. Текст
+у всех трёх одинаковый — это проверяется.
+
+    python -m bench.read_models --per-page 1 --per-page 10
+
+База засевается bench.seed и переиспользуется между запусками:
+bench_data/read_models_<users>u_<orders>o.sqlite. Засеянным заказам
+дописывается сводка pricing, как у заказов из бота.
+"""
+
+import argparse
+import gc
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def fill_pricing(db_path: str, user_id: int) -> None:
+    """Сводка pricing у заказов пользователя — в засеянной базе её нет."""
+    from bot.services.pricing import get_price_table, price_summary
+
+    table = get_price_table(1)
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT order_id, photos FROM orders WHERE user_id = ? AND pricing IS NULL", (user_id,)).fetchall()
+    conn.executemany(
+        "UPDATE orders SET pricing = ?, price_version = 1 WHERE order_id = ?",
+        [(json.dumps(price_summary(json.loads(photos), table)), order_id) for order_id, photos in rows],
+    )
+    conn.commit()
+    conn.close()
+
+
+def measure(load, render, pages: int) -> tuple[float, float, float, list[str]]:
+    """Средние на страницу: объекты и байты после загрузки и пик за загрузку с отрисовкой."""
+    from db.database import SessionLocal
+
+    blocks = retained = peak = 0
+    texts = []
+    for page in range(pages):
+        db = SessionLocal()
+        gc.collect()
+        base_blocks = sys.getallocatedblocks()
+        base_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        rows = load(db, page)
+        db.close()
+        gc.collect()
+        blocks += sys.getallocatedblocks() - base_blocks
+        retained += tracemalloc.get_traced_memory()[0] - base_bytes
+        texts.append("".join(render(o) for o in rows))
+        peak += tracemalloc.get_traced_memory()[1] - base_bytes
+        del rows
+    return blocks / pages, retained / pages, peak / pages, texts
+
+
+def timed(load, render, pages: int, repeat: int = 5) -> float:
+    """Лучшее из repeat время страницы (загрузка и текст), мс; без tracemalloc."""
+    from db.database import SessionLocal
+
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for page in range(pages):
+            db = SessionLocal()
+            rows = load(db, page)
+            db.close()
+            "".join(render(o) for o in rows)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000 / pages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=1_000)
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--per-page", type=int, action="append", help="заказов на странице; можно несколько раз")
+    parser.add_argument("--pages", type=int, default=20)
+    args = parser.parse_args()
+
+    db_path = os.path.join(ROOT, "bench_data", f"read_models_{args.users}u_{args.orders}o.sqlite")
+    if not os.path.exists(db_path):
+        subprocess.run(
+            [sys.executable, "-m", "bench.seed", "--db", db_path, "--users", str(args.users), "--orders", str(args.orders)],
+            cwd=ROOT, check=True,
+        )
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, ROOT)
+
+    from db.database import init_db, Order
+    from bot.handlers.user.orders import _order_card_text
+    from bot.services.archive import user_orders
+    from bot.services.order_cards import user_order_cards
+
+    init_db()
+    conn = sqlite3.connect(db_path)
+    user_id, status, total = conn.execute(
+        "SELECT user_id, status, count(*) FROM orders GROUP BY user_id, status ORDER BY count(*) DESC LIMIT 1"
+    ).fetchone()
+    conn.close()
+    fill_pricing(db_path, user_id)
+
+    def orm(db, page, per_page):
+        return (
+            db.query(Order)
+            .filter(Order.user_id == user_id, Order.status == status)
+            .order_by(Order.created_at.desc())
+            .offset(page * per_page)
+            .limit(per_page)
+            .all()
+        )
+
+    variants = [
+        ("ORM Order", orm),
+        ("строки всех полей", lambda db, page, per_page: user_orders(db, user_id, status, page, per_page)),
+        ("OrderCard", lambda db, page, per_page: user_order_cards(db, user_id, status, page, per_page)),
+    ]
+
+    print(f"пользователь {user_id}: {total} заказов в статусе {status}; средние на страницу\n")
+    print(f"{'загрузка':<20} {'заказов':>7} {'объектов':>9} {'байт':>9} {'пик, байт':>10} {'мс':>7}")
+    mismatched = False
+    for per_page in args.per_page or [1, 10]:
+        pages = min(args.pages, max(total // per_page, 1))
+        expected = None
+        for name, load in variants:
+            def page_loader(db, page, load=load):
+                return load(db, page, per_page)
+
+            ms = timed(page_loader, _order_card_text, pages)   # заодно прогрев кэша запросов SQLAlchemy
+            tracemalloc.start()
+            blocks, retained, peak, texts = measure(page_loader, _order_card_text, pages)
+            tracemalloc.stop()
+            expected = expected or texts
+            mismatched |= texts != expected
+            print(f"{name:<20} {per_page:>7} {blocks:>9,.0f} {retained:>9,.0f} {peak:>10,.0f} {ms:>7.2f}")
+        print()
+    print("ОШИБКА: тексты карточек расходятся" if mismatched else "OK: тексты карточек совпадают")
+    sys.exit(1 if mismatched else 0)
+
+
+if __name__ == "__main__":
+    main()
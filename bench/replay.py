@@ -0,0 +1,263 @@
+"""
+Нагрузочный прогон: реальный Dispatcher из main.py, фейковая сессия Bot API
+без сети и сценарии пользователей поверх засеянной базы.
+
+    python -m bench.replay --users 10000 --orders 1000000 --sessions 200 --concurrency 20 \\
+        --output bench_data/baseline.json
+    python -m bench.replay ... --baseline bench_data/baseline.json   # сравнить с прошлым прогоном
+    python -m bench.replay ... --query-report   # хендлеры с наибольшим числом SQL и N+1
+
+Печатает пропускную способность, перцентили задержки по шагам, число
+SQL-запросов на апдейт и пиковую память; --output пишет то же в JSON.
+С --baseline выводит разницу и завершается с кодом 1 при регрессии больше --tolerance.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+class ReplayRunner:
+    def __init__(self, dp, bot):
+        self.dp = dp
+        self.bot = bot
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.queries: dict[str, list[int]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def feed(self, step: str, update):
+        from bot.services.metrics import current_query_count
+
+        box = [0]
+        token = current_query_count.set(box)
+        started = time.perf_counter()
+        try:
+            await self.dp.feed_update(self.bot, update)
+        except Exception:
+            self.errors[step] += 1
+        finally:
+            self.latencies[step].append(time.perf_counter() - started)
+            self.queries[step].append(box[0])
+            current_query_count.reset(token)
+
+
+def summarize(runner: ReplayRunner, elapsed: float) -> dict:
+    all_latencies = [x for v in runner.latencies.values() for x in v]
+    all_queries = [x for v in runner.queries.values() for x in v]
+    steps = {}
+    for step in sorted(runner.latencies):
+        lat = runner.latencies[step]
+        q = runner.queries[step]
+        steps[step] = {
+            "updates": len(lat),
+            "p50_ms": round(percentile(lat, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(lat, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(lat, 0.99) * 1000, 3),
+            "queries_mean": round(sum(q) / len(q), 2),
+            "queries_max": max(q),
+            "errors": runner.errors.get(step, 0),
+        }
+    return {
+        "updates": len(all_latencies),
+        "elapsed_s": round(elapsed, 3),
+        "throughput_ups": round(len(all_latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(percentile(all_latencies, 0.50) * 1000, 3),
+            "p95": round(percentile(all_latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(all_latencies, 0.99) * 1000, 3),
+            "max": round(max(all_latencies) * 1000, 3) if all_latencies else 0.0,
+        },
+        "queries_per_update": {
+            "mean": round(sum(all_queries) / len(all_queries), 2) if all_queries else 0.0,
+            "p95": percentile(all_queries, 0.95),
+            "max": max(all_queries) if all_queries else 0,
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "errors": sum(runner.errors.values()),
+        "steps": steps,
+    }
+
+
+async def replay(args) -> dict:
+    # окружение выставляется до импорта main/db: движок создаётся при импорте
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(args.db)}"
+    os.environ["TELEGRAM_BOT_TOKEN"] = "123456:REPLAY-BENCHMARK"
+    os.environ.setdefault("THROTTLE_RATE", "1000000")
+    os.environ.setdefault("THROTTLE_BURST", "1000000")
+    if args.trace:
+        os.environ.setdefault("TRACE_SAMPLE_RATE", "1")
+
+    from bench.fake_bot import FakeSession
+    from bench.journeys import JOURNEYS, VirtualUser
+    from bench.seed import SEED_TELEGRAM_BASE
+    from bot.services.metrics import instrument_engine
+    from bot.services.query_budget import install_query_recorder
+    from bot.services.tracing import configure_tracing, instrument_engine_tracing, shutdown_tracing
+    from db.database import engine
+    import main
+
+    instrument_engine(engine)
+    install_query_recorder(engine)
+    session = FakeSession(latency=args.api_latency_ms / 1000)
+    bot = main.create_bot(session=session)
+    dp = main.create_dispatcher()
+    if args.trace and configure_tracing(args.trace):
+        instrument_engine_tracing(engine)
+        main.register_tracing_middlewares(dp, bot)
+    runner = ReplayRunner(dp, bot)
+
+    rng = random.Random(args.seed)
+    new_ids = iter(range(900_000_000, 1_000_000_000))
+    plans = []
+    for _ in range(args.sessions):
+        if rng.random() < args.returning:
+            plans.append(("returning_customer", SEED_TELEGRAM_BASE + rng.randint(1, args.users), True))
+        else:
+            plans.append(("new_customer", next(new_ids), False))
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+
+    async def run_session(name: str, telegram_id: int, returning: bool):
+        async with semaphore:
+            user = VirtualUser(runner, telegram_id, first_order_done=returning)
+            await JOURNEYS[name](user)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run_session(*plan) for plan in plans))
+    elapsed = time.perf_counter() - started
+
+    result = summarize(runner, elapsed)
+    result["config"] = {
+        "users": args.users,
+        "orders": args.orders,
+        "sessions": args.sessions,
+        "concurrency": args.concurrency,
+        "returning": args.returning,
+        "api_latency_ms": args.api_latency_ms,
+        "python": platform.python_version(),
+    }
+    result["api_calls"] = dict(session.calls)
+    shutdown_tracing()
+    engine.dispose()
+    return result
+
+
+def print_report(result: dict):
+    print(f"апдейтов: {result['updates']}  за {result['elapsed_s']} с  →  {result['throughput_ups']} апдейтов/с")
+    lat = result["latency_ms"]
+    print(f"задержка, мс: p50={lat['p50']}  p95={lat['p95']}  p99={lat['p99']}  max={lat['max']}")
+    q = result["queries_per_update"]
+    print(f"SQL на апдейт: mean={q['mean']}  p95={q['p95']}  max={q['max']}")
+    print(f"пиковая память: {result['peak_rss_mb']} МБ, ошибок: {result['errors']}\n")
+    print(f"{'шаг':<24} {'n':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'sql':>6} {'err':>4}")
+    for step, s in result["steps"].items():
+        print(f"{step:<24} {s['updates']:>6} {s['p50_ms']:>8.2f} {s['p95_ms']:>8.2f} "
+              f"{s['p99_ms']:>8.2f} {s['queries_mean']:>6.1f} {s['errors']:>4}")
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> bool:
+    """Печатает разницу с базовым прогоном; True, если есть регрессия."""
+    checks = [
+        ("throughput_ups", result["throughput_ups"], baseline["throughput_ups"], True),
+        ("latency p95", result["latency_ms"]["p95"], baseline["latency_ms"]["p95"], False),
+        ("latency p99", result["latency_ms"]["p99"], baseline["latency_ms"]["p99"], False),
+        ("queries mean", result["queries_per_update"]["mean"], baseline["queries_per_update"]["mean"], False),
+        ("peak_rss_mb", result["peak_rss_mb"], baseline["peak_rss_mb"], False),
+    ]
+    for step, s in result["steps"].items():
+        old = baseline.get("steps", {}).get(step)
+        if old:
+            checks.append((f"{step} p95", s["p95_ms"], old["p95_ms"], False))
+            checks.append((f"{step} sql", s["queries_mean"], old["queries_mean"], False))
+
+    regressed = False
+    print(f"\n{'метрика':<32} {'было':>10} {'стало':>10} {'Δ%':>8}")
+    for name, new, old, higher_is_better in checks:
+        delta = (new - old) / old * 100 if old else 0.0
+        worse = -delta if higher_is_better else delta
+        flag = ""
+        if worse > tolerance * 100:
+            flag = "  ← регрессия"
+            regressed = True
+        print(f"{name:<32} {old:>10.2f} {new:>10.2f} {delta:>+8.1f}{flag}")
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="путь к засеянной базе (по умолчанию bench_data/replay_<users>u_<orders>o.sqlite)")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--sessions", type=int, default=200, help="сколько пользовательских сессий проиграть")
+    parser.add_argument("--concurrency", type=int, default=20, help="сессий одновременно")
+    parser.add_argument("--returning", type=float, default=0.5, help="доля сессий засеянных пользователей")
+    parser.add_argument("--api-latency-ms", type=float, default=0.0, help="имитация задержки Bot API")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="куда записать JSON с результатами")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="допустимое ухудшение (доля)")
+    parser.add_argument("--query-report", action="store_true", help="напечатать хендлеры с наибольшим числом SQL и N+1")
+    parser.add_argument("--trace", help="писать трейсы апдейтов в этот JSONL (см. scripts/trace_report.py)")
+    parser.add_argument("--keep-db", action="store_true", help="не копировать базу: прогон изменит засеянные данные")
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    seeded = args.db or os.path.join(ROOT, "bench_data", f"replay_{args.users}u_{args.orders}o.sqlite")
+    if not os.path.exists(seeded):
+        # засеваем в отдельном процессе, чтобы не портить замер пиковой памяти
+        subprocess.run(
+            [sys.executable, "-m", "bench.seed", "--db", seeded, "--users", str(args.users), "--orders", str(args.orders)],
+            cwd=ROOT, check=True,
+        )
+
+    with tempfile.TemporaryDirectory(prefix="photoexpress-replay-") as workdir:
+        # прогон пишет в базу и в uploads/, поэтому работаем на копии и во временном каталоге
+        if args.keep_db:
+            args.db = seeded
+        else:
+            import sqlite3
+            args.db = os.path.join(workdir, "replay.sqlite")
+            src, dst = sqlite3.connect(seeded), sqlite3.connect(args.db)
+            src.backup(dst)
+            src.close()
+            dst.close()
+        if args.trace:
+            args.trace = os.path.abspath(args.trace)
+        os.chdir(workdir)
+        result = asyncio.run(replay(args))
+
+    print_report(result)
+    if args.query_report:
+        from bot.services.query_budget import STATS
+        print("\n" + STATS.report())
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare(result, baseline, args.tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
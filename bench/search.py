@@ -0,0 +1,112 @@
+"""
+Поиск заказов для поддержки: FTS5-индекс против LIKE-скана по orders
+и против скана с разбором JSON photos в Python (как искали раньше).
+
+    python -m bench.search --orders 1000000 --repeat 5
+
+База засевается bench.seed (триггеры сразу наполняют индекс) и
+переиспользуется между запусками: bench_data/search_<users>u_<orders>o.sqlite.
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (что ищем, запрос сотрудника)
+QUERIES = [
+    ("имя файла", "IMG_0042"),
+    ("фрагмент телефона", "0000123"),
+    ("ФИО + комментарий", "Пользователь Срочно"),
+    ("частое слово", "Матовая"),
+]
+
+
+def like_scan(conn: sqlite3.Connection, query: str, limit: int) -> list[str]:
+    """Каждый фрагмент должен встретиться хотя бы в одном поле; photos — как текст JSON."""
+    terms = query.split()
+    where = " AND ".join(
+        "(comment LIKE ? OR receiver_name LIKE ? OR replace(receiver_phone, '+', '') LIKE ? OR photos LIKE ?)"
+        for _ in terms
+    )
+    params = [f"%{t}%" for t in terms for _ in range(4)]
+    rows = conn.execute(
+        f"SELECT order_id FROM orders WHERE {where} ORDER BY created_at DESC LIMIT ?", (*params, limit)
+    ).fetchall()
+    return [r[0] for r in rows]
+
+
+def python_scan(conn: sqlite3.Connection, query: str, limit: int) -> list[str]:
+    """Полный проход с json.loads(photos) для каждого заказа."""
+    terms = [t.lower() for t in query.split()]
+    found = []
+    for order_id, comment, name, phone, photos, created_at in conn.execute(
+        "SELECT order_id, comment, receiver_name, receiver_phone, photos, created_at FROM orders"
+    ):
+        filenames = " ".join(p.get("filename", "") for p in json.loads(photos or "[]"))
+        haystack = f"{comment or ''} {name or ''} {(phone or '').lstrip('+')} {filenames}".lower()
+        if all(t in haystack for t in terms):
+            found.append((created_at, order_id))
+    found.sort(reverse=True)
+    return [order_id for _, order_id in found[:limit]]
+
+
+def timed(fn, repeat: int) -> tuple[float, object]:
+    best, result = float("inf"), None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--per-page", type=int, default=10)
+    parser.add_argument("--skip-python-scan", action="store_true", help="не гонять самый медленный вариант")
+    args = parser.parse_args()
+
+    db_path = os.path.join(ROOT, "bench_data", f"search_{args.users}u_{args.orders}o.sqlite")
+    if not os.path.exists(db_path):
+        subprocess.run(
+            [sys.executable, "-m", "bench.seed", "--db", db_path, "--users", str(args.users), "--orders", str(args.orders)],
+            cwd=ROOT, check=True,
+        )
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, ROOT)
+
+    from db.database import init_db
+    from bot.services.search import search_orders
+
+    init_db()  # старые засеянные базы получат индекс миграцией
+    conn = sqlite3.connect(db_path)
+    orders = conn.execute("SELECT count(*) FROM orders").fetchone()[0]
+    size_mb = os.path.getsize(db_path) / 2**20
+    print(f"заказов: {orders:,}, размер базы с индексом: {size_mb:.0f} МБ, лучшее из {args.repeat}\n")
+
+    header = f"{'запрос':<22} {'FTS rank':>10} {'FTS recent':>11} {'LIKE':>10}"
+    if not args.skip_python_scan:
+        header += f" {'скан+JSON':>10}"
+    print(header + f" {'LIKE/FTS':>9}   (мс)")
+    for title, query in QUERIES:
+        fts_rank, page = timed(lambda: search_orders(query, per_page=args.per_page), args.repeat)
+        fts_recent, _ = timed(lambda: search_orders(query, per_page=args.per_page, order="recent"), args.repeat)
+        like, like_ids = timed(lambda: like_scan(conn, query, args.per_page), args.repeat)
+        line = f"{title:<22} {fts_rank * 1000:>10.2f} {fts_recent * 1000:>11.2f} {like * 1000:>10.1f}"
+        if not args.skip_python_scan:
+            scan, _ = timed(lambda: python_scan(conn, query, args.per_page), 1)
+            line += f" {scan * 1000:>10.0f}"
+        print(line + f" {like / min(fts_rank, fts_recent):>8.0f}×   найдено ≥{len(page.hits)}{'+' if page.has_more else ''}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
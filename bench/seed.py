@@ -0,0 +1,114 @@
+"""
+Засевает SQLite-базу для нагрузочных прогонов: пользователи и заказы
+с правдоподобным распределением форматов, статусов и дат.
+
+    python -m bench.seed --db bench_data/replay.sqlite --users 10000 --orders 1000000
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+FORMATS = ["10x15", "13x18", "15x21", "21x30 (A4)", "30x40", "30x45"]
+FORMAT_WEIGHTS = [50, 15, 15, 10, 5, 5]
+STATUSES = ["new", "in_progress", "completed", "cancelled"]
+STATUS_WEIGHTS = [5, 5, 80, 10]
+PICKUP_POINTS = ["ПВЗ Тверская", "ПВЗ Арбат", "ПВЗ Пресненская наб.", "ПВЗ Кутузовская", "ПВЗ Измайлово"]
+
+# telegram_id засеянных пользователей: SEED_TELEGRAM_BASE + users.id
+SEED_TELEGRAM_BASE = 10_000_000
+
+
+def _photos(rng: random.Random, order_id: int) -> list[dict]:
+    photos = []
+    for i in range(rng.choice((1, 1, 2, 3, 5, 8))):
+        filename = f"IMG_{rng.randrange(10_000):04d}.jpg"
+        photos.append({
+            "filename": filename,
+            "path": f"uploads/{order_id}/{filename}",
+            "format": rng.choices(FORMATS, FORMAT_WEIGHTS)[0],
+            "copies": rng.choice((1, 1, 1, 2, 3, 5, 10)),
+        })
+    return photos
+
+
+def seed(db_path: str, users: int, orders: int, batch: int = 50_000, seed_value: int = 42):
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+
+    from db.database import REMINDER_INTERVAL, engine, init_db, make_order_id, write_meta
+
+    init_db()
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+
+    raw = engine.raw_connection()
+    try:
+        cur = raw.cursor()
+        cur.execute("PRAGMA journal_mode=WAL")
+        cur.execute("PRAGMA synchronous=OFF")
+        existing_users = cur.execute("SELECT count(*) FROM users").fetchone()[0]
+        existing_orders = cur.execute("SELECT count(*) FROM orders").fetchone()[0]
+        if existing_users >= users and existing_orders >= orders:
+            return existing_users, existing_orders
+
+        started = time.perf_counter()
+        cur.executemany(
+            "INSERT OR IGNORE INTO users (id, telegram_id, username, phone_number, full_name, "
+            "accepted_policy, first_order_paid, created_at) VALUES (?, ?, ?, ?, ?, 1, 1, ?)",
+            (
+                (uid, SEED_TELEGRAM_BASE + uid, f"user{uid}", f"+7900{uid:07d}", "Тест Пользователь",
+                 (now - timedelta(days=rng.randrange(730))).isoformat(sep=" "))
+                for uid in range(1, users + 1)
+            ),
+        )
+        raw.commit()
+
+        sql = (
+            "INSERT INTO orders (order_id, number, user_id, photos, delivery_point, receiver_name, receiver_phone, "
+            "comment, status, price, discount, paid, created_at, next_action_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+        )
+        for start in range(existing_orders, orders, batch):
+            rows = []
+            for i in range(start, start + min(batch, orders - start)):
+                created_at = now - timedelta(minutes=rng.randrange(525_600))
+                # минуты совпадают у многих заказов: номер заказа раскладывается по
+                # номеру процесса и счётчику Snowflake, так ключи не повторяются
+                order_id = make_order_id(int(created_at.timestamp() * 1000), (i >> 12) & 1023, i & 4095)
+                uid = rng.randint(1, users)
+                photos = _photos(rng, order_id)
+                price = sum(20 * p["copies"] for p in photos)
+                status = rng.choices(STATUSES, STATUS_WEIGHTS)[0]
+                rows.append((
+                    order_id, i + 1, uid, json.dumps(photos), rng.choice(PICKUP_POINTS),
+                    "Тест Пользователь", f"+7900{uid:07d}", rng.choice(("", "", "Матовая бумага", "Срочно")),
+                    status, price, 0.0, status != "new" or rng.random() < 0.5,
+                    created_at.isoformat(sep=" "), (created_at + REMINDER_INTERVAL).isoformat(sep=" "),
+                ))
+            cur.executemany(sql, rows)
+            raw.commit()
+        with engine.begin() as conn:
+            write_meta(conn, order_number=orders)
+            print(f"  заказов: {start + len(rows):,} / {orders:,}", file=sys.stderr)
+        print(f"засеяно за {time.perf_counter() - started:.1f} с", file=sys.stderr)
+        return users, orders
+    finally:
+        raw.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default="bench_data/replay.sqlite")
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--orders", type=int, default=1_000_000)
+    args = parser.parse_args()
+    seed(args.db, args.users, args.orders)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Скорость JSON для больших заказов: список фото (orders.photos) и снимок
+FSM с ним же, на каждом доступном бэкенде db.serialization против того,
+как было — json.dumps/json.loads с настройками по умолчанию и без
+проверки фото.
+
+    python -m bench.serialization --photos 10 --photos 200 --photos 2000
+
+Для каждого размера — кодирование и разбор фото, разбор с проверкой по
+PhotoRecord (decode_photos) и снимок FSM на --states пользователей;
+лучшее из --repeat, МБ/с по размеру JSON. Бэкенды, которых нет
+(pip install msgspec orjson), пропускаются.
+"""
+
+import argparse
+import importlib
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.seed import FORMATS  # noqa: E402
+
+
+def make_photos(count: int, rng: random.Random) -> list[dict]:
+    order_dir = f"uploads/{rng.randrange(10**9)}/{rng.randrange(10**18)}"
+    return [
+        {
+            "filename": f"IMG_{i:05d} Лето на даче.jpg",
+            "path": f"{order_dir}/IMG_{i:05d} Лето на даче.jpg",
+            "format": rng.choice(FORMATS),
+            "copies": rng.choice((1, 1, 2, 3, 5, 10)),
+        }
+        for i in range(count)
+    ]
+
+
+def make_fsm(photos: list[dict], states: int) -> list[dict]:
+    """Записи как в save_fsm_snapshot: пользователи посреди загрузки фото."""
+    return [
+        {
+            "key": {"bot_id": 1, "chat_id": uid, "user_id": uid, "thread_id": None, "business_connection_id": None,
+                    "destiny": "default"},
+            "state": "UploadFSM:waiting_more",
+            "data": {"order_id": 10**17 + uid, "photos": photos, "pricing": None},
+        }
+        for uid in range(states)
+    ]
+
+
+def best(fn, repeat: int, loops: int) -> float:
+    result = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        result = min(result, (time.perf_counter() - started) / loops)
+    return result
+
+
+def run_backend(backend: str, sizes: list[int], states: int, repeat: int) -> None:
+    """Строки таблицы для одного бэкенда; бэкенд выбирается при импорте, поэтому — в своём процессе."""
+    os.environ["JSON_BACKEND"] = backend
+    from db.serialization import decode_photos, dumpb, dumps, loads
+
+    rng = random.Random(42)
+    for count in sizes:
+        photos = make_photos(count, rng)
+        fsm = make_fsm(photos, states)
+        rows = [(backend, lambda: dumps(photos), loads, decode_photos, lambda: dumpb(fsm, default=str), loads)]
+        if backend == "json":
+            rows.insert(0, ("как было", lambda: json.dumps(photos), json.loads, json.loads,
+                            lambda: json.dumps(fsm, ensure_ascii=False, default=str).encode(), json.loads))
+        loops = max(1, 20_000 // count)
+        for name, encode, decode, decode_checked, encode_fsm, decode_fsm in rows:
+            text = encode()
+            assert decode_checked(text) == photos
+            snapshot = encode_fsm()
+            size = len(text.encode())
+            enc = best(encode, repeat, loops)
+            dec = best(lambda: decode(text), repeat, loops)
+            checked = best(lambda: decode_checked(text), repeat, loops)
+            fsm_enc = best(encode_fsm, repeat, max(1, loops // states))
+            fsm_dec = best(lambda: decode_fsm(snapshot), repeat, max(1, loops // states))
+            print(f"{count:>6} {name:<10} {size / 1024:>9.1f} {enc * 1e6:>11.1f} {size / enc / 2**20:>7.0f} "
+                  f"{dec * 1e6:>11.1f} {size / dec / 2**20:>7.0f} {checked * 1e6:>12.1f} "
+                  f"{fsm_enc * 1000:>14.2f} {fsm_dec * 1000:>14.2f}", flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--photos", type=int, action="append", help="фото в заказе; можно несколько раз")
+    parser.add_argument("--states", type=int, default=50, help="пользователей в снимке FSM")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--backend", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    sizes = args.photos or [10, 200, 2000]
+
+    if args.backend:
+        run_backend(args.backend, sizes, args.states, args.repeat)
+        return
+
+    backends = ["json"]
+    for name in ("orjson", "msgspec"):
+        try:
+            importlib.import_module(name)
+            backends.append(name)
+        except ImportError:
+            print(f"{name} не установлен — пропускаем", file=sys.stderr)
+
+    print(f"{'фото':>6} {'бэкенд':<10} {'JSON, КБ':>9} {'запись мкс':>11} {'МБ/с':>7} {'разбор мкс':>11} "
+          f"{'МБ/с':>7} {'с проверкой':>12} {'FSM запись мс':>14} {'FSM разбор мс':>14}", flush=True)
+    for name in backends:
+        subprocess.run(
+            [sys.executable, "-m", "bench.serialization", "--backend", name, "--states", str(args.states),
+             "--repeat", str(args.repeat), *(f"--photos={count}" for count in sizes)],
+            cwd=ROOT, check=True,
+        )
+
+
+if __name__ == "__main__":
+    main()
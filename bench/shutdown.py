@@ -0,0 +1,222 @@
+"""
+Плавная остановка: бот (настоящий main.start() в отдельном процессе, Bot API —
+фейковая сессия с задержкой) получает поток апдейтов из long polling, и
+посреди обработки ему приходит SIGTERM, а затем бот запускается снова.
+Фейковый Telegram хранит подтверждённый offset между запусками, как настоящий.
+Проверяется, что:
+
+  * каждый апдейт обработан ровно один раз за оба запуска: начатые
+    дообработаны, а выданные, но не начатые не подтверждены и пришли снова;
+  * уведомления, записанные в outbox прямо перед остановкой, отправлены;
+  * FSM-состояния пережили перезапуск через снимок.
+
+    python -m bench.shutdown --chats 40 --api-latency-ms 200 --stop-after 1
+    python -m bench.shutdown --timeout 1 --api-latency-ms 3000   # срок вышел — часть брошена
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import shutil
+import signal
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# ─── Процесс бота ────────────────────────────────────────────────────────────
+
+def _updates(chats: int) -> list[dict]:
+    """Каждый чат: /start, затем «Согласен» — после него пользователь ждёт ввода телефона (FSM)."""
+    updates = []
+    for text in ("/start", "✅ Согласен"):
+        for i in range(chats):
+            chat_id = 5_000_000 + i
+            update_id = len(updates) + 1
+            updates.append({
+                "update_id": update_id,
+                "message": {
+                    "message_id": update_id,
+                    "date": int(time.time()),
+                    "chat": {"id": chat_id, "type": "private"},
+                    "from": {"id": chat_id, "is_bot": False, "first_name": "Shutdown"},
+                    "text": text,
+                },
+            })
+    return updates
+
+
+async def _child(args):
+    logging.basicConfig(level=logging.INFO)
+    import main
+    from aiogram.methods import GetUpdates, SendMessage
+    from aiogram.types import Update
+    from bench.fake_bot import FakeSession
+
+    raw = _updates(args.chats)
+    state_file = os.path.join(args.workdir, "telegram.json")
+
+    class PollingSession(FakeSession):
+        """
+        Фейковый getUpdates: offset подтверждает всё, что ниже, и хранится в файле —
+        следующий запуск получит только неподтверждённые апдейты.
+        """
+
+        def __init__(self, latency: float):
+            super().__init__(latency=latency)
+            self.handler_replies = 0
+            with open(state_file) as f:
+                self.acked = json.load(f)["acked"]
+
+        def _confirm(self, offset: int):
+            self.acked = max(self.acked, offset)
+            with open(state_file, "w") as f:
+                json.dump({"acked": self.acked}, f)
+
+        async def make_request(self, bot, method, timeout=None):
+            if isinstance(method, SendMessage) and not (method.text or "").startswith("🛠"):
+                self.handler_replies += 1
+            if not isinstance(method, GetUpdates):
+                return await super().make_request(bot, method, timeout)
+            if method.offset:
+                self._confirm(method.offset)
+            batch = [u for u in raw if u["update_id"] >= self.acked][: method.limit or 100]
+            _mark(args.workdir, "empty" if not batch else "started")
+            if not batch:
+                await asyncio.sleep(method.timeout or 0)
+                return []
+            return [Update.model_validate(u, context={"bot": bot}) for u in batch]
+
+    session = PollingSession(latency=args.api_latency_ms / 1000)
+    report = await main.start(session=session)
+    print(json.dumps({
+        "acked": session.acked,
+        "replies": session.handler_replies,
+        "handlers_drained": report.handlers_drained,
+        "handlers_abandoned": report.handlers_abandoned,
+        "outbox_sent": report.outbox_sent,
+        "outbox_left": report.outbox_left,
+        "fsm_saved": report.fsm_saved,
+    }))
+
+
+def _mark(workdir: str, stage: str):
+    path = os.path.join(workdir, stage)
+    if not os.path.exists(path):
+        open(path, "w").close()
+
+
+# ─── Сценарии ────────────────────────────────────────────────────────────────
+
+def _run_bot(args, workdir: str, stop_on: str, delay: float = 0.0, before_stop=None) -> tuple[dict, float]:
+    """Запускает бота, шлёт SIGTERM через delay после отметки stop_on (started/empty)."""
+    for stage in ("started", "empty"):
+        if os.path.exists(os.path.join(workdir, stage)):
+            os.remove(os.path.join(workdir, stage))
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(workdir, 'bot.sqlite')}",
+        TELEGRAM_BOT_TOKEN="123456:SHUTDOWN-BENCHMARK",
+        FSM_SNAPSHOT_FILE=os.path.join(workdir, "fsm.json"),
+        SHUTDOWN_TIMEOUT=str(args.timeout),
+        POLLING_TASKS_LIMIT=str(args.tasks_limit),
+        THROTTLE_BURST="100",
+    )
+    env.pop("WEBHOOK_URL", None)
+    env.pop("BOT_PROCESSES", None)
+    child = subprocess.Popen(
+        [sys.executable, "-m", "bench.shutdown", "--child", "--chats", str(args.chats),
+         "--api-latency-ms", str(args.api_latency_ms), "--workdir", workdir],
+        cwd=ROOT, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True,
+    )
+    while not os.path.exists(os.path.join(workdir, stop_on)):
+        if child.poll() is not None:
+            raise RuntimeError(child.stderr.read())
+        time.sleep(0.02)
+    time.sleep(delay)
+    if before_stop:
+        before_stop()
+    stopped = time.perf_counter()
+    child.send_signal(signal.SIGTERM)
+    out, err = child.communicate(timeout=args.timeout + 30)
+    elapsed = time.perf_counter() - stopped
+    if child.returncode != 0:
+        raise RuntimeError(err)
+    if args.verbose:
+        print(err)
+    return json.loads(out.strip().splitlines()[-1]), elapsed
+
+
+def _emit_outbox(db_path: str, count: int):
+    conn = sqlite3.connect(db_path)
+    now = datetime.utcnow().isoformat(sep=" ")
+    conn.executemany(
+        "INSERT INTO order_events (dedup_key, order_id, telegram_id, kind, payload, created_at, attempts) "
+        "VALUES (?, ?, ?, 'status_changed', ?, ?, 0)",
+        [(f"bench-{i}", 1_000_000 + i, 5_000_000 + i, json.dumps({"label": "Готов"}), now)
+         for i in range(count)],
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chats", type=int, default=40)
+    parser.add_argument("--api-latency-ms", type=int, default=200)
+    parser.add_argument("--tasks-limit", type=int, default=10, help="POLLING_TASKS_LIMIT")
+    parser.add_argument("--stop-after", type=float, default=1.0, help="SIGTERM через столько секунд после старта polling")
+    parser.add_argument("--timeout", type=float, default=8.0, help="SHUTDOWN_TIMEOUT для бота")
+    parser.add_argument("--outbox", type=int, default=10, help="уведомлений в outbox перед SIGTERM")
+    parser.add_argument("--verbose", action="store_true", help="показать лог бота")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        asyncio.run(_child(args))
+        return
+
+    workdir = tempfile.mkdtemp(prefix="shutdown_bench_")
+    db_path = os.path.join(workdir, "bot.sqlite")
+    with open(os.path.join(workdir, "telegram.json"), "w") as f:
+        json.dump({"acked": 0}, f)
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    sys.path.insert(0, ROOT)
+    from db.database import init_db
+    init_db()
+
+    total = args.chats * 2
+    first, elapsed = _run_bot(args, workdir, "started", args.stop_after,
+                              before_stop=lambda: _emit_outbox(db_path, args.outbox))
+    abandoned = first["handlers_abandoned"]
+    print(f"SIGTERM:  остановка {elapsed:.1f} с (лимит {args.timeout:g} с), хендлеров дообработано "
+          f"{first['handlers_drained']}, брошено {len(abandoned)}; ответов {first['replies']} из {total}, "
+          f"подтверждено до {first['acked']}")
+    print(f"          outbox: отправлено {first['outbox_sent']}, осталось {first['outbox_left']}; "
+          f"FSM-состояний в снимке {first['fsm_saved']}")
+
+    second, _ = _run_bot(args, workdir, "empty")
+    replies = first["replies"] + second["replies"]
+    print(f"рестарт:  дообработано апдейтов {second['replies']}, всего ответов {replies} из {total}; "
+          f"FSM-состояний в снимке {second['fsm_saved']}")
+
+    ok = elapsed < args.timeout + 3
+    if not abandoned:
+        # без брошенных — ровно один ответ на апдейт, ни один не потерян и не повторён
+        ok &= replies == total and second["fsm_saved"] == args.chats
+        ok &= first["outbox_left"] == 0 and first["outbox_sent"] >= args.outbox
+    print("OK" if ok else "ОШИБКА")
+    shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# bot/cluster.py
+
+import asyncio
+import logging
+import queue
+from multiprocessing.queues import Queue as ProcessQueue
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+
+from bot.webhook import UpdateWorkerPool, extract_chat_id
+
+logger = logging.getLogger(__name__)
+
+
+def shard_for(update: dict, shards: int) -> int:
+    """
+    Номер процесса для апдейта: все апдейты одного чата попадают в один
+    процесс — там его FSM-состояние и очередь чата в UpdateWorkerPool.
+    """
+    chat_id = extract_chat_id(update)
+    if chat_id is None:
+        chat_id = update.get("update_id", 0)
+    return chat_id % shards
+
+
+class ShardRouter:
+    """
+    Раскладывает сырые апдейты по очередям процессов-шардов. Интерфейс тот же,
+    что у UpdateWorkerPool, поэтому вебхук отдаёт апдейты роутеру без изменений:
+    submit() возвращает False, если очередь шарда заполнена.
+    """
+
+    def __init__(self, queues: list[ProcessQueue]):
+        self.queues = queues
+        self.accepted = 0
+        self.shed = 0
+
+    def submit(self, update: dict) -> bool:
+        try:
+            self.queues[shard_for(update, len(self.queues))].put_nowait(update)
+        except queue.Full:
+            self.shed += 1
+            return False
+        self.accepted += 1
+        return True
+
+    def start(self):
+        pass
+
+    async def stop(self, drain: bool = True, timeout: float | None = None) -> int:
+        # None — сигнал шарду дообработать свою очередь и остановиться;
+        # в заполненную очередь не ждём — при остановке шард получает ещё и SIGTERM
+        for q in self.queues:
+            try:
+                q.put_nowait(None)
+            except queue.Full:
+                pass
+        return 0
+
+
+async def ack_updates(bot: Bot, offset: int | None):
+    """
+    Подтверждает Telegram апдейты до offset (не включая). Long polling
+    подтверждает пачку только следующим getUpdates, поэтому без этого после
+    остановки последняя уже обработанная пачка пришла бы повторно.
+    """
+    if offset is None:
+        return
+    try:
+        await bot.get_updates(offset=offset, timeout=0, limit=1)
+    except Exception as e:
+        logger.warning("Не удалось подтвердить апдейты до %s: %s", offset, e)
+
+
+async def poll_into(bot: Bot, router: ShardRouter, allowed_updates: list[str] | None = None,
+                    timeout: int = 30):
+    """
+    Long polling в процессе-роутере: апдейты не обрабатываются здесь,
+    а уходят в шарды. Если очередь шарда полна, ждём — Telegram хранит
+    неподтверждённые апдейты, пока мы не сдвинем offset. При отмене
+    подтверждает всё, что уже отдано шардам.
+    """
+    offset = None
+    backoff = 1.0
+    try:
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=timeout, allowed_updates=allowed_updates)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                logger.warning("getUpdates: %s, повтор через %.0f с", e, backoff)
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+            backoff = 1.0
+            for update in updates:
+                raw = update.model_dump(mode="json", exclude_none=True)
+                while not router.submit(raw):
+                    await asyncio.sleep(0.05)
+                offset = update.update_id + 1
+    except asyncio.CancelledError:
+        await ack_updates(bot, offset)
+        raise
+
+
+async def consume_shard_queue(updates: ProcessQueue, pool: UpdateWorkerPool, stop: asyncio.Event | None = None):
+    """
+    Перекладывает апдейты из межпроцессной очереди в пул воркеров шарда до
+    сигнала None от роутера или stop. Пул останавливает вызывающий.
+    """
+    stop = stop or asyncio.Event()
+    while not stop.is_set():
+        try:
+            # с таймаутом, чтобы поток не висел в get() после остановки
+            update = await asyncio.to_thread(updates.get, timeout=0.5)
+        except queue.Empty:
+            continue
+        if update is None:
+            break
+        while not pool.submit(update):
+            await asyncio.sleep(0.01)
+
+
+def drop_shard_queue(updates: ProcessQueue) -> int:
+    """Выбирает из межпроцессной очереди то, что шард уже не обработает. Возвращает число апдейтов."""
+    dropped = 0
+    while True:
+        try:
+            dropped += updates.get_nowait() is not None
+        except queue.Empty:
+            return dropped
@@ -17,10 +17,12 @@ def register_edit_order_handlers(dp: Dispatcher):
     async def start_edit_order(message: Message, state: FSMContext):
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
-        last_order = db.query(Order).filter_by(user_id=user.id).order_by(Order.created_at.desc()).first()
+        last_status = (
+            db.query(Order.status).filter_by(user_id=user.id).order_by(Order.created_at.desc()).limit(1).scalar()
+        )
         db.close()
 
-        if not last_order or last_order.status != "новый":
+        if last_status != "новый":
             await message.answer("Вы можете редактировать только активный (новый) заказ.")
             return
 
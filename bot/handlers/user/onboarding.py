@@ -19,9 +19,14 @@ def register_user_handlers(dp: Dispatcher):
     async def start(message: Message, state: FSMContext):
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
+        registered = bool(user and user.full_name and user.phone_number)
+        if user and not user.is_active:
+            # снова написал боту — значит, разблокировал; возвращаем в рассылки
+            user.is_active = True
+            db.commit()
         db.close()
 
-        if user and user.full_name and user.phone_number:
+        if registered:
             await message.answer("✅ Вы уже зарегистрированы. Вот главное меню:", reply_markup=main_menu_keyboard())
             return
 
@@ -5,11 +5,15 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKe
 from aiogram.enums.parse_mode import ParseMode
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
-from sqlalchemy import desc
-from sqlalchemy.orm.attributes import flag_modified
-from db.database import SessionLocal, Order, User, OrderStatus, PickupPoint
+from sqlalchemy import select
+from db.database import SessionLocal, Order, User
+from bot.services.order_cards import OrderCard, order_card, user_order_cards
+from bot.services.order_ids import order_code, parse_order_id
+from bot.services.pricing import FORMATS
+from bot.services.reference import get_statuses, get_status_label, get_status_code, get_pickup_points, get_pickup_point
+from bot.services.repricing import edit_order_photos
 
-FORMATS = ["10x15", "13x18", "15x21", "21x30 (A4)", "30x40", "30x45"]
+PAID_EDIT_REFUSED = "❗ Заказ уже оплачен — формат и количество копий изменить нельзя."
 
 class OrdersFSM(StatesGroup):
     choosing_status = State()
@@ -20,31 +24,33 @@ class OrdersFSM(StatesGroup):
     confirming_cancel = State()
     editing_pickup = State()
 
-def get_status_code(db, label_substring: str) -> str:
-    status = db.query(OrderStatus).filter(OrderStatus.label.contains(label_substring)).first()
-    return status.code if status else "new"
+def _order_card_text(o: OrderCard) -> str:
+    photo_lines = [
+        f"• {p['filename']} — {p['format']}, {p['copies']} коп."
+        for p in o.photos
+    ]
+    price_str = f"{float(o.price):.2f}".rstrip("0").rstrip(".")
+    payment_str = "❗ Не оплачен" if not o.paid else "✅ Оплачен"
+    return (
+        f"🆔 <code>{order_code(o)}</code>  📅 {o.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+        f"🖼 Фото: {len(o.photos)} шт.\n"
+        + "\n".join(photo_lines) + "\n"
+        f"💰 {price_str} ₽ — {payment_str}\n"
+        f"📍 {o.delivery_point or 'Пункт не выбран'}\n"
+        f"👤 Получатель: {o.receiver_name or '—'}\n"
+        f"📞 Телефон: {o.receiver_phone or '—'}\n"
+        f"💬 {o.comment or '—'}\n\n"
+    )
 
-async def _send_orders_list(message: Message, orders: list[Order], status_label: str, page: int):
+async def _send_orders_list(message: Message, orders: list[OrderCard], status_label: str, page: int):
     text = f"<b>📦 Заказы — {status_label}</b>\n\n"
     kb = InlineKeyboardMarkup(inline_keyboard=[])
 
     for o in orders:
-        photo_lines = [
-            f"• {p['filename']} — {p['format']}, {p['copies']} коп."
-            for p in o.photos
-        ]
-        price_str = f"{float(o.price):.2f}".rstrip("0").rstrip(".")
-        payment_str = "❗ Не оплачен" if not o.paid else "✅ Оплачен"
-        text += (
-            f"🆔 <code>{o.order_id[:8]}</code>  📅 {o.created_at.strftime('%d.%m.%Y %H:%M')}\n"
-            f"🖼 Фото: {len(o.photos)} шт.\n"
-            + "\n".join(photo_lines) + "\n"
-            f"💰 {price_str} ₽ — {payment_str}\n"
-            f"📍 {o.delivery_point or 'Пункт не выбран'}\n"
-            f"👤 Получатель: {o.receiver_name or '—'}\n"
-            f"📞 Телефон: {o.receiver_phone or '—'}\n"
-            f"💬 {o.comment or '—'}\n\n"
-        )
+        text += _order_card_text(o)
+        if o.archived:
+            # заказ из архива только показываем
+            continue
         # Изменить / Отменить
         kb.inline_keyboard.append([
             InlineKeyboardButton(text="✏ Изменить", callback_data=f"edit:{o.order_id}"),
@@ -70,9 +76,7 @@ async def _send_orders_list(message: Message, orders: list[Order], status_label:
 def register_orders_handlers(dp: Dispatcher):
     @dp.message(F.text == "📦 Мои заказы")
     async def choose_status(message: Message, state: FSMContext):
-        db = SessionLocal()
-        statuses = db.query(OrderStatus).order_by(OrderStatus.sort_order).all()
-        db.close()
+        statuses = get_statuses()
         kb_rows = [[InlineKeyboardButton(text=s.label, callback_data=f"status:{s.code}")] for s in statuses]
         await message.answer(
             "📦 Выберите категорию заказов:",
@@ -85,14 +89,7 @@ def register_orders_handlers(dp: Dispatcher):
         status_code = callback_query.data.split(":", 1)[1]
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=callback_query.from_user.id).first()
-        status = db.query(OrderStatus).filter_by(code=status_code).first()
-        orders = (
-            db.query(Order)
-            .filter_by(user_id=user.id, status=status_code)
-            .order_by(desc(Order.created_at))
-            .limit(1)
-            .all()
-        )
+        orders = user_order_cards(db, user.id, status_code, 0)
         db.close()
 
         if not orders:
@@ -101,43 +98,14 @@ def register_orders_handlers(dp: Dispatcher):
             return
 
         await state.update_data(status_filter=status_code, page=0)
-        await _send_orders_list(callback_query.message, orders, status.label, 0)
+        await _send_orders_list(callback_query.message, orders, get_status_label(status_code), 0)
         await state.set_state(OrdersFSM.browsing_orders)
 
-    @dp.callback_query(F.data.startswith("pay:"), OrdersFSM.browsing_orders)
-    async def pay_order(callback_query: CallbackQuery, state: FSMContext):
-        order_id = callback_query.data.split(":",1)[1]
-        db = SessionLocal()
-        order = db.query(Order).filter_by(order_id=order_id).first()
-        if order and not order.paid:
-            order.paid = True
-            db.commit()
-            await callback_query.answer("✅ Заказ оплачен.", show_alert=True)
-        else:
-            await callback_query.answer("❗ Невозможно оплатить этот заказ.", show_alert=True)
-
-        # Обновляем список на той же странице
-        data = await state.get_data()
-        status_code = data.get("status_filter")
-        page = data.get("page", 0)
-        user = db.query(User).filter_by(telegram_id=callback_query.from_user.id).first()
-        orders = (
-            db.query(Order)
-            .filter_by(user_id=user.id, status=status_code)
-            .order_by(desc(Order.created_at))
-            .offset(page * 1)
-            .limit(1)
-            .all()
-        )
-        status_label = db.query(OrderStatus).filter_by(code=status_code).first().label
-        db.close()
-        await _send_orders_list(callback_query.message, orders, status_label, page)
+    # Оплата (кнопка «💳 Оплатить») — в payment_handlers.py
 
     @dp.callback_query(F.data == "back:status")
     async def back_to_status(callback_query: CallbackQuery, state: FSMContext):
-        db = SessionLocal()
-        statuses = db.query(OrderStatus).order_by(OrderStatus.sort_order).all()
-        db.close()
+        statuses = get_statuses()
         kb_rows = [[InlineKeyboardButton(text=s.label, callback_data=f"status:{s.code}")] for s in statuses]
         await callback_query.message.edit_text(
             "📦 Выберите категорию заказов:",
@@ -156,28 +124,20 @@ def register_orders_handlers(dp: Dispatcher):
 
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=callback_query.from_user.id).first()
-        status = db.query(OrderStatus).filter_by(code=status_code).first()
-        orders = (
-            db.query(Order)
-            .filter_by(user_id=user.id, status=status_code)
-            .order_by(desc(Order.created_at))
-            .offset(new_page*1)
-            .limit(1)
-            .all()
-        )
+        orders = user_order_cards(db, user.id, status_code, new_page)
         db.close()
         if not orders:
             await callback_query.answer("Больше нет заказов.", show_alert=True)
             return
         await state.update_data(page=new_page)
-        await _send_orders_list(callback_query.message, orders, status.label, new_page)
+        await _send_orders_list(callback_query.message, orders, get_status_label(status_code), new_page)
         await callback_query.answer()
 
     @dp.callback_query(F.data.startswith("cancel:"), OrdersFSM.browsing_orders)
     async def cancel_order_callback(callback_query: CallbackQuery, state: FSMContext):
-        order_id = callback_query.data.split(":",1)[1]
+        order_id = parse_order_id(callback_query.data.split(":",1)[1])
         db = SessionLocal()
-        order = db.query(Order).filter_by(order_id=order_id).first()
+        order = db.get(Order, order_id) if order_id else None
         user = db.query(User).filter_by(telegram_id=callback_query.from_user.id).first()
         if order:
             folder = f"uploads/{user.telegram_id}/{order.order_id}"
@@ -188,23 +148,13 @@ def register_orders_handlers(dp: Dispatcher):
             data = await state.get_data()
             status_code = data.get("status_filter")
             page = data.get("page",0)
-            status = db.query(OrderStatus).filter_by(code=status_code).first()
-            orders = (
-                db.query(Order)
-                .filter_by(user_id=user.id, status=status_code)
-                .order_by(desc(Order.created_at))
-                .offset(page*1)
-                .limit(1)
-                .all()
-            )
+            orders = user_order_cards(db, user.id, status_code, page)
             db.close()
             await callback_query.answer("Заказ отменён.", show_alert=True)
             if orders:
-                await _send_orders_list(callback_query.message, orders, status.label, page)
+                await _send_orders_list(callback_query.message, orders, get_status_label(status_code), page)
             else:
-                db2 = SessionLocal()
-                statuses = db2.query(OrderStatus).order_by(OrderStatus.sort_order).all()
-                db2.close()
+                statuses = get_statuses()
                 kb_rows = [[InlineKeyboardButton(text=s.label, callback_data=f"status:{s.code}")] for s in statuses]
                 await callback_query.message.edit_text(
                     "❗ Заказы не найдены в этой категории.",
@@ -248,40 +198,60 @@ def register_orders_handlers(dp: Dispatcher):
 
     async def _apply_edit_common(source_msg: Message, state: FSMContext):
         data = await state.get_data()
-        order_id = data['editing_order_id']
+        order_id = parse_order_id(data['editing_order_id'])
         field    = data['editing_field']
         new_value= data['editing_value']
 
         db = SessionLocal()
-        order = db.query(Order).filter_by(order_id=order_id).first()
+        order = db.get(Order, order_id) if order_id else None
         if not order:
             await source_msg.answer("❗ Заказ не найден.")
             db.close()
             await state.clear()
             return
 
+        if field in ('format', 'copies') and order.paid:
+            await source_msg.answer(PAID_EDIT_REFUSED)
+            db.close()
+            await state.clear()
+            return
+
+        old_price = None
         if field == 'receiver_phone':
             order.receiver_phone = new_value
         elif field == 'receiver_name':
             order.receiver_name = new_value
         elif field == 'format' and order.status == 'new':
-            for photo in order.photos:
-                photo['format'] = new_value
-            flag_modified(order, 'photos')
+            # цена пересчитывается по сводке заказа, без повторного прохода по фото
+            old_price = edit_order_photos(order, fmt=new_value)
         elif field == 'copies' and order.status == 'new':
             try:
                 cnt = int(new_value)
-                for photo in order.photos:
-                    photo['copies'] = cnt
-                flag_modified(order, 'photos')
+                if cnt < 1:
+                    raise ValueError
             except ValueError:
                 await source_msg.answer("❗ Введите корректное число.")
                 db.close()
                 return
+            old_price = edit_order_photos(order, copies=cnt)
 
+        if old_price is not None:
+            # оплата могла прийти после чтения заказа: запись уже держит блокировку,
+            # поэтому свежее значение paid здесь окончательное
+            db.flush()
+            if db.scalar(select(Order.paid).where(Order.order_id == order_id)):
+                db.rollback()
+                db.close()
+                await source_msg.answer(PAID_EDIT_REFUSED)
+                await state.clear()
+                return
         db.commit()
-        updated = db.query(Order).filter_by(order_id=order_id).first()
+        updated = order_card(db, order_id)
         db.close()
+        price_note = (
+            f" (было {old_price:.2f} ₽)"
+            if old_price is not None and round(float(updated.price), 2) != round(old_price, 2) else ""
+        )
 
         # подготовка и отправка финального сообщения с кнопками
         photo_lines = [
@@ -290,10 +260,10 @@ def register_orders_handlers(dp: Dispatcher):
         ]
         res_text = (
             f"<b>✅ Изменения сохранены</b>\n\n"
-            + f"🆔 <code>{updated.order_id[:8]}</code>  📅 {updated.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+            + f"🆔 <code>{order_code(updated)}</code>  📅 {updated.created_at.strftime('%d.%m.%Y %H:%M')}\n"
             + f"🖼 Фото: {len(updated.photos)} шт.\n"
             + "\n".join(photo_lines) + "\n"
-            + f"💰 {float(updated.price):.2f} ₽\n"
+            + f"💰 {float(updated.price):.2f} ₽{price_note}\n"
             + f"📍 {updated.delivery_point or 'Пункт не выбран'}\n"
             + f"👤 {updated.receiver_name or '—'}\n"
             + f"📞 {updated.receiver_phone or '—'}\n"
@@ -308,10 +278,8 @@ def register_orders_handlers(dp: Dispatcher):
 
     @dp.callback_query(F.data.startswith("editpp:"), OrdersFSM.editing_field_choice)
     async def edit_pickup(callback_query: CallbackQuery, state: FSMContext):
-        order_id = callback_query.data.split(":", 1)[1]
-        db = SessionLocal()
-        points = db.query(PickupPoint).all()
-        db.close()
+        order_id = parse_order_id(callback_query.data.split(":", 1)[1])
+        points = get_pickup_points()
         kb = InlineKeyboardMarkup(inline_keyboard=[])
         for p in points:
             kb.inline_keyboard.append([
@@ -328,23 +296,24 @@ def register_orders_handlers(dp: Dispatcher):
     @dp.callback_query(F.data.startswith("setpp:"), OrdersFSM.editing_pickup)
     async def set_pickup(callback_query: CallbackQuery, state: FSMContext):
         _, order_id, pp_id = callback_query.data.split(":")
+        order_id = parse_order_id(order_id)
         pp_id = int(pp_id)
         db = SessionLocal()
-        pickup = db.query(PickupPoint).filter_by(id=pp_id).first()
-        order = db.query(Order).filter_by(order_id=order_id).first()
+        pickup = get_pickup_point(pp_id)
+        order = db.get(Order, order_id) if order_id else None
 
-        if order and order.status == get_status_code(db, "Новый"):
+        if order and order.status == get_status_code("Новый"):
             order.delivery_point = pickup.name
             db.commit()
             # повторяем логику _apply_edit_common для ПВЗ
-            updated = order
+            updated = order_card(db, order_id)
             photo_lines = [
                 f"• {p['filename']} — {p['format']}, {p['copies']} коп."
                 for p in updated.photos
             ]
             res_text = (
                 f"<b>✅ Изменения сохранены</b>\n\n"
-                + f"🆔 <code>{updated.order_id[:8]}</code>  📅 {updated.created_at.strftime('%d.%m.%Y %H:%M')}\n"
+                + f"🆔 <code>{order_code(updated)}</code>  📅 {updated.created_at.strftime('%d.%m.%Y %H:%M')}\n"
                 + f"🖼 Фото: {len(updated.photos)} шт.\n"
                 + "\n".join(photo_lines) + "\n"
                 + f"💰 {float(updated.price):.2f} ₽\n"
@@ -1,44 +1,65 @@
+import asyncio
+
 from aiogram import Dispatcher, F
 from aiogram.types import CallbackQuery
 from aiogram.fsm.context import FSMContext
-from db.database import SessionLocal, OrderStatus, User
-from bot.services.payment import mark_order_paid
+from db.database import SessionLocal, Order, User
+from bot.services.order_cards import user_order_cards
+from bot.services.order_ids import parse_order_id
+from bot.services.reference import get_status_label
+from bot.services.payment import PaymentResult, mark_order_paid
+from bot.tasks.order_status_updater import wake_status_updater
 from .orders import _send_orders_list  # чтобы обновить карточку после оплаты
 
+_ANSWERS = {
+    "applied":      ("✅ Заказ оплачен.", False),
+    "duplicate":    ("✅ Заказ уже оплачен.", False),
+    "already_paid": ("✅ Заказ уже оплачен.", False),
+}
+
+def _pay_order(telegram_id: int, order_id: int, status_code: str | None, page: int) -> tuple[PaymentResult | None, list]:
+    """
+    Синхронная часть нажатия «Оплатить» — выполняется в потоке, чтобы запросы
+    к базе не останавливали цикл событий. None — заказ не найден или чужой;
+    иначе результат оплаты и карточки для перерисовки списка.
+    """
+    db = SessionLocal()
+    try:
+        user = db.query(User).filter_by(telegram_id=telegram_id).first()
+        owned = user and order_id and db.query(Order.order_id).filter_by(order_id=order_id, user_id=user.id).first()
+        if not owned:
+            return None, []
+        # то же идемпотентное применение, что и у вебхука провайдера
+        result = mark_order_paid(order_id)
+        # Перезагружаем список заказов на той же странице
+        orders = user_order_cards(db, user.id, status_code, page) if status_code else []
+        return result, orders
+    finally:
+        db.close()
+
 class PaymentHandlers:
     @staticmethod
     def register(dp: Dispatcher):
+        # единственный обработчик префикса pay: — кнопка работает в любом состоянии,
+        # в том числе на старых карточках заказов
         @dp.callback_query(F.data.startswith("pay:"))
         async def pay_order_callback(callback: CallbackQuery, state: FSMContext):
-            order_id = callback.data.split(":", 1)[1]
-            # Обновляем в БД
-            updated_order = await mark_order_paid(order_id)
-            if not updated_order:
-                await callback.answer("❗ Заказ не найден.", show_alert=True)
-                return
-
-            # Берем текущую категорию и страницу из state
+            order_id = parse_order_id(callback.data.split(":", 1)[1])
             data = await state.get_data()
             status_code = data.get("status_filter")
             page = data.get("page", 0)
 
-            # Перезагружаем список заказов
-            db = SessionLocal()
-            user = db.query(User).filter_by(telegram_id=callback.from_user.id).first()
-            status = db.query(OrderStatus).filter_by(code=status_code).first()
-            orders = (
-                db.query(updated_order.__class__)
-                  .filter_by(user_id=user.id, status=status_code)
-                  .order_by(updated_order.__class__.created_at.desc())
-                  .offset(page * 3)
-                  .limit(3)
-                  .all()
-            )
-            db.close()
-
-            # Обновляем карточку списка
-            await _send_orders_list(callback.message, orders, status.label, page)
-            await callback.answer("✅ Оплата проведена", show_alert=False)
+            result, orders = await asyncio.to_thread(_pay_order, callback.from_user.id, order_id, status_code, page)
+            if result is None:
+                await callback.answer("❗ Заказ не найден.", show_alert=True)
+                return
+            if result.outcome == "applied":
+                wake_status_updater()
+            text, alert = _ANSWERS.get(result.outcome, ("❗ Невозможно оплатить этот заказ.", True))
+
+            if orders:
+                await _send_orders_list(callback.message, orders, get_status_label(status_code), page)
+            await callback.answer(text, show_alert=alert)
 
 # регистрация
 
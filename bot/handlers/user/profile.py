@@ -4,6 +4,8 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from db.database import SessionLocal, User
 from bot.keyboards.common import main_menu_keyboard
+from bot.services.account_deletion import request_account_deletion
+from bot.tasks.account_purge import wake_account_purge
 
 class ProfileEdit(StatesGroup):
     waiting_for_new_fullname = State()
@@ -102,8 +104,10 @@ def register_profile_handlers(dp: Dispatcher):
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
         if user:
-            db.delete(user)
+            # заказы и файлы сотрёт фоновая очистка, здесь — одна короткая транзакция
+            request_account_deletion(db, user)
             db.commit()
+            wake_account_purge()
             await message.answer("❌ Ваш аккаунт удалён. Для повторной регистрации используйте /start", reply_markup=ReplyKeyboardRemove())
         else:
             await message.answer("Аккаунт не найден.")
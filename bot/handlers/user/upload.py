@@ -1,8 +1,8 @@
 # bot/handlers/user/upload.py
 
-import uuid
 import shutil
 import os
+import time
 from datetime import datetime
 
 from aiogram import Dispatcher, F
@@ -20,14 +20,34 @@ from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import StatesGroup, State
 from sqlalchemy import desc
 
-from db.database import SessionLocal, Order, User, OrderStatus, PickupPoint
-from bot.services.storage import save_photo_to_order_folder
-from bot.services.pricing import calculate_order_price, PromoError
+from db.database import SessionLocal, Order, User
+from bot.services.order_ids import new_order_id, order_code
+from bot.services.storage import rename_order_folder, save_photo_to_order_folder
+from bot.services.pricing import (
+    FORMATS,
+    PromoError,
+    get_price_table,
+    personal_discount,
+    price_summary,
+    summary_totals,
+)
+from bot.services.promo import FIRST_ORDER_PERCENT
 from bot.services.maps import get_nearest_pickup_points
+from bot.services.reference import get_status_code, get_pickup_point
 from bot.keyboards.common import main_menu_keyboard
+from bot.services.metrics import UPLOAD_BYTES, UPLOAD_LATENCY
+from bot.services.tracing import span
+
 
-# Supported print formats
-FORMATS = ["10x15", "13x18", "15x21", "21x30 (A4)", "30x40", "30x45"]
+def _rehome_legacy_upload(telegram_id: int, order_id: str, photos: list[dict]) -> tuple[int, list[dict]]:
+    """
+    Загрузка, начатая до перехода на Snowflake, хранит в FSM uuid-ключ:
+    заказ получает новый ключ, папка с фото и пути в photos переносятся под него.
+    """
+    new_id = new_order_id()
+    rename_order_folder(telegram_id, order_id, new_id)
+    photos = [{**p, "path": p["path"].replace(order_id, str(new_id))} for p in photos]
+    return new_id, photos
 
 
 class UploadFSM(StatesGroup):
@@ -39,20 +59,11 @@ class UploadFSM(StatesGroup):
     choosing_pickup_point    = State()
 
 
-def get_status_code(db, label_substring: str) -> str:
-    status = (
-        db.query(OrderStatus)
-          .filter(OrderStatus.label.contains(label_substring))
-          .first()
-    )
-    return status.code if status else "new"
-
-
 def register_upload_handlers(dp: Dispatcher):
     # 1) Старт: “📂 Загрузить фото”
     @dp.message(F.text == "📂 Загрузить фото")
     async def start_upload(message: Message, state: FSMContext):
-        order_id = str(uuid.uuid4())
+        order_id = new_order_id()
         await state.update_data(order_id=order_id, photos=[])
         await message.answer(
             "📥 Отправьте фото <b>файлом</b> для сохранения качества.",
@@ -73,13 +84,19 @@ def register_upload_handlers(dp: Dispatcher):
             return
 
         data = await state.get_data()
-        file_bytes = await message.bot.download(doc)
+        started = time.perf_counter()
+        with span("telegram.download", "telegram", bytes=doc.file_size):
+            file_bytes = (await message.bot.download(doc)).read()
+        downloaded = time.perf_counter()
         filepath = save_photo_to_order_folder(
             message.from_user.id,
             data["order_id"],
             doc.file_name,
-            file_bytes.read(),
+            file_bytes,
         )
+        UPLOAD_BYTES.inc(len(file_bytes))
+        UPLOAD_LATENCY.observe(downloaded - started, stage="download")
+        UPLOAD_LATENCY.observe(time.perf_counter() - downloaded, stage="save")
         await state.update_data(
             current_file_path=filepath,
             current_filename=doc.file_name
@@ -183,6 +200,9 @@ def register_upload_handlers(dp: Dispatcher):
         comment = message.text.strip() if message.text.lower() != "без комментариев" else ""
         photos = data.get("photos", [])
         order_id = data.get("order_id")
+        if isinstance(order_id, str):
+            order_id, photos = _rehome_legacy_upload(message.from_user.id, order_id, photos)
+            await state.update_data(order_id=order_id, photos=photos)
 
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
@@ -192,17 +212,17 @@ def register_upload_handlers(dp: Dispatcher):
             await state.clear()
             return
 
-        # 1) Считаем базовую сумму (raw_total), учитываем threshold-скидку (по DISCOUNT_THRESHOLDS)
-        raw, after_threshold, thresh_disc = calculate_order_price(photos)
+        # 1) Сводка по действующему прайс-листу: копии и суммы по форматам, скидка за объём
+        table = get_price_table()
+        pricing = price_summary(photos, table)
 
         # 2) Если первый заказ (first_order_paid == False) — сразу даём 30%:
         if not user.first_order_paid:
-            first_discount_amount = round(after_threshold * 0.30, 2)
-            final_price = round(after_threshold - first_discount_amount, 2)
-            total_discount = round(thresh_disc + first_discount_amount, 2)
+            pricing["personal"] = personal_discount("first_order", FIRST_ORDER_PERCENT)
+            _, final_price, total_discount = summary_totals(pricing, table)
 
             # Сохраняем заказ и сразу флагируем у пользователя, что первый заказ сделан
-            status_code = get_status_code(db, "Новый")
+            status_code = get_status_code("Новый")
             new_order = Order(
                 order_id=order_id,
                 user_id=user.id,
@@ -210,6 +230,8 @@ def register_upload_handlers(dp: Dispatcher):
                 comment=comment,
                 price=final_price,
                 discount=total_discount,
+                price_version=table.version,
+                pricing=pricing,
                 status=status_code,
                 paid=False,
                 receiver_name=user.full_name,
@@ -247,8 +269,8 @@ def register_upload_handlers(dp: Dispatcher):
         # 3) Если НЕ первый заказ → спрашиваем промокод, показываем кнопку «Пропустить»
         db.close()
         await state.update_data(
-            raw_price=after_threshold,
-            threshold_discount=thresh_disc,
+            price_version=table.version,
+            pricing=pricing,
             comment=comment,
             photos=photos  # сохраняем список фото, чтобы не потерять
         )
@@ -267,29 +289,28 @@ def register_upload_handlers(dp: Dispatcher):
     @dp.message(UploadFSM.waiting_for_promocode, F.text)
     async def apply_promocode(message: Message, state: FSMContext):
         data = await state.get_data()
-        raw_after_threshold = data.get("raw_price", 0.0)
-        threshold_discount = data.get("threshold_discount", 0.0)
         comment = data.get("comment", "")
         order_id = data.get("order_id")
         photos = data.get("photos", [])
+        if isinstance(order_id, str):
+            order_id, photos = _rehome_legacy_upload(message.from_user.id, order_id, photos)
+            await state.update_data(order_id=order_id, photos=photos)
+        table = get_price_table(data.get("price_version"))
+        # сводку посчитали на шаге комментария; в состояниях, сохранённых до сводок, её нет
+        pricing = data.get("pricing") or price_summary(photos, table)
+        _, final_price, total_discount = summary_totals(pricing, table)
 
         promo_code_text = message.text.strip().lower()
         db = SessionLocal()
         user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
-        status_code = get_status_code(db, "Новый")
-
-        # Если пользователь нажал «Пропустить» или ввёл «без промокода»
-        if promo_code_text in ("пропустить", "без промокода", "нет", "skip"):
-            final_price = raw_after_threshold
-            total_discount = threshold_discount
+        status_code = get_status_code("Новый")
 
-        else:
+        # Если пользователь нажал «Пропустить» или ввёл «без промокода» — остаётся скидка за объём
+        if promo_code_text not in ("пропустить", "без промокода", "нет", "skip"):
             # Пробуем применить промокод:
-            from bot.services.promo import validate_and_apply_promocode
+            from bot.services.promo import redeem_promocode
             try:
-                promo_total, promo_disc = validate_and_apply_promocode(promo_code_text, raw_after_threshold)
-                final_price = promo_total
-                total_discount = round(threshold_discount + promo_disc, 2)
+                percent = redeem_promocode(promo_code_text)
             except PromoError as e:
                 # Некорректный/истёкший/исчерпанный промокод — предлагаем попробовать ещё раз или пропустить
                 await message.answer(
@@ -299,6 +320,10 @@ def register_upload_handlers(dp: Dispatcher):
                 )
                 db.close()
                 return
+            pricing = {**pricing, "personal": personal_discount("promo", percent, promo_code_text)}
+            threshold_discount = total_discount
+            _, final_price, total_discount = summary_totals(pricing, table)
+            promo_disc = round(total_discount - threshold_discount, 2)
 
             # Если промокод применён, сообщаем об этом
             await message.answer(
@@ -315,6 +340,8 @@ def register_upload_handlers(dp: Dispatcher):
             comment=comment,
             price=final_price,
             discount=total_discount,
+            price_version=table.version,
+            pricing=pricing,
             status=status_code,
             paid=False,
             receiver_name=user.full_name,
@@ -383,10 +410,10 @@ def register_upload_handlers(dp: Dispatcher):
         order_id = data.get("order_id")
 
         db = SessionLocal()
-        pp = db.query(PickupPoint).filter_by(id=pp_id).first()
+        pp = get_pickup_point(pp_id)
         pp_name, pp_address = pp.name, pp.address
 
-        order = db.query(Order).filter_by(order_id=order_id).first()
+        order = db.get(Order, order_id) if order_id else None
         if order:
             order.delivery_point = pp_name
             db.commit()
@@ -401,7 +428,7 @@ def register_upload_handlers(dp: Dispatcher):
             delivery_disp= pp_name
 
             final_text = (
-                "📦 <b>Заказ сформирован</b>\n\n"
+                f"📦 <b>Заказ #{order_code(order)} сформирован</b>\n\n"
                 + "\n".join(photo_lines) + "\n\n"
                 + f"💬 Комментарий: {comment_disp}\n"
                 + f"💰 Стоимость: <b>{price_str} ₽</b> (скидка: {discount_str} ₽)\n"
@@ -0,0 +1,58 @@
+import os
+
+from aiogram import Bot, Dispatcher
+
+from bot.services.shutdown import IN_FLIGHT
+
+from .chat_lanes import ChatLaneIsolation
+from .inflight import InFlightMiddleware
+from .metrics import HandlerMetricsMiddleware, TelegramApiMetrics
+from .query_budget import QueryBudgetMiddleware
+from .throttling import ThrottlingMiddleware
+from .tracing import TracingMiddleware, TracingRequestMiddleware
+
+__all__ = [
+    "ChatLaneIsolation",
+    "HandlerMetricsMiddleware",
+    "InFlightMiddleware",
+    "QueryBudgetMiddleware",
+    "TelegramApiMetrics",
+    "ThrottlingMiddleware",
+    "TracingMiddleware",
+    "TracingRequestMiddleware",
+    "register_metrics_middlewares",
+    "register_middlewares",
+    "register_tracing_middlewares",
+]
+
+
+def register_middlewares(dp: Dispatcher):
+    # апдейты в работе — чтобы при остановке дождаться их
+    dp.update.outer_middleware(InFlightMiddleware(IN_FLIGHT))
+
+    throttling = ThrottlingMiddleware(
+        rate=float(os.getenv("THROTTLE_RATE", "1.0")),       # токенов в секунду
+        capacity=float(os.getenv("THROTTLE_BURST", "10")),   # размер ведра
+    )
+    dp.message.outer_middleware(throttling)
+    dp.callback_query.outer_middleware(throttling)
+
+    mode = os.getenv("QUERY_BUDGET_MODE", "log")
+    if mode != "off":
+        budget = QueryBudgetMiddleware(mode)
+        dp.message.middleware(budget)
+        dp.callback_query.middleware(budget)
+
+
+def register_metrics_middlewares(dp: Dispatcher, bot: Bot):
+    handler_metrics = HandlerMetricsMiddleware()
+    dp.message.middleware(handler_metrics)
+    dp.callback_query.middleware(handler_metrics)
+    bot.session.middleware(TelegramApiMetrics())
+
+
+def register_tracing_middlewares(dp: Dispatcher, bot: Bot):
+    tracing = TracingMiddleware()
+    dp.message.middleware(tracing)
+    dp.callback_query.middleware(tracing)
+    bot.session.middleware(TracingRequestMiddleware())
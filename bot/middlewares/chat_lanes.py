@@ -0,0 +1,62 @@
+# bot/middlewares/chat_lanes.py
+
+import asyncio
+from contextlib import asynccontextmanager
+from typing import AsyncGenerator, Hashable
+
+from aiogram.fsm.storage.base import BaseEventIsolation, StorageKey
+
+
+class _Lane:
+    __slots__ = ("lock", "holders")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.holders = 0
+
+
+class ChatLaneIsolation(BaseEventIsolation):
+    """
+    Отдельная упорядоченная «полоса» на каждый чат.
+
+    Апдейты одного пользователя выполняются строго друг за другом и в порядке
+    поступления (asyncio.Lock будит ожидающих по FIFO), апдейты разных
+    пользователей — параллельно. Полоса живёт, пока по ней есть апдейты
+    в работе, и удаляется вместе с последним, так что в карте не больше
+    записей, чем одновременно обрабатываемых апдейтов.
+
+    Подключается через Dispatcher(events_isolation=...): FSMContextMiddleware
+    берёт этот лок до чтения состояния, поэтому два быстрых нажатия не
+    увидят одно и то же устаревшее состояние FSM.
+    """
+
+    def __init__(self):
+        self._lanes: dict[Hashable, _Lane] = {}
+
+    @staticmethod
+    def _lane_key(key: StorageKey) -> Hashable:
+        return key.bot_id, key.chat_id, key.user_id
+
+    @asynccontextmanager
+    async def lock(self, key: StorageKey) -> AsyncGenerator[None, None]:
+        lane_key = self._lane_key(key)
+        lane = self._lanes.get(lane_key)
+        if lane is None:
+            lane = self._lanes[lane_key] = _Lane()
+        lane.holders += 1
+        try:
+            async with lane.lock:
+                yield
+        finally:
+            lane.holders -= 1
+            if lane.holders == 0:
+                del self._lanes[lane_key]
+
+    @property
+    def active_lanes(self) -> int:
+        return len(self._lanes)
+
+    async def close(self) -> None:
+        # диспетчер зовёт close() сразу после остановки polling, когда апдейты
+        # ещё дообрабатываются; полосы удаляются сами вместе с последним апдейтом
+        pass
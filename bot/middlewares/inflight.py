@@ -0,0 +1,30 @@
+# bot/middlewares/inflight.py
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+from bot.services.shutdown import InFlightTracker
+
+
+class InFlightMiddleware(BaseMiddleware):
+    """
+    Внешний middleware на update: отмечает апдейт в трекере на всё время
+    обработки, чтобы при остановке было известно, чего ждать.
+    """
+
+    def __init__(self, tracker: InFlightTracker):
+        self.tracker = tracker
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        self.tracker.enter(event.update_id if isinstance(event, Update) else 0)
+        try:
+            return await handler(event, data)
+        finally:
+            self.tracker.leave()
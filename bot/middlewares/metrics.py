@@ -0,0 +1,91 @@
+# bot/middlewares/metrics.py
+
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from bot.services.metrics import (
+    HANDLER_ERRORS,
+    HANDLER_LATENCY,
+    TELEGRAM_API_ERRORS,
+    TELEGRAM_API_LATENCY,
+    UPDATE_QUERIES,
+    current_query_count,
+)
+
+
+def handler_name(data: dict[str, Any]) -> str:
+    handler = data.get("handler")
+    callback = getattr(handler, "callback", None)
+    return getattr(callback, "__name__", "unknown")
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: к этому моменту хендлер уже выбран, поэтому
+    время работы и число SQL-запросов пишутся с меткой его имени.
+    """
+
+    def __init__(self):
+        self._children: dict[str, tuple] = {}
+
+    def _metrics_for(self, name: str) -> tuple:
+        children = self._children.get(name)
+        if children is None:
+            children = self._children[name] = (
+                HANDLER_LATENCY.labels(handler=name),
+                UPDATE_QUERIES.labels(handler=name),
+            )
+        return children
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        name = handler_name(data)
+        latency, query_count = self._metrics_for(name)
+        queries = [0]
+        token = current_query_count.set(queries)
+        start = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            HANDLER_ERRORS.inc(handler=name)
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
+            query_count.observe(queries[0])
+            current_query_count.reset(token)
+
+
+class TelegramApiMetrics(BaseRequestMiddleware):
+    """Middleware сессии бота: время и ошибки каждого вызова Bot API."""
+
+    def __init__(self):
+        self._latency: dict[type, object] = {}
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        method_type = type(method)
+        latency = self._latency.get(method_type)
+        if latency is None:
+            latency = self._latency[method_type] = TELEGRAM_API_LATENCY.labels(method=method_type.__name__)
+        start = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            TELEGRAM_API_ERRORS.inc(method=method_type.__name__, error=type(e).__name__)
+            raise
+        finally:
+            latency.observe(time.perf_counter() - start)
@@ -0,0 +1,28 @@
+# bot/middlewares/query_budget.py
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from bot.services.query_budget import QUERY_BUDGET_MODE, query_budget
+from .metrics import handler_name
+
+
+class QueryBudgetMiddleware(BaseMiddleware):
+    """
+    Записывает SQL-запросы каждого апдейта и проверяет их против бюджета
+    хендлера (см. bot.services.query_budget.QUERY_BUDGETS).
+    """
+
+    def __init__(self, mode: str = QUERY_BUDGET_MODE):
+        self.mode = mode
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with query_budget(handler_name(data), self.mode):
+            return await handler(event, data)
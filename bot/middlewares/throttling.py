@@ -0,0 +1,130 @@
+# bot/middlewares/throttling.py
+
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from bot.services.metrics import THROTTLED_UPDATES
+from bot.services.ratelimit import BucketMap
+
+# Стоимость действий в токенах. Всё, что не перечислено, стоит DEFAULT_COST.
+DEFAULT_COST = 1.0
+DOCUMENT_COST = 3.0           # скачивание файла с серверов Telegram + запись на диск
+MESSAGE_COSTS = {
+    "📦 Мои заказы": 2.0,
+    "✅ Завершить и оформить заказ": 2.0,
+}
+CALLBACK_COSTS = {
+    "pay:": 2.0,
+    "cancel:": 2.0,
+    "status:": 1.5,
+    "page:": 1.5,
+}
+
+
+def action_cost(event: TelegramObject) -> float:
+    if isinstance(event, Message):
+        if event.document:
+            return DOCUMENT_COST
+        return MESSAGE_COSTS.get(event.text or "", DEFAULT_COST)
+    if isinstance(event, CallbackQuery):
+        prefix = (event.data or "").split(":", 1)[0] + ":"
+        return CALLBACK_COSTS.get(prefix, DEFAULT_COST)
+    return DEFAULT_COST
+
+
+class ThrottlingMiddleware(BaseMiddleware):
+    """
+    Антифлуд для сообщений и нажатий на inline-кнопки.
+
+    - у каждого пользователя своё ведро токенов, действия списывают разную стоимость;
+    - повторное нажатие той же кнопки под тем же сообщением в пределах
+      `coalesce_window` секунд (или пока первое ещё обрабатывается) схлопывается;
+    - память о последних нажатиях ограничена по размеру, а ведро вытесняется
+      из карты, только когда снова наполнилось (сброс не снимает штраф).
+
+    Отброшенные апдейты считаются в метрике photoexpress_throttled_updates_total.
+    """
+
+    def __init__(
+        self,
+        rate: float = 1.0,
+        capacity: float = 10.0,
+        coalesce_window: float = 1.0,
+        max_users: int = 10_000,
+    ):
+        self.buckets = BucketMap(rate, capacity, max_keys=max_users)
+        self.coalesce_window = coalesce_window
+        self.max_users = max_users
+        # (user_id, message_id, data) -> время нажатия; None — ещё обрабатывается
+        self._recent: OrderedDict[tuple, float | None] = OrderedDict()
+        # пользователи, которых уже предупредили о флуде в текущем «штрафе»
+        self._warned: OrderedDict[int, float] = OrderedDict()
+
+    def _remember(self, store: OrderedDict, key, value):
+        store[key] = value
+        store.move_to_end(key)
+        while len(store) > self.max_users:
+            store.popitem(last=False)
+
+    def _is_duplicate(self, key: tuple, now: float) -> bool:
+        if key not in self._recent:
+            return False
+        pressed_at = self._recent[key]
+        return pressed_at is None or now - pressed_at < self.coalesce_window
+
+    async def _reject(self, event: TelegramObject, user_id: int, reason: str, now: float):
+        event_name = "callback_query" if isinstance(event, CallbackQuery) else "message"
+        THROTTLED_UPDATES.inc(event=event_name, reason=reason)
+
+        if isinstance(event, CallbackQuery):
+            # без ответа у пользователя будет крутиться «часики» на кнопке
+            text = None if reason == "coalesced" else "⏳ Слишком часто, подождите немного."
+            try:
+                await event.answer(text)
+            except Exception:
+                pass
+            return
+
+        # о флуде сообщениями предупреждаем один раз, дальше молча игнорируем
+        warned_at = self._warned.get(user_id)
+        if warned_at is None or now - warned_at > 60:
+            self._remember(self._warned, user_id, now)
+            try:
+                await event.answer("⏳ Слишком много сообщений. Подождите немного и повторите.")
+            except Exception:
+                pass
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await handler(event, data)
+
+        now = time.monotonic()
+        coalesce_key = None
+        if isinstance(event, CallbackQuery):
+            message_id = event.message.message_id if event.message else None
+            coalesce_key = (user.id, message_id, event.data)
+            if self._is_duplicate(coalesce_key, now):
+                return await self._reject(event, user.id, "coalesced", now)
+
+        if not self.buckets.get(user.id, now).consume(action_cost(event), now):
+            return await self._reject(event, user.id, "rate_limited", now)
+
+        if coalesce_key is None:
+            return await handler(event, data)
+
+        self._remember(self._recent, coalesce_key, None)
+        try:
+            return await handler(event, data)
+        finally:
+            if coalesce_key in self._recent:
+                self._recent[coalesce_key] = time.monotonic()
@@ -0,0 +1,41 @@
+# bot/middlewares/tracing.py
+
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from bot.services.tracing import span, trace_update
+from .metrics import handler_name
+
+
+class TracingMiddleware(BaseMiddleware):
+    """
+    Внутренний middleware: открывает трейс апдейта с именем хендлера.
+    Спаны SQL, файлов и Bot API внутри хендлера становятся его детьми.
+    """
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        with trace_update(handler_name(data)):
+            return await handler(event, data)
+
+
+class TracingRequestMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: спан на каждый вызов Bot API."""
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        with span(f"telegram.{type(method).__name__}", "telegram"):
+            return await make_request(bot, method)
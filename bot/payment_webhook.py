@@ -0,0 +1,108 @@
+# bot/payment_webhook.py
+
+import asyncio
+import hashlib
+import hmac
+import logging
+
+from aiohttp import web
+
+from db.serialization import dumps, loads
+from bot.services.payment import Confirmation, PaymentIngestor, PaymentResult
+from bot.tasks.order_status_updater import wake_status_updater
+from bot.tasks.outbox_relay import wake_outbox_relay
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_HEADER = "X-Payment-Signature"
+
+
+def sign_payload(secret: str, body: bytes) -> str:
+    return "sha256=" + hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def parse_confirmations(payload, provider: str) -> list[Confirmation]:
+    """
+    Провайдер шлёт одно событие или пачку {"events": [...]}; событие —
+    {"id", "order_id", "amount", "status"}. В подтверждения попадают только
+    события со статусом succeeded, остальные просто подтверждаются провайдеру.
+    Сумма обязательна: без неё оплату не с чем сверить. Прежние uuid-ключи
+    заказов разрешаются уже при записи (apply_confirmations), не здесь.
+    """
+    events = payload.get("events", [payload]) if isinstance(payload, dict) else None
+    if not isinstance(events, list) or not all(isinstance(e, dict) for e in events):
+        raise ValueError("ожидается событие или {\"events\": [...]}")
+    confirmations = []
+    for e in events:
+        if not e.get("id") or not e.get("order_id"):
+            raise ValueError("у события нет id или order_id")
+        if e.get("status", "succeeded") != "succeeded":
+            continue
+        if e.get("amount") is None:
+            raise ValueError("у события нет amount")
+        order_id = str(e["order_id"]).strip()
+        confirmations.append(Confirmation(
+            key=f"{provider}:{e['id']}",
+            order_id=int(order_id) if order_id.isdigit() else 0,
+            amount=float(e["amount"]),
+            provider=provider,
+            order_ref=None if order_id.isdigit() else order_id,
+        ))
+    return confirmations
+
+
+def create_payment_app(ingestor: PaymentIngestor, provider: str, secret: str,
+                       path: str = "/payments/webhook") -> web.Application:
+    """
+    Приём подтверждений оплаты от провайдера; запросы без верной подписи
+    secret отклоняются (401). Отвечает 200 только после того,
+    как подтверждения записаны в базу; при ошибке — 500, и провайдер повторит
+    доставку (повтор безопасен: ключ provider:id обрабатывается один раз).
+    """
+
+    async def handle_payment(request: web.Request) -> web.Response:
+        body = await request.read()
+        if not hmac.compare_digest(request.headers.get(SIGNATURE_HEADER, ""), sign_payload(secret, body)):
+            return web.Response(status=401)
+        try:
+            confirmations = parse_confirmations(loads(body), provider)
+        except (ValueError, TypeError):
+            return web.Response(status=400)
+
+        try:
+            results = await asyncio.gather(*(ingestor.submit(c) for c in confirmations))
+        except Exception:
+            return web.Response(status=500)
+        return web.json_response({"results": [{"key": r.key, "outcome": r.outcome} for r in results]}, dumps=dumps)
+
+    app = web.Application()
+    app.router.add_post(path, handle_payment)
+    return app
+
+
+async def on_payments_applied(results: list[PaymentResult]):
+    """Колбэк для PaymentIngestor: уведомления об оплате уже в outbox — будим релей и смену статусов."""
+    wake_outbox_relay()
+    wake_status_updater()
+
+
+async def run_payment_webhook(
+    provider: str,
+    secret: str,
+    host: str = "127.0.0.1",
+    port: int = 8081,
+    path: str = "/payments/webhook",
+):
+    """Обслуживает вебхук платёжного провайдера до отмены."""
+    ingestor = PaymentIngestor(on_applied=on_payments_applied)
+    app = create_payment_app(ingestor, provider, secret, path=path)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    ingestor.start()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Вебхук оплат (%s) запущен на %s:%s%s", provider, host, port, path)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await ingestor.stop()
@@ -0,0 +1,172 @@
+# bot/services/account_deletion.py
+
+import os
+import shutil
+import time
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import delete, func, insert, text, update
+
+from db.database import (
+    SessionLocal, AccountDeletion, AppMeta, ArchivedOrder, ArchivedPhoto, Order, OrderEvent, User,
+)
+from bot.services.archive import ARCHIVE_DIR, repack_bundle
+from bot.services.tracing import span
+
+PURGE_BATCH = int(os.getenv("ACCOUNT_PURGE_BATCH", "200"))
+
+
+class PurgeResult(NamedTuple):
+    orders: int = 0
+    archived_orders: int = 0
+    events: int = 0
+    files: int = 0
+    accounts: int = 0       # удалений, завершённых этим шагом
+
+    def __add__(self, other: "PurgeResult") -> "PurgeResult":
+        return PurgeResult(*(a + b for a, b in zip(self, other)))
+
+
+def request_account_deletion(db, user: User) -> AccountDeletion:
+    """
+    Ставит надгробие и очередь на удаление — одна короткая транзакция в
+    хендлере, коммит за вызывающим. Личные данные стираются сразу, telegram_id
+    освобождается (становится -id), рассылки и напоминания пользователя больше
+    не видят. Заказы, события и файлы стирает account_purge.
+    """
+    deletion = AccountDeletion(user_id=user.id, telegram_id=user.telegram_id)
+    user.deleted_at = datetime.utcnow()
+    user.telegram_id = -user.id
+    user.username = user.full_name = user.phone_number = None
+    user.accepted_policy = False
+    user.is_active = False
+    db.add(deletion)
+    return deletion
+
+
+def pending_deletions() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(func.count(AccountDeletion.id)).filter(AccountDeletion.finished_at.is_(None)).scalar()
+    finally:
+        db.close()
+
+
+def _count_files(folder: str) -> int:
+    return sum(len(files) for _, _, files in os.walk(folder))
+
+
+def purge_account_batch(limit: int = PURGE_BATCH) -> PurgeResult | None:
+    """
+    Один шаг очереди удаления для самого старого запроса: до limit заказов
+    из orders, когда их не осталось — до limit архивных, а затем остатки
+    событий, папка uploads и сама строка users. None — очередь пуста.
+
+    Шаги повторяемы: после сбоя следующий вызов найдёт то, что не успело
+    удалиться, и продолжит. Файлы удаляются только после коммита строк.
+    """
+    db = SessionLocal()
+    try:
+        job = (
+            db.query(AccountDeletion)
+            .filter(AccountDeletion.finished_at.is_(None))
+            .order_by(AccountDeletion.id)
+            .first()
+        )
+        if job is None:
+            return None
+        uploads = f"uploads/{job.telegram_id}"
+
+        # 1. заказы в основной базе; продажи остаются в сводках: отметка purging
+        # не даёт триггеру их вычесть (как archiving при переносе в архив)
+        order_ids = [
+            r.order_id for r in db.query(Order.order_id).filter(Order.user_id == job.user_id).limit(limit).all()
+        ]
+        if order_ids:
+            folders = [f"{uploads}/{order_id}" for order_id in order_ids]
+            files = sum(_count_files(folder) for folder in folders)
+            events = db.execute(delete(OrderEvent).where(OrderEvent.order_id.in_(order_ids))).rowcount
+            db.execute(insert(AppMeta).values(key="purging", value="1"))
+            db.execute(
+                delete(Order).where(Order.order_id.in_(order_ids)).execution_options(synchronize_session=False)
+            )
+            db.execute(delete(AppMeta).where(AppMeta.key == "purging"))
+            job.orders += len(order_ids)
+            job.events += events
+            job.files += files
+            db.commit()
+            for folder in folders:
+                shutil.rmtree(folder, ignore_errors=True)
+            return PurgeResult(orders=len(order_ids), events=events, files=files)
+
+        # 2. архивные заказы; их фото вырезаются из пачек, сводки не трогаются
+        archived = [
+            r.order_id
+            for r in db.query(ArchivedOrder.order_id).filter(ArchivedOrder.user_id == job.user_id).limit(limit).all()
+        ]
+        if archived:
+            return _purge_archived(db, job, archived)
+
+        # 3. остатки: события заказов, удалённых раньше (например, просроченных), папка и пользователь
+        events = db.execute(delete(OrderEvent).where(OrderEvent.telegram_id == job.telegram_id)).rowcount
+        db.execute(delete(User).where(User.id == job.user_id, User.deleted_at.is_not(None)))
+        # зарегистрировался заново — в папке уже его новые заказы
+        reregistered = db.query(User.id).filter(User.telegram_id == job.telegram_id).first() is not None
+        files = 0 if reregistered else _count_files(uploads)
+        job.events += events
+        job.files += files
+        job.finished_at = datetime.utcnow()
+        db.commit()
+        if not reregistered:
+            shutil.rmtree(uploads, ignore_errors=True)
+        return PurgeResult(events=events, files=files, accounts=1)
+    finally:
+        db.close()
+
+
+def _purge_archived(db, job: AccountDeletion, order_ids: list[int]) -> PurgeResult:
+    events = db.execute(delete(OrderEvent).where(OrderEvent.order_id.in_(order_ids))).rowcount
+    # документы поиска архивных заказов живут в основной базе — триггер их не удалит
+    db.execute(text("DELETE FROM orders_fts WHERE rowid = :order_id"), [{"order_id": i} for i in order_ids])
+    job.events += events
+    db.commit()
+
+    photos = db.query(ArchivedPhoto.path, ArchivedPhoto.bundle).filter(ArchivedPhoto.order_id.in_(order_ids)).all()
+    purged = {path for path, _ in photos}
+    moved, emptied = [], []
+    for bundle in {bundle for _, bundle in photos}:
+        keep = [
+            (r.path, r.offset, r.length)
+            for r in db.query(ArchivedPhoto.path, ArchivedPhoto.offset, ArchivedPhoto.length)
+            .filter(ArchivedPhoto.bundle == bundle)
+            if r.path not in purged
+        ]
+        if not keep:
+            emptied.append(bundle)
+            continue
+        # новое имя — чтобы до коммита строки по-прежнему указывали на целый старый файл
+        new_name = f"{bundle.removesuffix('.tar.gz').split('~')[0]}~{time.time_ns():x}.tar.gz"
+        with span("account_purge.repack", "file", files=len(keep)):
+            offsets = repack_bundle(bundle, keep, new_name)
+        moved.append((bundle, new_name, offsets))
+
+    # транзакция только над файлом архива, как при переносе
+    for _, new_name, offsets in moved:
+        db.execute(update(ArchivedPhoto), [
+            {"path": path, "bundle": new_name, "offset": offset} for path, offset in offsets
+        ])
+    db.execute(delete(ArchivedPhoto).where(ArchivedPhoto.order_id.in_(order_ids)))
+    db.execute(
+        delete(ArchivedOrder).where(ArchivedOrder.order_id.in_(order_ids)).execution_options(synchronize_session=False)
+    )
+    db.commit()
+    for bundle, *_ in moved:
+        (ARCHIVE_DIR / bundle).unlink(missing_ok=True)
+    for bundle in emptied:
+        (ARCHIVE_DIR / bundle).unlink(missing_ok=True)
+
+    job.archived_orders += len(order_ids)
+    job.files += len(purged)
+    db.commit()
+    return PurgeResult(archived_orders=len(order_ids), events=events, files=len(purged))
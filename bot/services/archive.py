@@ -0,0 +1,253 @@
+# bot/services/archive.py
+
+import gzip
+import io
+import logging
+import os
+import tarfile
+from datetime import datetime, timedelta
+from pathlib import Path, PurePath
+from typing import NamedTuple, Sequence
+
+from sqlalchemy import delete, desc, exists, insert, literal, select, text, union_all
+
+from db.database import SessionLocal, AppMeta, ArchivedOrder, ArchivedPhoto, Order
+from bot.services.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# Завершённые и отменённые заказы старше ARCHIVE_AFTER_DAYS переезжают в архив:
+# строки — в файл ARCHIVE_DATABASE_PATH, фото — пачками tar.gz в ARCHIVE_DIR
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", "90"))
+ARCHIVE_DIR        = Path(os.getenv("ARCHIVE_DIR", "db/archive"))
+ARCHIVE_INTERVAL   = float(os.getenv("ARCHIVE_INTERVAL", "3600"))
+ARCHIVE_STATUSES   = ("completed", "cancelled")
+
+
+class ArchiveResult(NamedTuple):
+    orders: int = 0         # заказов перенесено
+    photos: int = 0         # файлов упаковано
+    photo_bytes: int = 0    # сколько они занимали в uploads
+    bundle_bytes: int = 0   # сколько занимает пачка
+    db_bytes: int = 0       # освободилось страниц основной базы (их займут новые строки), байт
+
+    def __add__(self, other: "ArchiveResult") -> "ArchiveResult":
+        return ArchiveResult(*(a + b for a, b in zip(self, other)))
+
+    def report(self) -> str:
+        mb = 2 ** 20
+        return (
+            f"заказов: {self.orders}, фото: {self.photos}; uploads −{self.photo_bytes / mb:.1f} МБ, "
+            f"пачки +{self.bundle_bytes / mb:.1f} МБ, свободных страниц в базе +{self.db_bytes / mb:.1f} МБ "
+            f"(итого освобождено {(self.photo_bytes - self.bundle_bytes + self.db_bytes) / mb:.1f} МБ)"
+        )
+
+
+# ─── Пачки фото ──────────────────────────────────────────────────────────────
+
+def pack_bundle(bundle: Path, files: list[str]) -> list[tuple[str, int, int, int]]:
+    """
+    Пишет пачку фото: tar.gz, в котором каждый файл — отдельный gzip-член с
+    одной записью tar. Вся пачка распаковывается обычным `tar xzf`, а один
+    файл — чтением его члена по смещению, без распаковки остальных.
+    Возвращает (путь, смещение, длина члена, размер файла) для каждого файла.
+    """
+    index = []
+    bundle.parent.mkdir(parents=True, exist_ok=True)
+    tmp = bundle.with_name(f".{bundle.name}.{os.getpid()}.part")
+    try:
+        with open(tmp, "wb") as out:
+            for path in files:
+                data = Path(path).read_bytes()
+                info = tarfile.TarInfo(path)
+                info.size = len(data)
+                info.mtime = int(os.path.getmtime(path))
+                record = info.tobuf(tarfile.PAX_FORMAT) + data + tarfile.NUL * (-len(data) % tarfile.BLOCKSIZE)
+                member = gzip.compress(record, mtime=0)
+                index.append((path, out.tell(), len(member), len(data)))
+                out.write(member)
+            out.write(gzip.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2, mtime=0))  # конец архива tar
+            # исходные файлы удаляются сразу после переноса — пачка должна пережить сбой питания
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, bundle)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return index
+
+
+def repack_bundle(bundle: str, keep: list[tuple[str, int, int]], new_name: str) -> list[tuple[str, int]]:
+    """
+    Переписывает пачку под именем new_name, оставляя только члены keep
+    (путь, смещение, длина) — они копируются как есть, без перепаковки.
+    Старый файл не трогает: его удаляют после коммита новых смещений.
+    Возвращает (путь, новое смещение) для каждого оставленного члена.
+    """
+    offsets = []
+    target = ARCHIVE_DIR / new_name
+    tmp = target.with_name(f".{new_name}.{os.getpid()}.part")
+    try:
+        with open(ARCHIVE_DIR / bundle, "rb") as src, open(tmp, "wb") as out:
+            for path, offset, length in sorted(keep, key=lambda k: k[1]):
+                src.seek(offset)
+                offsets.append((path, out.tell()))
+                out.write(src.read(length))
+            out.write(gzip.compress(tarfile.NUL * tarfile.BLOCKSIZE * 2, mtime=0))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return offsets
+
+
+def read_order_photo(path: str) -> bytes:
+    """Файл фото по пути из orders.photos: из uploads, а у архивного заказа — из его пачки."""
+    if os.path.isfile(path):
+        return Path(path).read_bytes()
+    db = SessionLocal()
+    try:
+        entry = db.get(ArchivedPhoto, path)
+    finally:
+        db.close()
+    if entry is None:
+        raise FileNotFoundError(path)
+    with open(ARCHIVE_DIR / entry.bundle, "rb") as f:
+        f.seek(entry.offset)
+        record = gzip.decompress(f.read(entry.length))
+    with tarfile.open(fileobj=io.BytesIO(record)) as tar:
+        return tar.extractfile(tar.next()).read()
+
+
+# ─── Перенос заказов ─────────────────────────────────────────────────────────
+
+def _free_bytes(db) -> int:
+    return db.execute(text("PRAGMA main.freelist_count")).scalar() * db.execute(text("PRAGMA main.page_size")).scalar()
+
+
+def archive_orders_batch(limit: int = 200, older_than: timedelta | None = None) -> ArchiveResult:
+    """
+    Переносит до limit завершённых и отменённых заказов старше older_than
+    (по умолчанию ARCHIVE_AFTER_DAYS дней) в архив.
+
+    Файлы архива и основной базы — разные, а в режиме WAL транзакция над двумя
+    файлами не атомарна, поэтому шагов два: строки копируются в архив и
+    коммитятся, затем удаляются из orders. Сбой между ними оставит копию в
+    обоих файлах; следующий проход заберёт те же заказы и доделает удаление
+    (их фото уже в пачке и заново не пакуются), а чтение и сводки до тех пор
+    считают такой заказ один раз. Фото удаляются из uploads только после
+    обоих коммитов.
+    """
+    cutoff = datetime.utcnow() - (older_than or timedelta(days=ARCHIVE_AFTER_DAYS))
+    db = SessionLocal()
+    try:
+        orders = (
+            db.query(Order.order_id, Order.photos)
+            .filter(Order.status.in_(ARCHIVE_STATUSES), Order.created_at < cutoff)
+            .order_by(Order.order_id)
+            .limit(limit)
+            .all()
+        )
+        if not orders:
+            return ArchiveResult()
+        order_ids = [o.order_id for o in orders]
+        owners = {}
+        for o in orders:
+            for photo in o.photos or []:
+                if photo.get("path") and os.path.isfile(photo["path"]):
+                    owners[photo["path"]] = o.order_id
+        # файлы, упакованные прошлым проходом, который не успел удалить заказы, уже лежат в его пачке
+        packed = set(db.scalars(select(ArchivedPhoto.path).where(ArchivedPhoto.path.in_(list(owners)))))
+        to_pack = [path for path in owners if path not in packed]
+
+        index = []
+        bundle = f"{datetime.utcnow():%Y%m%d-%H%M%S}-{order_ids[0]}.tar.gz"
+        if to_pack:
+            with span("archive.pack", "file", files=len(to_pack)):
+                index = pack_bundle(ARCHIVE_DIR / bundle, to_pack)
+
+        # 1. копия в архив — транзакция только над файлом архива; не закоммитилась —
+        # пачку удаляем, следующий проход упакует файлы заново
+        try:
+            columns = [c.name for c in Order.__table__.columns]
+            db.execute(
+                insert(ArchivedOrder).prefix_with("OR IGNORE").from_select(
+                    columns + ["archived_at"],
+                    select(*Order.__table__.c, literal(datetime.utcnow())).where(Order.order_id.in_(order_ids)),
+                )
+            )
+            if index:
+                db.execute(insert(ArchivedPhoto).prefix_with("OR REPLACE"), [
+                    {"path": path, "order_id": owners[path], "bundle": bundle,
+                     "offset": offset, "length": length, "size": size}
+                    for path, offset, length, size in index
+                ])
+            db.commit()
+        except BaseException:
+            if index:
+                (ARCHIVE_DIR / bundle).unlink(missing_ok=True)
+            raise
+
+        # 2. удаление из основной базы; отметка archiving не даёт триггеру
+        # вычесть заказы из сводок и видна только внутри этой транзакции
+        free_before = _free_bytes(db)
+        db.execute(insert(AppMeta).values(key="archiving", value="1"))
+        db.execute(
+            delete(Order)
+            .where(Order.order_id.in_(order_ids))
+            .where(exists().where(ArchivedOrder.order_id == Order.order_id))
+            .execution_options(synchronize_session=False)
+        )
+        db.execute(delete(AppMeta).where(AppMeta.key == "archiving"))
+        db.commit()
+        db_bytes = _free_bytes(db) - free_before
+    finally:
+        db.close()
+
+    # 3. файлы — только после коммитов; опустевшие папки заказа и пользователя убираем.
+    # Заказы уже в архиве, поэтому ошибка файловой системы не прерывает проход
+    for path in owners:
+        try:
+            os.remove(path)
+        except OSError as e:
+            logger.warning("Архив: не удалось удалить %s: %s", path, e)
+    for folder in {PurePath(path).parent for path in owners}:
+        for empty in (folder, folder.parent):
+            try:
+                os.rmdir(empty)
+            except OSError:
+                break
+    return ArchiveResult(
+        orders=len(order_ids),
+        photos=len(index),
+        photo_bytes=sum(size for *_, size in index),
+        bundle_bytes=os.path.getsize(ARCHIVE_DIR / bundle) if index else 0,
+        db_bytes=db_bytes,
+    )
+
+
+# ─── Чтение для «Моих заказов» ───────────────────────────────────────────────
+
+def user_orders(
+    db, user_id: int, status: str, page: int, per_page: int = 1, columns: Sequence[str] | None = None,
+) -> list:
+    """
+    Страница «Моих заказов» в статусе status от новых к старым — вместе с
+    архивными: пользователь не замечает, что старые заказы переехали. У строк
+    поля columns (по умолчанию все поля Order) плюс archived (1 — заказ из архива).
+    """
+    names = columns or [c.name for c in Order.__table__.c]
+    hot = select(*(Order.__table__.c[name] for name in names), literal(0).label("archived")).where(
+        Order.user_id == user_id, Order.status == status
+    )
+    cold = select(
+        *(ArchivedOrder.__table__.c[name] for name in names), literal(1).label("archived")
+    ).where(
+        ArchivedOrder.user_id == user_id,
+        ArchivedOrder.status == status,
+        ~exists().where(Order.order_id == ArchivedOrder.order_id),
+    )
+    query = union_all(hot, cold).order_by(desc("created_at")).offset(page * per_page).limit(per_page)
+    return db.execute(query).all()
@@ -0,0 +1,268 @@
+# bot/services/broadcast.py
+
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramBadRequest,
+    TelegramForbiddenError,
+    TelegramNetworkError,
+    TelegramRetryAfter,
+    TelegramServerError,
+)
+
+from db.database import SessionLocal, Broadcast, User
+from bot.services.ratelimit import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Telegram пропускает около 30 сообщений в секунду от одного бота разным чатам;
+# держимся с запасом, флуд-контроль (RetryAfter) всё равно обрабатывается
+BROADCAST_RATE       = float(os.getenv("BROADCAST_RATE", "25"))
+BROADCAST_WORKERS    = int(os.getenv("BROADCAST_WORKERS", "8"))
+BROADCAST_BATCH      = int(os.getenv("BROADCAST_BATCH", "1000"))
+CHECKPOINT_INTERVAL  = float(os.getenv("BROADCAST_CHECKPOINT_INTERVAL", "2"))
+MAX_ATTEMPTS         = 3
+
+# ошибки BadRequest, после которых писать пользователю бессмысленно
+_GONE_MARKERS = ("chat not found", "user is deactivated", "bot was blocked")
+
+
+def create_broadcast(text: str) -> int:
+    db = SessionLocal()
+    broadcast = Broadcast(text=text)
+    db.add(broadcast)
+    db.commit()
+    broadcast_id = broadcast.id
+    db.close()
+    return broadcast_id
+
+
+def cancel_broadcast(broadcast_id: int) -> bool:
+    """Помечает рассылку отменённой; запущенный BroadcastRunner остановится на ближайшем чекпоинте."""
+    db = SessionLocal()
+    updated = (
+        db.query(Broadcast)
+        .filter(Broadcast.id == broadcast_id, Broadcast.status.in_(("pending", "running")))
+        .update({Broadcast.status: "cancelled", Broadcast.finished_at: datetime.utcnow()}, synchronize_session=False)
+    )
+    db.commit()
+    db.close()
+    return bool(updated)
+
+
+def fetch_recipients(after_user_id: int, limit: int) -> list[tuple[int, int]]:
+    """
+    Следующая порция активных получателей по keyset-пагинации (users.id > after),
+    без OFFSET: стоимость запроса не растёт по мере продвижения рассылки.
+    """
+    db = SessionLocal()
+    rows = (
+        db.query(User.id, User.telegram_id)
+        .filter(User.id > after_user_id, User.is_active == True)
+        .order_by(User.id)
+        .limit(limit)
+        .all()
+    )
+    db.close()
+    return [(user_id, telegram_id) for user_id, telegram_id in rows]
+
+
+class BroadcastRunner:
+    """
+    Отправляет рассылку пулом воркеров с общим ведром токенов.
+    Получатели идут по возрастанию users.id; чекпоинт — наибольший id,
+    до которого включительно все получатели уже обработаны. После падения
+    новый запуск продолжает с чекпоинта: повторно уйдут только сообщения,
+    отправленные после последнего чекпоинта (не больше rate × checkpoint_interval
+    плюс те, что были в работе).
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        broadcast_id: int,
+        rate: float = BROADCAST_RATE,
+        workers: int = BROADCAST_WORKERS,
+        batch_size: int = BROADCAST_BATCH,
+        checkpoint_interval: float = CHECKPOINT_INTERVAL,
+    ):
+        self.bot = bot
+        self.broadcast_id = broadcast_id
+        self.workers = workers
+        self.batch_size = batch_size
+        self.checkpoint_interval = checkpoint_interval
+        self.bucket = TokenBucket(rate, capacity=max(rate, 1.0))
+
+        self.text = ""
+        self.sent = 0
+        self.failed = 0
+        self.deactivated = 0
+        self.checkpoints = 0
+        self._blocked: list[int] = []
+        self._inflight: set[int] = set()
+        self._dispatched_upto = 0
+        self._paused_until = 0.0
+        self._cancelled = False
+
+    # ─── Отправка ────────────────────────────────────────────────────────────
+
+    async def _acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+            if self.bucket.consume(1.0, now):
+                return
+            await asyncio.sleep(self.bucket.time_until(1.0, now))
+
+    async def _deliver(self, user_id: int, telegram_id: int):
+        for attempt in range(MAX_ATTEMPTS):
+            await self._acquire()
+            try:
+                await self.bot.send_message(telegram_id, self.text)
+                self.sent += 1
+                return
+            except TelegramRetryAfter as e:
+                # флуд-контроль действует на весь бот — притормаживаем все воркеры разом
+                self._paused_until = max(self._paused_until, time.monotonic() + e.retry_after)
+            except TelegramForbiddenError:
+                self._blocked.append(user_id)
+                return
+            except TelegramBadRequest as e:
+                if any(marker in str(e).lower() for marker in _GONE_MARKERS):
+                    self._blocked.append(user_id)
+                else:
+                    self.failed += 1
+                return
+            except (TelegramNetworkError, TelegramServerError):
+                await asyncio.sleep(2 ** attempt)
+            except Exception:
+                # неожиданная ошибка не должна останавливать воркер: получатель просто не доставлен
+                logger.exception("Рассылка #%s: не удалось отправить пользователю %s", self.broadcast_id, user_id)
+                self.failed += 1
+                return
+        self.failed += 1
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            item = await queue.get()
+            try:
+                if item is None:
+                    return
+                user_id, telegram_id = item
+                try:
+                    await self._deliver(user_id, telegram_id)
+                finally:
+                    self._inflight.discard(user_id)
+            finally:
+                queue.task_done()
+
+    # ─── Чекпоинты ───────────────────────────────────────────────────────────
+
+    def _done_upto(self) -> int:
+        # получатели выдаются по возрастанию id, значит всё ниже самого раннего незавершённого готово
+        return min(self._inflight) - 1 if self._inflight else self._dispatched_upto
+
+    def _save_checkpoint(self, cursor: int, counters: tuple[int, int, int], blocked: list[int],
+                         status: str | None = None) -> str:
+        db = SessionLocal()
+        try:
+            if blocked:
+                db.query(User).filter(User.id.in_(blocked)).update(
+                    {User.is_active: False}, synchronize_session=False
+                )
+            broadcast = db.get(Broadcast, self.broadcast_id)
+            broadcast.last_user_id = max(broadcast.last_user_id, cursor)
+            broadcast.sent, broadcast.failed, broadcast.deactivated = counters
+            if status and broadcast.status != "cancelled":
+                broadcast.status = status
+                if status == "done":
+                    broadcast.finished_at = datetime.utcnow()
+            current = broadcast.status
+            db.commit()
+            return current
+        finally:
+            db.close()
+
+    async def _checkpoint(self, status: str | None = None):
+        blocked, self._blocked = self._blocked, []
+        self.deactivated += len(blocked)
+        # курсор и счётчики снимаем в один момент, пока воркеры не продвинулись дальше
+        counters = (self.sent, self.failed, self.deactivated)
+        current = await asyncio.to_thread(self._save_checkpoint, self._done_upto(), counters, blocked, status)
+        self.checkpoints += 1
+        if current == "cancelled":
+            self._cancelled = True
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.checkpoint_interval)
+            await self._checkpoint()
+
+    # ─── Запуск ──────────────────────────────────────────────────────────────
+
+    def _load(self) -> bool:
+        db = SessionLocal()
+        try:
+            broadcast = db.get(Broadcast, self.broadcast_id)
+            if broadcast is None or broadcast.status in ("done", "cancelled"):
+                return False
+            self.text = broadcast.text
+            self._dispatched_upto = broadcast.last_user_id
+            self.sent, self.failed, self.deactivated = broadcast.sent, broadcast.failed, broadcast.deactivated
+            broadcast.status = "running"
+            db.commit()
+            return True
+        finally:
+            db.close()
+
+    async def run(self) -> dict:
+        """Отправляет рассылку (или продолжает с чекпоинта) до конца или до отмены."""
+        if not await asyncio.to_thread(self._load):
+            return self.stats()
+
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.workers * 4)
+        workers = [asyncio.create_task(self._worker(queue)) for _ in range(self.workers)]
+        checkpointer = asyncio.create_task(self._checkpoint_loop())
+        try:
+            cursor = self._dispatched_upto
+            while not self._cancelled:
+                batch = await asyncio.to_thread(fetch_recipients, cursor, self.batch_size)
+                if not batch:
+                    break
+                for user_id, telegram_id in batch:
+                    if self._cancelled:
+                        break
+                    self._inflight.add(user_id)
+                    self._dispatched_upto = user_id
+                    await queue.put((user_id, telegram_id))
+                cursor = batch[-1][0]
+
+            await queue.join()
+            for _ in workers:
+                queue.put_nowait(None)
+            await asyncio.gather(*workers)
+        finally:
+            checkpointer.cancel()
+            for task in workers:
+                task.cancel()
+
+        await self._checkpoint(status=None if self._cancelled else "done")
+        logger.info("Рассылка #%s: %s", self.broadcast_id, self.stats())
+        return self.stats()
+
+    def stats(self) -> dict:
+        return {
+            "broadcast_id": self.broadcast_id,
+            "sent": self.sent,
+            "failed": self.failed,
+            "deactivated": self.deactivated,
+            "checkpoints": self.checkpoints,
+            "cancelled": self._cancelled,
+        }
@@ -0,0 +1,201 @@
+# bot/services/lease.py
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable
+
+from sqlalchemy import case, insert, or_, update
+
+from db.database import SessionLocal, JobLease
+
+logger = logging.getLogger(__name__)
+
+# Аренда продлевается каждые LEASE_TTL / 3 секунд; пропавший владелец теряет её через LEASE_TTL
+LEASE_TTL = float(os.getenv("LEASE_TTL", "30"))
+
+# Аренды, под которыми задачи сейчас выполняются в этом процессе
+_held: set[str] = set()
+
+# Будильники задач. wake_job будит задачу в этом процессе, а если её аренда у
+# другого (шард кластера, второй экземпляр бота) — отмечает job_leases.wake_at;
+# процесс-владелец сверяет отметки своих аренд раз в LEASE_WAKE_POLL секунд.
+LEASE_WAKE_POLL = float(os.getenv("LEASE_WAKE_POLL", "1"))
+_wakeups: dict[str, asyncio.Event] = {}
+_watcher: asyncio.Task | None = None
+
+
+def lease_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def try_acquire(name: str, owner: str, ttl: float = LEASE_TTL) -> bool:
+    """
+    Берёт или продлевает аренду одним UPDATE: удаётся, если аренда свободна,
+    истекла или уже принадлежит owner. SQLite выполняет записи по очереди,
+    поэтому из нескольких претендентов аренду получит ровно один.
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        db.execute(insert(JobLease).prefix_with("OR IGNORE").values(name=name, owner=None, expires_at=now))
+        taken = db.execute(
+            update(JobLease)
+            .where(
+                JobLease.name == name,
+                or_(JobLease.owner.is_(None), JobLease.owner == owner, JobLease.expires_at < now),
+            )
+            .values(
+                owner=owner,
+                expires_at=now + timedelta(seconds=ttl),
+                heartbeat_at=now,
+                acquired_at=case((JobLease.owner == owner, JobLease.acquired_at), else_=now),
+            )
+        ).rowcount
+        db.commit()
+        return bool(taken)
+    finally:
+        db.close()
+
+
+def holds_lease(name: str) -> bool:
+    """Выполняется ли задача `name` в этом процессе (а не ждёт аренды)."""
+    return name in _held
+
+
+def wakeup_event(name: str) -> asyncio.Event:
+    """Событие, которое задача `name` ждёт между проходами; его взводит wake_job(name)."""
+    return _wakeups.setdefault(name, asyncio.Event())
+
+
+def wake_job(name: str):
+    """
+    Будит задачу `name`, где бы она ни выполнялась. Вне своего процесса —
+    отметкой в базе, в фоновом потоке: вызывающий цикл не ждёт записи.
+    """
+    wakeup_event(name).set()
+    if name not in _held:
+        asyncio.get_running_loop().run_in_executor(None, _request_wake, name)
+
+
+def _request_wake(name: str):
+    db = SessionLocal()
+    try:
+        db.execute(update(JobLease).where(JobLease.name == name).values(wake_at=datetime.utcnow()))
+        db.commit()
+    except Exception:
+        logger.exception("Аренда %s: не удалось отметить пробуждение", name)
+    finally:
+        db.close()
+
+
+def _take_wakeups(names: list[str]) -> list[str]:
+    """Снимает отметки wake_at с аренд names; запись — только если отметки есть."""
+    db = SessionLocal()
+    try:
+        if db.query(JobLease.name).filter(JobLease.name.in_(names), JobLease.wake_at.is_not(None)).first() is None:
+            return []
+        woken = db.scalars(
+            update(JobLease)
+            .where(JobLease.name.in_(names), JobLease.wake_at.is_not(None))
+            .values(wake_at=None)
+            .returning(JobLease.name)
+        ).all()
+        db.commit()
+        return woken
+    finally:
+        db.close()
+
+
+async def _watch_wakeups():
+    while _held:
+        await asyncio.sleep(LEASE_WAKE_POLL)
+        try:
+            woken = await asyncio.to_thread(_take_wakeups, list(_held))
+        except Exception:
+            logger.exception("Аренды: не удалось проверить пробуждения")
+            continue
+        for name in woken:
+            wakeup_event(name).set()
+
+
+def _ensure_watcher():
+    global _watcher
+    if _watcher is None or _watcher.done():
+        _watcher = asyncio.create_task(_watch_wakeups())
+
+
+def release(name: str, owner: str):
+    db = SessionLocal()
+    try:
+        db.execute(
+            update(JobLease)
+            .where(JobLease.name == name, JobLease.owner == owner)
+            .values(owner=None, expires_at=datetime.utcnow())
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+async def run_leased(name: str, job: Callable[[], Awaitable], ttl: float = LEASE_TTL, owner: str | None = None):
+    """
+    Выполняет фоновую задачу, только пока этот процесс держит аренду `name`.
+    Остальные процессы ждут и забирают аренду, если владелец перестал её
+    продлевать. Не удалось продлить вовремя — задача отменяется до истечения
+    аренды, чтобы два процесса не работали одновременно. Задача, завершившаяся
+    сама (например, дозаливка сводок), освобождает аренду и больше не запускается.
+    """
+    owner = owner or lease_owner()
+    renew_every = ttl / 3
+    while True:
+        try:
+            acquired = await asyncio.to_thread(try_acquire, name, owner, ttl)
+        except Exception:
+            logger.exception("Аренда %s: ошибка базы", name)
+            acquired = False
+        if not acquired:
+            await asyncio.sleep(renew_every)
+            continue
+
+        logger.info("Аренда %s: задачу выполняет %s", name, owner)
+        renewed_at = time.monotonic()
+        task = asyncio.create_task(job())
+        _held.add(name)
+        _ensure_watcher()
+        try:
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=renew_every)
+                if done:
+                    break
+                try:
+                    held = await asyncio.to_thread(try_acquire, name, owner, ttl)
+                except Exception:
+                    logger.exception("Аренда %s: не удалось продлить", name)
+                    # пока аренда заведомо наша, пробуем ещё раз
+                    held = time.monotonic() - renewed_at < ttl - renew_every
+                else:
+                    renewed_at = time.monotonic() if held else renewed_at
+                if not held:
+                    logger.warning("Аренда %s потеряна, задача остановлена", name)
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    break
+        except asyncio.CancelledError:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            release(name, owner)
+            raise
+        finally:
+            _held.discard(name)
+
+        if task.cancelled():
+            continue
+        await asyncio.to_thread(release, name, owner)
+        if task.exception() is None:
+            return
+        logger.error("Задача %s упала, перезапуск", name, exc_info=task.exception())
+        await asyncio.sleep(renew_every)
@@ -1,6 +1,6 @@
 import os
 from math import radians, sin, cos, sqrt, asin
-from db.database import SessionLocal, PickupPoint
+from bot.services.reference import PickupPointRef, get_pickup_points
 
 GOOGLE_MAPS_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
 
@@ -14,18 +14,16 @@ def haversine(lat1, lon1, lat2, lon2):
 
 
 def get_nearest_pickup_points(user_lat: float, user_lon: float, limit: int = 5):
-    """Возвращает `limit` ближайших ПВЗ из БД."""
-    db = SessionLocal()
-    points = db.query(PickupPoint).all()
-    db.close()
+    """Возвращает `limit` ближайших ПВЗ из справочника."""
+    points = get_pickup_points()
     # считаем расстояния и сортируем
-    pts = [(p, haversine(user_lat, user_lon, float(p.lat), float(p.lon)))
+    pts = [(p, haversine(user_lat, user_lon, p.lat, p.lon))
            for p in points]
     pts_sorted = sorted(pts, key=lambda x: x[1])[:limit]
     return [p for p, _ in pts_sorted]
 
 
-def generate_static_map_url(points: list[PickupPoint], size: str = "800x400") -> str:
+def generate_static_map_url(points: list[PickupPointRef], size: str = "800x400") -> str:
     """
     Генерирует URL Google Static Map с маркерами.
     Метки нумеруются по порядку.
@@ -0,0 +1,330 @@
+# bot/services/metrics.py
+
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+
+def _format_labels(names: tuple[str, ...], values: tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{v}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def labels(self, **labels) -> "_Child":
+        """Метрика с заранее вычисленными метками — для горячих путей."""
+        return _Child(self, self._key(labels))
+
+
+class _Child:
+    __slots__ = ("metric", "key")
+
+    def __init__(self, metric: _Metric, key: tuple[str, ...]):
+        self.metric = metric
+        self.key = key
+
+    def inc(self, amount: float = 1):
+        self.metric._inc_key(self.key, amount)
+
+    def observe(self, value: float):
+        self.metric._observe_key(self.key, value)
+
+
+class Counter(_Metric):
+    """Монотонный счётчик с метками, как в Prometheus."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        self._inc_key(self._key(labels), amount)
+
+    def _inc_key(self, key: tuple[str, ...], amount: float):
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self):
+        for key, value in sorted(self._values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Gauge(_Metric):
+    """Текущее значение; можно задать функцию, которая вызывается при экспорте."""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: dict[tuple[str, ...], float] = {}
+        self._functions: dict[tuple[str, ...], callable] = {}
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, fn, **labels):
+        self._functions[self._key(labels)] = fn
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key, 0)
+
+    def samples(self):
+        values = dict(self._values)
+        for key, fn in self._functions.items():
+            values[key] = fn()
+        for key, value in sorted(values.items()):
+            yield self.name, _format_labels(self.labelnames, key), value
+
+
+class Histogram(_Metric):
+    """Гистограмма с фиксированными границами корзин."""
+
+    kind = "histogram"
+
+    DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        # key -> [counts по корзинам (+Inf последней), сумма]
+        self._values: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels):
+        self._observe_key(self._key(labels), value)
+
+    def _observe_key(self, key: tuple[str, ...], value: float):
+        idx = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][idx] += 1
+            entry[1] += value
+
+    def count(self, **labels) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self):
+        for key, (counts, total) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                yield f"{self.name}_bucket", _format_labels(self.labelnames, key, f'le="{le}"'), cumulative
+            yield f"{self.name}_sum", _format_labels(self.labelnames, key), total
+            yield f"{self.name}_count", _format_labels(self.labelnames, key), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        """Текстовый формат экспозиции Prometheus."""
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{labels} {value:g}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: tuple[str, ...] = ()) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: tuple[str, ...] = (), buckets=Histogram.DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+# ─── Метрики ─────────────────────────────────────────────────────────────────
+
+THROTTLED_UPDATES = counter(
+    "photoexpress_throttled_updates_total",
+    "Апдейты, отброшенные антифлудом",
+    ("event", "reason"),
+)
+
+HANDLER_LATENCY = histogram(
+    "photoexpress_handler_duration_seconds",
+    "Время работы хендлера",
+    ("handler",),
+)
+HANDLER_ERRORS = counter(
+    "photoexpress_handler_errors_total",
+    "Исключения в хендлерах",
+    ("handler",),
+)
+UPDATE_QUERIES = histogram(
+    "photoexpress_update_queries",
+    "Число SQL-запросов на один апдейт",
+    ("handler",),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+
+DB_QUERIES = counter(
+    "photoexpress_db_queries_total",
+    "Выполненные SQL-запросы",
+    ("statement",),
+)
+DB_QUERY_LATENCY = histogram(
+    "photoexpress_db_query_duration_seconds",
+    "Время выполнения SQL-запроса",
+    ("statement",),
+    buckets=(0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0),
+)
+
+WORKER_TICK_LATENCY = histogram(
+    "photoexpress_worker_tick_duration_seconds",
+    "Длительность одного прохода фонового воркера",
+    ("worker",),
+)
+WORKER_BACKLOG = gauge(
+    "photoexpress_worker_backlog",
+    "Сколько записей воркер нашёл к обработке на последнем проходе",
+    ("worker",),
+)
+WORKER_LAST_TICK = gauge(
+    "photoexpress_worker_last_tick_timestamp_seconds",
+    "Unix-время окончания последнего прохода воркера",
+    ("worker",),
+)
+
+TELEGRAM_API_LATENCY = histogram(
+    "photoexpress_telegram_api_duration_seconds",
+    "Время вызова метода Telegram Bot API",
+    ("method",),
+)
+TELEGRAM_API_ERRORS = counter(
+    "photoexpress_telegram_api_errors_total",
+    "Ошибки вызовов Telegram Bot API",
+    ("method", "error"),
+)
+
+UPLOAD_BYTES = counter(
+    "photoexpress_upload_bytes_total",
+    "Байты загруженных пользователями фото",
+)
+UPLOAD_LATENCY = histogram(
+    "photoexpress_upload_duration_seconds",
+    "Время загрузки фото по этапам",
+    ("stage",),
+)
+
+WEBHOOK_UPDATES = counter(
+    "photoexpress_webhook_updates_total",
+    "Апдейты, пришедшие на вебхук",
+    ("result",),
+)
+WEBHOOK_BACKLOG = gauge(
+    "photoexpress_webhook_backlog",
+    "Апдейты в очереди webhook-пула",
+)
+
+ACCOUNT_PURGE_ITEMS = counter(
+    "photoexpress_account_purge_items_total",
+    "Что стёрто при удалении аккаунтов",
+    ("kind",),
+)
+
+
+# ─── SQL: счётчики на апдейт и события движка ────────────────────────────────
+
+# Сколько запросов выполнено в рамках текущего апдейта (список из одного int,
+# чтобы инкрементировать без ContextVar.set внутри вложенных вызовов)
+current_query_count: ContextVar[list[int] | None] = ContextVar("current_query_count", default=None)
+
+
+def _statement_kind(statement: str) -> str:
+    return statement.lstrip().split(None, 1)[0].upper() if statement else ""
+
+
+def instrument_engine(engine):
+    """Вешает на движок SQLAlchemy счётчик запросов и гистограмму их длительности."""
+    from sqlalchemy import event
+
+    # текст запроса -> (счётчик, гистограмма) с уже проставленной меткой;
+    # SQLAlchemy кэширует скомпилированные запросы, так что различных строк немного
+    children: dict[str, tuple[_Child, _Child]] = {}
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_start = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - context._metrics_start
+        pair = children.get(statement)
+        if pair is None:
+            kind = _statement_kind(statement)
+            if len(children) < 10_000:
+                pair = children[statement] = (
+                    DB_QUERIES.labels(statement=kind),
+                    DB_QUERY_LATENCY.labels(statement=kind),
+                )
+            else:
+                pair = (DB_QUERIES.labels(statement=kind), DB_QUERY_LATENCY.labels(statement=kind))
+        pair[0].inc()
+        pair[1].observe(elapsed)
+        counter_box = current_query_count.get()
+        if counter_box is not None:
+            counter_box[0] += 1
+
+
+# ─── HTTP-эндпоинт ───────────────────────────────────────────────────────────
+
+async def start_metrics_server(host: str = "127.0.0.1", port: int = 9100):
+    """Поднимает /metrics в формате Prometheus. Возвращает runner для остановки."""
+    # aiohttp.web нужен только с включёнными метриками — не тянем его при импорте модуля
+    from aiohttp import web
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(
+            text=REGISTRY.render(),
+            content_type="text/plain",
+            headers={"X-Content-Type-Options": "nosniff"},
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
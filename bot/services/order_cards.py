@@ -0,0 +1,44 @@
+# bot/services/order_cards.py
+
+from datetime import datetime
+from decimal import Decimal
+from typing import NamedTuple
+
+from sqlalchemy import select
+
+from db.database import Order
+from bot.services.archive import user_orders
+
+
+class OrderCard(NamedTuple):
+    """
+    Карточка заказа для «Моих заказов» и ответа после правки — только то, что
+    показывается. Обычный кортеж: живёт после db.close() и не тянет за собой
+    сессию, pricing и прочие поля заказа.
+    """
+    order_id: int
+    number: int | None
+    created_at: datetime
+    photos: list[dict]
+    price: Decimal | None
+    paid: bool
+    delivery_point: str | None
+    receiver_name: str | None
+    receiver_phone: str | None
+    comment: str | None
+    archived: bool = False
+
+
+CARD_COLUMNS = OrderCard._fields[:-1]
+
+
+def user_order_cards(db, user_id: int, status: str, page: int, per_page: int = 1) -> list[OrderCard]:
+    """Страница «Моих заказов» (bot.services.archive.user_orders) карточками."""
+    return [OrderCard._make(row) for row in user_orders(db, user_id, status, page, per_page, CARD_COLUMNS)]
+
+
+def order_card(db, order_id: int) -> OrderCard | None:
+    row = db.execute(
+        select(*(Order.__table__.c[name] for name in CARD_COLUMNS)).where(Order.order_id == order_id)
+    ).first()
+    return OrderCard(*row) if row else None
@@ -0,0 +1,163 @@
+# bot/services/order_ids.py
+
+import threading
+import time
+
+from sqlalchemy import text
+
+from db.database import (
+    ORDER_ID_SEQUENCE_BITS,
+    ORDER_ID_WORKER_BITS,
+    SessionLocal,
+    OrderIdAlias,
+    make_order_id,
+)
+
+# ─── Ключи заказов ───────────────────────────────────────────────────────────
+
+
+class SnowflakeGenerator:
+    """
+    Растущие ключи заказов для одного процесса (см. db.database.make_order_id).
+    Если за миллисекунду выдано больше 4096 ключей или часы отступили назад,
+    генератор берёт следующую миллисекунду вперёд, а не ждёт: ключи остаются
+    уникальными и возрастающими.
+    """
+
+    def __init__(self, worker_id: int):
+        if not 0 <= worker_id < 1 << ORDER_ID_WORKER_BITS:
+            raise ValueError(f"номер процесса вне диапазона 0..{(1 << ORDER_ID_WORKER_BITS) - 1}")
+        self.worker_id = worker_id
+        self._lock = threading.Lock()
+        self._last_ms = 0
+        self._sequence = 0
+
+    def next_id(self) -> int:
+        with self._lock:
+            ms = max(time.time_ns() // 1_000_000, self._last_ms)
+            if ms == self._last_ms:
+                self._sequence += 1
+                if self._sequence >> ORDER_ID_SEQUENCE_BITS:
+                    ms, self._sequence = ms + 1, 0
+            else:
+                self._sequence = 0
+            self._last_ms = ms
+            return make_order_id(ms, self.worker_id, self._sequence)
+
+
+def allocate_worker_id() -> int:
+    """
+    Номер процесса для Snowflake: следующее значение общего счётчика в app_meta
+    по модулю 1024. Процессы, работающие с одной базой одновременно, получают
+    разные номера, пока их меньше 1024 запусков подряд.
+    """
+    db = SessionLocal()
+    try:
+        value = db.execute(text(
+            "INSERT INTO app_meta (key, value) VALUES ('order_id_worker', '0') "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1 "
+            "RETURNING CAST(value AS INTEGER)"
+        )).scalar_one()
+        db.commit()
+    finally:
+        db.close()
+    return value % (1 << ORDER_ID_WORKER_BITS)
+
+
+_generator: SnowflakeGenerator | None = None
+_generator_lock = threading.Lock()
+
+
+def new_order_id() -> int:
+    """Ключ для нового заказа; номер процесса берётся из базы при первом вызове."""
+    global _generator
+    if _generator is None:
+        with _generator_lock:
+            if _generator is None:
+                _generator = SnowflakeGenerator(allocate_worker_id())
+    return _generator.next_id()
+
+
+def parse_order_id(value) -> int | None:
+    """
+    Ключ заказа из callback_data, FSM или запроса провайдера. Прежние
+    uuid-ключи (кнопки в старых сообщениях) ищутся в order_id_aliases.
+    """
+    if isinstance(value, int):
+        return value
+    value = str(value).strip()
+    if value.isdigit():
+        return int(value)
+    if not value:
+        return None
+    db = SessionLocal()
+    try:
+        return db.query(OrderIdAlias.order_id).filter_by(legacy_id=value).scalar()
+    finally:
+        db.close()
+
+
+# ─── Короткие коды ───────────────────────────────────────────────────────────
+#
+# Код заказа для людей — порядковый номер, переставленный сетью Фейстеля и
+# записанный в base32 Крокфорда (без I, L, O, U). Перестановка взаимно
+# однозначна, поэтому разные номера всегда дают разные коды, а соседние
+# номера — непохожие. Первые 2^30 заказов получают 6 символов, дальше — 8,
+# 10, 12: у каждой длины свой диапазон номеров, и длины не пересекаются.
+
+CODE_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_CODE_DIGITS = {c: i for i, c in enumerate(CODE_ALPHABET)}
+_CODE_WIDTHS = (30, 40, 50, 60)     # бит; символов — width // 5
+_FEISTEL_KEYS = (0x5BD1E995, 0x27D4EB2D, 0x165667B1, 0x9E3779B1)
+
+
+def _round(half: int, key: int, bits: int) -> int:
+    x = (half * key + key) & 0xFFFFFFFFFFFF
+    x ^= x >> 17
+    return (x * 0x2545F491) >> 13 & ((1 << bits) - 1)
+
+
+def _permute(n: int, width: int, inverse: bool = False) -> int:
+    bits = width // 2
+    mask = (1 << bits) - 1
+    left, right = n >> bits, n & mask
+    if not inverse:
+        for key in _FEISTEL_KEYS:
+            left, right = right, left ^ _round(right, key, bits)
+    else:
+        for key in reversed(_FEISTEL_KEYS):
+            left, right = right ^ _round(left, key, bits), left
+    return left << bits | right
+
+
+def _width(number: int) -> int:
+    for width in _CODE_WIDTHS:
+        if number < 1 << width:
+            return width
+    raise ValueError(f"номер {number} не помещается в код")
+
+
+def short_code(number: int) -> str:
+    """Короткий код по порядковому номеру заказа."""
+    width = _width(number)
+    value = _permute(number, width)
+    return "".join(CODE_ALPHABET[value >> shift & 31] for shift in range(width - 5, -1, -5))
+
+
+def parse_short_code(code: str) -> int | None:
+    """Порядковый номер по коду; None — строка не похожа на выданный код."""
+    code = code.strip().lstrip("#").upper()
+    width = len(code) * 5
+    if width not in _CODE_WIDTHS or any(c not in _CODE_DIGITS for c in code):
+        return None
+    value = 0
+    for c in code:
+        value = value << 5 | _CODE_DIGITS[c]
+    number = _permute(value, width, inverse=True)
+    # код такой длины выдаётся только номерам своего диапазона
+    return number if _width(number) == width else None
+
+
+def order_code(order) -> str:
+    """Код заказа для сообщений; у заказа без номера — его ключ."""
+    return short_code(order.number) if order.number is not None else str(order.order_id)
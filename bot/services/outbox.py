@@ -0,0 +1,169 @@
+# bot/services/outbox.py
+
+from datetime import datetime, timedelta
+from typing import Any, NamedTuple
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm import Session
+
+from db.database import SessionLocal, OrderEvent
+from bot.services.order_ids import short_code
+
+# После стольких неудачных попыток событие откладывается с last_error и больше не отправляется
+MAX_ATTEMPTS = 5
+RETRY_BASE = timedelta(seconds=30)
+
+
+class OutboxEvent(NamedTuple):
+    id: int
+    order_id: int
+    telegram_id: int | None
+    kind: str
+    payload: dict
+    attempts: int
+
+
+def order_event(order_id: int, kind: str, telegram_id: int | None, dedup_key: str | None = None,
+                number: int | None = None, **payload: Any) -> dict:
+    """
+    Строка для emit_events. По умолчанию ключ — заказ + вид события. number —
+    порядковый номер заказа: его код попадает в payload для текста уведомления,
+    ведь к отправке заказа может уже не быть.
+    """
+    if number is not None:
+        payload["code"] = short_code(number)
+    return {
+        "dedup_key": dedup_key or f"{order_id}:{kind}",
+        "order_id": order_id,
+        "telegram_id": telegram_id,
+        "kind": kind,
+        "payload": payload,
+        "created_at": datetime.utcnow(),
+    }
+
+
+def emit_events(db: Session, events: list[dict]):
+    """
+    Записывает события в outbox в текущей транзакции `db` — одним INSERT
+    на всю пачку. Событие с уже записанным dedup_key пропускается.
+    """
+    if events:
+        db.execute(insert(OrderEvent).prefix_with("OR IGNORE"), events)
+
+
+# ─── Тексты уведомлений ──────────────────────────────────────────────────────
+
+def render_event(event: OutboxEvent) -> str | None:
+    """Текст уведомления для события; None — событие только для ленты изменений."""
+    short = event.payload.get("code") or event.order_id
+    if event.kind == "status_changed":
+        return f"🛠 Заказ #{short} переведён в статус «{event.payload.get('label')}»."
+    if event.kind == "paid":
+        # оплату кнопкой пользователь и так видит во всплывающем ответе
+        if event.payload.get("provider") == "manual":
+            return None
+        return f"✅ Оплата заказа #{short} получена."
+    if event.kind == "payment_reminder":
+        return f"💡 Напоминание: заказ #{short} всё ещё не оплачен."
+    if event.kind == "payment_warning":
+        return f"⚠️ Последнее предупреждение: заказ #{short} не оплачен."
+    if event.kind == "expired":
+        return f"❌ Заказ #{short} удалён из-за не оплаты."
+    if event.kind == "repriced":
+        return (f"💱 Прайс-лист обновлён: стоимость заказа #{short} теперь "
+                f"{event.payload['new_price']:.2f} ₽ (было {event.payload['old_price']:.2f} ₽).")
+    return None
+
+
+# ─── Чтение и отметки для релея ──────────────────────────────────────────────
+
+def _to_event(row: OrderEvent) -> OutboxEvent:
+    return OutboxEvent(row.id, row.order_id, row.telegram_id, row.kind, row.payload or {}, row.attempts)
+
+
+def fetch_pending(limit: int) -> list[OutboxEvent]:
+    """Необработанные события в порядке записи, у которых подошло время попытки."""
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(OrderEvent)
+            .filter(OrderEvent.delivered_at.is_(None))
+            .filter((OrderEvent.next_attempt_at.is_(None)) | (OrderEvent.next_attempt_at <= now))
+            .order_by(OrderEvent.id)
+            .limit(limit)
+            .all()
+        )
+        return [_to_event(r) for r in rows]
+    finally:
+        db.close()
+
+
+def mark_events(delivered: list[int], failed: list[tuple[OutboxEvent, str]], dropped: list[tuple[int, str]]):
+    """
+    Отмечает результат отправки пачки одной транзакцией: delivered — отправлены
+    (или не требуют отправки), failed — повторить позже с экспоненциальной
+    паузой, dropped — отправлять бессмысленно (пользователь заблокировал бота).
+    """
+    now = datetime.utcnow()
+    db = SessionLocal()
+    try:
+        if delivered:
+            db.execute(
+                update(OrderEvent).where(OrderEvent.id.in_(delivered)).values(delivered_at=now)
+            )
+        for event, error in failed:
+            attempts = event.attempts + 1
+            values = {"attempts": attempts, "last_error": error[:500]}
+            if attempts >= MAX_ATTEMPTS:
+                values["delivered_at"] = now
+            else:
+                values["next_attempt_at"] = now + RETRY_BASE * 2 ** (attempts - 1)
+            db.execute(update(OrderEvent).where(OrderEvent.id == event.id).values(**values))
+        if dropped:
+            for event_id, error in dropped:
+                db.execute(
+                    update(OrderEvent).where(OrderEvent.id == event_id)
+                    .values(delivered_at=now, last_error=error[:500])
+                )
+        db.commit()
+    finally:
+        db.close()
+
+
+def count_pending() -> int:
+    """Сколько событий ещё не обработано, включая отложенные повторы."""
+    db = SessionLocal()
+    try:
+        return db.query(OrderEvent).filter(OrderEvent.delivered_at.is_(None)).count()
+    finally:
+        db.close()
+
+
+def purge_delivered(older_than: timedelta) -> int:
+    """Удаляет обработанные события старше older_than."""
+    db = SessionLocal()
+    try:
+        deleted = (
+            db.query(OrderEvent)
+            .filter(OrderEvent.delivered_at < datetime.utcnow() - older_than)
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def events_since(after_id: int, limit: int = 1000) -> list[OutboxEvent]:
+    """
+    Лента изменений заказов для потребителей вроде кэшей и сводок: все события
+    с id > after_id по порядку, независимо от того, отправлены ли уведомления.
+    Потребитель хранит последний обработанный id у себя.
+    """
+    db = SessionLocal()
+    try:
+        rows = db.query(OrderEvent).filter(OrderEvent.id > after_id).order_by(OrderEvent.id).limit(limit).all()
+        return [_to_event(r) for r in rows]
+    finally:
+        db.close()
@@ -1,20 +1,207 @@
-from db.database import SessionLocal, Order, OrderStatus, User
+# bot/services/payment.py
 
-async def mark_order_paid(order_id: str) -> Order:
+import asyncio
+import logging
+from datetime import datetime
+from typing import Awaitable, Callable, Iterable, NamedTuple
+
+from sqlalchemy import insert, update
+
+from db.database import SessionLocal, Order, OrderIdAlias, PaymentConfirmation, User
+from bot.services.outbox import emit_events, order_event
+
+logger = logging.getLogger(__name__)
+
+# Расхождение суммы, которое считаем округлением провайдера
+AMOUNT_TOLERANCE = 0.01
+
+
+class Confirmation(NamedTuple):
+    key: str                    # идемпотентный ключ: provider:payment_id
+    order_id: int               # 0 — провайдер прислал ключ, которого у нас не бывает
+    amount: float | None = None
+    provider: str = "manual"
+    order_ref: str | None = None    # прежний uuid-ключ заказа; order_id по нему ищется при записи
+
+
+class PaymentResult(NamedTuple):
+    key: str
+    order_id: int
+    outcome: str                # applied / duplicate / already_paid / not_found / amount_mismatch
+    telegram_id: int | None = None
+
+
+def apply_confirmations(confirmations: Iterable[Confirmation]) -> list[PaymentResult]:
     """
-    Помечает заказ как оплаченный (paid=True), оставляет статус 'new'.
-    Возвращает обновленный объект Order.
+    Применяет пачку подтверждений оплаты в одной транзакции.
+
+    Каждый ключ обрабатывается не больше одного раза: повтор того же ключа
+    (ретрай провайдера, двойное нажатие) возвращает outcome="duplicate"
+    и ничего не меняет. Заказ помечается оплаченным только если ещё не был
+    оплачен и сумма совпала с ценой; результат записывается в payment_confirmations,
+    а об оплате — событие "paid" в outbox order_events. Прежние uuid-ключи
+    (order_ref) ищутся в order_id_aliases той же сессией.
     """
+    batch: dict[str, Confirmation] = {}
+    in_batch_repeats: list[Confirmation] = []
+    for c in confirmations:
+        if c.key in batch:
+            in_batch_repeats.append(c)
+        else:
+            batch[c.key] = c
+    if not batch:
+        return [PaymentResult(c.key, c.order_id, "duplicate") for c in in_batch_repeats]
+
     db = SessionLocal()
-    order = db.query(Order).filter_by(order_id=order_id).first()
-    if not order:
+    try:
+        refs = {c.order_ref for c in batch.values() if c.order_ref}
+        if refs:
+            aliases = dict(
+                db.query(OrderIdAlias.legacy_id, OrderIdAlias.order_id).filter(OrderIdAlias.legacy_id.in_(refs))
+            )
+            batch = {key: c._replace(order_id=aliases.get(c.order_ref, 0)) if c.order_ref else c
+                     for key, c in batch.items()}
+        orders = {
+            order_id: (paid, price, telegram_id, number)
+            for order_id, paid, price, telegram_id, number in (
+                db.query(Order.order_id, Order.paid, Order.price, User.telegram_id, Order.number)
+                .outerjoin(User, User.id == Order.user_id)
+                .filter(Order.order_id.in_({c.order_id for c in batch.values()}))
+            )
+        }
+
+        outcomes: dict[str, str] = {}
+        paying: set[int] = set()
+        for c in batch.values():
+            if c.order_id not in orders:
+                outcomes[c.key] = "not_found"
+                continue
+            paid, price, _, _ = orders[c.order_id]
+            if paid or c.order_id in paying:
+                outcomes[c.key] = "already_paid"
+            elif c.amount is not None and price is not None and abs(float(price) - c.amount) > AMOUNT_TOLERANCE:
+                outcomes[c.key] = "amount_mismatch"
+            else:
+                outcomes[c.key] = "applied"
+                paying.add(c.order_id)
+
+        # вставка с ON CONFLICT DO NOTHING берёт блокировку записи: ключи, которые
+        # успел принять другой процесс, не вернутся в RETURNING и станут дубликатами
+        now = datetime.utcnow()
+        stmt = (
+            insert(PaymentConfirmation)
+            .prefix_with("OR IGNORE")
+            .returning(PaymentConfirmation.key)
+        )
+        fresh = set(db.scalars(stmt, [
+            {"key": c.key, "order_id": c.order_id, "provider": c.provider, "amount": c.amount,
+             "outcome": outcomes[c.key], "received_at": now}
+            for c in batch.values()
+        ]))
+
+        to_pay = {c.order_id for c in batch.values() if c.key in fresh and outcomes[c.key] == "applied"}
+        if to_pay:
+            paid_now = set(db.scalars(
+                update(Order)
+                .where(Order.order_id.in_(to_pay), Order.paid == False)
+                .values(paid=True)
+                .returning(Order.order_id)
+            ))
+            # заказ успели оплатить в другой транзакции — поправляем запись о подтверждении
+            lost = [c.key for c in batch.values()
+                    if c.key in fresh and c.order_id in to_pay - paid_now]
+            if lost:
+                db.query(PaymentConfirmation).filter(PaymentConfirmation.key.in_(lost)).update(
+                    {PaymentConfirmation.outcome: "already_paid"}, synchronize_session=False
+                )
+                for key in lost:
+                    outcomes[key] = "already_paid"
+            emit_events(db, [
+                order_event(c.order_id, "paid", orders[c.order_id][2], number=orders[c.order_id][3],
+                            provider=c.provider, key=c.key)
+                for c in batch.values()
+                if c.key in fresh and outcomes[c.key] == "applied"
+            ])
+        db.commit()
+    finally:
         db.close()
-        return None
 
-    # Помечаем как оплаченный
-    order.paid = True
-    db.commit()
+    results = []
+    for c in batch.values():
+        outcome = outcomes[c.key] if c.key in fresh else "duplicate"
+        results.append(PaymentResult(c.key, c.order_id, outcome, orders.get(c.order_id, (None, None, None, None))[2]))
+    results.extend(PaymentResult(c.key, c.order_id, "duplicate") for c in in_batch_repeats)
+    return results
+
+
+def mark_order_paid(order_id: int) -> PaymentResult:
+    """Оплата кнопкой в боте: ключ по заказу, поэтому повторные нажатия — дубликаты."""
+    return apply_confirmations([Confirmation(f"manual:{order_id}", order_id)])[0]
+
+
+class PaymentIngestor:
+    """
+    Групповая запись подтверждений: submit() ставит подтверждение в очередь
+    и ждёт результата, а фоновая задача применяет накопившееся одной
+    транзакцией — сразу, как только освободится предыдущая, или по набору
+    max_batch. При всплеске подтверждений это одна запись в базу на пачку,
+    а не на каждое.
+    """
+
+    def __init__(
+        self,
+        max_batch: int = 200,
+        on_applied: Callable[[list[PaymentResult]], Awaitable[None]] | None = None,
+    ):
+        self.max_batch = max_batch
+        self.on_applied = on_applied
+        self._queue: asyncio.Queue[tuple[Confirmation, asyncio.Future]] = asyncio.Queue()
+        self._task: asyncio.Task | None = None
+        self.batches = 0
+        self.confirmations = 0
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def submit(self, confirmation: Confirmation) -> PaymentResult:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((confirmation, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            items = [await self._queue.get()]
+            while len(items) < self.max_batch and not self._queue.empty():
+                items.append(self._queue.get_nowait())
+
+            try:
+                results = await asyncio.to_thread(apply_confirmations, [c for c, _ in items])
+            except Exception as e:
+                logger.exception("Не удалось применить %s подтверждений оплаты", len(items))
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            self.batches += 1
+            self.confirmations += len(items)
+            # результаты идут в том же порядке, кроме повторов внутри пачки — сопоставляем по ключу
+            by_key: dict[str, list[PaymentResult]] = {}
+            for r in results:
+                by_key.setdefault(r.key, []).append(r)
+            for c, future in items:
+                if not future.done():
+                    future.set_result(by_key[c.key].pop(0))
 
-    db.refresh(order)
-    db.close()
-    return order
\ No newline at end of file
+            applied = [r for r in results if r.outcome == "applied"]
+            if applied and self.on_applied:
+                try:
+                    await self.on_applied(applied)
+                except Exception:
+                    logger.exception("Ошибка обработчика оплаченных заказов")
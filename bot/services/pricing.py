@@ -1,8 +1,20 @@
 # bot/services/pricing.py
 
-from .promo import apply_first_order_discount, validate_and_apply_promocode, PromoError
+import os
+import threading
+import time
+from operator import mul
+from typing import Iterable, NamedTuple
 
-# Новые (обновлённые) цены для форматов
+from sqlalchemy import func, insert
+
+from db.database import SessionLocal, PriceList
+from .promo import apply_first_order_discount, apply_percent, validate_and_apply_promocode, PromoError
+from .tracing import traced
+
+# Прайс-лист версии 1: с ним создаётся таблица price_lists, и по нему же
+# посчитаны заказы, созданные до появления версий (orders.price_version IS NULL).
+# Действующие цены меняются новой версией в базе (scripts/prices.py), не здесь.
 PRICES = {
     "10x15": 20,
     "13x18": 30,
@@ -11,12 +23,255 @@ PRICES = {
     "30x40": 60,
     "30x45": 70,
 }
+DEFAULT_UNIT_PRICE = 20
 
 DISCOUNT_THRESHOLDS = {
     50: 0.95,   # 5% скидка, если суммарное количество копий ≥50
     100: 0.90,  # 10% скидка, если ≥100
 }
 
+# Форматы печати. id формата — индекс в этом списке; всё, чего в нём нет, — OTHER_FORMAT
+FORMATS = ["10x15", "13x18", "15x21", "21x30 (A4)", "30x40", "30x45"]
+FORMAT_IDS = {name: i for i, name in enumerate(FORMATS)}
+OTHER_FORMAT = len(FORMATS)
+DEFAULT_FORMAT = "10x15"
+
+# Как часто процесс проверяет, не появилась ли новая версия прайс-листа
+PRICE_RELOAD_INTERVAL = float(os.getenv("PRICE_RELOAD_INTERVAL", "30"))
+
+
+class PriceTable:
+    """
+    Прайс-лист, собранный для расчёта: цены копий лежат в кортеже по id
+    формата, пороги — по возрастанию. Заказ описывается вектором копий по
+    id формата (copy_counts), и его цена — одно скалярное произведение.
+    """
+    __slots__ = ("version", "unit_prices", "thresholds")
+
+    def __init__(self, version: int, prices: dict, default_price: float, thresholds: Iterable):
+        self.version = version
+        self.unit_prices = tuple(float(prices.get(name, default_price)) for name in FORMATS) + (float(default_price),)
+        self.thresholds = tuple(sorted((int(copies), float(mult)) for copies, mult in thresholds))
+
+    def multiplier(self, total_copies: int) -> float:
+        result = 1.0
+        for threshold, mult in self.thresholds:
+            if total_copies < threshold:
+                break
+            result = mult
+        return result
+
+    def price_counts(self, counts: list[int]) -> tuple[float, float, float]:
+        """(raw_total, сумма после скидки за объём, скидка за объём) для вектора копий."""
+        raw_total = float(sum(map(mul, self.unit_prices, counts)))
+        discounted = round(raw_total * self.multiplier(sum(counts)), 2)
+        return raw_total, discounted, round(raw_total - discounted, 2)
+
+    def price_batch(self, counts: Iterable[list[int]]) -> list[tuple[float, float, float]]:
+        """price_counts для пачки заказов — например, векторов из order_copy_counts()."""
+        price_counts = self.price_counts
+        return [price_counts(c) for c in counts]
+
+
+class PriceQuote(NamedTuple):
+    version: int
+    raw_total: float
+    discounted: float           # после скидки за объём
+    threshold_discount: float
+
+
+def copy_counts(photos: list[dict]) -> list[int]:
+    """Вектор копий по id формата для списка фото заказа."""
+    counts = [0] * (OTHER_FORMAT + 1)
+    format_id = FORMAT_IDS.get
+    for p in photos:
+        counts[format_id(p.get("format", DEFAULT_FORMAT), OTHER_FORMAT)] += p.get("copies", 1)
+    return counts
+
+
+# ─── Версии прайс-листа ──────────────────────────────────────────────────────
+
+_lock = threading.Lock()
+_tables: dict[int, PriceTable] = {}     # версии не меняются, поэтому кэшируются навсегда
+_current: PriceTable | None = None
+_checked_at = 0.0
+
+
+def _compile(row: PriceList) -> PriceTable:
+    return PriceTable(row.version, row.prices, row.default_price, row.thresholds)
+
+
+def _load(version: int | None) -> PriceTable:
+    db = SessionLocal()
+    try:
+        if version is None:
+            version = db.query(func.max(PriceList.version)).scalar() or 1
+        row = db.get(PriceList, version)
+        if row is None and version == 1:
+            # первый запуск с версиями: записываем прайс-лист из констант как версию 1
+            db.execute(insert(PriceList).prefix_with("OR IGNORE").values(
+                version=1, prices=PRICES, default_price=DEFAULT_UNIT_PRICE,
+                thresholds=sorted(DISCOUNT_THRESHOLDS.items()), comment="исходный прайс-лист",
+            ))
+            db.commit()
+            row = db.get(PriceList, 1)
+        if row is None:
+            raise LookupError(f"Нет прайс-листа версии {version}")
+        return _compile(row)
+    finally:
+        db.close()
+
+
+def get_price_table(version: int | None = None) -> PriceTable:
+    """
+    Прайс-лист версии version или действующий (version=None). Действующий
+    берётся из памяти и сверяется с базой не чаще PRICE_RELOAD_INTERVAL —
+    одним SELECT max(version); новая версия подхватывается без перезапуска.
+    """
+    global _current, _checked_at
+    if version is not None:
+        table = _tables.get(version)
+        if table is None:
+            table = _load(version)
+            with _lock:
+                _tables[version] = table
+        return table
+
+    if _current is not None and time.monotonic() - _checked_at < PRICE_RELOAD_INTERVAL:
+        return _current
+    db = SessionLocal()
+    try:
+        latest = db.query(func.max(PriceList.version)).scalar()
+    finally:
+        db.close()
+    if latest is None:
+        table = _load(None)
+    elif _current is not None and _current.version == latest:
+        table = _current
+    else:
+        table = get_price_table(latest)
+    with _lock:
+        _tables[table.version] = table
+        _current = table
+        _checked_at = time.monotonic()
+    return table
+
+
+def invalidate_price_table():
+    """Следующий get_price_table() сверится с базой сразу."""
+    global _checked_at
+    _checked_at = 0.0
+
+
+def publish_price_list(
+    prices: dict[str, float],
+    thresholds: dict[int, float],
+    default_price: float,
+    comment: str | None = None,
+) -> int:
+    """
+    Записывает новую версию прайс-листа и возвращает её номер. Открытые
+    заказы пересчитает задача reprice_orders.
+    """
+    if any(float(v) <= 0 for v in prices.values()) or float(default_price) <= 0:
+        raise ValueError("цены должны быть положительными")
+    if any(int(c) <= 0 or not 0 < float(m) <= 1 for c, m in thresholds.items()):
+        raise ValueError("порог — положительное число копий, множитель — в (0, 1]")
+    get_price_table()   # версия 1 должна существовать раньше новой
+    db = SessionLocal()
+    try:
+        version = (db.query(func.max(PriceList.version)).scalar() or 0) + 1
+        db.add(PriceList(
+            version=version,
+            prices={name: float(v) for name, v in prices.items()},
+            default_price=float(default_price),
+            thresholds=sorted((int(c), float(m)) for c, m in thresholds.items()),
+            comment=comment,
+        ))
+        db.commit()
+    finally:
+        db.close()
+    invalidate_price_table()
+    return version
+
+
+# ─── Сводка заказа ───────────────────────────────────────────────────────────
+#
+# Заказ хранит в orders.pricing всё, что нужно для пересчёта цены:
+#   {"photos":    [фото по id формата],
+#    "copies":    [копии по id формата],
+#    "subtotals": [сумма по id формата без скидок, по прайс-листу price_version],
+#    "personal":  null | {"kind": "first_order" | "promo" | "legacy", "percent": 30, "code": "..."}}
+# Правка форматов или копий меняет векторы за O(числа форматов), а скидка за
+# объём и личная скидка пересчитываются из сводки — без разбора фото и без
+# запросов к пользователю и промокодам.
+
+def personal_discount(kind: str, percent: float, code: str | None = None) -> dict:
+    """Личная скидка для сводки: первый заказ, промокод или восстановленная у старого заказа."""
+    personal = {"kind": kind, "percent": percent}
+    if code:
+        personal["code"] = code
+    return personal
+
+
+def _subtotals(table: PriceTable, copies: list[int]) -> list[float]:
+    return list(map(mul, table.unit_prices, copies))
+
+
+def price_summary(photos: list[dict], table: PriceTable, personal: dict | None = None) -> dict:
+    """Сводка для списка фото — единственный полный проход по ним."""
+    by_format = [0] * (OTHER_FORMAT + 1)
+    format_id = FORMAT_IDS.get
+    for p in photos:
+        by_format[format_id(p.get("format", DEFAULT_FORMAT), OTHER_FORMAT)] += 1
+    copies = copy_counts(photos)
+    return {"photos": by_format, "copies": copies, "subtotals": _subtotals(table, copies), "personal": personal}
+
+
+def edit_summary(summary: dict, table: PriceTable, *, fmt: str | None = None, copies: int | None = None) -> dict:
+    """
+    Сводка после правки «всем фото формат fmt» и/или «всем фото copies копий»
+    (так заказ правят в «Моих заказах»). Исходная сводка не меняется.
+    """
+    by_format, counts = list(summary["photos"]), list(summary["copies"])
+    if fmt is not None:
+        target = FORMAT_IDS.get(fmt, OTHER_FORMAT)
+        by_format, counts = [0] * len(by_format), [0] * len(counts)
+        by_format[target], counts[target] = sum(summary["photos"]), sum(summary["copies"])
+    if copies is not None:
+        counts = [n * copies for n in by_format]
+    return {**summary, "photos": by_format, "copies": counts, "subtotals": _subtotals(table, counts)}
+
+
+def retarget_summary(summary: dict, table: PriceTable) -> dict:
+    """Сводка с подытогами по другой версии прайс-листа."""
+    return {**summary, "subtotals": _subtotals(table, summary["copies"])}
+
+
+def summary_totals(summary: dict, table: PriceTable) -> tuple[float, float, float]:
+    """
+    (raw_total, final_total, discount_amount) — как у calculate_order_price:
+    скидка за объём по сумме копий, затем личная скидка из сводки.
+    """
+    raw_total = float(sum(summary["subtotals"]))
+    discounted = round(raw_total * table.multiplier(sum(summary["copies"])), 2)
+    threshold_discount = round(raw_total - discounted, 2)
+    personal = summary.get("personal")
+    if not personal:
+        return raw_total, discounted, threshold_discount
+    final_total, personal_amount = apply_percent(discounted, personal["percent"])
+    return raw_total, final_total, round(threshold_discount + personal_amount, 2)
+
+
+# ─── Расчёт цены ─────────────────────────────────────────────────────────────
+
+def quote_photos(photos: list[dict]) -> PriceQuote:
+    """Цена фото по действующему прайс-листу со скидкой за объём, вместе с версией прайс-листа."""
+    table = get_price_table()
+    return PriceQuote(table.version, *table.price_counts(copy_counts(photos)))
+
+
+@traced("pricing.calculate_order_price")
 def calculate_order_price(
     photos: list[dict],
     user_id: int | None = None,
@@ -30,34 +285,20 @@ def calculate_order_price(
 
     Логика:
     1) Считаем raw_total по перечисленным форматам и копиям.
-    2) Сначала пробуем (если user_id передан) дать 30% на первый заказ: 
+    2) Сначала пробуем (если user_id передан) дать 30% на первый заказ:
        apply_first_order_discount(user_id, raw_total).
-    3) Если передан promocode и это не первый заказ, применяем промокод: 
+    3) Если передан promocode и это не первый заказ, применяем промокод:
        validate_and_apply_promocode(promocode, raw_total).
     4) Если ни первого заказа, ни промокода нет — возвращаем raw_total и нулевую скидку.
     """
-    raw_total = 0.0
-    total_copies = 0
+    # базовая скидка по объёму копий (threshold), потом —
+    # скидка на первый заказ или промокод (они перекрывают)
+    quote = quote_photos(photos)
+    raw_total = quote.raw_total
+    discounted_by_threshold = quote.discounted
+    threshold_discount_amount = quote.threshold_discount
 
-    for p in photos:
-        fmt = p.get("format", "10x15")
-        copies = p.get("copies", 1)
-        unit_price = PRICES.get(fmt, 20)
-        raw_total += unit_price * copies
-        total_copies += copies
-
-    # Ещё раз: базовая скидка по объёму копий (threshold), потом — 
-    # скидка на первый заказ или промокод (они перекрывают).
-    # Но исходный код до этого уже выдавал скидки по порогу DISCOUNT_THRESHOLDS.
-    discount_multiplier = 1.0
-    for threshold, mult in sorted(DISCOUNT_THRESHOLDS.items()):
-        if total_copies >= threshold:
-            discount_multiplier = mult
-
-    discounted_by_threshold = round(raw_total * discount_multiplier, 2)
-    threshold_discount_amount = round(raw_total - discounted_by_threshold, 2)
-
-    # Теперь перекрываем этим (для простоты): 
+    # Теперь перекрываем этим (для простоты):
     # если задан user_id и first_order — 30%. Иначе если передан promocode — применяем его.
     final_total = discounted_by_threshold
     total_discount = threshold_discount_amount
@@ -0,0 +1,364 @@
+# bot/services/print_queue.py
+
+import os
+from collections import defaultdict
+from datetime import datetime, time, timedelta
+from pathlib import Path
+from typing import Iterable, NamedTuple
+
+from sqlalchemy import delete, exists, func, insert, or_, select, update
+
+from db.database import SessionLocal, Order, PickupPoint, PrintJob, PrintRun, ROLLUP_DAY_SHIFT_HOURS
+from bot.services.order_ids import order_code
+from bot.services.pricing import DEFAULT_FORMAT, FORMATS
+from bot.services.storage import atomic_write_bytes
+
+# Очередь печати лаборатории. Оплаченный заказ в in_progress раскладывается
+# на задания — фото одного формата, — задания разных заказов собираются в
+# прогоны по формату, и прогоны выстраиваются так, чтобы бумагу меняли как
+# можно реже, но каждый заказ успевал к отправке в свой ПВЗ.
+PRINT_CHANGEOVER     = timedelta(minutes=float(os.getenv("PRINT_CHANGEOVER_MINUTES", "5")))
+PRINT_PACK_TIME      = timedelta(minutes=float(os.getenv("PRINT_PACK_MINUTES", "30")))
+PRINT_MAX_AGE        = timedelta(hours=float(os.getenv("PRINT_MAX_AGE_HOURS", "6")))
+PRINT_MAX_RUN        = timedelta(minutes=float(os.getenv("PRINT_MAX_RUN_MINUTES", "60")))
+PRINT_DISPATCH_TIMES = os.getenv("PRINT_DISPATCH_TIMES", "12:00,17:00")
+PRINT_HISTORY_DAYS   = int(os.getenv("PRINT_HISTORY_DAYS", "7"))
+PRINT_PLAN_INTERVAL  = float(os.getenv("PRINT_PLAN_INTERVAL", "300"))
+PRINT_SHEETS_DIR     = Path(os.getenv("PRINT_SHEETS_DIR", "print_sheets"))
+
+# секунд печати на копию; незнакомый формат — как DEFAULT_FORMAT
+SECONDS_PER_COPY = dict(zip(FORMATS, (4, 5, 6, 12, 25, 30)))
+
+# время отправки в ПВЗ — московское, как день сводок
+_LOCAL_SHIFT = timedelta(hours=ROLLUP_DAY_SHIFT_HOURS)
+
+
+class QueuedJob(NamedTuple):
+    order_id: int
+    format: str
+    photos: int
+    copies: int
+    due_at: datetime        # напечатать до этого момента
+    created_at: datetime
+
+
+class PlannedRun(NamedTuple):
+    format: str
+    jobs: tuple[QueuedJob, ...]     # в порядке печати
+    start: datetime                 # после смены бумаги, если она нужна
+    finish: datetime
+    changeover: bool
+
+
+class PlanResult(NamedTuple):
+    orders: int = 0     # заказов добавлено в очередь
+    dropped: int = 0    # заданий снято: заказ отменён или ушёл из in_progress
+    jobs: int = 0       # заданий ждут печати
+    runs: int = 0       # прогонов в плане
+    replanned: bool = False
+
+
+class StartedRun(NamedTuple):
+    run_id: int
+    format: str
+    photos: int
+    copies: int
+    sheet: Path
+
+
+def print_time(fmt: str, copies: int) -> timedelta:
+    return timedelta(seconds=SECONDS_PER_COPY.get(fmt, SECONDS_PER_COPY[DEFAULT_FORMAT]) * copies)
+
+
+def dispatch_times(value: str | None) -> list[time]:
+    """'12:00,17:00' → моменты отправки; пусто — PRINT_DISPATCH_TIMES."""
+    return sorted(time.fromisoformat(part.strip()) for part in (value or PRINT_DISPATCH_TIMES).split(",") if part.strip())
+
+
+def next_dispatch(after: datetime, times: list[time]) -> datetime | None:
+    """Ближайшая отправка (UTC) не раньше after; times — по Москве."""
+    local = after + _LOCAL_SHIFT
+    for days in range(2):
+        day = local.date() + timedelta(days=days)
+        for moment in times:
+            if datetime.combine(day, moment) >= local:
+                return datetime.combine(day, moment) - _LOCAL_SHIFT
+    return None
+
+
+def due_at(created_at: datetime, queued_at: datetime, times: list[time]) -> datetime:
+    """
+    Срок печати заказа: ближайшая отправка в его ПВЗ, до которой остаётся
+    время на упаковку, минус эта упаковка — но не позже PRINT_MAX_AGE от
+    создания заказа, чтобы заказы к далёкой отправке не копились в хвосте.
+    """
+    by_age = created_at + PRINT_MAX_AGE
+    dispatch = next_dispatch(queued_at + PRINT_PACK_TIME, times)
+    return by_age if dispatch is None else min(dispatch - PRINT_PACK_TIME, by_age)
+
+
+def split_by_format(photos: Iterable[dict]) -> dict[str, tuple[int, int]]:
+    """{формат: (фото, копий)} для списка фото заказа."""
+    result = defaultdict(lambda: [0, 0])
+    for p in photos:
+        counts = result[p.get("format", DEFAULT_FORMAT)]
+        counts[0] += 1
+        counts[1] += p.get("copies", 1)
+    return {fmt: (count, copies) for fmt, (count, copies) in result.items()}
+
+
+# ─── План ────────────────────────────────────────────────────────────────────
+
+
+def _can_wait(left: list[int], pos: int, t: float, due: list[float], dur: list[float],
+              fmt: list[str], change: float) -> bool:
+    """
+    Можно ли напечатать left[pos] — первое задание на текущей бумаге — раньше
+    более срочных заданий left[:pos] других форматов. Для каждого из них
+    оценка снизу: все задания до него по сроку плюс по одной смене бумаги на
+    формат. Нельзя, если задание из-за этого опоздает; те, что опоздают и так,
+    не мешают — при перегрузке лишние смены бумаги только удлинят хвост.
+    """
+    extra = dur[left[pos]]
+    work = 0.0
+    formats = set()
+    for i in left[:pos]:
+        work += dur[i]
+        formats.add(fmt[i])
+        finish = t + work + change * len(formats)
+        if finish <= due[i] < finish + extra:
+            return False
+    return True
+
+
+def sequence_jobs(
+    jobs: Iterable[QueuedJob],
+    now: datetime,
+    paper: str | None = None,
+    changeover: timedelta = PRINT_CHANGEOVER,
+    max_run: timedelta = PRINT_MAX_RUN,
+) -> list[PlannedRun]:
+    """
+    Порядок печати начиная с now, когда в принтере бумага paper. Жадно: пока
+    есть задания на текущей бумаге и их печать не сорвёт срок более срочных
+    заданий (_can_wait), печатаем их по сроку; иначе меняем бумагу на формат
+    самого срочного задания. При равных сроках раньше идут старые заказы.
+    Прогон длиннее max_run делится на несколько подряд — без смены бумаги,
+    но план между ними успевает учесть новые заказы.
+    """
+    pending = sorted(jobs, key=lambda j: (j.due_at, j.created_at, j.order_id, j.format))
+    due = [(j.due_at - now).total_seconds() for j in pending]
+    dur = [print_time(j.format, j.copies).total_seconds() for j in pending]
+    fmt = [j.format for j in pending]
+    change, limit = changeover.total_seconds(), max_run.total_seconds()
+
+    runs: list[list] = []     # [формат, индексы, начало, конец, смена бумаги]
+    left = list(range(len(pending)))
+    t = 0.0
+    while left:
+        pos = next((k for k, i in enumerate(left) if fmt[i] == paper), None)
+        if pos is None or not _can_wait(left, pos, t, due, dur, fmt, change):
+            pos = 0
+        i = left.pop(pos)
+        switch = fmt[i] != paper
+        if switch or not runs or runs[-1][3] - runs[-1][2] + dur[i] > limit:
+            t += change if switch else 0.0
+            runs.append([fmt[i], [], t, t, switch])
+            paper = fmt[i]
+        t += dur[i]
+        runs[-1][1].append(i)
+        runs[-1][3] = t
+
+    return [
+        PlannedRun(f, tuple(pending[i] for i in indices), now + timedelta(seconds=start),
+                   now + timedelta(seconds=finish), switch)
+        for f, indices, start, finish, switch in runs
+    ]
+
+
+def _printer_state(db, now: datetime) -> tuple[datetime, str | None]:
+    """Когда принтер освободится и какая в нём бумага — по начатому или последнему прогону."""
+    current = db.query(PrintRun).filter(PrintRun.status == "printing").order_by(PrintRun.started_at).first()
+    if current:
+        busy_until = current.started_at + print_time(current.format, current.copies)
+        return max(now, busy_until), current.format
+    last = db.query(PrintRun.format).filter(PrintRun.status == "done").order_by(PrintRun.finished_at.desc()).first()
+    return now, last.format if last else None
+
+
+def plan_print_queue(now: datetime | None = None, force: bool = False) -> PlanResult:
+    """
+    Шаг планировщика: снимает задания заказов, которые уже не ждут печати,
+    раскладывает на задания новые заказы в in_progress и, если что-то
+    изменилось (или force), пересобирает план — все прогоны planned. Начатые
+    прогоны не трогаются. Старые завершённые прогоны удаляются через
+    PRINT_HISTORY_DAYS.
+    """
+    now = now or datetime.utcnow()
+    db = SessionLocal()
+    try:
+        started = select(PrintRun.id).where(PrintRun.status != "planned")
+        dropped = db.execute(
+            delete(PrintJob).where(
+                or_(PrintJob.run_id.is_(None), PrintJob.run_id.not_in(started)),
+                ~exists().where(Order.order_id == PrintJob.order_id, Order.status == "in_progress"),
+            )
+        ).rowcount
+        old_runs = select(PrintRun.id).where(
+            PrintRun.status == "done", PrintRun.finished_at < now - timedelta(days=PRINT_HISTORY_DAYS)
+        )
+        db.execute(delete(PrintJob).where(PrintJob.run_id.in_(old_runs)))
+        db.execute(delete(PrintRun).where(PrintRun.id.in_(old_runs)))
+
+        times = {name: dispatch_times(value) for name, value in db.query(PickupPoint.name, PickupPoint.dispatch_times)}
+        default_times = dispatch_times(None)
+        fresh = (
+            db.query(Order.order_id, Order.photos, Order.delivery_point, Order.created_at)
+            .filter(Order.status == "in_progress", ~exists().where(PrintJob.order_id == Order.order_id))
+            .all()
+        )
+        rows = []
+        for order_id, photos, point, created_at in fresh:
+            due = due_at(created_at, now, times.get(point, default_times))
+            for fmt, (count, copies) in split_by_format(photos or []).items():
+                rows.append({"order_id": order_id, "format": fmt, "photos": count, "copies": copies,
+                             "queued_at": now, "due_at": due})
+        if rows:
+            db.execute(insert(PrintJob), rows)
+
+        last_plan = db.query(func.max(PrintRun.planned_at)).filter(PrintRun.status == "planned").scalar()
+        changed = force or rows or dropped or last_plan is None or db.query(
+            exists().where(or_(PrintRun.started_at >= last_plan, PrintRun.finished_at >= last_plan))
+        ).scalar()
+        planned = select(PrintRun.id).where(PrintRun.status == "planned")
+        if not changed:
+            db.commit()
+            return PlanResult(jobs=db.query(func.count(PrintJob.id)).filter(PrintJob.run_id.in_(planned)).scalar())
+
+        db.execute(update(PrintJob).where(PrintJob.run_id.in_(planned)).values(run_id=None))
+        db.execute(delete(PrintRun).where(PrintRun.status == "planned"))
+        queued = [
+            (job_id, QueuedJob(*row))
+            for job_id, *row in db.query(
+                PrintJob.id, PrintJob.order_id, PrintJob.format, PrintJob.photos, PrintJob.copies,
+                PrintJob.due_at, Order.created_at,
+            )
+            .join(Order, Order.order_id == PrintJob.order_id)
+            .filter(PrintJob.run_id.is_(None))
+        ]
+        ids = {(job.order_id, job.format): job_id for job_id, job in queued}
+        start, paper = _printer_state(db, now)
+        plan = sequence_jobs([job for _, job in queued], start, paper)
+        for position, run in enumerate(plan, 1):
+            row = PrintRun(
+                format=run.format, position=position, planned_at=now,
+                photos=sum(job.photos for job in run.jobs), copies=sum(job.copies for job in run.jobs),
+                due_at=min(job.due_at for job in run.jobs),
+            )
+            db.add(row)
+            db.flush()
+            db.execute(update(PrintJob), [{"id": ids[job.order_id, job.format], "run_id": row.id} for job in run.jobs])
+        db.commit()
+        return PlanResult(len(fresh), dropped, len(queued), len(plan), True)
+    finally:
+        db.close()
+
+
+# ─── Лаборатория ─────────────────────────────────────────────────────────────
+
+
+def _local(moment: datetime | None) -> str:
+    return f"{moment + _LOCAL_SHIFT:%d.%m %H:%M}" if moment else "—"
+
+
+def job_sheet(db, run_id: int) -> str:
+    """Лист прогона для оператора: заказы по сроку, у каждого — его фото этого формата."""
+    run = db.get(PrintRun, run_id)
+    if run is None:
+        raise ValueError(f"прогона #{run_id} нет")
+    rows = (
+        db.query(Order.order_id, Order.number, Order.photos, Order.delivery_point, PrintJob.due_at)
+        .join(PrintJob, PrintJob.order_id == Order.order_id)
+        .filter(PrintJob.run_id == run_id)
+        .order_by(PrintJob.due_at, Order.created_at)
+        .all()
+    )
+    minutes = print_time(run.format, run.copies).total_seconds() / 60
+    lines = [
+        f"Прогон #{run.id} — бумага {run.format}",
+        f"Фото: {run.photos}, копий: {run.copies}, печать ~{minutes:.0f} мин; первый срок {_local(run.due_at)} (МСК)",
+        "",
+    ]
+    for row in rows:
+        lines.append(f"Заказ {order_code(row)} · {row.delivery_point or 'ПВЗ не выбран'} · до {_local(row.due_at)}")
+        for p in row.photos or []:
+            if p.get("format", DEFAULT_FORMAT) == run.format:
+                lines.append(f"  {p['copies']:>3} × {p['filename']}    {p['path']}")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def start_next_run(now: datetime | None = None) -> StartedRun | None:
+    """
+    Отдаёт в печать первый прогон плана (план перед этим обновляется) и
+    сохраняет его лист в PRINT_SHEETS_DIR. None — печатать нечего; пока
+    печатается другой прогон — ValueError: принтер один.
+    """
+    now = now or datetime.utcnow()
+    plan_print_queue(now)
+    db = SessionLocal()
+    try:
+        busy = db.query(PrintRun.id).filter(PrintRun.status == "printing").first()
+        if busy:
+            raise ValueError(f"сначала завершите прогон #{busy.id}")
+        run = (
+            db.query(PrintRun).filter(PrintRun.status == "planned").order_by(PrintRun.position).first()
+        )
+        if run is None:
+            return None
+        run.status, run.position, run.started_at = "printing", None, now
+        sheet = PRINT_SHEETS_DIR / f"{now + _LOCAL_SHIFT:%Y%m%d-%H%M}-run{run.id}.txt"
+        PRINT_SHEETS_DIR.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(sheet, job_sheet(db, run.id).encode())
+        db.commit()
+        return StartedRun(run.id, run.format, run.photos, run.copies, sheet)
+    finally:
+        db.close()
+
+
+def finish_run(run_id: int, now: datetime | None = None) -> list:
+    """Отмечает прогон напечатанным. Возвращает заказы, у которых напечатано всё, — их пора упаковывать."""
+    now = now or datetime.utcnow()
+    db = SessionLocal()
+    try:
+        run = db.get(PrintRun, run_id)
+        if run is None or run.status != "printing":
+            raise ValueError(f"прогон #{run_id} не печатается")
+        run.status, run.finished_at = "done", now
+        db.flush()
+        order_ids = select(PrintJob.order_id).where(PrintJob.run_id == run_id)
+        unfinished = (
+            select(PrintJob.order_id)
+            .outerjoin(PrintRun, PrintRun.id == PrintJob.run_id)
+            .where(PrintJob.order_id.in_(order_ids), or_(PrintRun.id.is_(None), PrintRun.status != "done"))
+        )
+        ready = (
+            db.query(Order.order_id, Order.number, Order.delivery_point)
+            .filter(Order.order_id.in_(order_ids), Order.order_id.not_in(unfinished))
+            .order_by(Order.delivery_point, Order.created_at)
+            .all()
+        )
+        db.commit()
+        return ready
+    finally:
+        db.close()
+
+
+def open_runs(db) -> list[PrintRun]:
+    """Печатающийся прогон и план по порядку."""
+    return (
+        db.query(PrintRun)
+        .filter(PrintRun.status != "done")
+        .order_by(PrintRun.status != "printing", PrintRun.position)
+        .all()
+    )
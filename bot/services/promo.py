@@ -2,11 +2,23 @@
 
 from datetime import datetime
 from db.database import SessionLocal, PromoCode, User
+from .tracing import traced
+
+# Скидка на первый заказ, %
+FIRST_ORDER_PERCENT = 30
+
 
 class PromoError(Exception):
     pass
 
 
+def apply_percent(base_total: float, percent: float) -> tuple[float, float]:
+    """Скидка percent% от base_total. Возвращает (new_total, discount_amount)."""
+    discount_amount = round(base_total * percent / 100, 2)
+    return round(base_total - discount_amount, 2), discount_amount
+
+
+@traced("promo.first_order_discount")
 def apply_first_order_discount(user_id: int, base_total: float) -> tuple[float, float]:
     """
     Если это первый оплаченный заказ пользователя, даём 30% скидку.
@@ -20,8 +32,7 @@ def apply_first_order_discount(user_id: int, base_total: float) -> tuple[float,
 
     if not user.first_order_paid:
         # Применяем 30% скидку
-        discount_amount = round(base_total * 0.30, 2)
-        new_total = round(base_total - discount_amount, 2)
+        new_total, discount_amount = apply_percent(base_total, FIRST_ORDER_PERCENT)
     else:
         discount_amount = 0.0
         new_total = base_total
@@ -30,11 +41,11 @@ def apply_first_order_discount(user_id: int, base_total: float) -> tuple[float,
     return new_total, discount_amount
 
 
-def validate_and_apply_promocode(code: str, base_total: float) -> tuple[float, float]:
+@traced("promo.validate")
+def redeem_promocode(code: str) -> int:
     """
-    Проверяет промокод, применяет процент. 
-    Возвращает (new_total, discount_amount).
-    Может бросить PromoError с текстом ошибки.
+    Проверяет промокод и списывает одно использование.
+    Возвращает процент скидки; может бросить PromoError с текстом ошибки.
     """
     db = SessionLocal()
     promo = db.query(PromoCode).filter_by(code=code).first()
@@ -50,8 +61,7 @@ def validate_and_apply_promocode(code: str, base_total: float) -> tuple[float, f
         db.close()
         raise PromoError("Промокод исчерпан")
 
-    discount_amount = round(base_total * promo.discount_percent / 100, 2)
-    new_total = round(base_total - discount_amount, 2)
+    percent = promo.discount_percent
 
     # Уменьшаем счётчик uses_left, если он задан
     if promo.uses_left is not None:
@@ -59,4 +69,13 @@ def validate_and_apply_promocode(code: str, base_total: float) -> tuple[float, f
 
     db.commit()
     db.close()
-    return new_total, discount_amount
+    return percent
+
+
+def validate_and_apply_promocode(code: str, base_total: float) -> tuple[float, float]:
+    """
+    Проверяет промокод, применяет процент.
+    Возвращает (new_total, discount_amount).
+    Может бросить PromoError с текстом ошибки.
+    """
+    return apply_percent(base_total, redeem_promocode(code))
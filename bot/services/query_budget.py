@@ -0,0 +1,157 @@
+# bot/services/query_budget.py
+
+import logging
+import os
+import re
+from collections import Counter as _Tally
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# off — ничего не записываем, log — пишем предупреждение, raise — бросаем исключение (для тестов/бенчмарков)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "log")
+DEFAULT_QUERY_BUDGET = int(os.getenv("QUERY_BUDGET", "10"))
+# одинаковый по форме запрос, повторённый столько раз за апдейт, считаем N+1
+REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "3"))
+
+# Бюджеты запросов для отдельных хендлеров и воркеров (имя функции -> максимум)
+QUERY_BUDGETS: dict[str, int] = {
+    "unpaid_order_checker": 4,
+    "order_status_updater": 4,
+}
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+_STRING_RE  = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE  = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\(\s*(?:\?|__\[POSTCOMPILE_\w+\])(?:\s*,\s*\?)*\s*\)")
+_SPACE_RE   = re.compile(r"\s+")
+
+
+def fingerprint(statement: str) -> str:
+    """
+    Форма запроса без литералов: строки и числа заменяются на ?,
+    списки в IN (...) схлопываются, пробелы нормализуются.
+    """
+    shape = _STRING_RE.sub("?", statement)
+    shape = _NUMBER_RE.sub("?", shape)
+    shape = _IN_LIST_RE.sub("(?+)", shape)
+    return _SPACE_RE.sub(" ", shape).strip()
+
+
+class QueryRecorder:
+    """Все SQL-запросы одного апдейта или одного прохода воркера."""
+
+    __slots__ = ("name", "statements")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements: list[str] = []
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def repeated(self, threshold: int = REPEAT_THRESHOLD) -> list[tuple[str, int]]:
+        """Формы запросов, повторившиеся не меньше threshold раз, — кандидаты в N+1."""
+        tally = _Tally(fingerprint(s) for s in self.statements)
+        return [(shape, n) for shape, n in tally.most_common() if n >= threshold]
+
+
+class QueryStats:
+    """Накопленная статистика по всем записанным апдейтам для отчёта о худших местах."""
+
+    def __init__(self):
+        self.runs: dict[str, int] = {}
+        self.total: dict[str, int] = {}
+        self.worst: dict[str, int] = {}
+        self.over_budget: dict[str, int] = {}
+        self.repeated: dict[tuple[str, str], int] = {}
+
+    def add(self, recorder: QueryRecorder, repeated: list[tuple[str, int]], over_budget: bool):
+        name = recorder.name
+        self.runs[name] = self.runs.get(name, 0) + 1
+        self.total[name] = self.total.get(name, 0) + recorder.count
+        self.worst[name] = max(self.worst.get(name, 0), recorder.count)
+        if over_budget:
+            self.over_budget[name] = self.over_budget.get(name, 0) + 1
+        for shape, n in repeated:
+            key = (name, shape)
+            self.repeated[key] = max(self.repeated.get(key, 0), n)
+
+    def report(self, top: int = 10) -> str:
+        lines = [f"{'хендлер/воркер':<34} {'вызовов':>8} {'sql/вызов':>10} {'макс':>6} {'сверх бюджета':>14}"]
+        ranked = sorted(self.runs, key=lambda n: self.total[n] / self.runs[n], reverse=True)
+        for name in ranked[:top]:
+            lines.append(
+                f"{name:<34} {self.runs[name]:>8} {self.total[name] / self.runs[name]:>10.1f} "
+                f"{self.worst[name]:>6} {self.over_budget.get(name, 0):>14}"
+            )
+        if self.repeated:
+            lines.append("\nповторяющиеся формы запросов (N+1):")
+            for (name, shape), n in sorted(self.repeated.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+                lines.append(f"  {n:>4}× {name}: {shape[:150]}")
+        return "\n".join(lines)
+
+    def reset(self):
+        self.__init__()
+
+
+STATS = QueryStats()
+
+current_recorder: ContextVar[QueryRecorder | None] = ContextVar("current_recorder", default=None)
+
+
+def install_query_recorder(engine):
+    """Пишет каждый запрос движка в текущий QueryRecorder, если он есть."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _record(conn, cursor, statement, parameters, context, executemany):
+        recorder = current_recorder.get()
+        if recorder is not None:
+            recorder.statements.append(statement)
+
+
+def check_budget(recorder: QueryRecorder, mode: str = QUERY_BUDGET_MODE):
+    budget = QUERY_BUDGETS.get(recorder.name, DEFAULT_QUERY_BUDGET)
+    repeated = recorder.repeated()
+    over_budget = recorder.count > budget
+    STATS.add(recorder, repeated, over_budget)
+
+    if not over_budget and not repeated:
+        return
+    problems = []
+    if over_budget:
+        problems.append(f"{recorder.count} запросов при бюджете {budget}")
+    for shape, n in repeated:
+        problems.append(f"{n}× {shape[:200]}")
+    message = f"{recorder.name}: " + "; ".join(problems)
+    # повтор формы в пределах бюджета — только повод посмотреть, а не ошибка
+    if mode == "raise" and over_budget:
+        raise QueryBudgetExceeded(message)
+    logger.warning("Бюджет запросов: %s", message)
+
+
+@contextmanager
+def query_budget(name: str, mode: str = QUERY_BUDGET_MODE):
+    """
+    Записывает запросы блока и проверяет их против бюджета:
+
+        with query_budget("unpaid_order_checker"):
+            ...
+    """
+    if mode == "off":
+        yield None
+        return
+    recorder = QueryRecorder(name)
+    token = current_recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        current_recorder.reset(token)
+    check_budget(recorder, mode)
@@ -0,0 +1,88 @@
+# bot/services/ratelimit.py
+
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+
+class TokenBucket:
+    """
+    Классическое «ведро токенов»: пополняется со скоростью `rate` токенов
+    в секунду до `capacity`, каждое действие списывает свою стоимость.
+    """
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at")
+
+    def __init__(self, rate: float, capacity: float, now: float | None = None):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic() if now is None else now
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def consume(self, cost: float = 1.0, now: float | None = None) -> bool:
+        self._refill(time.monotonic() if now is None else now)
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return True
+        return False
+
+    def time_until(self, cost: float = 1.0, now: float | None = None) -> float:
+        """Сколько секунд ждать, пока хватит токенов на `cost`."""
+        self._refill(time.monotonic() if now is None else now)
+        missing = cost - self.tokens
+        return 0.0 if missing <= 0 else missing / self.rate
+
+    def is_full(self, now: float | None = None) -> bool:
+        self._refill(time.monotonic() if now is None else now)
+        return self.tokens >= self.capacity
+
+
+class BucketMap:
+    """
+    Вёдра по ключу с ограниченным размером. Вытесняются только вёдра,
+    наполнившиеся до краёв: новое ведро для такого ключа ничем не отличается
+    от старого, поэтому флудер не обнулит себе штраф, набрав max_keys
+    других ключей. Первыми проверяются давно не тронутые вёдра; если
+    наполнившихся нет, карта временно растёт сверх max_keys (не больше
+    ключей, активных за capacity / rate секунд) и ужимается на следующих
+    вставках.
+    """
+
+    EVICT_SCAN = 8
+
+    def __init__(self, rate: float, capacity: float, max_keys: int = 10_000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[Hashable, TokenBucket] = OrderedDict()
+
+    def get(self, key: Hashable, now: float | None = None) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            now = time.monotonic() if now is None else now
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.capacity, now)
+            self._evict(now)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket
+
+    def _evict(self, now: float):
+        # за вставку смотрим не больше EVICT_SCAN вёдер: ещё не наполнившееся
+        # уходит в конец очереди, чтобы не заслонять наполнившиеся за ним
+        for _ in range(self.EVICT_SCAN):
+            if len(self._buckets) <= self.max_keys:
+                return
+            key, oldest = next(iter(self._buckets.items()))
+            if oldest.is_full(now):
+                self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
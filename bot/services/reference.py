@@ -0,0 +1,107 @@
+# bot/services/reference.py
+
+import threading
+from typing import NamedTuple
+
+from db.database import SessionLocal, OrderStatus, PickupPoint
+
+
+class StatusRef(NamedTuple):
+    code: str
+    label: str
+    sort_order: int
+
+
+class PickupPointRef(NamedTuple):
+    id: int
+    name: str
+    address: str | None
+    lat: float
+    lon: float
+    rating: float | None
+
+
+# Справочники меняются только сидами/миграциями, поэтому держим их в памяти
+# и не ходим за ними в базу на каждом апдейте.
+_lock = threading.Lock()
+_statuses: list[StatusRef] | None = None
+_statuses_by_code: dict[str, StatusRef] = {}
+_pickup_points: list[PickupPointRef] | None = None
+_pickup_points_by_id: dict[int, PickupPointRef] = {}
+
+
+def warm_reference_cache():
+    """
+    Загружает статусы и ПВЗ одной сессией. При старте вызывается в отдельном
+    потоке, пока бот подключается к Telegram; иначе — лениво при первом обращении.
+    """
+    global _statuses, _statuses_by_code, _pickup_points, _pickup_points_by_id
+
+    db = SessionLocal()
+    try:
+        statuses = [
+            StatusRef(s.code, s.label, s.sort_order)
+            for s in db.query(OrderStatus).order_by(OrderStatus.sort_order).all()
+        ]
+        points = [
+            PickupPointRef(
+                p.id, p.name, p.address, float(p.lat), float(p.lon),
+                float(p.rating) if p.rating is not None else None,
+            )
+            for p in db.query(PickupPoint).order_by(PickupPoint.id).all()
+        ]
+    finally:
+        db.close()
+
+    with _lock:
+        _statuses = statuses
+        _statuses_by_code = {s.code: s for s in statuses}
+        _pickup_points = points
+        _pickup_points_by_id = {p.id: p for p in points}
+
+
+def invalidate_reference_cache():
+    """Сбрасывает справочники — следующее обращение перечитает их из базы."""
+    global _statuses, _pickup_points
+    with _lock:
+        _statuses = None
+        _pickup_points = None
+
+
+def _ensure_loaded():
+    if _statuses is None or _pickup_points is None:
+        warm_reference_cache()
+
+
+def get_statuses() -> list[StatusRef]:
+    """Статусы заказов в порядке sort_order."""
+    _ensure_loaded()
+    return _statuses
+
+
+def get_status(code: str) -> StatusRef | None:
+    _ensure_loaded()
+    return _statuses_by_code.get(code)
+
+
+def get_status_label(code: str) -> str:
+    status = get_status(code)
+    return status.label if status else code
+
+
+def get_status_code(label_substring: str) -> str:
+    """Код статуса по части подписи ("Новый" → "new")."""
+    for status in get_statuses():
+        if label_substring in status.label:
+            return status.code
+    return "new"
+
+
+def get_pickup_points() -> list[PickupPointRef]:
+    _ensure_loaded()
+    return _pickup_points
+
+
+def get_pickup_point(pp_id: int) -> PickupPointRef | None:
+    _ensure_loaded()
+    return _pickup_points_by_id.get(pp_id)
@@ -0,0 +1,178 @@
+# bot/services/repricing.py
+
+from typing import NamedTuple
+
+from sqlalchemy import JSON, String, bindparam, cast, func, select, update
+from sqlalchemy.orm.attributes import flag_modified
+
+from db.database import SessionLocal, Order, User
+from bot.services.outbox import emit_events, order_event
+from bot.services.pricing import (
+    PriceTable,
+    copy_counts,
+    edit_summary,
+    get_price_table,
+    personal_discount,
+    price_summary,
+    retarget_summary,
+    summary_totals,
+)
+
+class RepriceResult(NamedTuple):
+    version: int
+    repriced: int       # цена изменилась
+    unchanged: int      # цена та же, отмечена новая версия
+
+
+def order_copy_counts(db, order_ids: list[int]) -> dict[int, list[int]]:
+    """
+    Векторы копий по id формата для заказов. Читаются только order_id и
+    photos, без сборки ORM-объектов: json.loads из C-модуля разбирает
+    фото быстрее, чем json_each в самой SQLite.
+    """
+    orders = Order.__table__
+    rows = db.execute(select(orders.c.order_id, orders.c.photos).where(orders.c.order_id.in_(order_ids)))
+    return {order_id: copy_counts(photos or []) for order_id, photos in rows}
+
+
+def _personal_ratio(price: float, discounted: float) -> float:
+    return min(price / discounted, 1.0) if discounted else 1.0
+
+
+def reprice(counts: list[int], price: float, old: PriceTable, new: PriceTable) -> tuple[float, float]:
+    """
+    Новые (price, discount) заказа без сводки. Личная скидка — 30% на первый
+    заказ или промокод — в таком заказе не записана, но восстанавливается как
+    отношение цены к сумме по старому прайс-листу после скидки за объём; это
+    же отношение применяется к сумме по новому.
+    """
+    _, old_discounted, _ = old.price_counts(counts)
+    personal = _personal_ratio(price, old_discounted)
+    raw_total, discounted, _ = new.price_counts(counts)
+    new_price = round(discounted * personal, 2)
+    return new_price, round(raw_total - new_price, 2)
+
+
+def order_summary(order: Order) -> dict:
+    """
+    Сводка заказа (orders.pricing). Заказам, созданным до сводок, она
+    строится один раз по фото, а личная скидка восстанавливается из цены.
+    """
+    if order.pricing:
+        return order.pricing
+    table = get_price_table(order.price_version or 1)
+    summary = price_summary(order.photos or [], table)
+    _, discounted, _ = summary_totals(summary, table)
+    ratio = _personal_ratio(float(order.price or 0), discounted)
+    if ratio < 1.0:
+        summary["personal"] = personal_discount("legacy", round((1 - ratio) * 100, 2))
+    return summary
+
+
+def edit_order_photos(order: Order, *, fmt: str | None = None, copies: int | None = None) -> float:
+    """
+    Меняет формат и/или число копий у всех фото заказа и пересчитывает цену
+    по его сводке и его версии прайс-листа. Оплаченный заказ не меняется —
+    ValueError: иначе печатались бы не те фото, за которые заплачено.
+    Возвращает прежнюю цену; коммит — за вызывающим.
+    """
+    if order.paid:
+        raise ValueError("заказ уже оплачен")
+    table = get_price_table(order.price_version or 1)
+    summary = edit_summary(order_summary(order), table, fmt=fmt, copies=copies)
+    for photo in order.photos:
+        if fmt is not None:
+            photo["format"] = fmt
+        if copies is not None:
+            photo["copies"] = copies
+    flag_modified(order, "photos")
+
+    old_price = float(order.price or 0)
+    order.pricing = summary
+    order.price_version = table.version
+    _, order.price, order.discount = summary_totals(summary, table)
+    return old_price
+
+
+def reprice_open_orders(limit: int = 500, table: PriceTable | None = None) -> RepriceResult:
+    """
+    Пересчитывает до limit неоплаченных заказов в статусе new, посчитанных
+    по прайс-листу старше действующего. Заказы, у которых поменялась цена,
+    получают событие "repriced" в outbox — пользователю придёт уведомление.
+
+    Чтение и запись — разные транзакции: между ними заказ могут оплатить,
+    отменить или изменить (edit_order_photos). Поэтому UPDATE повторяет
+    условия выборки и сверяет сводку pricing с прочитанной — такой заказ
+    не перезаписывается, события получают только обновлённые строки, а
+    заказ, изменённый без оплаты, пересчитается на следующем проходе.
+    """
+    table = table or get_price_table()
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(
+                Order.order_id, Order.number, Order.price, Order.price_version, Order.pricing,
+                func.coalesce(cast(Order.pricing, String), "").label("pricing_text"), User.telegram_id,
+            )
+            .outerjoin(User, User.id == Order.user_id)
+            .filter(Order.status == "new", Order.paid == False)
+            .filter(func.coalesce(Order.price_version, 1) < table.version)
+            .order_by(Order.created_at)
+            .limit(limit)
+            .all()
+        )
+        if not rows:
+            return RepriceResult(table.version, 0, 0)
+        counts = order_copy_counts(db, [r.order_id for r in rows if not r.pricing])
+
+        changes, events = [], []
+        for r in rows:
+            price = float(r.price or 0)
+            if r.pricing:
+                summary = retarget_summary(r.pricing, table)
+                _, new_price, new_discount = summary_totals(summary, table)
+            else:
+                summary = None
+                new_price, new_discount = reprice(
+                    counts[r.order_id], price, get_price_table(r.price_version or 1), table
+                )
+            changes.append({
+                "b_id": r.order_id, "b_price": new_price, "b_discount": new_discount, "b_pricing": summary,
+                "b_pricing_text": r.pricing_text,
+            })
+            if new_price != price:
+                events.append(order_event(
+                    r.order_id, "repriced", r.telegram_id, dedup_key=f"{r.order_id}:repriced:{table.version}",
+                    number=r.number, old_price=price, new_price=new_price, version=table.version,
+                ))
+
+        # одним executemany по первичному ключу; условия выборки — ещё раз, уже под блокировкой записи
+        orders = Order.__table__
+        updated = db.execute(
+            update(orders)
+            .where(
+                orders.c.order_id == bindparam("b_id"),
+                orders.c.status == "new",
+                orders.c.paid == False,
+                func.coalesce(orders.c.price_version, 1) < table.version,
+                func.coalesce(cast(orders.c.pricing, String), "") == bindparam("b_pricing_text"),
+            )
+            .values(
+                price=bindparam("b_price"), discount=bindparam("b_discount"),
+                pricing=bindparam("b_pricing", type_=JSON(none_as_null=True)), price_version=table.version,
+            ),
+            changes,
+        ).rowcount
+        if updated < len(rows):
+            # часть заказов успели изменить — уведомляем только о пересчитанных
+            done = set(db.scalars(
+                select(orders.c.order_id).where(
+                    orders.c.order_id.in_([r.order_id for r in rows]), orders.c.price_version == table.version
+                )
+            ))
+            events = [e for e in events if e["order_id"] in done]
+        emit_events(db, events)
+        db.commit()
+        return RepriceResult(table.version, len(events), updated - len(events))
+    finally:
+        db.close()
@@ -0,0 +1,173 @@
+# bot/services/rollups.py
+
+import random
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import text
+
+from db.database import ROLLUP_DAY_SHIFT_HOURS, ROLLUP_RECOMPUTE_SQL, SessionLocal, engine, write_meta
+
+# столбцы ключа и значений каждой сводки — в порядке ROLLUP_RECOMPUTE_SQL
+ROLLUP_TABLES = {
+    "daily_sales": (("day",), ("orders", "paid_orders", "gross", "revenue", "discount_cost")),
+    "daily_format_copies": (("day", "format"), ("photos", "copies")),
+    "daily_pickup_orders": (("day", "pickup_point"), ("orders", "paid_orders")),
+}
+
+# деньги копятся во float, поэтому сравниваем с допуском
+MONEY_TOLERANCE = 0.005
+
+
+def _utc_bounds(first_day: date, last_day: date) -> tuple[str, str]:
+    """Интервал created_at (UTC), который покрывают дни first_day..last_day по Москве."""
+    start = datetime.combine(first_day, datetime.min.time()) - timedelta(hours=ROLLUP_DAY_SHIFT_HOURS)
+    end = datetime.combine(last_day + timedelta(days=1), datetime.min.time()) - timedelta(hours=ROLLUP_DAY_SHIFT_HOURS)
+    return start.isoformat(sep=" "), end.isoformat(sep=" ")
+
+
+def _recompute(conn, table: str, first_day: date, last_day: date) -> dict[tuple, tuple]:
+    start, end = _utc_bounds(first_day, last_day)
+    keys, values = ROLLUP_TABLES[table]
+    rows = conn.execute(text(ROLLUP_RECOMPUTE_SQL[table]), {"start": start, "end": end}).all()
+    return {tuple(r[:len(keys)]): tuple(r[len(keys):]) for r in rows}
+
+
+def _stored(conn, table: str, first_day: date, last_day: date) -> dict[tuple, tuple]:
+    keys, values = ROLLUP_TABLES[table]
+    rows = conn.execute(
+        text(f"SELECT {', '.join(keys + values)} FROM {table} WHERE day BETWEEN :first AND :last"),
+        {"first": first_day.isoformat(), "last": last_day.isoformat()},
+    ).all()
+    return {tuple(r[:len(keys)]): tuple(r[len(keys):]) for r in rows}
+
+
+def recompute_rollups(conn, first_day: date, last_day: date) -> None:
+    """Заменяет строки сводок за дни first_day..last_day полным пересчётом — в транзакции conn."""
+    for table, (keys, values) in ROLLUP_TABLES.items():
+        conn.execute(
+            text(f"DELETE FROM {table} WHERE day BETWEEN :first AND :last"),
+            {"first": first_day.isoformat(), "last": last_day.isoformat()},
+        )
+        start, end = _utc_bounds(first_day, last_day)
+        conn.execute(
+            text(f"INSERT INTO {table} ({', '.join(keys + values)}) {ROLLUP_RECOMPUTE_SQL[table]}"),
+            {"start": start, "end": end},
+        )
+
+
+# ─── Дозаливка истории ───────────────────────────────────────────────────────
+
+def backfill_rollups_chunk(days: int = 7) -> bool:
+    """
+    Пересчитывает сводки за очередные `days` дней истории (от сегодняшнего назад)
+    одной транзакцией. Триггеры к этому моменту уже работают: пересчёт дня
+    заменяет его строки целиком, а дальнейшие изменения дня снова идут дельтами.
+    Возвращает True, когда вся история пересчитана.
+    """
+    with engine.begin() as conn:
+        meta = dict(conn.execute(text(
+            "SELECT key, value FROM app_meta WHERE key IN ('rollup_backfill_next', 'rollup_backfill_stop')"
+        )).all())
+        if "rollup_backfill_next" not in meta:
+            return True
+        last_day = date.fromisoformat(meta["rollup_backfill_next"])
+        stop = date.fromisoformat(meta["rollup_backfill_stop"])
+        first_day = max(stop, last_day - timedelta(days=days - 1))
+
+        recompute_rollups(conn, first_day, last_day)
+
+        if first_day <= stop:
+            conn.execute(text("DELETE FROM app_meta WHERE key IN ('rollup_backfill_next', 'rollup_backfill_stop')"))
+            return True
+        write_meta(conn, rollup_backfill_next=(first_day - timedelta(days=1)).isoformat())
+        return False
+
+
+def backfill_pending() -> bool:
+    with engine.connect() as conn:
+        return conn.execute(text("SELECT 1 FROM app_meta WHERE key = 'rollup_backfill_next'")).first() is not None
+
+
+# ─── Проверка согласованности ────────────────────────────────────────────────
+
+def check_rollups(sample_days: int = 30, seed: int | None = None) -> list[str]:
+    """
+    Сравнивает сводки за случайные `sample_days` дней с полным пересчётом
+    по orders. Возвращает список расхождений (пустой — всё сходится).
+    """
+    rng = random.Random(seed)
+    problems = []
+    with engine.connect() as conn:
+        days = [r[0] for r in conn.execute(text("SELECT day FROM daily_sales")).all()]
+        for day_str in rng.sample(days, min(sample_days, len(days))):
+            day = date.fromisoformat(day_str)
+            for table, (keys, values) in ROLLUP_TABLES.items():
+                expected = _recompute(conn, table, day, day)
+                stored = _stored(conn, table, day, day)
+                zero = (0,) * len(values)
+                for key in expected.keys() | stored.keys():
+                    want, got = expected.get(key, zero), stored.get(key, zero)
+                    if any(abs((w or 0) - (g or 0)) > MONEY_TOLERANCE for w, g in zip(want, got)):
+                        problems.append(f"{table} {key}: сводка {got}, пересчёт {want}")
+    return problems
+
+
+# ─── Отчёты ──────────────────────────────────────────────────────────────────
+
+def sales_report(first_day: date, last_day: date) -> list[dict]:
+    """Выручка, скидки и число заказов по дням — O(дней), без сканирования orders."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text(
+                "SELECT day, orders, paid_orders, gross, revenue, discount_cost FROM daily_sales "
+                "WHERE day BETWEEN :first AND :last ORDER BY day"
+            ),
+            {"first": first_day.isoformat(), "last": last_day.isoformat()},
+        ).all()
+    finally:
+        db.close()
+    return [
+        {
+            "day": r.day,
+            "orders": r.orders,
+            "paid_orders": r.paid_orders,
+            "gross": round(r.gross, 2),
+            "revenue": round(r.revenue, 2),
+            "discount_cost": round(r.discount_cost, 2),
+        }
+        for r in rows
+    ]
+
+
+def format_report(first_day: date, last_day: date) -> dict[str, dict]:
+    """Фото и копии по форматам за период."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text(
+                "SELECT format, sum(photos) AS photos, sum(copies) AS copies FROM daily_format_copies "
+                "WHERE day BETWEEN :first AND :last GROUP BY format ORDER BY copies DESC"
+            ),
+            {"first": first_day.isoformat(), "last": last_day.isoformat()},
+        ).all()
+    finally:
+        db.close()
+    return {r.format: {"photos": r.photos, "copies": r.copies} for r in rows if r.photos}
+
+
+def pickup_report(first_day: date, last_day: date) -> dict[str, dict]:
+    """Заказы по пунктам выдачи за период."""
+    db = SessionLocal()
+    try:
+        rows = db.execute(
+            text(
+                "SELECT pickup_point, sum(orders) AS orders, sum(paid_orders) AS paid_orders "
+                "FROM daily_pickup_orders WHERE day BETWEEN :first AND :last "
+                "GROUP BY pickup_point ORDER BY orders DESC"
+            ),
+            {"first": first_day.isoformat(), "last": last_day.isoformat()},
+        ).all()
+    finally:
+        db.close()
+    return {r.pickup_point or "—": {"orders": r.orders, "paid_orders": r.paid_orders} for r in rows if r.orders}
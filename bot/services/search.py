@@ -0,0 +1,115 @@
+# bot/services/search.py
+
+import re
+from datetime import datetime
+from typing import NamedTuple
+
+from sqlalchemy import text
+
+from db.database import SessionLocal
+from bot.services.order_ids import parse_short_code, short_code
+
+# Триграммный индекс не умеет искать фрагменты короче трёх символов
+MIN_TERM_LENGTH = 3
+MAX_PAGE_SIZE = 50
+
+# Веса столбцов для bm25: comment, receiver_name, receiver_phone, filenames
+_BM25 = "bm25(orders_fts, 1.0, 2.0, 3.0, 1.0)"
+_PHONE_RE = re.compile(r"^[+\d()\-\s]+$")
+_HIT_FIELDS = ("order_id", "number", "status", "created_at", "receiver_name", "receiver_phone", "comment")
+_HIT_COLUMNS = ", ".join(f"o.{f}" for f in _HIT_FIELDS)
+# документ индекса — заказ из orders или, после переноса, из архива; основная база важнее
+_HIT_EITHER = ", ".join(f"CASE WHEN o.order_id IS NULL THEN a.{f} ELSE o.{f} END AS {f}" for f in _HIT_FIELDS)
+
+
+class OrderSearchHit(NamedTuple):
+    order_id: int
+    code: str
+    status: str
+    created_at: datetime
+    receiver_name: str | None
+    receiver_phone: str | None
+    comment: str | None
+    rank: float
+
+
+class OrderSearchPage(NamedTuple):
+    hits: list[OrderSearchHit]
+    page: int
+    has_more: bool
+
+
+def build_match_query(query: str) -> str | None:
+    """
+    Превращает ввод сотрудника в выражение FTS5: каждый фрагмент — отдельная
+    фраза в кавычках, все фрагменты должны встретиться (AND). Телефон ищется
+    по цифрам, как он лежит в индексе. Фрагменты короче трёх символов
+    отбрасываются; если не осталось ни одного — возвращает None.
+    """
+    query = query.strip()
+    if _PHONE_RE.match(query) and sum(c.isdigit() for c in query) >= MIN_TERM_LENGTH:
+        terms = ["".join(c for c in query if c.isdigit())]
+    else:
+        terms = query.split()
+    phrases = ['"' + term.replace('"', '""') + '"' for term in terms if len(term) >= MIN_TERM_LENGTH]
+    return " ".join(phrases) or None
+
+
+def search_orders(query: str, page: int = 0, per_page: int = 10, order: str = "rank") -> OrderSearchPage:
+    """
+    Ищет заказы по фрагменту комментария, ФИО или телефона получателя
+    и имён файлов. order="rank" — по релевантности (bm25), order="recent" —
+    сначала новые: так FTS5 не ранжирует все совпадения и отвечает быстро
+    даже для очень частых фрагментов. Код заказа (#K7M2QX) находит ровно его.
+    Заказы, перенесённые в архив, находятся так же.
+    """
+    per_page = max(1, min(per_page, MAX_PAGE_SIZE))
+    db = SessionLocal()
+    try:
+        rows = []
+        # код без букв неотличим от фрагмента телефона — такой ищется только с #
+        if query.strip().startswith("#") or any(c.isalpha() for c in query):
+            number = parse_short_code(query)
+            if number is not None and page == 0:
+                for table in ("orders", "archive.archived_orders"):
+                    rows = db.execute(
+                        text(f"SELECT {_HIT_COLUMNS}, 0.0 AS score FROM {table} o WHERE o.number = :number"),
+                        {"number": number},
+                    ).all()
+                    if rows:
+                        break
+        if not rows:
+            match = build_match_query(query)
+            if match is None:
+                return OrderSearchPage([], page, False)
+            ordering = f"{_BM25}" if order == "rank" else "rowid DESC"
+            # берём на одну строку больше, чтобы узнать, есть ли следующая страница
+            sql = text(
+                f"SELECT {_HIT_EITHER}, m.score "
+                "FROM ("
+                f"  SELECT rowid AS id, {_BM25} AS score FROM orders_fts"
+                f"  WHERE orders_fts MATCH :match ORDER BY {ordering} LIMIT :limit OFFSET :offset"
+                ") AS m "
+                "LEFT JOIN orders o ON o.order_id = m.id "
+                "LEFT JOIN archive.archived_orders a ON a.order_id = m.id "
+                "WHERE o.order_id IS NOT NULL OR a.order_id IS NOT NULL "
+                f"ORDER BY {'m.score' if order == 'rank' else 'm.id DESC'}"
+            )
+            rows = db.execute(sql, {"match": match, "limit": per_page + 1, "offset": page * per_page}).all()
+    finally:
+        db.close()
+
+    hits = [
+        OrderSearchHit(
+            order_id=r.order_id,
+            code=short_code(r.number) if r.number is not None else str(r.order_id),
+            status=r.status,
+            created_at=datetime.fromisoformat(r.created_at) if isinstance(r.created_at, str) else r.created_at,
+            receiver_name=r.receiver_name,
+            receiver_phone=r.receiver_phone,
+            comment=r.comment,
+            rank=r.score,
+        )
+        for r in rows[:per_page]
+    ]
+    return OrderSearchPage(hits, page, len(rows) > per_page)
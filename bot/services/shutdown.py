@@ -0,0 +1,150 @@
+# bot/services/shutdown.py
+
+import asyncio
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+
+from aiogram.fsm.storage.base import StorageKey
+from aiogram.fsm.storage.memory import MemoryStorage, MemoryStorageRecord
+
+from db.serialization import dumpb, loads
+from bot.services.storage import atomic_write_bytes
+
+logger = logging.getLogger(__name__)
+
+# Сколько всего даётся на остановку после SIGTERM. Должно быть меньше, чем
+# ждёт оркестратор до SIGKILL (docker stop — 10 с, stop_grace_period в compose)
+SHUTDOWN_TIMEOUT = float(os.getenv("SHUTDOWN_TIMEOUT", "8"))
+
+# Куда сохранять FSM-состояния пользователей между перезапусками; пусто — не сохранять
+FSM_SNAPSHOT_FILE = os.getenv("FSM_SNAPSHOT_FILE", "fsm_snapshot.json")
+
+
+class InFlightTracker:
+    """
+    Апдейты, которые сейчас обрабатываются. Заполняется InFlightMiddleware;
+    при остановке drain() ждёт, пока они закончатся, и отменяет оставшиеся.
+    """
+
+    def __init__(self):
+        self._tasks: dict[asyncio.Task, int] = {}     # задача хендлера → update_id
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.max_update_id = 0
+        self.finished = 0
+
+    def enter(self, update_id: int):
+        self._tasks[asyncio.current_task()] = update_id
+        self.max_update_id = max(self.max_update_id, update_id)
+        self._idle.clear()
+
+    def leave(self):
+        self._tasks.pop(asyncio.current_task(), None)
+        self.finished += 1
+        if not self._tasks:
+            self._idle.set()
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    async def drain(self, deadline: float) -> tuple[int, list[int]]:
+        """
+        Ждёт до deadline (time.monotonic()), пока не останется апдейтов в работе.
+        Возвращает (сколько дообработано, update_id брошенных) — брошенные отменяются.
+        """
+        finished_before = self.finished
+        while self._tasks and (remaining := deadline - time.monotonic()) > 0:
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                break
+            # следующий апдейт того же чата ждал свою полосу и зайдёт через итерацию-другую
+            await asyncio.sleep(0.05)
+        drained = self.finished - finished_before
+        abandoned = list(self._tasks.items())
+        for task, _ in abandoned:
+            task.cancel()
+        await asyncio.gather(*(task for task, _ in abandoned), return_exceptions=True)
+        return drained, sorted(update_id for _, update_id in abandoned)
+
+
+IN_FLIGHT = InFlightTracker()
+
+
+@dataclass
+class ShutdownReport:
+    """Что удалось довести до конца при остановке, а что брошено."""
+    handlers_drained: int = 0
+    handlers_abandoned: list[int] = field(default_factory=list)   # update_id
+    queued_drained: int = 0
+    queued_abandoned: int = 0
+    outbox_sent: int = 0
+    outbox_left: int = 0
+    fsm_saved: int = 0
+    errors: list[str] = field(default_factory=list)
+    started: float = field(default_factory=time.monotonic)
+
+    def log(self):
+        parts = []
+        if self.handlers_drained or self.handlers_abandoned:
+            parts.append(f"апдейтов дообработано {self.handlers_drained}, брошено {len(self.handlers_abandoned)}"
+                         + (f" {self.handlers_abandoned}" if self.handlers_abandoned else ""))
+        if self.queued_drained or self.queued_abandoned:
+            parts.append(f"из очереди дообработано {self.queued_drained}, брошено {self.queued_abandoned}")
+        if self.outbox_sent or self.outbox_left:
+            parts.append(f"уведомлений отправлено {self.outbox_sent}, осталось {self.outbox_left}")
+        if self.fsm_saved:
+            parts.append(f"FSM-состояний сохранено {self.fsm_saved}")
+        if self.errors:
+            parts.append(f"ошибки: {'; '.join(self.errors)}")
+        logger.info("Остановка за %.1f с%s", time.monotonic() - self.started,
+                    ": " + "; ".join(parts) if parts else "")
+
+
+# ─── Снимок FSM ──────────────────────────────────────────────────────────────
+#
+# MemoryStorage живёт в памяти процесса, и без снимка перезапуск сбрасывает
+# всех, кто был посреди загрузки фото или оформления заказа.
+
+def save_fsm_snapshot(storage, path: str | Path) -> int:
+    """Записывает непустые состояния MemoryStorage в JSON атомарно. Возвращает их число."""
+    if not isinstance(storage, MemoryStorage):
+        return 0
+    records = [
+        {"key": asdict(key), "state": record.state, "data": record.data}
+        for key, record in storage.storage.items()
+        if record.state is not None or record.data
+    ]
+    if not records:
+        Path(path).unlink(missing_ok=True)
+        return 0
+    body = dumpb(records, default=str)
+    atomic_write_bytes(Path(path), body, fsync=True)
+    return len(records)
+
+
+def load_fsm_snapshot(storage, path: str | Path, keep=lambda key: True) -> int:
+    """
+    Восстанавливает состояния из снимка и удаляет файл, чтобы после падения
+    без нового снимка не вернуть пользователей в давно устаревшее состояние.
+    keep(key) отбирает записи — в кластере шард берёт только свои чаты.
+    """
+    path = Path(path)
+    if not isinstance(storage, MemoryStorage) or not path.exists():
+        return 0
+    try:
+        records = loads(path.read_bytes())
+    except ValueError:
+        logger.warning("Снимок FSM %s повреждён, пропускаем", path)
+        records = []
+    loaded = 0
+    for r in records:
+        key = StorageKey(**r["key"])
+        if keep(key):
+            storage.storage[key] = MemoryStorageRecord(data=r["data"], state=r["state"])
+            loaded += 1
+    path.unlink()
+    return loaded
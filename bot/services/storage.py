@@ -1,16 +1,49 @@
 import os
 from pathlib import Path
 
+from bot.services.tracing import span
+
 UPLOADS_DIR = Path("uploads")
 
-def get_order_folder(telegram_id: int, order_id: str) -> Path:
-    folder = UPLOADS_DIR / str(telegram_id) / order_id
+def get_order_folder(telegram_id: int, order_id: int) -> Path:
+    folder = UPLOADS_DIR / str(telegram_id) / str(order_id)
     folder.mkdir(parents=True, exist_ok=True)
     return folder
 
-def save_photo_to_order_folder(telegram_id: int, order_id: str, filename: str, file_bytes: bytes) -> str:
-    folder = get_order_folder(telegram_id, order_id)
-    filepath = folder / filename
-    with open(filepath, "wb") as f:
-        f.write(file_bytes)
+def rename_order_folder(telegram_id: int, old_order_id, new_order_id) -> bool:
+    """
+    Переносит папку с фото заказа под новый ключ. Повторный вызов ничего не
+    делает: папки под старым ключом уже нет или под новым уже есть.
+    """
+    old = UPLOADS_DIR / str(telegram_id) / str(old_order_id)
+    new = UPLOADS_DIR / str(telegram_id) / str(new_order_id)
+    if not old.is_dir() or new.exists():
+        return False
+    os.replace(old, new)
+    return True
+
+def atomic_write_bytes(path: Path, data: bytes, fsync: bool = False):
+    """
+    Пишет во временный файл рядом и переименовывает: по пути path всегда либо
+    старое содержимое, либо новое целиком — даже если процесс убили посреди записи.
+    fsync=True дополнительно переживает отключение питания.
+    """
+    path = Path(path)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.part")
+    try:
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+
+def save_photo_to_order_folder(telegram_id: int, order_id: int, filename: str, file_bytes: bytes) -> str:
+    with span("storage.save_photo", "file", bytes=len(file_bytes)):
+        folder = get_order_folder(telegram_id, order_id)
+        filepath = folder / filename
+        atomic_write_bytes(filepath, file_bytes)
     return str(filepath)
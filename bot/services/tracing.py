@@ -0,0 +1,262 @@
+# bot/services/tracing.py
+
+import functools
+import inspect
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+logger = logging.getLogger(__name__)
+
+# Если задан TRACE_FILE — трейсы апдейтов дописываются туда в формате JSONL
+TRACE_FILE = os.getenv("TRACE_FILE")
+# head-сэмплирование: доля апдейтов, которые сохраняются всегда
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.01"))
+# tail-сэмплирование: медленнее порога или с ошибкой — сохраняются независимо от head;
+# 0 отключает tail, и тогда несэмплированные апдейты вообще не пишут спаны
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+# верхняя граница числа спанов в одном трейсе, чтобы цикл с запросами не раздул память
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+_ids = itertools.count(1)
+
+
+class Trace:
+    """Трейс одного апдейта: корневой спан хендлера и плоский список дочерних."""
+
+    __slots__ = ("trace_id", "name", "head_sampled", "started", "started_ns", "spans", "dropped", "error")
+
+    def __init__(self, name: str, head_sampled: bool):
+        self.trace_id = f"{os.getpid():x}-{next(_ids):x}"
+        self.name = name
+        self.head_sampled = head_sampled
+        self.started = time.time()
+        self.started_ns = time.perf_counter_ns()
+        # (span_id, parent_id, name, kind, start_ns, duration_ns, attrs)
+        self.spans: list[tuple] = []
+        self.dropped = 0
+        self.error: str | None = None
+
+    def to_dict(self, duration_ns: int) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": round(self.started, 6),
+            "duration_ms": round(duration_ns / 1e6, 3),
+            "error": self.error,
+            "sampled": "head" if self.head_sampled else "tail",
+            "dropped_spans": self.dropped,
+            "spans": [
+                {
+                    "id": span_id,
+                    "parent": parent_id,
+                    "name": name,
+                    "kind": kind,
+                    "start_ms": round((start_ns - self.started_ns) / 1e6, 3),
+                    "duration_ms": round(duration_ns / 1e6, 3),
+                    **({"attrs": attrs} if attrs else {}),
+                }
+                for span_id, parent_id, name, kind, start_ns, duration_ns, attrs in self.spans
+            ],
+        }
+
+
+current_trace: ContextVar[Trace | None] = ContextVar("current_trace", default=None)
+current_span: ContextVar[int] = ContextVar("current_span", default=0)
+
+
+class JsonlExporter:
+    """Пишет трейсы в файл из отдельного потока, чтобы не блокировать event loop."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, record: dict):
+        self._queue.put(record)
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join(timeout=5)
+
+    def _run(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                # дописываем всё, что уже накопилось, одним flush
+                while True:
+                    try:
+                        record = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if record is None:
+                        f.flush()
+                        return
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+                f.flush()
+
+
+_exporter: JsonlExporter | None = None
+
+
+def tracing_enabled() -> bool:
+    return _exporter is not None
+
+
+def configure_tracing(path: str | None = TRACE_FILE) -> bool:
+    """Включает экспорт трейсов в path. Без пути трейсинг остаётся выключенным."""
+    global _exporter
+    if not path:
+        return False
+    if _exporter is None:
+        _exporter = JsonlExporter(path)
+    return True
+
+
+def shutdown_tracing():
+    global _exporter
+    if _exporter is not None:
+        _exporter.close()
+        _exporter = None
+
+
+@contextmanager
+def trace_update(name: str):
+    """Корневой спан апдейта. Решение head-сэмплирования принимается здесь."""
+    if _exporter is None:
+        yield None
+        return
+    head = random.random() < TRACE_SAMPLE_RATE
+    if not head and TRACE_SLOW_MS <= 0:
+        yield None
+        return
+
+    trace = Trace(name, head)
+    trace_token = current_trace.set(trace)
+    span_token = current_span.set(0)
+    try:
+        yield trace
+    except BaseException as e:
+        trace.error = type(e).__name__
+        raise
+    finally:
+        duration_ns = time.perf_counter_ns() - trace.started_ns
+        current_span.reset(span_token)
+        current_trace.reset(trace_token)
+        if head or trace.error or duration_ns >= TRACE_SLOW_MS * 1e6:
+            _exporter.export(trace.to_dict(duration_ns))
+
+
+def start_span(trace: Trace, name: str, kind: str, attrs: dict | None = None):
+    """
+    Низкоуровневое открытие спана для хуков без контекст-менеджера
+    (события SQLAlchemy). Возвращает состояние для finish_span.
+    """
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        return None
+    span_id = next(_ids)
+    parent = current_span.get()
+    token = current_span.set(span_id)
+    return (trace, span_id, parent, name, kind, attrs, token, time.perf_counter_ns())
+
+
+def finish_span(state, error: str | None = None):
+    trace, span_id, parent, name, kind, attrs, token, start_ns = state
+    duration_ns = time.perf_counter_ns() - start_ns
+    try:
+        current_span.reset(token)
+    except ValueError:
+        # сброс из другого контекста — родителя восстанавливать не нужно
+        pass
+    if error:
+        attrs = {**(attrs or {}), "error": error}
+    trace.spans.append((span_id, parent, name, kind, start_ns, duration_ns, attrs))
+
+
+@contextmanager
+def span(name: str, kind: str = "internal", **attrs):
+    """
+    Дочерний спан текущего трейса. Вне трейса почти ничего не стоит:
+
+        with span("storage.save", kind="file", bytes=len(data)):
+            ...
+    """
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    state = start_span(trace, name, kind, attrs or None)
+    if state is None:
+        yield
+        return
+    error = None
+    try:
+        yield
+    except BaseException as e:
+        error = type(e).__name__
+        raise
+    finally:
+        finish_span(state, error)
+
+
+def traced(name: str | None = None, kind: str = "internal"):
+    """Декоратор: оборачивает вызов функции (обычной или async) в спан."""
+
+    def decorator(func):
+        span_name = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name, kind):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name, kind):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def instrument_engine_tracing(engine):
+    """Спан на каждый SQL-запрос движка, если апдейт трассируется."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        trace = current_trace.get()
+        if trace is not None:
+            verb = statement.lstrip().split(None, 1)[0].upper() if statement else "SQL"
+            context._trace_span = start_span(trace, f"sql.{verb.lower()}", "db", {"statement": statement[:300]})
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        state = getattr(context, "_trace_span", None)
+        if state is not None:
+            context._trace_span = None
+            finish_span(state)
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context):
+        context = exception_context.execution_context
+        state = getattr(context, "_trace_span", None) if context is not None else None
+        if state is not None:
+            context._trace_span = None
+            finish_span(state, type(exception_context.original_exception).__name__)
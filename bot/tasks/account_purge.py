@@ -0,0 +1,58 @@
+import asyncio
+import logging
+import os
+import time
+
+from bot.services.account_deletion import PurgeResult, pending_deletions, purge_account_batch
+from bot.services.lease import wake_job, wakeup_event
+from bot.services.metrics import ACCOUNT_PURGE_ITEMS, WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+ACCOUNT_PURGE_IDLE = float(os.getenv("ACCOUNT_PURGE_IDLE", "60"))
+
+_wakeup = wakeup_event("account_purge")
+
+
+def wake_account_purge():
+    """Будит очистку сразу после запроса на удаление, не дожидаясь ACCOUNT_PURGE_IDLE."""
+    wake_job("account_purge")
+
+
+async def account_purge(idle: float = ACCOUNT_PURGE_IDLE, pause: float = 0.2):
+    """
+    Разбирает очередь удаления аккаунтов: шаг — одна пачка заказов или
+    финальная уборка аккаунта, в отдельном потоке; между шагами пауза, чтобы
+    не мешать хендлерам. Прерванное удаление продолжается со следующего шага
+    — в том числе после перезапуска.
+    """
+    while True:
+        tick_start = time.perf_counter()
+        total = PurgeResult()
+        while True:
+            try:
+                result = await asyncio.to_thread(purge_account_batch)
+            except Exception:
+                logger.exception("Удаление аккаунта")
+                break
+            if result is None:
+                break
+            total += result
+            for kind, value in result._asdict().items():
+                if value:
+                    ACCOUNT_PURGE_ITEMS.inc(value, kind=kind)
+            await asyncio.sleep(pause)
+        if total.accounts:
+            logger.info(
+                "Удалено аккаунтов: %d (заказов %d, архивных %d, событий %d, файлов %d)",
+                total.accounts, total.orders, total.archived_orders, total.events, total.files,
+            )
+
+        WORKER_BACKLOG.set(await asyncio.to_thread(pending_deletions), worker="account_purge")
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="account_purge")
+        WORKER_LAST_TICK.set(time.time(), worker="account_purge")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=idle)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
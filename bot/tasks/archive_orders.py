@@ -0,0 +1,37 @@
+import asyncio
+import logging
+import time
+
+from bot.services.archive import ARCHIVE_INTERVAL, ArchiveResult, archive_orders_batch
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+async def archive_orders(batch_size: int = 200, interval: float = ARCHIVE_INTERVAL, pause: float = 1.0):
+    """
+    Переносит старые завершённые и отменённые заказы в холодный архив. Пачка —
+    упаковка фото и две короткие транзакции в отдельном потоке, между пачками
+    пауза, чтобы не мешать хендлерам. Итог прохода пишется в лог.
+    """
+    while True:
+        tick_start = time.perf_counter()
+        total = ArchiveResult()
+        while True:
+            try:
+                result = await asyncio.to_thread(archive_orders_batch, batch_size)
+            except Exception:
+                # пачку доделает следующий проход: каждый шаг переноса можно повторить
+                logger.exception("Перенос заказов в архив")
+                break
+            total += result
+            WORKER_BACKLOG.set(result.orders, worker="archive_orders")
+            if result.orders < batch_size:
+                break
+            await asyncio.sleep(pause)
+        if total.orders:
+            logger.info("Архив: %s", total.report())
+
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="archive_orders")
+        WORKER_LAST_TICK.set(time.time(), worker="archive_orders")
+        await asyncio.sleep(interval)
@@ -0,0 +1,79 @@
+import asyncio
+import logging
+import time
+from datetime import datetime
+
+from bot.services.backup import (
+    BACKUP_INTERVAL,
+    BACKUP_WAL_INTERVAL,
+    BACKUP_WAL_SHIPPING,
+    WalGap,
+    backups_enabled,
+    list_generations,
+    rotate_backups,
+    take_snapshot,
+)
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+async def database_backup(interval: float = BACKUP_INTERVAL, wal_interval: float = BACKUP_WAL_INTERVAL):
+    """
+    Снимает онлайн-копию базы раз в interval секунд и удаляет старые
+    поколения. С BACKUP_WAL_SHIPPING между снимками каждые wal_interval
+    секунд дописывает в текущее поколение новые транзакции из WAL. Что журнал
+    не менялся между запусками процесса, проверить нельзя, поэтому доставка
+    после старта всегда начинается с нового снимка; без неё отсчёт идёт от
+    последнего готового поколения.
+    """
+    if not backups_enabled():
+        return
+    shipper = None
+    next_snapshot = 0.0
+    generations = list_generations()
+    if generations and not BACKUP_WAL_SHIPPING:
+        age = (datetime.utcnow() - generations[-1][0]).total_seconds()
+        next_snapshot = time.monotonic() + interval - age
+    try:
+        while True:
+            tick_start = time.perf_counter()
+            snapshot_due = time.monotonic() >= next_snapshot
+            try:
+                if snapshot_due:
+                    generation = await asyncio.to_thread(take_snapshot)
+                    if shipper:
+                        await asyncio.to_thread(shipper.close)
+                    shipper = generation.shipper
+                    next_snapshot = time.monotonic() + interval
+                    removed = await asyncio.to_thread(rotate_backups)
+                    logger.info(
+                        "Резервная копия %s: база %.1f МБ, архив %.1f МБ, %.1f с; удалено поколений: %d",
+                        generation.path, generation.db_bytes / 2**20, generation.archive_bytes / 2**20,
+                        time.perf_counter() - tick_start, len(removed),
+                    )
+                elif shipper:
+                    frames = await asyncio.to_thread(shipper.ship)
+                    WORKER_BACKLOG.set(frames, worker="database_backup")
+            except WalGap as e:
+                # журнал переносил wal_guard — продолжать это поколение нельзя
+                logger.warning("Доставка WAL: %s", e)
+                next_snapshot = 0.0
+            except Exception:
+                # доставка продолжит с того же кадра, неудавшийся снимок повторим через минуту
+                logger.exception("Резервное копирование базы")
+                if snapshot_due:
+                    next_snapshot = time.monotonic() + max(wal_interval, 60.0)
+
+            WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="database_backup")
+            WORKER_LAST_TICK.set(time.time(), worker="database_backup")
+            await asyncio.sleep(wal_interval if shipper else max(next_snapshot - time.monotonic(), 1.0))
+    finally:
+        if shipper:
+            # последние транзакции до остановки; checkpoint не нужен — журнал перенесёт следующий запуск
+            try:
+                shipper.ship(checkpoint=False)
+            except Exception:
+                logger.exception("Доставка WAL при остановке")
+            finally:
+                shipper.close()
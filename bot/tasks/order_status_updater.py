@@ -1,39 +1,90 @@
 import asyncio
+import time
 from datetime import datetime, timedelta
 
-from aiogram import Bot
-from db.database import SessionLocal, Order, OrderStatus, User
+from sqlalchemy import func
+from db.database import SessionLocal, Order, User
+from bot.services.lease import wake_job, wakeup_event
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+from bot.services.outbox import emit_events, order_event
+from bot.services.query_budget import query_budget
+from bot.services.reference import get_status
+from bot.tasks.outbox_relay import wake_outbox_relay
+from bot.tasks.print_queue import wake_print_queue
 
-async def order_status_updater(bot: Bot):
+# Оплаченный заказ уходит в работу через 5 минут после оформления
+PROCESSING_DELAY = timedelta(minutes=5)
+POLL_INTERVAL = 60
+
+_wakeup = wakeup_event("order_status_updater")
+
+
+def wake_status_updater():
+    """Будит воркер раньше очередного опроса — сразу после подтверждения оплаты."""
+    wake_job("order_status_updater")
+
+
+async def order_status_updater():
     """
-    Каждые 60 секунд переводит оплаченные заказы со статусом 'new' старше 5 минут в 'in_progress'
-    и уведомляет пользователя.
+    Переводит оплаченные заказы со статусом 'new' старше 5 минут в 'in_progress'.
+    Уведомления пишутся в outbox в той же транзакции, отправляет их outbox_relay.
+    Опрашивает базу раз в 60 секунд, а если есть
+    оплаченный заказ, которому ещё рано в работу, — просыпается к его сроку.
+    wake_status_updater() запускает проверку сразу.
     """
+    delay = POLL_INTERVAL
     while True:
-        await asyncio.sleep(60)
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
+        tick_start = time.perf_counter()
         now = datetime.utcnow()
-        threshold = now - timedelta(minutes=5)
-
-        db = SessionLocal()
-        # находим все оплаченные новые заказы, старше threshold
-        ready = (
-            db.query(Order)
-            .filter(Order.status == "new", Order.paid == True, Order.created_at <= threshold)
-            .all()
-        )
-        in_prog = db.query(OrderStatus).filter_by(code="in_progress").first()
-
-        for order in ready:
-            order.status = in_prog.code
-            db.commit()
-
-            user = db.query(User).filter_by(id=order.user_id).first()
-            try:
-                await bot.send_message(
-                    user.telegram_id,
-                    f"🛠 Заказ #{order.order_id[:8]} переведён в статус «{in_prog.label}»."
+        threshold = now - PROCESSING_DELAY
+
+        with query_budget("order_status_updater"):
+            db = SessionLocal()
+            # находим все оплаченные новые заказы старше threshold вместе с telegram_id владельца
+            ready = (
+                db.query(Order.order_id, Order.number, User.telegram_id)
+                .join(User, User.id == Order.user_id)
+                .filter(Order.status == "new", Order.paid == True, Order.created_at <= threshold)
+                .all()
+            )
+            in_prog = get_status("in_progress")
+            code, label = in_prog.code, in_prog.label
+            WORKER_BACKLOG.set(len(ready), worker="order_status_updater")
+
+            if ready:
+                (
+                    db.query(Order)
+                    .filter(Order.order_id.in_([order_id for order_id, _, _ in ready]))
+                    .update({Order.status: code}, synchronize_session=False)
                 )
-            except Exception:
-                pass
+                emit_events(db, [
+                    order_event(order_id, "status_changed", telegram_id, dedup_key=f"{order_id}:status:{code}",
+                                number=number, status=code, label=label)
+                    for order_id, number, telegram_id in ready
+                ])
+                db.commit()
+            # ближайший оплаченный заказ, которому ещё рано в работу
+            next_created = (
+                db.query(func.min(Order.created_at))
+                .filter(Order.status == "new", Order.paid == True, Order.created_at > threshold)
+                .scalar()
+            )
+            db.close()
+
+        if next_created is None:
+            delay = POLL_INTERVAL
+        else:
+            due_in = (next_created + PROCESSING_DELAY - datetime.utcnow()).total_seconds()
+            delay = min(max(due_in, 1.0), POLL_INTERVAL)
+
+        if ready:
+            wake_outbox_relay()
+            wake_print_queue()
 
-        db.close()
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="order_status_updater")
+        WORKER_LAST_TICK.set(time.time(), worker="order_status_updater")
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import timedelta
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from bot.services.lease import wake_job, wakeup_event
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+from bot.services.outbox import fetch_pending, mark_events, purge_delivered, render_event
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_BATCH     = int(os.getenv("OUTBOX_BATCH", "100"))
+OUTBOX_IDLE      = float(os.getenv("OUTBOX_IDLE", "5"))
+OUTBOX_RETENTION = timedelta(days=int(os.getenv("OUTBOX_RETENTION_DAYS", "7")))
+PURGE_INTERVAL   = 3600
+
+_wakeup = wakeup_event("outbox_relay")
+_stopping = False
+
+
+def wake_outbox_relay():
+    """Будит релей сразу после коммита новых событий, не дожидаясь OUTBOX_IDLE."""
+    wake_job("outbox_relay")
+
+
+def stop_outbox_relay():
+    """При остановке бота: релей досылает всё, что уже можно отправить, и завершается."""
+    global _stopping
+    _stopping = True
+    _wakeup.set()
+
+
+async def outbox_relay(bot: Bot, batch_size: int = OUTBOX_BATCH, idle: float = OUTBOX_IDLE):
+    """
+    Отправляет уведомления из outbox order_events пачками. Доставка «хотя бы
+    один раз»: событие отмечается отправленным после send_message, поэтому
+    при падении между ними уйдёт повторно — но не больше одной пачки.
+    При отмене уже отправленное в пачке отмечается сразу, без повторов.
+    """
+    last_purge = 0.0
+    while True:
+        events = await asyncio.to_thread(fetch_pending, batch_size)
+        WORKER_BACKLOG.set(len(events), worker="outbox_relay")
+        if not events:
+            if _stopping:
+                return
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                last_purge = time.monotonic()
+                purged = await asyncio.to_thread(purge_delivered, OUTBOX_RETENTION)
+                if purged:
+                    logger.info("Outbox: удалено %d обработанных событий", purged)
+            try:
+                await asyncio.wait_for(_wakeup.wait(), timeout=idle)
+            except asyncio.TimeoutError:
+                pass
+            _wakeup.clear()
+            continue
+
+        tick_start = time.perf_counter()
+        delivered, failed, dropped = [], [], []
+        pause = 0.0
+        try:
+            for event in events:
+                text = render_event(event)
+                if text is None or event.telegram_id is None:
+                    delivered.append(event.id)
+                    continue
+                try:
+                    await bot.send_message(event.telegram_id, text)
+                    delivered.append(event.id)
+                except TelegramRetryAfter as e:
+                    # остаток пачки не трогаем — он уйдёт после паузы
+                    pause = e.retry_after
+                    break
+                except TelegramForbiddenError as e:
+                    dropped.append((event.id, str(e)))
+                except Exception as e:
+                    failed.append((event, str(e)))
+        except asyncio.CancelledError:
+            # остановка посреди пачки: одна короткая запись прямо в цикле событий
+            mark_events(delivered, failed, dropped)
+            raise
+
+        await asyncio.to_thread(mark_events, delivered, failed, dropped)
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="outbox_relay")
+        WORKER_LAST_TICK.set(time.time(), worker="outbox_relay")
+        if pause:
+            if _stopping:
+                # ждать паузу Telegram при остановке незачем — дошлёт следующий запуск
+                return
+            await asyncio.sleep(pause)
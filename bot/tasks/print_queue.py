@@ -0,0 +1,45 @@
+import asyncio
+import logging
+import time
+
+from bot.services.lease import wake_job, wakeup_event
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+from bot.services.print_queue import PRINT_PLAN_INTERVAL, plan_print_queue
+
+logger = logging.getLogger(__name__)
+
+_wakeup = wakeup_event("print_queue")
+
+
+def wake_print_queue():
+    """Будит планировщик сразу после перевода заказов в работу."""
+    wake_job("print_queue")
+
+
+async def print_queue(interval: float = PRINT_PLAN_INTERVAL):
+    """
+    Планировщик очереди печати: раскладывает новые заказы в in_progress на
+    задания и пересобирает план прогонов (bot.services.print_queue). Шаг — в
+    отдельном потоке; раз в interval секунд или по wake_print_queue().
+    Печать запускает и завершает оператор — scripts/print_queue.py.
+    """
+    while True:
+        tick_start = time.perf_counter()
+        try:
+            result = await asyncio.to_thread(plan_print_queue)
+        except Exception:
+            logger.exception("План печати")
+        else:
+            if result.replanned:
+                logger.info(
+                    "План печати: заказов добавлено %d, заданий снято %d; в очереди %d заданий, %d прогонов",
+                    result.orders, result.dropped, result.jobs, result.runs,
+                )
+            WORKER_BACKLOG.set(result.jobs, worker="print_queue")
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="print_queue")
+        WORKER_LAST_TICK.set(time.time(), worker="print_queue")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
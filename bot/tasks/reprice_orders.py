@@ -0,0 +1,43 @@
+import asyncio
+import logging
+import time
+
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+from bot.services.pricing import PRICE_RELOAD_INTERVAL, get_price_table
+from bot.services.repricing import reprice_open_orders
+from bot.tasks.outbox_relay import wake_outbox_relay
+
+logger = logging.getLogger(__name__)
+
+
+async def reprice_orders(batch_size: int = 500, interval: float = PRICE_RELOAD_INTERVAL):
+    """
+    Следит за версией прайс-листа и пересчитывает открытые неоплаченные
+    заказы, посчитанные по старой. Пачка — одна транзакция в отдельном
+    потоке; уведомления о новой цене уходят через outbox.
+    """
+    while True:
+        tick_start = time.perf_counter()
+        table = await asyncio.to_thread(get_price_table)
+        repriced = unchanged = 0
+        while True:
+            try:
+                result = await asyncio.to_thread(reprice_open_orders, batch_size, table)
+            except Exception:
+                # например, пачку перебила конкурирующая запись — повторим на следующем проходе
+                logger.exception("Пересчёт заказов по прайс-листу %d", table.version)
+                break
+            repriced += result.repriced
+            unchanged += result.unchanged
+            WORKER_BACKLOG.set(result.repriced + result.unchanged, worker="reprice_orders")
+            if result.repriced + result.unchanged < batch_size:
+                break
+        if repriced or unchanged:
+            logger.info("Прайс-лист %d: пересчитано заказов %d, цена не изменилась у %d",
+                        table.version, repriced, unchanged)
+        if repriced:
+            wake_outbox_relay()
+
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="reprice_orders")
+        WORKER_LAST_TICK.set(time.time(), worker="reprice_orders")
+        await asyncio.sleep(interval)
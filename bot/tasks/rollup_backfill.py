@@ -0,0 +1,20 @@
+import asyncio
+import logging
+
+from bot.services.rollups import backfill_rollups_chunk
+
+logger = logging.getLogger(__name__)
+
+
+async def rollup_backfill(days_per_chunk: int = 7, pause: float = 1.0):
+    """
+    Досчитывает сводки за дни до их появления: порция дней — одна короткая
+    транзакция в отдельном потоке, между порциями пауза, чтобы не мешать хендлерам.
+    Завершается, когда вся история пересчитана.
+    """
+    chunks = 0
+    while not await asyncio.to_thread(backfill_rollups_chunk, days_per_chunk):
+        chunks += 1
+        await asyncio.sleep(pause)
+    if chunks:
+        logger.info("Сводки: история пересчитана (%d порций)", chunks + 1)
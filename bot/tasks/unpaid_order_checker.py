@@ -1,55 +1,107 @@
 import asyncio
 import os
 import shutil
-from datetime import datetime, timedelta
+import time
+from datetime import datetime
 
-from aiogram import Bot
-from db.database import SessionLocal, Order, User
+from sqlalchemy import bindparam, delete, select, update
 
-async def unpaid_order_checker(bot: Bot):
+from db.database import SessionLocal, Order, User, ORDER_AWAITING_PAYMENT, REMINDER_INTERVAL
+from bot.services.metrics import WORKER_BACKLOG, WORKER_LAST_TICK, WORKER_TICK_LATENCY
+from bot.services.outbox import emit_events, order_event
+from bot.services.query_budget import query_budget
+from bot.tasks.outbox_relay import wake_outbox_relay
+
+# событие для стадии, в которую переходит заказ; после последней заказ удаляется
+STAGE_EVENTS = {1: "payment_reminder", 2: "payment_warning"}
+EXPIRE_AFTER = REMINDER_INTERVAL * (len(STAGE_EVENTS) + 1)
+
+async def unpaid_order_checker():
     """
-    Каждые 60 секунд проверяет заказы со статусом 'new' и paid=False.
-    - Через 10 минут (discount==0.0) шлёт напоминание и ставит discount=0.01
-    - Через 20 минут (discount==0.01) шлёт предупреждение и ставит discount=0.02
-    - Через 30 минут удаляет заказ и папку с файлами.
+    Каждые 60 секунд обходит неоплаченные заказы со статусом 'new', у которых
+    подошло next_action_at (частичный индекс ix_orders_next_action):
+    - через 10 минут напоминает об оплате (reminder_stage=1)
+    - через 20 минут шлёт предупреждение (reminder_stage=2)
+    - через 30 минут удаляет заказ и папку с файлами.
+    Уведомления пишутся в outbox в той же транзакции, что и изменения заказов;
+    отправляет их outbox_relay, поэтому на заказ здесь приходится только работа с базой.
     """
     while True:
         await asyncio.sleep(60)
+        tick_start = time.perf_counter()
         now = datetime.utcnow()
-        t1 = now - timedelta(minutes=10)
-        t2 = now - timedelta(minutes=20)
-        t3 = now - timedelta(minutes=30)
-
-        db = SessionLocal()
-        orders = db.query(Order).filter(Order.status == "new", Order.paid == False).all()
-
-        for order in orders:
-            user = db.query(User).filter_by(id=order.user_id).first()
-            try:
-                if order.created_at <= t3:
-                    # удаляем сам заказ и файлы
-                    folder = f"uploads/{user.telegram_id}/{order.order_id}"
-                    if os.path.exists(folder):
-                        shutil.rmtree(folder)
-                    db.delete(order)
-                    await bot.send_message(
-                        user.telegram_id,
-                        f"❌ Заказ #{order.order_id[:8]} удалён из-за не оплаты."
-                    )
-                elif order.created_at <= t2 and float(order.discount) == 0.01:
-                    await bot.send_message(
-                        user.telegram_id,
-                        f"⚠️ Последнее предупреждение: заказ #{order.order_id[:8]} не оплачен."
-                    )
-                    order.discount = 0.02
-                elif order.created_at <= t1 and float(order.discount) == 0.0:
-                    await bot.send_message(
-                        user.telegram_id,
-                        f"💡 Напоминание: заказ #{order.order_id[:8]} всё ещё не оплачен."
-                    )
-                    order.discount = 0.01
-            except Exception:
-                pass
-
-        db.commit()
-        db.close()
+
+        with query_budget("unpaid_order_checker"):
+            db = SessionLocal()
+            # владелец подтягивается тем же запросом, а не отдельным SELECT на каждый заказ;
+            # из заказа — только поля для решения и события, без photos и pricing
+            due = (
+                db.query(Order.order_id, Order.number, Order.created_at, Order.reminder_stage, User.telegram_id)
+                .join(User, User.id == Order.user_id)
+                .filter(ORDER_AWAITING_PAYMENT, Order.next_action_at <= now, User.deleted_at.is_(None))
+                .order_by(Order.next_action_at)
+                .all()
+            )
+            WORKER_BACKLOG.set(len(due), worker="unpaid_order_checker")
+
+            owners = {}
+            expired = []
+            reminders = []
+            for order_id, number, created_at, reminder_stage, telegram_id in due:
+                owners[order_id] = (number, telegram_id)
+                stage = reminder_stage + 1
+                if stage > len(STAGE_EVENTS) or created_at + EXPIRE_AFTER <= now:
+                    expired.append(order_id)
+                else:
+                    reminders.append({
+                        "b_id": order_id,
+                        "b_stage": stage,
+                        "b_next": created_at + REMINDER_INTERVAL * (stage + 1),
+                    })
+
+            # выборка и запись — разные транзакции: заказ, оплаченный между ними,
+            # не удаляется и не получает напоминание — условия выборки повторяются в WHERE
+            events = []
+            expired_folders = []
+            if expired:
+                deleted = db.scalars(
+                    delete(Order)
+                    .where(Order.order_id.in_(expired), ORDER_AWAITING_PAYMENT, Order.next_action_at <= now)
+                    .returning(Order.order_id)
+                    .execution_options(synchronize_session=False)
+                ).all()
+                for order_id in deleted:
+                    number, telegram_id = owners[order_id]
+                    expired_folders.append(f"uploads/{telegram_id}/{order_id}")
+                    events.append(order_event(order_id, "expired", telegram_id, number=number))
+            if reminders:
+                orders = Order.__table__
+                updated = db.execute(
+                    update(orders)
+                    .where(orders.c.order_id == bindparam("b_id"), ORDER_AWAITING_PAYMENT, orders.c.next_action_at <= now)
+                    .values(reminder_stage=bindparam("b_stage"), next_action_at=bindparam("b_next")),
+                    reminders,
+                ).rowcount
+                if updated < len(reminders):
+                    # обновлённые — те, что уже на новой стадии
+                    stages = dict(db.execute(
+                        select(orders.c.order_id, orders.c.reminder_stage)
+                        .where(orders.c.order_id.in_([r["b_id"] for r in reminders]))
+                    ).all())
+                    reminders = [r for r in reminders if stages.get(r["b_id"]) == r["b_stage"]]
+                for r in reminders:
+                    number, telegram_id = owners[r["b_id"]]
+                    events.append(order_event(r["b_id"], STAGE_EVENTS[r["b_stage"]], telegram_id, number=number))
+            emit_events(db, events)
+            db.commit()
+            db.close()
+
+        # файлы удаляем только после коммита: откат не должен оставить заказ без фото
+        for folder in expired_folders:
+            if os.path.exists(folder):
+                shutil.rmtree(folder, ignore_errors=True)
+        if events:
+            wake_outbox_relay()
+
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="unpaid_order_checker")
+        WORKER_LAST_TICK.set(time.time(), worker="unpaid_order_checker")
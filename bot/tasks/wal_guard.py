@@ -0,0 +1,34 @@
+import asyncio
+import logging
+import time
+
+from bot.services.backup import BACKUP_WAL_SHIPPING, backups_enabled, guard_wal
+from bot.services.metrics import WORKER_LAST_TICK, WORKER_TICK_LATENCY
+
+logger = logging.getLogger(__name__)
+
+
+async def wal_guard(interval: float = 60.0):
+    """
+    Следит, чтобы при BACKUP_WAL_SHIPPING журнал не рос без конца, когда
+    database_backup остановлена или падает: раз в interval секунд вызывает
+    guard_wal, и если тот перенёс журнал в обход доставки — предупреждает в
+    логе. Резервная копия после этого начнёт новое поколение. Без доставки
+    работает автоматический checkpoint, и задача сразу завершается.
+    """
+    if not (BACKUP_WAL_SHIPPING and backups_enabled()):
+        return
+    since = time.time()
+    while True:
+        tick_start = time.perf_counter()
+        try:
+            reason = await asyncio.to_thread(guard_wal, since)
+        except Exception:
+            logger.exception("Проверка журнала WAL")
+        else:
+            if reason:
+                logger.warning("WAL: %s — checkpoint без доставки, резервная копия начнёт новое поколение", reason)
+
+        WORKER_TICK_LATENCY.observe(time.perf_counter() - tick_start, worker="wal_guard")
+        WORKER_LAST_TICK.set(time.time(), worker="wal_guard")
+        await asyncio.sleep(interval)
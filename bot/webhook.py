@@ -0,0 +1,178 @@
+# bot/webhook.py
+
+import asyncio
+import hmac
+import logging
+import time
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from db.serialization import loads
+from bot.services.metrics import WEBHOOK_BACKLOG, WEBHOOK_UPDATES
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def extract_chat_id(update: dict) -> int | None:
+    """
+    Достаёт из сырого апдейта id чата (или пользователя), по которому
+    апдейты одного собеседника попадают в одну и ту же очередь.
+    """
+    for key, event in update.items():
+        if key == "update_id" or not isinstance(event, dict):
+            continue
+        chat = event.get("chat")
+        if chat is None and isinstance(event.get("message"), dict):
+            chat = event["message"].get("chat")
+        if chat is not None:
+            return chat.get("id")
+        user = event.get("from") or event.get("user")
+        if user is not None:
+            return user.get("id")
+    return None
+
+
+class UpdateWorkerPool:
+    """
+    Ограниченная очередь апдейтов, которую разбирают N воркеров.
+
+    Каждому чату соответствует ровно один воркер (chat_id % workers),
+    поэтому апдейты одного чата обрабатываются строго по порядку,
+    а разные чаты — параллельно. Если очередь воркера заполнена,
+    submit() возвращает False и апдейт отбрасывается (load shedding).
+    """
+
+    def __init__(self, dp: Dispatcher, bot: Bot, workers: int = 4, queue_size: int = 1000):
+        self.dp = dp
+        self.bot = bot
+        per_worker = max(queue_size // workers, 1)
+        self.queues: list[asyncio.Queue] = [asyncio.Queue(maxsize=per_worker) for _ in range(workers)]
+        self._tasks: list[asyncio.Task] = []
+
+        self.accepted = 0
+        self.shed = 0
+        self.processed = 0
+        self.failed = 0
+
+    def _queue_for(self, update: dict) -> asyncio.Queue:
+        chat_id = extract_chat_id(update)
+        if chat_id is None:
+            chat_id = update.get("update_id", 0)
+        return self.queues[chat_id % len(self.queues)]
+
+    def submit(self, update: dict) -> bool:
+        queue = self._queue_for(update)
+        try:
+            queue.put_nowait((time.monotonic(), update))
+        except asyncio.QueueFull:
+            self.shed += 1
+            WEBHOOK_UPDATES.inc(result="shed")
+            return False
+        self.accepted += 1
+        WEBHOOK_UPDATES.inc(result="accepted")
+        return True
+
+    @property
+    def backlog(self) -> int:
+        return sum(q.qsize() for q in self.queues)
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            _, update = await queue.get()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+                self.processed += 1
+            except Exception:
+                self.failed += 1
+                logger.exception("Ошибка обработки апдейта %s", update.get("update_id"))
+            finally:
+                queue.task_done()
+
+    def start(self):
+        WEBHOOK_BACKLOG.set_function(lambda: self.backlog)
+        self._tasks = [asyncio.create_task(self._worker(q)) for q in self.queues]
+
+    async def stop(self, drain: bool = True, timeout: float | None = None) -> int:
+        """
+        Останавливает воркеров; при drain=True сначала ждёт, пока очереди
+        опустеют, но не дольше timeout. Возвращает число брошенных апдейтов —
+        принятых, но так и не обработанных.
+        """
+        if drain:
+            try:
+                await asyncio.wait_for(asyncio.gather(*(q.join() for q in self.queues)), timeout)
+            except asyncio.TimeoutError:
+                pass
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        return self.accepted - self.processed - self.failed
+
+
+def create_webhook_app(pool: UpdateWorkerPool, path: str = "/webhook", secret: str | None = None) -> web.Application:
+    """
+    aiohttp-приложение, которое проверяет секрет, кладёт апдейт в пул
+    и сразу отвечает Telegram. При переполнении отвечает 503, и Telegram
+    повторит доставку позже.
+    """
+
+    async def handle_update(request: web.Request) -> web.Response:
+        if secret and not hmac.compare_digest(request.headers.get(SECRET_HEADER, ""), secret):
+            return web.Response(status=401)
+        try:
+            update = loads(await request.read())
+        except ValueError:
+            return web.Response(status=400)
+        if not isinstance(update, dict):
+            return web.Response(status=400)
+        if not pool.submit(update):
+            return web.Response(status=503, headers={"Retry-After": "1"})
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, handle_update)
+    return app
+
+
+async def run_webhook(
+    dp: Dispatcher,
+    bot: Bot,
+    url: str,
+    host: str = "0.0.0.0",
+    port: int = 8080,
+    path: str = "/webhook",
+    secret: str | None = None,
+    workers: int = 4,
+    queue_size: int = 1000,
+    pool=None,
+    drain_timeout: float | None = None,
+):
+    """
+    Регистрирует вебхук в Telegram и обслуживает входящие апдейты до отмены.
+    pool — куда отдавать апдейты: по умолчанию свой UpdateWorkerPool,
+    в кластере — ShardRouter, раскладывающий их по процессам. При отмене
+    перестаёт принимать запросы и дообрабатывает очередь не дольше drain_timeout.
+    """
+    pool = pool or UpdateWorkerPool(dp, bot, workers=workers, queue_size=queue_size)
+    app = create_webhook_app(pool, path=path, secret=secret)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+
+    pool.start()
+    await site.start()
+    await bot.set_webhook(
+        url,
+        secret_token=secret,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+    logger.info("Webhook запущен на %s:%s%s (воркеров: %s)", host, port, path, workers)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
+        await pool.stop(timeout=drain_timeout)
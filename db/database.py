@@ -1,14 +1,68 @@
+import json
+import os
+from pathlib import PurePath
 from datetime import timedelta
+from dotenv import load_dotenv
+from typing import Callable
 from sqlalchemy import (
-    create_engine, Column, Integer, String, Boolean,
-    Text, ForeignKey, DateTime, JSON, DECIMAL
+    create_engine, event, inspect, Column, Integer, String, Boolean,
+    Text, ForeignKey, DateTime, JSON, DECIMAL, Float, Index, MetaData, TypeDecorator, UniqueConstraint, and_, false,
+    literal_column,
 )
-from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.orm import declarative_base, sessionmaker, relationship
 from datetime import datetime
 
-engine = create_engine("sqlite:///db/photoexpress.sqlite", echo=False)
+from db.serialization import decode_photos, dumps, loads
+
+load_dotenv()
+
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///db/photoexpress.sqlite")
+
+# В кластерном режиме в базу пишут несколько процессов: WAL пускает читателей
+# параллельно с писателем, а busy_timeout ждёт освобождения блокировки
+# вместо мгновенного "database is locked"
+SQLITE_WAL             = os.getenv("SQLITE_WAL", "1") == "1"
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "10000"))
+# Доставка WAL в резервную копию (bot.services.backup): checkpoint делает
+# только задача database_backup, и лишь после того, как кадры сохранены, —
+# иначе перезапуск журнала может затереть ещё не скопированные транзакции.
+# Журнал больше BACKUP_WAL_MAX_MB задача wal_guard переносит сама; чтобы файл
+# после перезапуска не выглядел переполненным, он обрезается до четверти порога
+BACKUP_WAL_SHIPPING    = SQLITE_WAL and os.getenv("BACKUP_WAL_SHIPPING", "0") == "1"
+BACKUP_WAL_MAX_BYTES   = int(os.getenv("BACKUP_WAL_MAX_MB", "256")) * 2**20
+
+# колонки JSON пишутся и читаются через db.serialization (msgspec/orjson, если установлены)
+engine = create_engine(DATABASE_URL, echo=False, json_serializer=dumps, json_deserializer=loads)
 SessionLocal = sessionmaker(bind=engine)
+
+
+def _archive_path(database: str | None) -> str:
+    if not database or database == ":memory:":
+        return ":memory:"
+    base, ext = os.path.splitext(database)
+    return f"{base}.archive{ext or '.sqlite'}"
+
+
+# Холодный архив заказов (bot.services.archive) — отдельный файл SQLite рядом с
+# основной базой: не раздувает её и не попадает в её резервные копии. Каждое
+# соединение подключает его через ATTACH как схему archive
+ARCHIVE_DATABASE_PATH = os.getenv("ARCHIVE_DATABASE_PATH") or _archive_path(engine.url.database)
+
+if engine.dialect.name == "sqlite":
+    @event.listens_for(engine, "connect")
+    def _sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute(f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}")
+        if SQLITE_WAL:
+            cursor.execute("PRAGMA journal_mode = WAL")
+        if BACKUP_WAL_SHIPPING:
+            cursor.execute("PRAGMA wal_autocheckpoint = 0")
+            cursor.execute(f"PRAGMA journal_size_limit = {BACKUP_WAL_MAX_BYTES // 4}")
+        _attach_archive(cursor)
+        cursor.close()
+
 Base = declarative_base()
 
 
@@ -23,6 +77,11 @@ class User(Base):
     accepted_policy  = Column(Boolean, default=False)
     # Новое поле: флаг, указывающий, что первый заказ уже был оплачен
     first_order_paid = Column(Boolean, default=False)
+    # False — пользователь заблокировал бота; рассылки его пропускают
+    is_active        = Column(Boolean, nullable=False, default=True, server_default="1")
+    # аккаунт удалён: строка — надгробие, пока account_purge не сотрёт заказы и
+    # файлы. telegram_id у неё -id, чтобы тот же человек мог сразу зарегистрироваться снова
+    deleted_at       = Column(DateTime)
 
     created_at       = Column(DateTime, default=datetime.utcnow)
 
@@ -35,12 +94,43 @@ class OrderStatus(Base):
     sort_order = Column(Integer)
 
 
+# Ключ заказа — Snowflake: 41 бит — миллисекунды от ORDER_ID_EPOCH_MS, 10 бит —
+# номер процесса, 12 бит — счётчик внутри миллисекунды. Ключи растут со временем,
+# поэтому новые заказы дописываются в конец B-дерева, а INTEGER PRIMARY KEY
+# хранится прямо в rowid — без отдельного индекса. Выдаёт ключи
+# bot.services.order_ids.new_order_id().
+ORDER_ID_EPOCH_MS = 1_704_067_200_000   # 2024-01-01 UTC
+ORDER_ID_WORKER_BITS = 10
+ORDER_ID_SEQUENCE_BITS = 12
+
+
+def make_order_id(ms: int, worker: int, sequence: int) -> int:
+    """Ключ заказа из unix-времени в миллисекундах, номера процесса и счётчика."""
+    return (
+        ((ms - ORDER_ID_EPOCH_MS) << (ORDER_ID_WORKER_BITS + ORDER_ID_SEQUENCE_BITS))
+        | (worker << ORDER_ID_SEQUENCE_BITS)
+        | sequence
+    )
+
+
+class PhotoList(TypeDecorator):
+    """JSON со списком фото заказа; при чтении проверяется по PhotoRecord (db.serialization.decode_photos)."""
+    impl = JSON
+    cache_ok = True
+
+    def result_processor(self, dialect, coltype):
+        def process(value):
+            return None if value is None else decode_photos(value)
+        return process
+
+
 class Order(Base):
     __tablename__ = "orders"
 
-    order_id       = Column(String, primary_key=True, index=True)
+    order_id       = Column(Integer, primary_key=True, autoincrement=False)  # Snowflake, см. make_order_id
+    number         = Column(Integer, unique=True)   # порядковый номер; из него — короткий код для людей
     user_id        = Column(Integer, ForeignKey("users.id"))
-    photos         = Column(JSON)
+    photos         = Column(PhotoList)
     delivery_point = Column(String)
     receiver_name  = Column(String)
     receiver_phone = Column(String)
@@ -49,7 +139,25 @@ class Order(Base):
     price          = Column(DECIMAL)
     discount       = Column(DECIMAL, default=0.0)
     paid           = Column(Boolean, default=False)
-    created_at     = Column(DateTime, default=datetime.utcnow)
+    created_at     = Column(DateTime, default=datetime.utcnow, index=True)
+    price_version  = Column(Integer)    # по какой версии прайс-листа посчитана price; NULL — версия 1
+    pricing        = Column(JSON)       # сводка для пересчёта цены (bot.services.pricing.price_summary); NULL у старых заказов
+    # напоминания об оплате: 0 — не было, 1 — напомнили, 2 — предупредили;
+    # next_action_at — когда unpaid_order_checker займётся заказом снова
+    reminder_stage = Column(Integer, nullable=False, default=0, server_default="0")
+    next_action_at = Column(DateTime, default=lambda: datetime.utcnow() + REMINDER_INTERVAL)
+
+
+# Шаг между стадиями неоплаченного заказа: напоминание, предупреждение, удаление
+REMINDER_INTERVAL = timedelta(minutes=10)
+
+# Неоплаченные заказы в статусе new — их обходит unpaid_order_checker. Условие
+# записано литералами: SQLite берёт частичный индекс, только если находит его
+# WHERE в запросе буквально, а параметр (status = ?) не сопоставляется
+ORDER_AWAITING_PAYMENT = and_(Order.status == literal_column("'new'"), Order.paid == false())
+_ORDER_NEXT_ACTION_INDEX = Index("ix_orders_next_action", Order.next_action_at, sqlite_where=ORDER_AWAITING_PAYMENT)
+# «Мои заказы» и очистка удалённых аккаунтов — как ix_archived_orders_user в архиве
+_ORDER_USER_INDEX = Index("ix_orders_user", Order.user_id, Order.status, Order.created_at)
 
 
 class PickupPoint(Base):
@@ -61,6 +169,8 @@ class PickupPoint(Base):
     lat      = Column(DECIMAL)
     lon      = Column(DECIMAL)
     rating   = Column(DECIMAL)
+    # когда курьер забирает заказы в ПВЗ, по Москве: "12:00,17:00"; NULL — PRINT_DISPATCH_TIMES
+    dispatch_times = Column(String)
 
 
 # Новая таблица для хранения информации о промокодах
@@ -74,9 +184,742 @@ class PromoCode(Base):
     uses_left        = Column(Integer, nullable=True)                   # сколько раз ещё можно использовать (None = неограниченно)
 
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
+class Broadcast(Base):
+    __tablename__ = "broadcasts"
+
+    id           = Column(Integer, primary_key=True)
+    text         = Column(Text, nullable=False)
+    status       = Column(String, nullable=False, default="pending")  # pending / running / done / cancelled
+    # чекпоинт: все получатели с users.id <= last_user_id уже обработаны
+    last_user_id = Column(Integer, nullable=False, default=0)
+    sent         = Column(Integer, nullable=False, default=0)
+    failed       = Column(Integer, nullable=False, default=0)
+    deactivated  = Column(Integer, nullable=False, default=0)
+    created_at   = Column(DateTime, default=datetime.utcnow)
+    finished_at  = Column(DateTime)
+
+
+class PaymentConfirmation(Base):
+    """Принятые подтверждения оплаты. Ключ — идемпотентный: provider:payment_id."""
+    __tablename__ = "payment_confirmations"
+
+    key         = Column(String, primary_key=True)
+    order_id    = Column(Integer, nullable=False, index=True)
+    provider    = Column(String, nullable=False)
+    amount      = Column(DECIMAL)
+    outcome     = Column(String, nullable=False)  # applied / already_paid / not_found / amount_mismatch
+    received_at = Column(DateTime, default=datetime.utcnow)
+
+
+class OrderEvent(Base):
+    """
+    Outbox событий по заказам: строка пишется в той же транзакции, что и
+    изменение заказа, а уведомления из неё отправляет outbox_relay.
+    dedup_key не даёт записать одно и то же событие дважды.
+    """
+    __tablename__ = "order_events"
+
+    id              = Column(Integer, primary_key=True)
+    dedup_key       = Column(String, nullable=False, unique=True)
+    order_id        = Column(Integer, nullable=False, index=True)
+    telegram_id     = Column(Integer)                   # кому сообщить; заказ к моменту отправки может быть удалён
+    kind            = Column(String, nullable=False)    # status_changed / paid / payment_reminder / payment_warning / expired / repriced
+    payload         = Column(JSON)
+    created_at      = Column(DateTime, default=datetime.utcnow)
+    attempts        = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime)
+    delivered_at    = Column(DateTime)                  # NULL — ещё не обработано
+    last_error      = Column(String)
+
+    # релей читает только необработанные события — маленький частичный индекс;
+    # AUTOINCREMENT не переиспользует id после чистки, лента изменений идёт по id
+    __table_args__ = (
+        Index("ix_order_events_pending", "id", sqlite_where=delivered_at.is_(None)),
+        {"sqlite_autoincrement": True},
+    )
+
+
+class AccountDeletion(Base):
+    """
+    Очередь удаления аккаунтов. Хендлер только ставит надгробие на users и
+    пишет сюда строку; заказы, события и файлы пачками стирает account_purge.
+    Счётчики — прогресс; finished_at NULL — удаление ещё идёт.
+    """
+    __tablename__ = "account_deletions"
+
+    id              = Column(Integer, primary_key=True)
+    user_id         = Column(Integer, nullable=False, unique=True)
+    telegram_id     = Column(Integer, nullable=False)   # прежний: по нему папка uploads и события
+    requested_at    = Column(DateTime, default=datetime.utcnow)
+    finished_at     = Column(DateTime)
+    orders          = Column(Integer, nullable=False, default=0)
+    archived_orders = Column(Integer, nullable=False, default=0)
+    events          = Column(Integer, nullable=False, default=0)
+    files           = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index("ix_account_deletions_pending", "id", sqlite_where=finished_at.is_(None)),
+    )
+
+
+class PrintRun(Base):
+    """
+    Прогон печати: фото одного формата из нескольких заказов подряд, без смены
+    бумаги. planned — план, его пересобирает каждый шаг планировщика
+    (bot.services.print_queue), position — место в очереди; printing и done
+    лаборатория отмечает сама, такие прогоны план не трогает.
+    """
+    __tablename__ = "print_runs"
+
+    id          = Column(Integer, primary_key=True)
+    format      = Column(String, nullable=False)
+    status      = Column(String, nullable=False, default="planned")     # planned → printing → done
+    position    = Column(Integer)
+    photos      = Column(Integer, nullable=False, default=0)
+    copies      = Column(Integer, nullable=False, default=0)
+    due_at      = Column(DateTime)      # самый ранний срок среди заказов прогона
+    planned_at  = Column(DateTime, default=datetime.utcnow)
+    started_at  = Column(DateTime)
+    finished_at = Column(DateTime)
+
+    __table_args__ = (
+        Index("ix_print_runs_status", "status", "position"),
+    )
+
+
+class PrintJob(Base):
+    """
+    Фото одного формата из одного заказа — единица очереди печати. Строки
+    появляются, когда заказ попадает в in_progress, и переходят из прогона в
+    прогон, пока их прогон не начали печатать.
+    """
+    __tablename__ = "print_jobs"
+
+    id        = Column(Integer, primary_key=True)
+    order_id  = Column(Integer, nullable=False)
+    format    = Column(String, nullable=False)
+    photos    = Column(Integer, nullable=False)
+    copies    = Column(Integer, nullable=False)
+    queued_at = Column(DateTime, nullable=False)
+    due_at    = Column(DateTime, nullable=False)    # к отправке в ПВЗ с запасом на упаковку или по возрасту
+    run_id    = Column(Integer, ForeignKey("print_runs.id"), index=True)
+
+    __table_args__ = (
+        UniqueConstraint("order_id", "format"),
+    )
+
+
+class JobLease(Base):
+    """
+    Аренда фоновой задачи: задачу выполняет только процесс-владелец, пока
+    продлевает аренду. Если владелец пропал, после expires_at её забирает другой.
+    """
+    __tablename__ = "job_leases"
+
+    name         = Column(String, primary_key=True)
+    owner        = Column(String)        # hostname:pid; NULL — свободна
+    expires_at   = Column(DateTime, nullable=False)
+    acquired_at  = Column(DateTime)
+    heartbeat_at = Column(DateTime)
+    wake_at      = Column(DateTime)      # задачу будили из другого процесса; сбрасывает владелец
+
+
+class PriceList(Base):
+    """
+    Версия прайс-листа. Действует последняя; прошлые версии не меняются и не
+    удаляются — по ним пересчёт узнаёт, как была посчитана цена открытого заказа.
+    """
+    __tablename__ = "price_lists"
+
+    version       = Column(Integer, primary_key=True)
+    prices        = Column(JSON, nullable=False)      # {"10x15": 20, ...} — цена копии по формату
+    default_price = Column(Float, nullable=False)     # для форматов, которых нет в prices
+    thresholds    = Column(JSON, nullable=False)      # [[50, 0.95], [100, 0.9]] — множитель от числа копий
+    comment       = Column(String)
+    created_at    = Column(DateTime, default=datetime.utcnow)
+
+
+# ─── Холодный архив ──────────────────────────────────────────────────────────
+# Таблицы живут в подключённом файле ARCHIVE_DATABASE_PATH (схема archive).
+# Переносит туда заказы bot.services.archive.
+
+ArchiveBase = declarative_base(metadata=MetaData(schema="archive"))
+
+
+class ArchivedOrder(ArchiveBase):
+    __tablename__ = "archived_orders"
+
+    order_id       = Column(Integer, primary_key=True, autoincrement=False)
+    number         = Column(Integer)
+    user_id        = Column(Integer)
+    photos         = Column(PhotoList)  # пути прежние: файлы ищутся по archived_photos
+    delivery_point = Column(String)
+    receiver_name  = Column(String)
+    receiver_phone = Column(String)
+    comment        = Column(Text)
+    status         = Column(String)
+    price          = Column(DECIMAL)
+    discount       = Column(DECIMAL)
+    paid           = Column(Boolean)
+    created_at     = Column(DateTime)
+    price_version  = Column(Integer)
+    pricing        = Column(JSON)
+    reminder_stage = Column(Integer)
+    next_action_at = Column(DateTime)
+    archived_at    = Column(DateTime, default=datetime.utcnow)
+
+    # «Мои заказы» листают заказы пользователя по статусу от новых к старым
+    __table_args__ = (
+        Index("ix_archived_orders_user", "user_id", "status", "created_at"),
+        Index("ix_archived_orders_created_at", "created_at"),
+        Index("ix_archived_orders_number", "number"),   # поиск по коду заказа
+    )
+
+
+class ArchivedPhoto(ArchiveBase):
+    """Где лежит файл архивного заказа: gzip-член с одной записью tar внутри пачки."""
+    __tablename__ = "archived_photos"
+
+    path     = Column(String, primary_key=True)      # путь из orders.photos
+    order_id = Column(Integer, nullable=False, index=True)
+    bundle   = Column(String, nullable=False, index=True)  # имя файла пачки в ARCHIVE_DIR
+    offset   = Column(Integer, nullable=False)
+    length   = Column(Integer, nullable=False)       # сжатый размер члена
+    size     = Column(Integer, nullable=False)       # размер файла до упаковки
+
+
+def _attach_archive(cursor):
+    cursor.execute("ATTACH DATABASE ? AS archive", (ARCHIVE_DATABASE_PATH,))
+    if SQLITE_WAL:
+        cursor.execute("PRAGMA archive.journal_mode = WAL")
+    # файл архива могли создать только что — таблицы заводим здесь же, а не в
+    # init_db: его быстрый путь на совпадающей версии схемы ничего не создаёт
+    for table in ArchiveBase.metadata.sorted_tables:
+        cursor.execute(str(CreateTable(table, if_not_exists=True).compile(dialect=engine.dialect)))
+        for index in table.indexes:
+            cursor.execute(str(CreateIndex(index, if_not_exists=True).compile(dialect=engine.dialect)))
+
+
+class OrderIdAlias(Base):
+    """
+    Прежние uuid-ключи заказов (до Snowflake). По ним находятся заказы из
+    кнопок в старых сообщениях и из ссылок, отданных платёжному провайдеру.
+    """
+    __tablename__ = "order_id_aliases"
+
+    legacy_id = Column(String, primary_key=True)
+    order_id  = Column(Integer, nullable=False)
+
+
+class AppMeta(Base):
+    """Служебные ключи: версия схемы и сидов — чтобы не проверять их на каждом старте."""
+    __tablename__ = "app_meta"
+
+    key   = Column(String, primary_key=True)
+    value = Column(String)
+
+
+# ─── Полнотекстовый поиск по заказам (SQLite FTS5) ───────────────────────────
+#
+# orders_fts хранит нормализованные копии полей, по которым ищет поддержка:
+# комментарий, ФИО и телефон (только цифры) получателя, имена файлов из photos.
+# rowid документа — order_id: ключ заказа целочисленный и не меняется, а раз
+# он растёт со временем, «сначала новые» — это просто rowid DESC. Индекс
+# держат в актуальном состоянии триггеры на orders; токенизатор trigram ищет
+# по любому фрагменту от трёх символов.
+
+_SEARCH_PHONE = (
+    "replace(replace(replace(replace(replace(coalesce({p}.receiver_phone, ''), "
+    "'+', ''), ' ', ''), '-', ''), '(', ''), ')', '')"
+)
+_SEARCH_FILENAMES = (
+    "coalesce((SELECT group_concat(json_extract(value, '$.filename'), ' ') "
+    "FROM json_each(CASE WHEN json_valid({p}.photos) THEN {p}.photos ELSE '[]' END)), '')"
+)
+
+
+def _search_values(p: str) -> str:
+    return (
+        f"coalesce({p}.comment, ''), coalesce({p}.receiver_name, ''), "
+        f"{_SEARCH_PHONE.format(p=p)}, {_SEARCH_FILENAMES.format(p=p)}"
+    )
+
+
+ORDER_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS orders_fts USING fts5("
+    " comment, receiver_name, receiver_phone, filenames, tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS orders_search_ai AFTER INSERT ON orders BEGIN"
+    " INSERT INTO orders_fts (rowid, comment, receiver_name, receiver_phone, filenames)"
+    f" VALUES (new.order_id, {_search_values('new')});"
+    " END",
+    # перенос в архив (отметка archiving) документ не удаляет: архивный заказ тоже находится
+    "CREATE TRIGGER IF NOT EXISTS orders_search_ad AFTER DELETE ON orders"
+    " WHEN NOT EXISTS (SELECT 1 FROM app_meta WHERE key = 'archiving') BEGIN"
+    " DELETE FROM orders_fts WHERE rowid = old.order_id;"
+    " END",
+    "CREATE TRIGGER IF NOT EXISTS orders_search_au"
+    " AFTER UPDATE OF comment, receiver_name, receiver_phone, photos ON orders BEGIN"
+    " UPDATE orders_fts SET"
+    f" (comment, receiver_name, receiver_phone, filenames) = ({_search_values('new')})"
+    " WHERE rowid = new.order_id;"
+    " END",
+]
+
+
+def create_order_search_index(conn):
+    for statement in ORDER_SEARCH_DDL:
+        conn.exec_driver_sql(statement)
+
+
+# ─── Номера заказов ──────────────────────────────────────────────────────────
+#
+# Порядковый номер заказа выдаёт триггер из счётчика app_meta.order_number —
+# в той же записи, что и вставка, поэтому номера не повторяются ни между
+# процессами, ни после удаления последнего заказа. Из номера получается
+# короткий код для сообщений и поддержки (bot.services.order_ids.short_code).
+
+ORDER_NUMBER_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS orders_number_ai AFTER INSERT ON orders WHEN new.number IS NULL BEGIN"
+    " INSERT INTO app_meta (key, value) VALUES ('order_number', '1')"
+    " ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1;"
+    " UPDATE orders SET number = (SELECT CAST(value AS INTEGER) FROM app_meta WHERE key = 'order_number')"
+    " WHERE order_id = new.order_id;"
+    " END",
+]
+
+
+def create_order_number_trigger(conn):
+    for statement in ORDER_NUMBER_DDL:
+        conn.exec_driver_sql(statement)
+
+
+# ─── Сводки продаж и производства ────────────────────────────────────────────
+#
+# Дневные агрегаты, которые триггеры на orders поддерживают инкрементально:
+# вставка добавляет вклад заказа, удаление (отмена) вычитает, изменение
+# вычитает старый вклад и добавляет новый. День — по московскому времени.
+# Историю до появления сводок досчитывает bot.services.rollups.backfill_rollups.
+
+ROLLUP_DAY_SHIFT_HOURS = 3
+ROLLUP_DAY_SHIFT = f"+{ROLLUP_DAY_SHIFT_HOURS} hours"
+
+
+class DailySales(Base):
+    __tablename__ = "daily_sales"
+
+    day           = Column(String, primary_key=True)          # YYYY-MM-DD по Москве
+    orders        = Column(Integer, nullable=False, default=0)
+    paid_orders   = Column(Integer, nullable=False, default=0)
+    gross         = Column(Float, nullable=False, default=0)  # сумма всех заказов дня
+    revenue       = Column(Float, nullable=False, default=0)  # сумма оплаченных
+    discount_cost = Column(Float, nullable=False, default=0)  # скидки по оплаченным
+
+
+class DailyFormatCopies(Base):
+    __tablename__ = "daily_format_copies"
+
+    day    = Column(String, primary_key=True)
+    format = Column(String, primary_key=True)
+    photos = Column(Integer, nullable=False, default=0)
+    copies = Column(Integer, nullable=False, default=0)
+
+
+class DailyPickupOrders(Base):
+    __tablename__ = "daily_pickup_orders"
+
+    day          = Column(String, primary_key=True)
+    pickup_point = Column(String, primary_key=True)           # '' — пункт ещё не выбран
+    orders       = Column(Integer, nullable=False, default=0)
+    paid_orders  = Column(Integer, nullable=False, default=0)
+
+
+def _rollup_day(p: str) -> str:
+    return f"date({p}.created_at, '{ROLLUP_DAY_SHIFT}')"
+
+
+def _rollup_photos(p: str) -> str:
+    return f"json_each(CASE WHEN json_valid({p}.photos) THEN {p}.photos ELSE '[]' END)"
+
+
+def _rollup_delta(p: str, sign: int) -> str:
+    """Вклад строки заказа p (new/old) во все сводки со знаком sign."""
+    paid = f"coalesce({p}.paid, 0)"
+    return (
+        "INSERT INTO daily_sales (day, orders, paid_orders, gross, revenue, discount_cost)"
+        f" VALUES ({_rollup_day(p)}, {sign}, {sign} * {paid}, {sign} * coalesce({p}.price, 0),"
+        f" {sign} * {paid} * coalesce({p}.price, 0), {sign} * {paid} * coalesce({p}.discount, 0))"
+        " ON CONFLICT (day) DO UPDATE SET orders = orders + excluded.orders,"
+        " paid_orders = paid_orders + excluded.paid_orders, gross = gross + excluded.gross,"
+        " revenue = revenue + excluded.revenue, discount_cost = discount_cost + excluded.discount_cost;"
+        " INSERT INTO daily_format_copies (day, format, photos, copies)"
+        f" SELECT {_rollup_day(p)}, coalesce(json_extract(value, '$.format'), '?'),"
+        f" {sign} * count(*), {sign} * sum(coalesce(json_extract(value, '$.copies'), 1))"
+        f" FROM {_rollup_photos(p)} WHERE true GROUP BY 2"
+        " ON CONFLICT (day, format) DO UPDATE SET photos = photos + excluded.photos,"
+        " copies = copies + excluded.copies;"
+        " INSERT INTO daily_pickup_orders (day, pickup_point, orders, paid_orders)"
+        f" VALUES ({_rollup_day(p)}, coalesce({p}.delivery_point, ''), {sign}, {sign} * {paid})"
+        " ON CONFLICT (day, pickup_point) DO UPDATE SET orders = orders + excluded.orders,"
+        " paid_orders = paid_orders + excluded.paid_orders;"
+    )
+
+
+ROLLUP_DDL = [
+    "CREATE TRIGGER IF NOT EXISTS orders_rollup_ai AFTER INSERT ON orders BEGIN"
+    f" {_rollup_delta('new', 1)} END",
+    # перенос в архив и удаление аккаунта стирают заказы, не вычитая их из сводок:
+    # на время своих транзакций bot.services.archive держит в app_meta отметку
+    # archiving, bot.services.account_deletion — purging
+    "CREATE TRIGGER IF NOT EXISTS orders_rollup_ad AFTER DELETE ON orders"
+    " WHEN NOT EXISTS (SELECT 1 FROM app_meta WHERE key IN ('archiving', 'purging')) BEGIN"
+    f" {_rollup_delta('old', -1)} END",
+    "CREATE TRIGGER IF NOT EXISTS orders_rollup_au"
+    " AFTER UPDATE OF created_at, paid, price, discount, photos, delivery_point ON orders BEGIN"
+    f" {_rollup_delta('old', -1)} {_rollup_delta('new', 1)} END",
+]
+
+# Заказы для пересчёта — вместе с архивными. Заказ, который уже скопирован в
+# архив, но ещё не удалён из orders (между двумя транзакциями переноса), — один раз
+ROLLUP_ORDERS = (
+    "(SELECT created_at, paid, price, discount, photos, delivery_point FROM main.orders"
+    " UNION ALL SELECT created_at, paid, price, discount, photos, delivery_point FROM archive.archived_orders a"
+    " WHERE NOT EXISTS (SELECT 1 FROM main.orders m WHERE m.order_id = a.order_id))"
+)
+
+# Полный пересчёт сводок за интервал created_at [:start, :end) — для дозаливки
+# истории и проверки согласованности. Та же формула, что и в триггерах.
+ROLLUP_RECOMPUTE_SQL = {
+    "daily_sales": (
+        f"SELECT {_rollup_day('o')} AS day, count(*), sum(coalesce(o.paid, 0)), sum(coalesce(o.price, 0)),"
+        " sum(coalesce(o.paid, 0) * coalesce(o.price, 0)), sum(coalesce(o.paid, 0) * coalesce(o.discount, 0))"
+        f" FROM {ROLLUP_ORDERS} o WHERE o.created_at >= :start AND o.created_at < :end GROUP BY 1"
+    ),
+    "daily_format_copies": (
+        f"SELECT {_rollup_day('o')} AS day, coalesce(json_extract(p.value, '$.format'), '?'),"
+        " count(*), sum(coalesce(json_extract(p.value, '$.copies'), 1))"
+        f" FROM {ROLLUP_ORDERS} o, {_rollup_photos('o')} AS p"
+        " WHERE o.created_at >= :start AND o.created_at < :end GROUP BY 1, 2"
+    ),
+    "daily_pickup_orders": (
+        f"SELECT {_rollup_day('o')} AS day, coalesce(o.delivery_point, ''), count(*), sum(coalesce(o.paid, 0))"
+        f" FROM {ROLLUP_ORDERS} o WHERE o.created_at >= :start AND o.created_at < :end GROUP BY 1, 2"
+    ),
+}
+
+
+def create_rollup_triggers(conn):
+    for statement in ROLLUP_DDL:
+        conn.exec_driver_sql(statement)
+
+
+def _migrate_rollups(conn):
+    # таблицы сводок уже создал create_all; индекс по created_at нужен дозаливке и отчётам воркеров
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_orders_created_at ON orders (created_at)")
+    create_rollup_triggers(conn)
+    # с этого момента изменения учитывают триггеры, а прошлые дни дозальёт backfill_rollups:
+    # он идёт от сегодняшнего дня назад до самого раннего заказа
+    first = conn.exec_driver_sql(
+        f"SELECT date(min(created_at), '{ROLLUP_DAY_SHIFT}'), date('now', '{ROLLUP_DAY_SHIFT}') FROM orders"
+    ).first()
+    if first[0] is not None:
+        write_meta(conn, rollup_backfill_next=first[1], rollup_backfill_stop=first[0])
+
+
+def _migrate_users_is_active(conn):
+    conn.exec_driver_sql("ALTER TABLE users ADD COLUMN is_active BOOLEAN NOT NULL DEFAULT 1")
+
+
+def _migrate_order_price_version(conn):
+    # прежние заказы посчитаны по прайс-листу версии 1 — NULL так и читается
+    conn.exec_driver_sql("ALTER TABLE orders ADD COLUMN price_version INTEGER")
+
+
+def _migrate_order_pricing(conn):
+    # сводку старым заказам строит первая правка (bot.services.repricing.order_summary)
+    conn.exec_driver_sql("ALTER TABLE orders ADD COLUMN pricing JSON")
+
+
+def _migrate_order_reminders(conn):
+    # столбцы могла уже создать пересборка orders в миграции 10
+    present = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(orders)")}
+    if "reminder_stage" not in present:
+        conn.exec_driver_sql("ALTER TABLE orders ADD COLUMN reminder_stage INTEGER NOT NULL DEFAULT 0")
+    if "next_action_at" not in present:
+        conn.exec_driver_sql("ALTER TABLE orders ADD COLUMN next_action_at DATETIME")
+    # стадия жила в discount отметками 0.01 и 0.02 — переносим её и возвращаем
+    # скидке ноль; триггеры сводок заодно уберут отметки из discount_cost
+    conn.exec_driver_sql(
+        "UPDATE orders SET reminder_stage = CASE CAST(discount AS REAL) WHEN 0.01 THEN 1 ELSE 2 END, discount = 0"
+        " WHERE CAST(discount AS REAL) IN (0.01, 0.02)"
+    )
+    step = int(REMINDER_INTERVAL.total_seconds())
+    conn.exec_driver_sql(
+        "UPDATE orders SET next_action_at ="
+        f" datetime(created_at, '+' || ((reminder_stage + 1) * {step}) || ' seconds')"
+        " WHERE next_action_at IS NULL"
+    )
+    conn.execute(CreateIndex(_ORDER_NEXT_ACTION_INDEX, if_not_exists=True))
+
+
+def _migrate_account_deletion(conn):
+    conn.exec_driver_sql("ALTER TABLE users ADD COLUMN deleted_at DATETIME")
+    # индекс мог уже создать пересборка orders в миграции 10
+    conn.execute(CreateIndex(_ORDER_USER_INDEX, if_not_exists=True))
+
+
+def _migrate_pickup_dispatch(conn):
+    conn.exec_driver_sql("ALTER TABLE pickup_points ADD COLUMN dispatch_times VARCHAR")
+
+
+def _migrate_archived_search(conn):
+    # заказы, перенесённые в архив до этой версии, триггер удалил из индекса — возвращаем
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS orders_search_ad")
+    create_order_search_index(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO orders_fts (rowid, comment, receiver_name, receiver_phone, filenames) "
+        f"SELECT a.order_id, {_search_values('a')} FROM archive.archived_orders a "
+        "WHERE NOT EXISTS (SELECT 1 FROM orders o WHERE o.order_id = a.order_id)"
+    )
+
+
+def _migrate_purge_rollups(conn):
+    # удаление аккаунта больше не вычитает заказы из сводок и не пересчитывает дни
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS orders_rollup_ad")
+    create_rollup_triggers(conn)
+    present = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(account_deletions)")}
+    if "rollup_days" in present:
+        conn.exec_driver_sql("ALTER TABLE account_deletions DROP COLUMN rollup_days")
+
+
+def _migrate_lease_wakeups(conn):
+    # база старше версии 7 получает job_leases из create_all уже со столбцом
+    present = {row[1] for row in conn.exec_driver_sql("PRAGMA table_info(job_leases)")}
+    if "wake_at" not in present:
+        conn.exec_driver_sql("ALTER TABLE job_leases ADD COLUMN wake_at DATETIME")
+
+
+def _migrate_archive(conn):
+    # таблицы архива создаёт ATTACH при подключении; триггер удаления получает
+    # условие, при котором перенос в архив не вычитает заказ из сводок
+    conn.exec_driver_sql("DROP TRIGGER IF EXISTS orders_rollup_ad")
+    create_rollup_triggers(conn)
+
+
+def _rebuild_table(conn, table, rewrite: dict[str, str], source: str):
+    """
+    Пересоздаёт таблицу по текущей модели — SQLite не меняет тип столбца через
+    ALTER. Старая таблица переименовывается в <имя>_legacy, новая создаётся без
+    событий after_create (триггеры не должны сработать на переносе). Строки
+    переносятся запросом SELECT ... source, где старая таблица — псевдоним e:
+    столбцы берутся как есть, rewrite задаёт выражения для изменённых. Столбцы,
+    которых в старой таблице нет (их добавили следующие версии схемы),
+    получают значения по умолчанию — их заполнят свои миграции.
+    """
+    legacy = f"{table.name}_legacy"
+    conn.exec_driver_sql(f"ALTER TABLE {table.name} RENAME TO {legacy}")
+    for (index,) in conn.exec_driver_sql(
+        "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (legacy,)
+    ).all():
+        conn.exec_driver_sql(f'DROP INDEX "{index}"')
+    conn.execute(CreateTable(table))
+    for index in table.indexes:
+        conn.execute(CreateIndex(index))
+    present = {row[1] for row in conn.exec_driver_sql(f"PRAGMA table_info({legacy})")}
+    columns = [c.name for c in table.columns if c.name in rewrite or c.name in present]
+    select = ", ".join(rewrite.get(name, f"e.{name}") for name in columns)
+    conn.exec_driver_sql(f"INSERT INTO {table.name} ({', '.join(columns)}) SELECT {select} {source}")
+    conn.exec_driver_sql(f"DROP TABLE {legacy}")
+
+
+def _legacy_order_id_map(conn) -> list[tuple[str, int, int | None]]:
+    """
+    (uuid, Snowflake, номер) для всех прежних ключей заказов — включая ключи
+    удалённых заказов, на которые ещё ссылаются события и оплаты. Время ключа —
+    время создания; порядок и номера — по created_at. Результат не зависит от
+    запуска, поэтому повтор прерванной миграции даст те же ключи.
+    """
+    rows = conn.exec_driver_sql(
+        "SELECT order_id, min(at), max(is_order) FROM ("
+        " SELECT order_id, created_at AS at, 1 AS is_order FROM orders"
+        " UNION ALL SELECT order_id, created_at, 0 FROM order_events"
+        " UNION ALL SELECT order_id, received_at, 0 FROM payment_confirmations"
+        ") GROUP BY order_id ORDER BY 2, 1"
+    ).all()
+    mapping, last_ms, sequence, number = [], 0, 0, 0
+    for legacy_id, at, is_order in rows:
+        if isinstance(at, str):
+            at = datetime.fromisoformat(at)
+        ms = (at - datetime(1970, 1, 1)) // timedelta(milliseconds=1) if at else ORDER_ID_EPOCH_MS
+        ms = max(ms, ORDER_ID_EPOCH_MS, last_ms)
+        sequence = sequence + 1 if ms == last_ms else 0
+        if sequence >> ORDER_ID_SEQUENCE_BITS:
+            ms, sequence = ms + 1, 0
+        last_ms = ms
+        if is_order:
+            number += 1
+        mapping.append((legacy_id, make_order_id(ms, 0, sequence), number if is_order else None))
+    return mapping
+
+
+def _migrate_order_ids(conn):
+    from bot.services.storage import rename_order_folder  # файлы заказов переименовываются вместе с ключами
+
+    mapping = _legacy_order_id_map(conn)
+    conn.exec_driver_sql(
+        "CREATE TEMP TABLE order_id_map (legacy_id TEXT PRIMARY KEY, order_id INTEGER NOT NULL, number INTEGER)"
+    )
+    conn.exec_driver_sql("INSERT INTO order_id_map VALUES (?, ?, ?)", mapping)
+    conn.exec_driver_sql("INSERT OR IGNORE INTO order_id_aliases SELECT legacy_id, order_id FROM order_id_map")
+    # папки заказов берутся из путей фото: пользователя заказа может уже не быть
+    folders = {
+        (PurePath(photo["path"]).parent.parent.name, legacy_id, order_id)
+        for legacy_id, order_id, photos in conn.exec_driver_sql(
+            "SELECT m.legacy_id, m.order_id, o.photos FROM orders o JOIN order_id_map m ON m.legacy_id = o.order_id"
+        )
+        for photo in json.loads(photos or "[]")
+        if PurePath(photo.get("path", "")).parent.name == legacy_id
+    }
+
+    # триггеры поиска и сводок уйдут вместе со старой таблицей; индекс поиска
+    # переключается с order_search_keys на rowid = order_id
+    for trigger in ("orders_search_ai", "orders_search_ad", "orders_search_au",
+                    "orders_rollup_ai", "orders_rollup_ad", "orders_rollup_au"):
+        conn.exec_driver_sql(f"DROP TRIGGER IF EXISTS {trigger}")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS orders_fts")
+    conn.exec_driver_sql("DROP TABLE IF EXISTS order_search_keys")
+
+    # в путях фото лежит uuid заказа — он меняется на новый ключ
+    _rebuild_table(
+        conn, Order.__table__,
+        {"order_id": "m.order_id", "number": "m.number",
+         "photos": "replace(e.photos, m.legacy_id, CAST(m.order_id AS TEXT))"},
+        "FROM orders_legacy e JOIN order_id_map m ON m.legacy_id = e.order_id",
+    )
+    # в ключах дедупликации и оплат ("manual:<uuid>") — тоже
+    for table, rewrite in (
+        (OrderEvent.__table__, {"dedup_key": "replace(e.dedup_key, m.legacy_id, CAST(m.order_id AS TEXT))",
+                                "payload": "replace(e.payload, m.legacy_id, CAST(m.order_id AS TEXT))"}),
+        (PaymentConfirmation.__table__, {"key": "replace(e.key, m.legacy_id, CAST(m.order_id AS TEXT))"}),
+    ):
+        _rebuild_table(
+            conn, table, {"order_id": "m.order_id", **rewrite},
+            f"FROM {table.name}_legacy e JOIN order_id_map m ON m.legacy_id = e.order_id",
+        )
+
+    create_order_search_index(conn)
+    conn.exec_driver_sql(
+        "INSERT INTO orders_fts (rowid, comment, receiver_name, receiver_phone, filenames) "
+        f"SELECT o.order_id, {_search_values('o')} FROM orders o"
+    )
+    create_rollup_triggers(conn)
+    create_order_number_trigger(conn)
+    write_meta(conn, order_number=max((n for _, _, n in mapping if n), default=0))
+    conn.exec_driver_sql("DROP TABLE order_id_map")
+
+    for telegram_id, legacy_id, order_id in folders:
+        rename_order_folder(telegram_id, legacy_id, order_id)
+
+
+@event.listens_for(Order.__table__, "after_create")
+def _orders_after_create(target, connection, **kw):
+    # новая база получает поисковый индекс и триггеры сводок вместе с таблицей orders
+    if connection.dialect.name == "sqlite":
+        create_order_search_index(connection)
+        create_rollup_triggers(connection)
+        create_order_number_trigger(connection)
+
+
+# Версия схемы. При изменении моделей увеличиваем её; если меняются существующие
+# таблицы — добавляем миграцию в MIGRATIONS под новым номером: функция получает
+# соединение внутри транзакции. Новые таблицы создаёт create_all.
+SCHEMA_VERSION = 17
+SEED_VERSION = 1
+
+MIGRATIONS: dict[int, Callable] = {
+    # 2: поисковый индекс — строится в 10 вместе с переходом на целочисленный order_id, которым он ключуется
+    3: _migrate_rollups,
+    4: _migrate_users_is_active,
+    # 5: payment_confirmations, 6: order_events, 7: job_leases — таблицы создаёт create_all
+    8: _migrate_order_price_version,    # и таблица price_lists
+    9: _migrate_order_pricing,
+    10: _migrate_order_ids,             # и таблица order_id_aliases
+    11: _migrate_order_reminders,
+    12: _migrate_archive,
+    13: _migrate_account_deletion,      # и таблица account_deletions
+    14: _migrate_pickup_dispatch,       # и таблицы print_runs, print_jobs
+    15: _migrate_lease_wakeups,
+    16: _migrate_archived_search,
+    17: _migrate_purge_rollups,
+}
+
+
+def read_meta(conn) -> dict[str, str]:
+    try:
+        return dict(conn.exec_driver_sql("SELECT key, value FROM app_meta").all())
+    except OperationalError:
+        # таблицы ещё нет: свежая база или база до появления app_meta
+        conn.rollback()
+        return {}
+
+
+def write_meta(conn, **values):
+    for key, value in values.items():
+        conn.exec_driver_sql(
+            "INSERT INTO app_meta (key, value) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, str(value)),
+        )
+
+
+def init_db() -> bool:
+    """
+    Готовит базу к работе. Если в app_meta записаны текущие версии схемы и сидов,
+    делает один SELECT и выходит — без create_all и проверок сидов.
+    Возвращает True, если пришлось создавать таблицы, мигрировать или сеять.
+    """
+    with engine.connect() as conn:
+        meta = read_meta(conn)
+    if meta.get("schema_version") == str(SCHEMA_VERSION) and meta.get("seed_version") == str(SEED_VERSION):
+        return False
+
+    with engine.begin() as conn:
+        if "schema_version" in meta:
+            version = int(meta["schema_version"])
+        elif inspect(conn).has_table("orders"):
+            version = 1  # база, созданная до появления app_meta
+        else:
+            version = SCHEMA_VERSION  # пустая база: create_all сразу создаст актуальную схему
+
+        # новые таблицы создаёт create_all, изменения существующих — миграции
+        Base.metadata.create_all(bind=conn)
+        for target in range(version + 1, SCHEMA_VERSION + 1):
+            if target in MIGRATIONS:
+                MIGRATIONS[target](conn)
+        write_meta(conn, schema_version=SCHEMA_VERSION)
+
+    if meta.get("seed_version") != str(SEED_VERSION):
+        _seed_reference_data()
+        with engine.begin() as conn:
+            write_meta(conn, seed_version=SEED_VERSION)
+    return True
+
+
+def close_db():
+    """
+    Закрывает соединения пула при остановке. В SQLite перед этим переносит WAL
+    в основной файл, чтобы следующий запуск не начинал с длинного журнала;
+    если базу ещё читают другие процессы, checkpoint просто сделает что успеет.
+    При доставке WAL журнал не трогаем: это делает только задача резервного копирования.
+    """
+    if engine.dialect.name == "sqlite" and SQLITE_WAL and not BACKUP_WAL_SHIPPING:
+        try:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("PRAGMA wal_checkpoint(TRUNCATE)")
+        except OperationalError:
+            pass
+    engine.dispose()
 
+def _seed_reference_data():
     db = SessionLocal()
     # Статусы заказов
     if not db.query(OrderStatus).first():
@@ -0,0 +1,117 @@
+# db/serialization.py
+"""
+JSON для колонок базы (через json_serializer/json_deserializer движка),
+снимка FSM, событий outbox и тел вебхуков — в одном месте.
+
+Быстрый путь — msgspec или orjson, если пакет установлен (uv add msgspec);
+без них работает стандартный json. JSON_BACKEND=msgspec|orjson|json
+выбирает явно, по умолчанию берётся первый доступный в этом порядке.
+Вывод у всех одинаково компактный, кириллица без \\u-экранирования;
+ключи-числа становятся строками, как у json.
+
+Фото заказа (orders.photos) при чтении проверяются: список записей
+PhotoRecord. С msgspec проверка идёт прямо при разборе (поля сверх
+PhotoRecord он отбрасывает — новое поле фото сначала добавить туда), иначе —
+проходом по уже разобранному списку.
+"""
+
+import json
+import os
+from typing import Any, Callable, TypedDict
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class PhotoRecord(TypedDict):
+    filename: str
+    path: str           # uploads/<telegram_id>/<order_id>/<filename>
+    format: str
+    copies: int
+
+
+_PHOTO_KEYS = PhotoRecord.__required_keys__
+
+
+def _pick_backend() -> str:
+    wanted = os.getenv("JSON_BACKEND", "auto")
+    available = {"msgspec": msgspec is not None, "orjson": orjson is not None, "json": True}
+    if wanted != "auto":
+        if not available.get(wanted):
+            raise RuntimeError(f"JSON_BACKEND={wanted}: пакет не установлен")
+        return wanted
+    return next(name for name, ok in available.items() if ok)
+
+
+BACKEND = _pick_backend()
+
+
+def _check_photos(photos: Any) -> list[PhotoRecord] | None:
+    if photos is None:
+        return None
+    if not isinstance(photos, list) or not all(
+        type(p) is dict and _PHOTO_KEYS <= p.keys() and type(p["copies"]) is int for p in photos
+    ):
+        raise ValueError("photos: ожидается список записей с filename, path, format и copies")
+    return photos
+
+
+if BACKEND == "msgspec":
+    _encoder = msgspec.json.Encoder()
+    _photos_decoder = msgspec.json.Decoder(list[PhotoRecord] | None)
+
+    def dumpb(obj: Any, default: Callable[[Any], Any] | None = None) -> bytes:
+        return (msgspec.json.Encoder(enc_hook=default) if default else _encoder).encode(obj)
+
+    def dumps(obj: Any, default: Callable[[Any], Any] | None = None) -> str:
+        return dumpb(obj, default).decode()
+
+    def loads(data: str | bytes) -> Any:
+        try:
+            return msgspec.json.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(str(e)) from None
+
+    def decode_photos(data: str | bytes) -> list[PhotoRecord] | None:
+        try:
+            return _photos_decoder.decode(data)
+        except msgspec.DecodeError as e:
+            raise ValueError(f"photos: {e}") from None
+
+elif BACKEND == "orjson":
+    def dumpb(obj: Any, default: Callable[[Any], Any] | None = None) -> bytes:
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(obj: Any, default: Callable[[Any], Any] | None = None) -> str:
+        return dumpb(obj, default).decode()
+
+    def loads(data: str | bytes) -> Any:
+        return orjson.loads(data)   # orjson.JSONDecodeError — подкласс ValueError
+
+    def decode_photos(data: str | bytes) -> list[PhotoRecord] | None:
+        return _check_photos(orjson.loads(data))
+
+else:
+    _json_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+    def dumps(obj: Any, default: Callable[[Any], Any] | None = None) -> str:
+        if default is None:
+            return _json_encoder.encode(obj)
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+
+    def dumpb(obj: Any, default: Callable[[Any], Any] | None = None) -> bytes:
+        return dumps(obj, default).encode()
+
+    def loads(data: str | bytes) -> Any:
+        return json.loads(data)
+
+    def decode_photos(data: str | bytes) -> list[PhotoRecord] | None:
+        return _check_photos(json.loads(data))
+
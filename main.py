@@ -1,11 +1,36 @@
 import asyncio
+import logging
 import os
+import signal
+import time
 from aiogram import Bot, Dispatcher
 from aiogram.enums import ParseMode
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from dotenv import load_dotenv
 
-from db.database import init_db
+from db.database import init_db, close_db, engine
+from db.serialization import dumps, loads
+from bot.middlewares import (
+    ChatLaneIsolation,
+    register_middlewares,
+    register_metrics_middlewares,
+    register_tracing_middlewares,
+)
+from bot.services.metrics import instrument_engine
+from bot.services.query_budget import install_query_recorder
+from bot.services.pricing import get_price_table
+from bot.services.reference import warm_reference_cache
+from bot.services.tracing import TRACE_FILE, configure_tracing, instrument_engine_tracing, shutdown_tracing
+from bot.services.outbox import count_pending
+from bot.services.shutdown import (
+    FSM_SNAPSHOT_FILE,
+    IN_FLIGHT,
+    SHUTDOWN_TIMEOUT,
+    ShutdownReport,
+    load_fsm_snapshot,
+    save_fsm_snapshot,
+)
 from bot.handlers.user.onboarding import register_user_handlers
 from bot.handlers.user.profile import register_profile_handlers
 from bot.handlers.user.upload import register_upload_handlers
@@ -14,17 +39,57 @@ from bot.handlers.user.edit_order import register_edit_order_handlers
 from bot.handlers.user.payment_handlers import register_payment_handlers
 from bot.tasks.unpaid_order_checker import unpaid_order_checker
 from bot.tasks.order_status_updater import order_status_updater
+from bot.tasks.outbox_relay import outbox_relay, stop_outbox_relay
+from bot.tasks.reprice_orders import reprice_orders
+from bot.tasks.rollup_backfill import rollup_backfill
+from bot.tasks.archive_orders import archive_orders
+from bot.tasks.database_backup import database_backup
+from bot.tasks.wal_guard import wal_guard
+from bot.tasks.account_purge import account_purge
+from bot.tasks.print_queue import print_queue
+from bot.services.lease import holds_lease, run_leased
 
 load_dotenv()
 
-bot = Bot(
-    token=os.getenv("TELEGRAM_BOT_TOKEN"),
-    default=DefaultBotProperties(parse_mode=ParseMode.HTML)
-)
-dp = Dispatcher()
+# Сколько процессов обрабатывают апдейты; больше одного — кластерный режим
+BOT_PROCESSES = int(os.getenv("BOT_PROCESSES", "1"))
 
-async def start():
-    init_db()
+# Сколько апдейтов polling обрабатывает одновременно
+POLLING_TASKS_LIMIT = int(os.getenv("POLLING_TASKS_LIMIT", "100"))
+
+# Если задан WEBHOOK_URL — принимаем апдейты вебхуком вместо long polling
+WEBHOOK_URL        = os.getenv("WEBHOOK_URL")
+WEBHOOK_SECRET     = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_HOST       = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT       = int(os.getenv("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH       = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_WORKERS    = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "1000"))
+
+# Если задан PAYMENTS_PORT — принимаем подтверждения оплаты от провайдера;
+# без PAYMENTS_SECRET бот не запустится: неподписанный запрос отметил бы заказ оплаченным
+PAYMENTS_PROVIDER = os.getenv("PAYMENTS_PROVIDER", "stub")
+PAYMENTS_HOST     = os.getenv("PAYMENTS_HOST", "127.0.0.1")
+PAYMENTS_PORT     = os.getenv("PAYMENTS_PORT")
+PAYMENTS_PATH     = os.getenv("PAYMENTS_PATH", "/payments/webhook")
+PAYMENTS_SECRET   = os.getenv("PAYMENTS_SECRET")
+
+# Если задан METRICS_PORT — отдаём метрики Prometheus на /metrics
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = os.getenv("METRICS_PORT")
+
+def create_bot(session=None) -> Bot:
+    return Bot(
+        token=os.getenv("TELEGRAM_BOT_TOKEN"),
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML),
+        # запросы к Bot API (клавиатуры, callback_data) и ответы — через db.serialization
+        session=session or AiohttpSession(json_loads=loads, json_dumps=dumps),
+    )
+
+def create_dispatcher() -> Dispatcher:
+    # апдейты одного чата — строго по очереди, разных чатов — параллельно
+    dp = Dispatcher(events_isolation=ChatLaneIsolation())
+    register_middlewares(dp)
 
     # регистрируем хендлеры
     register_user_handlers(dp)
@@ -33,13 +98,303 @@ async def start():
     register_orders_handlers(dp)
     register_edit_order_handlers(dp)
     register_payment_handlers(dp)
+    return dp
 
-    # запускаем polling и оба фоновых воркера
-    await asyncio.gather(
-        dp.start_polling(bot),
-        unpaid_order_checker(bot),
-        order_status_updater(bot),
-    )
+def prepare_database():
+    # при совпадающей версии схемы init_db — один SELECT из app_meta
+    init_db()
+    warm_reference_cache()
+    get_price_table()
+
+def fsm_snapshot_path(shard: int | None = None) -> str | None:
+    if not FSM_SNAPSHOT_FILE:
+        return None
+    return FSM_SNAPSHOT_FILE if shard is None else f"{FSM_SNAPSHOT_FILE}.{shard}"
+
+async def setup(bot: Bot, shard: int | None = None, shards: int = 1) -> Dispatcher:
+    """
+    Готовит базу и диспетчер с метриками и трейсингом, восстанавливает
+    FSM-состояния из снимка прошлой остановки. shard — номер процесса в кластере из shards.
+    """
+    install_query_recorder(engine)
+    # база и справочники готовятся в потоке, пока бот подключается к Telegram;
+    # polling/вебхук потом берут закэшированный getMe
+    await asyncio.gather(asyncio.to_thread(prepare_database), bot.me())
+
+    dp = create_dispatcher()
+    snapshot = fsm_snapshot_path(shard)
+    if snapshot:
+        # при другом числе шардов чужие чаты из снимка теряются
+        restored = load_fsm_snapshot(dp.storage, snapshot, keep=lambda key: key.chat_id % shards == (shard or 0))
+        if restored:
+            logging.getLogger(__name__).info("Восстановлено FSM-состояний из снимка: %d", restored)
+    if METRICS_PORT:
+        from bot.services.metrics import start_metrics_server
+        instrument_engine(engine)
+        register_metrics_middlewares(dp, bot)
+        # у каждого шарда свой порт: METRICS_PORT + 1 + номер шарда
+        port = int(METRICS_PORT) + (0 if shard is None else shard + 1)
+        await start_metrics_server(METRICS_HOST, port)
+    # трейсинг включается переменной TRACE_FILE
+    trace_file = TRACE_FILE and (TRACE_FILE if shard is None else f"{TRACE_FILE}.{shard}")
+    if configure_tracing(trace_file):
+        instrument_engine_tracing(engine)
+        register_tracing_middlewares(dp, bot)
+    return dp
+
+def background_jobs(bot: Bot) -> dict[str, asyncio.Task]:
+    """
+    Фоновые воркеры и дозаливка сводок. Каждый работает под арендой в базе:
+    сколько бы процессов ни было запущено, задача выполняется ровно в одном.
+    """
+    jobs = {
+        "unpaid_order_checker": unpaid_order_checker,
+        "order_status_updater": order_status_updater,
+        "outbox_relay": lambda: outbox_relay(bot),
+        "reprice_orders": reprice_orders,
+        "rollup_backfill": rollup_backfill,
+        "archive_orders": archive_orders,
+        "database_backup": database_backup,
+        "wal_guard": wal_guard,
+        "account_purge": account_purge,
+        "print_queue": print_queue,
+    }
+    return {name: asyncio.create_task(run_leased(name, job), name=name) for name, job in jobs.items()}
+
+def payment_services() -> list:
+    if not PAYMENTS_PORT:
+        return []
+    if not PAYMENTS_SECRET:
+        raise RuntimeError("PAYMENTS_PORT задан без PAYMENTS_SECRET: вебхук оплат принимает только подписанные запросы")
+    from bot.payment_webhook import run_payment_webhook
+    return [run_payment_webhook(
+        PAYMENTS_PROVIDER,
+        PAYMENTS_SECRET,
+        host=PAYMENTS_HOST,
+        port=int(PAYMENTS_PORT),
+        path=PAYMENTS_PATH,
+    )]
+
+def stop_signal() -> asyncio.Event:
+    """Событие, которое взводят SIGTERM (docker stop, systemd) и SIGINT (Ctrl+C)."""
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    return stop
+
+async def until_stopped(stop: asyncio.Event, *tasks: asyncio.Task):
+    """Ждёт сигнала остановки или завершения любой из задач (упавший приём апдейтов)."""
+    waiter = asyncio.create_task(stop.wait())
+    await asyncio.wait({waiter, *tasks}, return_when=asyncio.FIRST_COMPLETED)
+    waiter.cancel()
+    for task in tasks:
+        if task.done() and not task.cancelled() and task.exception():
+            logging.getLogger(__name__).error("%s завершилась с ошибкой", task.get_name(), exc_info=task.exception())
+
+async def stop_background(jobs: dict[str, asyncio.Task], deadline: float, report: ShutdownReport):
+    """
+    Останавливает фоновые задачи. Воркеры отменяются сразу: их транзакции
+    синхронные и посередине не обрываются, а аренды при отмене освобождаются,
+    так что после перезапуска задачи подхватываются без ожидания TTL.
+    Релей outbox, если он работает в этом процессе, до deadline досылает
+    уведомления — в том числе только что записанные воркерами.
+    """
+    relay = jobs.pop("outbox_relay")
+    for task in jobs.values():
+        task.cancel()
+    await asyncio.gather(*jobs.values(), return_exceptions=True)
+
+    pending = await asyncio.to_thread(count_pending)
+    if holds_lease("outbox_relay") and pending:
+        stop_outbox_relay()
+        await asyncio.wait({relay}, timeout=max(deadline - time.monotonic(), 0))
+    relay.cancel()
+    await asyncio.gather(relay, return_exceptions=True)
+    report.outbox_left = await asyncio.to_thread(count_pending)
+    report.outbox_sent = max(pending - report.outbox_left, 0)
+
+async def close_resources(bot: Bot, dp: Dispatcher | None, snapshot: str | None, report: ShutdownReport):
+    """Последний шаг остановки: снимок FSM, сессия Bot API, трейсы и пул соединений."""
+    if dp is not None and snapshot:
+        try:
+            report.fsm_saved = save_fsm_snapshot(dp.storage, snapshot)
+        except OSError as e:
+            report.errors.append(f"снимок FSM: {e}")
+    await bot.session.close()
+    shutdown_tracing()
+    await asyncio.to_thread(close_db)
+    report.log()
+
+async def start(session=None) -> ShutdownReport:
+    bot = create_bot(session=session)
+    dp = await setup(bot)
+    stop = stop_signal()
+
+    pool = None
+    if WEBHOOK_URL:
+        from bot.webhook import UpdateWorkerPool, run_webhook
+        pool = UpdateWorkerPool(dp, bot, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE)
+        ingress = run_webhook(
+            dp, bot, WEBHOOK_URL,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            workers=WEBHOOK_WORKERS,
+            pool=pool,
+            drain_timeout=SHUTDOWN_TIMEOUT / 2,
+        )
+    else:
+        # сигналы и закрытие сессии — наши: сессия нужна до конца остановки
+        ingress = dp.start_polling(
+            bot,
+            tasks_concurrency_limit=POLLING_TASKS_LIMIT,
+            handle_signals=False,
+            close_bot_session=False,
+        )
+
+    # запускаем приём апдейтов, приём оплат и фоновые воркеры
+    ingress = asyncio.create_task(ingress, name="ingress")
+    services = [asyncio.create_task(s, name="payments") for s in payment_services()]
+    jobs = background_jobs(bot)
+    await until_stopped(stop, ingress, *services)
+
+    report = ShutdownReport()
+    deadline = report.started + SHUTDOWN_TIMEOUT
+    logging.getLogger(__name__).info("Остановка: не больше %.0f с", SHUTDOWN_TIMEOUT)
+
+    # 1. перестаём принимать апдейты и оплаты; вебхук при отмене дообрабатывает очередь
+    done_before = pool.processed + pool.failed if pool else 0
+    if pool is None and not ingress.done():
+        await dp.stop_polling()
+    ingress.cancel()
+    for task in services:
+        task.cancel()
+    await asyncio.gather(ingress, *services, return_exceptions=True)
+    if pool is not None:
+        report.queued_drained = pool.processed + pool.failed - done_before
+        report.queued_abandoned = pool.accepted - pool.processed - pool.failed
+
+    # 2. ждём хендлеры, которые уже работают; брошенные Telegram пришлёт снова
+    report.handlers_drained, report.handlers_abandoned = await IN_FLIGHT.drain(deadline)
+    if pool is None:
+        from bot.cluster import ack_updates
+        if report.handlers_abandoned:
+            await ack_updates(bot, report.handlers_abandoned[0])
+        elif IN_FLIGHT.max_update_id:
+            await ack_updates(bot, IN_FLIGHT.max_update_id + 1)
+
+    # 3. фоновые задачи и outbox, 4. снимок FSM и закрытие ресурсов
+    await stop_background(jobs, deadline, report)
+    await close_resources(bot, dp, fsm_snapshot_path(), report)
+    return report
+
+# ─── Кластерный режим: BOT_PROCESSES > 1 ─────────────────────────────────────
+#
+# Родительский процесс только принимает апдейты (polling или вебхук) и
+# раскладывает их по процессам-шардам по chat_id, а также принимает оплаты.
+# Шарды обрабатывают апдейты своих чатов и по очереди (через аренды в базе)
+# выполняют фоновые воркеры. Воркер, которого будят из другого процесса
+# (оплата в роутере, заказы в работе в соседнем шарде), просыпается через
+# отметку в job_leases — см. bot.services.lease.wake_job. Упавший шард
+# перезапускается, его апдейты ждут в очереди.
+
+async def run_shard(index: int, total: int, updates, session=None):
+    """Процесс-шард: свои чаты плюс фоновые воркеры под арендой. Возвращает статистику пула."""
+    from bot.cluster import consume_shard_queue, drop_shard_queue
+    from bot.webhook import UpdateWorkerPool
+
+    bot = create_bot(session=session)
+    dp = await setup(bot, shard=index, shards=total)
+    stop = stop_signal()
+    pool = UpdateWorkerPool(dp, bot, workers=WEBHOOK_WORKERS, queue_size=WEBHOOK_QUEUE_SIZE)
+    pool.start()
+    jobs = background_jobs(bot)
+    logging.getLogger(__name__).info("Шард %d/%d запущен (pid %d)", index + 1, total, os.getpid())
+    try:
+        await consume_shard_queue(updates, pool, stop)
+    finally:
+        # по None от роутера дообрабатываем очередь целиком, по SIGTERM — половину срока
+        report = ShutdownReport()
+        done_before = pool.processed + pool.failed
+        report.queued_abandoned = await pool.stop(timeout=SHUTDOWN_TIMEOUT / 2 if stop.is_set() else None)
+        report.queued_drained = pool.processed + pool.failed - done_before
+        if stop.is_set():
+            report.queued_abandoned += drop_shard_queue(updates)
+        await stop_background(jobs, report.started + SHUTDOWN_TIMEOUT, report)
+        await close_resources(bot, dp, fsm_snapshot_path(index), report)
+    return {"shard": index, "processed": pool.processed, "failed": pool.failed, "abandoned": report.queued_abandoned}
+
+def _shard_process(index: int, total: int, updates):
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run_shard(index, total, updates))
+
+async def start_cluster(processes: int):
+    import multiprocessing
+    from bot.cluster import ShardRouter, poll_into
+
+    # схему и сиды готовит родитель, чтобы шарды не мигрировали базу наперегонки
+    bot = create_bot()
+    await asyncio.gather(asyncio.to_thread(prepare_database), bot.me())
+    # диспетчер в роутере нужен только для списка типов апдейтов
+    dp = create_dispatcher()
+
+    ctx = multiprocessing.get_context("spawn")
+    queues = [ctx.Queue(maxsize=WEBHOOK_QUEUE_SIZE) for _ in range(processes)]
+    shards = [ctx.Process(target=_shard_process, args=(i, processes, q), daemon=True) for i, q in enumerate(queues)]
+    for p in shards:
+        p.start()
+    router = ShardRouter(queues)
+
+    async def supervise():
+        while True:
+            await asyncio.sleep(1)
+            for i, p in enumerate(shards):
+                if not p.is_alive():
+                    logging.warning("Шард %d завершился (код %s), перезапуск", i + 1, p.exitcode)
+                    shards[i] = ctx.Process(target=_shard_process, args=(i, processes, queues[i]), daemon=True)
+                    shards[i].start()
+
+    if WEBHOOK_URL:
+        from bot.webhook import run_webhook
+        ingress = run_webhook(
+            dp, bot, WEBHOOK_URL,
+            host=WEBHOOK_HOST,
+            port=WEBHOOK_PORT,
+            path=WEBHOOK_PATH,
+            secret=WEBHOOK_SECRET,
+            pool=router,
+        )
+    else:
+        await bot.delete_webhook()
+        ingress = poll_into(bot, router, dp.resolve_used_update_types())
+
+    stop = stop_signal()
+    ingress = asyncio.create_task(ingress, name="ingress")
+    supervisor = asyncio.create_task(supervise(), name="supervisor")
+    services = [asyncio.create_task(s, name="payments") for s in payment_services()]
+    await until_stopped(stop, ingress, supervisor, *services)
+
+    # роутер перестаёт принимать и подтверждает отданное шардам, шарды
+    # останавливаются сами по SIGTERM и пишут свой отчёт; ждём их с запасом
+    report = ShutdownReport()
+    for task in (supervisor, ingress, *services):
+        task.cancel()
+    await asyncio.gather(supervisor, ingress, *services, return_exceptions=True)
+    for p in shards:
+        if p.is_alive():
+            p.terminate()
+    for i, p in enumerate(shards):
+        await asyncio.to_thread(p.join, max(report.started + SHUTDOWN_TIMEOUT + 1 - time.monotonic(), 0))
+        if p.is_alive():
+            p.kill()
+            report.errors.append(f"шард {i + 1} не успел остановиться")
+    await close_resources(bot, None, None, report)
 
 if __name__ == "__main__":
-    asyncio.run(start())
+    logging.basicConfig(level=logging.INFO)
+    if BOT_PROCESSES > 1:
+        asyncio.run(start_cluster(BOT_PROCESSES))
+    else:
+        asyncio.run(start())
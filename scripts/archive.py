@@ -0,0 +1,98 @@
+"""
+Холодный архив заказов.
+
+    python scripts/archive.py run [--days 90] [--batch 200]      # перенести старые заказы сейчас
+    python scripts/archive.py stats                               # сколько лежит в архиве
+    python scripts/archive.py extract uploads/123/456/IMG_1.jpg [-o out/]
+
+run переносит завершённые и отменённые заказы старше --days дней: строки —
+в файл архива рядом с базой, фото — пачками tar.gz в ARCHIVE_DIR. Пачку
+целиком распакует и обычный `tar xzf`; extract достаёт один файл по пути из
+orders.photos, не распаковывая остальные. Бот делает то же задачей
+archive_orders (ARCHIVE_INTERVAL).
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func  # noqa: E402
+
+from db.database import ARCHIVE_DATABASE_PATH, SessionLocal, ArchivedOrder, ArchivedPhoto, init_db  # noqa: E402
+from bot.services.archive import (  # noqa: E402
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_DIR,
+    ArchiveResult,
+    archive_orders_batch,
+    read_order_photo,
+)
+
+
+def cmd_run(args):
+    started = time.perf_counter()
+    total = ArchiveResult()
+    while True:
+        result = archive_orders_batch(args.batch, timedelta(days=args.days))
+        total += result
+        if result.orders:
+            print(f"  пачка: {result.report()}")
+        if result.orders < args.batch:
+            break
+    print(f"{total.report()}; {time.perf_counter() - started:.1f} с")
+
+
+def cmd_stats(args):
+    db = SessionLocal()
+    orders = db.query(func.count(ArchivedOrder.order_id)).scalar()
+    photos, size = db.query(func.count(ArchivedPhoto.path), func.coalesce(func.sum(ArchivedPhoto.size), 0)).one()
+    db.close()
+    bundles = list(ARCHIVE_DIR.glob("*.tar.gz"))
+    mb = 2 ** 20
+    print(f"архив {ARCHIVE_DATABASE_PATH}: заказов {orders}, "
+          f"{os.path.getsize(ARCHIVE_DATABASE_PATH) / mb:.1f} МБ")
+    print(f"фото: {photos}, исходно {size / mb:.1f} МБ; "
+          f"пачек {len(bundles)} в {ARCHIVE_DIR}, {sum(b.stat().st_size for b in bundles) / mb:.1f} МБ")
+
+
+def cmd_extract(args):
+    for path in args.paths:
+        try:
+            data = read_order_photo(path)
+        except FileNotFoundError:
+            print(f"не найден: {path}", file=sys.stderr)
+            continue
+        target = os.path.join(args.output, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open(target, "wb") as f:
+            f.write(data)
+        print(f"{target} ({len(data)} байт)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="перенести старые заказы в архив")
+    p.add_argument("--days", type=int, default=ARCHIVE_AFTER_DAYS, help="старше скольких дней")
+    p.add_argument("--batch", type=int, default=200)
+    p.set_defaults(func=cmd_run)
+
+    p = sub.add_parser("stats", help="размер архива")
+    p.set_defaults(func=cmd_stats)
+
+    p = sub.add_parser("extract", help="достать фото по пути из orders.photos")
+    p.add_argument("paths", nargs="+")
+    p.add_argument("-o", "--output", default="extracted")
+    p.set_defaults(func=cmd_extract)
+
+    args = parser.parse_args()
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Резервные копии базы без остановки бота.
+
+    python scripts/backup.py snapshot                       # снять копию сейчас
+    python scripts/backup.py list                           # поколения и до какого момента их можно восстановить
+    python scripts/backup.py restore --to restore/photoexpress.sqlite [--until "2026-10-19 12:30"]
+    python scripts/backup.py rotate [--keep 4]
+
+Копия снимается через online backup API шагами по BACKUP_PAGES_PER_STEP
+страниц с зафиксированного снимка базы — писатели её не ждут. Бот делает то
+же задачей database_backup (BACKUP_INTERVAL), а с BACKUP_WAL_SHIPPING=1
+дописывает в последнее поколение транзакции из WAL, и restore --until
+восстанавливает базу на любой момент между снимком и последней доставкой.
+Время — UTC. restore пишет в --to, рабочую базу не трогает: подменить её
+нужно при остановленном боте.
+"""
+
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import init_db  # noqa: E402
+from bot.services.backup import (  # noqa: E402
+    BACKUP_DIR,
+    BACKUP_KEEP,
+    find_generation,
+    generation_size,
+    list_generations,
+    read_manifest,
+    restore,
+    rotate_backups,
+    take_snapshot,
+)
+
+
+def cmd_snapshot(args):
+    started = time.perf_counter()
+    generation = take_snapshot(ship_wal=False)
+    mb = 2 ** 20
+    print(f"{generation.path}: база {generation.db_bytes / mb:.1f} МБ, архив {generation.archive_bytes / mb:.1f} МБ; "
+          f"{time.perf_counter() - started:.1f} с")
+    for path in rotate_backups(args.keep):
+        print(f"удалено {path}")
+
+
+def cmd_list(args):
+    generations = list_generations()
+    if not generations:
+        print(f"в {BACKUP_DIR} копий нет")
+        return
+    print(f"{'поколение':<17} {'снимок (UTC)':<20} {'восстановимо до':<20} {'сегментов':>9} {'МБ':>8}")
+    for taken_at, path in generations:
+        entries = read_manifest(path)
+        until = entries[-1]["at"][:19] if entries else str(taken_at)
+        print(f"{path.name:<17} {str(taken_at):<20} {until:<20} {len(entries):>9} "
+              f"{generation_size(path) / 2**20:>8.1f}")
+
+
+def cmd_restore(args):
+    until = datetime.fromisoformat(args.until) if args.until else None
+    generation = BACKUP_DIR / args.generation if args.generation else find_generation(until)
+    if generation is None or not generation.is_dir():
+        sys.exit("подходящей копии нет")
+    target = Path(args.to)
+    if target.exists() and not args.force:
+        sys.exit(f"{target} уже есть; --force перезапишет")
+    result = restore(generation, target, until)
+    conn = sqlite3.connect(target)
+    check = conn.execute("PRAGMA integrity_check").fetchone()[0]
+    conn.close()
+    print(f"{result.target}: снимок {result.snapshot_at}, восстановлено на {result.restored_to:%Y-%m-%d %H:%M:%S} "
+          f"({result.segments} сегментов WAL, {result.frames} кадров); integrity_check: {check}")
+
+
+def cmd_rotate(args):
+    for path in rotate_backups(args.keep):
+        print(f"удалено {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("snapshot", help="снять копию сейчас")
+    p.add_argument("--keep", type=int, default=BACKUP_KEEP, help="сколько поколений оставить")
+    p.set_defaults(func=cmd_snapshot)
+
+    p = sub.add_parser("list", help="поколения копий")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("restore", help="восстановить базу в отдельный файл")
+    p.add_argument("--to", required=True, help="куда записать базу")
+    p.add_argument("--until", help="момент UTC, например '2026-10-19 12:30:00'; по умолчанию — последний")
+    p.add_argument("--generation", help="имя папки поколения; по умолчанию — последнее со снимком до --until")
+    p.add_argument("--force", action="store_true")
+    p.set_defaults(func=cmd_restore)
+
+    p = sub.add_parser("rotate", help="удалить старые поколения")
+    p.add_argument("--keep", type=int, default=BACKUP_KEEP)
+    p.set_defaults(func=cmd_rotate)
+
+    args = parser.parse_args()
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
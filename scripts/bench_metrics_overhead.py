@@ -0,0 +1,156 @@
+"""
+Оверхед метрик: один и тот же поток апдейтов прогоняется через Dispatcher
+без инструментирования и с ним (middleware хендлеров, middleware сессии бота,
+события движка SQLAlchemy). Хендлер повторяет show_orders_by_status: ищет
+пользователя, статус и последний заказ через ORM в засеянной SQLite-базе
+и отвечает через фейковую сессию Bot API без сети.
+
+    python scripts/bench_metrics_overhead.py --updates 5000
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F  # noqa: E402
+from aiogram.client.session.base import BaseSession  # noqa: E402
+from aiogram.types import Message, Update  # noqa: E402
+from datetime import datetime, timedelta  # noqa: E402
+
+from sqlalchemy import create_engine, desc  # noqa: E402
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from db.database import Base, Order, OrderStatus, User  # noqa: E402
+from bot.middlewares import register_metrics_middlewares  # noqa: E402
+from bot.services.metrics import REGISTRY, instrument_engine  # noqa: E402
+
+USERS = 1000
+ORDERS_PER_USER = 10
+
+
+class NullSession(BaseSession):
+    """Сессия без сети: любой метод возвращает заглушку сообщения."""
+
+    async def make_request(self, bot, method, timeout=None):
+        return method.__returning__.model_validate(
+            {"message_id": 1, "date": 0, "chat": {"id": 1, "type": "private"}, "text": "ok"},
+            context={"bot": bot},
+        )
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_updates(bot: Bot, count: int) -> list[Update]:
+    return [
+        Update.model_validate({
+            "update_id": i,
+            "message": {
+                "message_id": i,
+                "date": 0,
+                "chat": {"id": 100 + i % USERS, "type": "private"},
+                "from": {"id": 100 + i % USERS, "is_bot": False, "first_name": "B"},
+                "text": "ping",
+            },
+        }, context={"bot": bot})
+        for i in range(1, count + 1)
+    ]
+
+
+def seed(db_path: str):
+    engine = create_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(engine)
+    now = datetime.now()
+    with engine.begin() as conn:
+        conn.execute(OrderStatus.__table__.insert(), [
+            {"code": "new", "label": "🔄 Новый", "sort_order": 1},
+            {"code": "in_progress", "label": "🛠 В обработке", "sort_order": 2},
+        ])
+        conn.execute(User.__table__.insert(), [
+            {"id": u + 1, "telegram_id": 100 + u, "full_name": "Bench User"} for u in range(USERS)
+        ])
+        conn.execute(Order.__table__.insert(), [
+            {
+                "order_id": u * ORDERS_PER_USER + k + 1,
+                "user_id": u + 1,
+                "photos": [{"filename": "a.jpg", "path": "a.jpg", "format": "10x15", "copies": 1}],
+                "status": "new" if k % 2 else "in_progress",
+                "price": 20,
+                "created_at": now - timedelta(minutes=k),
+            }
+            for u in range(USERS) for k in range(ORDERS_PER_USER)
+        ])
+    engine.dispose()
+
+
+async def run(instrumented: bool, updates: int, db_path: str) -> float:
+    engine = create_engine(f"sqlite:///{db_path}")
+    if instrumented:
+        instrument_engine(engine)
+
+    dp = Dispatcher()
+    bot = Bot(token="123456:BENCH", session=NullSession())
+    if instrumented:
+        register_metrics_middlewares(dp, bot)
+
+    Session = sessionmaker(bind=engine)
+
+    @dp.message(F.text)
+    async def show_orders_by_status(message: Message):
+        db = Session()
+        user = db.query(User).filter_by(telegram_id=message.from_user.id).first()
+        status = db.query(OrderStatus).filter_by(code="new").first()
+        orders = (
+            db.query(Order)
+            .filter_by(user_id=user.id, status="new")
+            .order_by(desc(Order.created_at))
+            .limit(1)
+            .all()
+        )
+        db.close()
+        await message.answer(f"{status.label}: {orders[0].order_id if orders else '—'}")
+
+    batch = make_updates(bot, updates)
+    started = time.perf_counter()
+    for update in batch:
+        await dp.feed_update(bot, update)
+    elapsed = time.perf_counter() - started
+    engine.dispose()
+    return elapsed
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--rounds", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.sqlite")
+        seed(db_path)
+
+        # прогоны чередуются, берётся лучший из каждой серии — так меньше шума
+        base_runs, inst_runs = [], []
+        for _ in range(args.rounds):
+            base_runs.append(await run(False, args.updates, db_path))
+            inst_runs.append(await run(True, args.updates, db_path))
+        base, inst = min(base_runs), min(inst_runs)
+
+    overhead = (inst - base) / base * 100
+    per_update_us = (inst - base) / args.updates * 1e6
+    print(f"без метрик:  {args.updates / base:>8.0f} апдейтов/с")
+    print(f"с метриками: {args.updates / inst:>8.0f} апдейтов/с")
+    print(f"оверхед:     {overhead:>8.1f} %  ({per_update_us:.0f} мкс на апдейт)")
+    print(f"размер экспозиции /metrics: {len(REGISTRY.render())} байт")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""
+Массовые рассылки всем активным пользователям.
+
+    python scripts/broadcast.py send "Текст рассылки"     # создать и отправить
+    python scripts/broadcast.py send --file message.html
+    python scripts/broadcast.py resume 12                 # продолжить с чекпоинта после падения
+    python scripts/broadcast.py status [12]
+    python scripts/broadcast.py cancel 12                 # запущенная рассылка остановится на чекпоинте
+
+Бот рассылки сам не возобновляет: прерванную рассылку продолжают явно
+командой resume, чтобы два процесса не отправляли одно и то же.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import SessionLocal, Broadcast, User, init_db  # noqa: E402
+from bot.services.broadcast import (  # noqa: E402
+    BROADCAST_RATE,
+    BROADCAST_WORKERS,
+    BroadcastRunner,
+    cancel_broadcast,
+    create_broadcast,
+)
+
+
+async def _run(broadcast_id: int, rate: float, workers: int):
+    from main import create_bot
+
+    bot = create_bot()
+    try:
+        stats = await BroadcastRunner(bot, broadcast_id, rate=rate, workers=workers).run()
+    finally:
+        await bot.session.close()
+    print(f"рассылка #{broadcast_id}: отправлено {stats['sent']}, ошибок {stats['failed']}, "
+          f"отключено {stats['deactivated']}{' (отменена)' if stats['cancelled'] else ''}")
+
+
+def cmd_send(args):
+    if args.file:
+        with open(args.file, encoding="utf-8") as f:
+            text = f.read()
+    else:
+        text = args.text
+    if not text:
+        sys.exit("нужен текст рассылки или --file")
+    broadcast_id = create_broadcast(text)
+    print(f"создана рассылка #{broadcast_id}")
+    asyncio.run(_run(broadcast_id, args.rate, args.workers))
+
+
+def cmd_resume(args):
+    asyncio.run(_run(args.id, args.rate, args.workers))
+
+
+def cmd_status(args):
+    db = SessionLocal()
+    query = db.query(Broadcast).order_by(Broadcast.id.desc())
+    broadcasts = [db.get(Broadcast, args.id)] if args.id else query.limit(10).all()
+    active = db.query(User).filter(User.is_active == True).count()
+    db.close()
+
+    print(f"активных получателей: {active}")
+    for b in broadcasts:
+        if b is None:
+            continue
+        print(f"#{b.id:<5} {b.status:<10} отправлено {b.sent:>8}  ошибок {b.failed:>6}  "
+              f"отключено {b.deactivated:>6}  чекпоинт users.id={b.last_user_id}  "
+              f"{b.created_at:%d.%m.%Y %H:%M}  {b.text[:40]!r}")
+
+
+def cmd_cancel(args):
+    if cancel_broadcast(args.id):
+        print(f"рассылка #{args.id} отменена")
+    else:
+        print(f"рассылка #{args.id} не найдена или уже завершена")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_runner_options(p):
+        p.add_argument("--rate", type=float, default=BROADCAST_RATE, help="сообщений в секунду")
+        p.add_argument("--workers", type=int, default=BROADCAST_WORKERS)
+
+    p = sub.add_parser("send", help="создать рассылку и отправить")
+    p.add_argument("text", nargs="?")
+    p.add_argument("--file", help="взять текст (HTML) из файла")
+    add_runner_options(p)
+    p.set_defaults(func=cmd_send)
+
+    p = sub.add_parser("resume", help="продолжить прерванную рассылку")
+    p.add_argument("id", type=int)
+    add_runner_options(p)
+    p.set_defaults(func=cmd_resume)
+
+    p = sub.add_parser("status", help="последние рассылки")
+    p.add_argument("id", type=int, nargs="?")
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("cancel", help="отменить рассылку")
+    p.add_argument("id", type=int)
+    p.set_defaults(func=cmd_cancel)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Проверка ChatLaneIsolation на реальном Dispatcher.
+
+1) Пачки апдейтов от нескольких пользователей запускаются задачами, как при
+   polling с handle_as_tasks=True; хендлер со случайной задержкой пишет
+   порядок обработки — у каждого пользователя он должен совпасть с порядком
+   поступления, а в FSM не должно быть потерянных инкрементов.
+2) Пропускная способность при росте числа пользователей должна расти
+   линейно (хендлер только ждёт, поэтому упираемся в параллелизм).
+
+    python scripts/check_chat_lanes.py
+"""
+
+import asyncio
+import itertools
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiogram import Bot, Dispatcher, F  # noqa: E402
+from aiogram.fsm.context import FSMContext  # noqa: E402
+from aiogram.types import Message, Update  # noqa: E402
+
+from bot.middlewares import ChatLaneIsolation  # noqa: E402
+
+_ids = itertools.count(1)
+
+
+def make_update(bot: Bot, user_id: int, seq: int) -> Update:
+    update_id = next(_ids)
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": "U"},
+            "text": str(seq),
+        },
+    }, context={"bot": bot})
+
+
+def build_dispatcher(isolation, delay: float, jitter: bool):
+    dp = Dispatcher(events_isolation=isolation)
+    seen: dict[int, list[int]] = {}
+
+    @dp.message(F.text)
+    async def handler(message: Message, state: FSMContext):
+        data = await state.get_data()
+        await asyncio.sleep(random.uniform(0, delay) if jitter else delay)
+        await state.update_data(counter=data.get("counter", 0) + 1)
+        seen.setdefault(message.from_user.id, []).append(int(message.text))
+
+    return dp, seen
+
+
+async def feed_as_tasks(dp: Dispatcher, bot: Bot, updates: list[Update]):
+    await asyncio.gather(*(asyncio.create_task(dp.feed_update(bot, u)) for u in updates))
+
+
+async def check_ordering(isolation, users: int = 50, per_user: int = 20) -> tuple[int, int]:
+    dp, seen = build_dispatcher(isolation, delay=0.003, jitter=True)
+    bot = Bot(token="123456:LANES")
+    # апдейты пользователей перемешаны между собой, но у каждого идут по порядку
+    updates = [make_update(bot, 1000 + u, seq) for seq in range(per_user) for u in range(users)]
+    await feed_as_tasks(dp, bot, updates)
+
+    reordered = sum(1 for order in seen.values() if order != sorted(order))
+    lost = 0
+    for u in range(users):
+        data = await dp.fsm.storage.get_data(dp.fsm.get_context(bot, 1000 + u, 1000 + u).key)
+        lost += per_user - data.get("counter", 0)
+    await bot.session.close()
+    return reordered, lost
+
+
+async def measure_throughput(users: int, per_user: int = 5, delay: float = 0.05) -> float:
+    dp, _ = build_dispatcher(ChatLaneIsolation(), delay=delay, jitter=False)
+    bot = Bot(token="123456:LANES")
+    updates = [make_update(bot, 5000 + u, seq) for seq in range(per_user) for u in range(users)]
+    started = time.perf_counter()
+    await feed_as_tasks(dp, bot, updates)
+    elapsed = time.perf_counter() - started
+    await bot.session.close()
+    return len(updates) / elapsed
+
+
+async def main():
+    from aiogram.fsm.storage.memory import DisabledEventIsolation
+
+    reordered, lost = await check_ordering(DisabledEventIsolation())
+    print(f"без изоляции:      переупорядочено пользователей={reordered}, потеряно инкрементов={lost}")
+
+    isolation = ChatLaneIsolation()
+    reordered, lost = await check_ordering(isolation)
+    print(f"ChatLaneIsolation: переупорядочено пользователей={reordered}, потеряно инкрементов={lost}, "
+          f"полос после прогона={isolation.active_lanes}")
+    assert reordered == 0 and lost == 0 and isolation.active_lanes == 0
+
+    print("\nпользователей  апдейтов/с  ускорение")
+    base = None
+    for users in (1, 2, 4, 8, 16, 32, 64):
+        rate = await measure_throughput(users)
+        base = base or rate
+        print(f"{users:>13}  {rate:>10.0f}  {rate / base:>8.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,106 @@
+"""
+Версии прайс-листа.
+
+    python scripts/prices.py show [3]                           # действующая или указанная версия
+    python scripts/prices.py set --price 10x15=22 --price 13x18=32 \
+        --threshold 50=0.95 --threshold 100=0.9 --comment "осень"
+    python scripts/prices.py reprice                            # пересчитать открытые заказы сейчас
+
+Форматы, не указанные в set, берут цену из действующей версии; пороги
+скидки за объём — тоже, если не передан ни один --threshold. Работающие
+боты подхватят новую версию сами (PRICE_RELOAD_INTERVAL) и пересчитают
+неоплаченные заказы задачей reprice_orders; reprice делает то же сразу.
+"""
+
+import argparse
+import logging
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import SessionLocal, PriceList, init_db  # noqa: E402
+from bot.services.pricing import FORMATS, get_price_table, publish_price_list  # noqa: E402
+from bot.services.repricing import reprice_open_orders  # noqa: E402
+
+
+def _pair(value: str, cast):
+    key, sep, number = value.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError(f"ожидается КЛЮЧ=ЧИСЛО, получено {value!r}")
+    try:
+        return key.strip(), cast(number)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"не число: {number!r}")
+
+
+def cmd_show(args):
+    table = get_price_table(args.version)
+    db = SessionLocal()
+    row = db.get(PriceList, table.version)
+    db.close()
+    print(f"версия {table.version} от {row.created_at:%d.%m.%Y %H:%M}{f'  {row.comment}' if row.comment else ''}")
+    for name, price in zip(FORMATS, table.unit_prices):
+        print(f"  {name:<12} {price:>8.2f} ₽")
+    print(f"  {'прочие':<12} {table.unit_prices[-1]:>8.2f} ₽")
+    for copies, mult in table.thresholds:
+        print(f"  от {copies} копий — скидка {round((1 - mult) * 100, 2):g}%")
+
+
+def cmd_set(args):
+    current = get_price_table()
+    prices = dict(zip(FORMATS, current.unit_prices))
+    unknown = [name for name, _ in args.price if name not in prices]
+    if unknown:
+        sys.exit(f"неизвестные форматы: {', '.join(unknown)}; есть {', '.join(FORMATS)}")
+    prices.update(args.price)
+    thresholds = dict(args.threshold) if args.threshold else dict(current.thresholds)
+    default_price = args.default_price if args.default_price is not None else current.unit_prices[-1]
+    try:
+        version = publish_price_list(prices, thresholds, default_price, args.comment)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"опубликована версия {version} (была {current.version})")
+
+
+def cmd_reprice(args):
+    table = get_price_table()
+    repriced = unchanged = 0
+    while True:
+        result = reprice_open_orders(args.batch, table)
+        repriced += result.repriced
+        unchanged += result.unchanged
+        if result.repriced + result.unchanged < args.batch:
+            break
+    print(f"версия {table.version}: цена изменилась у {repriced} заказов, не изменилась у {unchanged}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("show", help="показать прайс-лист")
+    p.add_argument("version", type=int, nargs="?")
+    p.set_defaults(func=cmd_show)
+
+    p = sub.add_parser("set", help="опубликовать новую версию")
+    p.add_argument("--price", action="append", default=[], metavar="ФОРМАТ=ЦЕНА",
+                   type=lambda v: _pair(v, float))
+    p.add_argument("--threshold", action="append", default=[], metavar="КОПИЙ=МНОЖИТЕЛЬ",
+                   type=lambda v: (lambda k, m: (int(k), m))(*_pair(v, float)))
+    p.add_argument("--default-price", type=float, help="цена копии формата не из списка")
+    p.add_argument("--comment")
+    p.set_defaults(func=cmd_set)
+
+    p = sub.add_parser("reprice", help="пересчитать неоплаченные заказы по действующей версии")
+    p.add_argument("--batch", type=int, default=500)
+    p.set_defaults(func=cmd_reprice)
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+Очередь печати лаборатории.
+
+    python scripts/print_queue.py list                 # печатающийся прогон и план
+    python scripts/print_queue.py start                # отдать в печать следующий прогон
+    python scripts/print_queue.py done 42              # прогон 42 напечатан
+    python scripts/print_queue.py sheet 42             # лист прогона ещё раз
+    python scripts/print_queue.py plan                 # пересобрать план сейчас
+
+Бот сам раскладывает заказы в in_progress на задания и пересобирает план
+задачей print_queue (PRINT_PLAN_INTERVAL). start берёт первый прогон плана
+и пишет его лист в PRINT_SHEETS_DIR; done отмечает прогон напечатанным и
+перечисляет заказы, у которых напечатаны все форматы, — их пора упаковывать.
+Время — московское.
+"""
+
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import ROLLUP_DAY_SHIFT_HOURS, SessionLocal, init_db  # noqa: E402
+from bot.services.order_ids import order_code  # noqa: E402
+from bot.services.print_queue import (  # noqa: E402
+    finish_run,
+    job_sheet,
+    open_runs,
+    plan_print_queue,
+    print_time,
+    start_next_run,
+)
+
+SHIFT = timedelta(hours=ROLLUP_DAY_SHIFT_HOURS)
+
+
+def cmd_plan(args):
+    result = plan_print_queue(force=True)
+    print(f"заказов добавлено {result.orders}, заданий снято {result.dropped}; "
+          f"в очереди {result.jobs} заданий, {result.runs} прогонов")
+
+
+def cmd_list(args):
+    db = SessionLocal()
+    runs = open_runs(db)
+    db.close()
+    if not runs:
+        print("очередь пуста")
+        return
+    for run in runs:
+        minutes = print_time(run.format, run.copies).total_seconds() / 60
+        state = f"печатается с {run.started_at + SHIFT:%H:%M}" if run.status == "printing" else f"{run.position:>3}."
+        print(f"{state} #{run.id:<6} {run.format:<12} фото {run.photos:>5}, копий {run.copies:>5}, "
+              f"~{minutes:>4.0f} мин, срок {run.due_at + SHIFT:%d.%m %H:%M}")
+
+
+def cmd_sheet(args):
+    db = SessionLocal()
+    try:
+        print(job_sheet(db, args.run_id))
+    except ValueError as e:
+        sys.exit(str(e))
+    finally:
+        db.close()
+
+
+def cmd_start(args):
+    try:
+        run = start_next_run()
+    except ValueError as e:
+        sys.exit(str(e))
+    if run is None:
+        print("печатать нечего")
+        return
+    print(f"прогон #{run.run_id}: бумага {run.format}, фото {run.photos}, копий {run.copies}")
+    print(f"лист: {run.sheet}")
+
+
+def cmd_done(args):
+    try:
+        ready = finish_run(args.run_id)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f"прогон #{args.run_id} напечатан; заказов готово к упаковке: {len(ready)}")
+    for row in ready:
+        print(f"  {order_code(row)}  {row.delivery_point or 'ПВЗ не выбран'}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("list", help="печатающийся прогон и план")
+    p.set_defaults(func=cmd_list)
+
+    p = sub.add_parser("start", help="отдать в печать следующий прогон")
+    p.set_defaults(func=cmd_start)
+
+    p = sub.add_parser("done", help="прогон напечатан")
+    p.add_argument("run_id", type=int)
+    p.set_defaults(func=cmd_done)
+
+    p = sub.add_parser("sheet", help="лист прогона")
+    p.add_argument("run_id", type=int)
+    p.set_defaults(func=cmd_sheet)
+
+    p = sub.add_parser("plan", help="пересобрать план сейчас")
+    p.set_defaults(func=cmd_plan)
+
+    args = parser.parse_args()
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+Сводки продаж и производства.
+
+    python scripts/rollups.py backfill [--days 7]         # досчитать историю сразу, без бота
+    python scripts/rollups.py check [--sample 30]         # сравнить сводки с пересчётом по orders
+    python scripts/rollups.py report --from 2025-06-01 --to 2025-06-30
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db.database import init_db  # noqa: E402
+from bot.services.rollups import (  # noqa: E402
+    backfill_rollups_chunk,
+    check_rollups,
+    format_report,
+    pickup_report,
+    sales_report,
+)
+
+
+def cmd_backfill(args):
+    started = time.perf_counter()
+    chunks = 1
+    while not backfill_rollups_chunk(args.days):
+        chunks += 1
+    print(f"история пересчитана: {chunks} порций за {time.perf_counter() - started:.1f} с")
+
+
+def cmd_check(args):
+    started = time.perf_counter()
+    problems = check_rollups(args.sample, args.seed)
+    for p in problems[:50]:
+        print(p)
+    print(f"расхождений: {len(problems)} (проверено дней: до {args.sample}, {time.perf_counter() - started:.1f} с)")
+    sys.exit(1 if problems else 0)
+
+
+def cmd_report(args):
+    first = date.fromisoformat(args.date_from)
+    last = date.fromisoformat(args.date_to)
+    started = time.perf_counter()
+    sales = sales_report(first, last)
+    formats = format_report(first, last)
+    points = pickup_report(first, last)
+    elapsed = time.perf_counter() - started
+
+    print(f"{'день':<12} {'заказов':>8} {'оплачено':>9} {'выручка':>12} {'скидки':>10}")
+    for row in sales:
+        print(f"{row['day']:<12} {row['orders']:>8} {row['paid_orders']:>9} "
+              f"{row['revenue']:>12.2f} {row['discount_cost']:>10.2f}")
+    print(f"{'итого':<12} {sum(r['orders'] for r in sales):>8} {sum(r['paid_orders'] for r in sales):>9} "
+          f"{sum(r['revenue'] for r in sales):>12.2f} {sum(r['discount_cost'] for r in sales):>10.2f}\n")
+
+    print(f"{'формат':<14} {'фото':>8} {'копий':>8}")
+    for fmt, row in formats.items():
+        print(f"{fmt:<14} {row['photos']:>8} {row['copies']:>8}")
+    print(f"\n{'пункт выдачи':<28} {'заказов':>8} {'оплачено':>9}")
+    for name, row in points.items():
+        print(f"{name:<28} {row['orders']:>8} {row['paid_orders']:>9}")
+    print(f"\nотчёт построен за {elapsed * 1000:.1f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("backfill", help="досчитать сводки за прошлые дни")
+    p.add_argument("--days", type=int, default=7, help="дней в одной транзакции")
+    p.set_defaults(func=cmd_backfill)
+
+    p = sub.add_parser("check", help="проверить сводки на выборке дней")
+    p.add_argument("--sample", type=int, default=30)
+    p.add_argument("--seed", type=int)
+    p.set_defaults(func=cmd_check)
+
+    today = date.today()
+    p = sub.add_parser("report", help="отчёт за период")
+    p.add_argument("--from", dest="date_from", default=(today - timedelta(days=30)).isoformat())
+    p.add_argument("--to", dest="date_to", default=today.isoformat())
+    p.set_defaults(func=cmd_report)
+
+    args = parser.parse_args()
+    init_db()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+"""
+Разбор трейсов из TRACE_FILE: по каждому хендлеру — число апдейтов,
+перцентили длительности и дерево, где время разложено по вложенным спанам
+(SQL, файлы, Bot API, цены/промокоды) и собственному коду хендлера.
+
+    python scripts/trace_report.py traces.jsonl
+    python scripts/trace_report.py traces.jsonl --handler receive_comment_and_finalize
+    python scripts/trace_report.py traces.jsonl --folded flame.txt   # для flamegraph.pl / speedscope
+"""
+
+import argparse
+import json
+import sys
+from collections import defaultdict
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(int(len(values) * p), len(values) - 1)]
+
+
+def load_traces(paths: list[str]):
+    for path in paths:
+        with open(path, encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"{path}:{line_no}: битая строка пропущена", file=sys.stderr)
+
+
+def self_times(trace: dict) -> dict[tuple[str, ...], float]:
+    """
+    Собственное время каждого пути спанов (handler;span;child...) в мс:
+    длительность спана минус длительности его прямых детей.
+    """
+    spans = trace["spans"]
+    children_time: dict[int, float] = defaultdict(float)
+    for s in spans:
+        children_time[s["parent"]] += s["duration_ms"]
+
+    by_id = {s["id"]: s for s in spans}
+    paths: dict[int, tuple[str, ...]] = {}
+
+    def path_of(span_id: int) -> tuple[str, ...]:
+        if span_id == 0:
+            return (trace["name"],)
+        cached = paths.get(span_id)
+        if cached is None:
+            s = by_id[span_id]
+            # родитель мог не попасть в трейс из-за TRACE_MAX_SPANS
+            parent = s["parent"] if s["parent"] in by_id else 0
+            cached = paths[span_id] = path_of(parent) + (s["name"],)
+        return cached
+
+    result: dict[tuple[str, ...], float] = defaultdict(float)
+    result[(trace["name"],)] += max(trace["duration_ms"] - children_time[0], 0.0)
+    for s in spans:
+        result[path_of(s["id"])] += max(s["duration_ms"] - children_time[s["id"]], 0.0)
+    return result
+
+
+class HandlerStats:
+    def __init__(self):
+        self.durations: list[float] = []
+        self.errors = 0
+        self.self_ms: dict[tuple[str, ...], float] = defaultdict(float)
+        self.calls: dict[tuple[str, ...], int] = defaultdict(int)
+        self.statements: dict[str, list[float]] = defaultdict(list)
+
+    def add(self, trace: dict):
+        self.durations.append(trace["duration_ms"])
+        if trace.get("error"):
+            self.errors += 1
+        for path, ms in self_times(trace).items():
+            self.self_ms[path] += ms
+        for s in trace["spans"]:
+            self.calls[(s["name"],)] += 1
+            statement = (s.get("attrs") or {}).get("statement")
+            if statement:
+                self.statements[statement].append(s["duration_ms"])
+
+    def tree(self) -> dict[tuple[str, ...], float]:
+        """Полное (inclusive) время каждого пути — сумма собственного времени поддерева."""
+        total: dict[tuple[str, ...], float] = defaultdict(float)
+        for path, ms in self.self_ms.items():
+            for i in range(1, len(path) + 1):
+                total[path[:i]] += ms
+        return total
+
+
+def print_handler(name: str, stats: HandlerStats, top: int):
+    n = len(stats.durations)
+    print(f"━━ {name}: {n} трейсов, ошибок {stats.errors}; "
+          f"p50={percentile(stats.durations, 0.5):.1f} мс  p95={percentile(stats.durations, 0.95):.1f} мс  "
+          f"max={max(stats.durations):.1f} мс")
+
+    tree = stats.tree()
+    root_total = tree[(name,)] or 1.0
+
+    def walk(path: tuple[str, ...], depth: int):
+        children = sorted(
+            (p for p in tree if len(p) == len(path) + 1 and p[:len(path)] == path),
+            key=lambda p: tree[p],
+            reverse=True,
+        )
+        own = stats.self_ms.get(path, 0.0)
+        label = path[-1] if depth else f"{name} (всего)"
+        bar = "█" * max(int(tree[path] / root_total * 30), 0)
+        print(f"  {'  ' * depth}{label:<{44 - 2 * depth}} {tree[path] / n:>9.2f} мс/апд "
+              f"{tree[path] / root_total * 100:>5.1f}%  {bar}")
+        if depth and children and own:
+            print(f"  {'  ' * (depth + 1)}{'(собственное)':<{42 - 2 * depth}} {own / n:>9.2f} мс/апд")
+        for child in children:
+            walk(child, depth + 1)
+
+    walk((name,), 0)
+
+    if stats.statements:
+        print("  самые дорогие запросы:")
+        ranked = sorted(stats.statements.items(), key=lambda kv: sum(kv[1]), reverse=True)[:top]
+        for statement, durations in ranked:
+            short = " ".join(statement.split())[:110]
+            print(f"    {sum(durations) / n:>8.2f} мс/апд  ×{len(durations) / n:<5.1f} {short}")
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("files", nargs="+", help="JSONL-файлы трейсов")
+    parser.add_argument("--handler", help="показать только этот хендлер")
+    parser.add_argument("--top", type=int, default=5, help="сколько запросов показывать на хендлер")
+    parser.add_argument("--folded", help="записать свёрнутые стеки (собственное время, мкс) для флеймграфа")
+    args = parser.parse_args()
+
+    handlers: dict[str, HandlerStats] = defaultdict(HandlerStats)
+    for trace in load_traces(args.files):
+        if args.handler and trace["name"] != args.handler:
+            continue
+        handlers[trace["name"]].add(trace)
+
+    if not handlers:
+        print("трейсов не найдено")
+        return
+
+    ranked = sorted(handlers.items(), key=lambda kv: sum(kv[1].durations), reverse=True)
+    for name, stats in ranked:
+        print_handler(name, stats, args.top)
+
+    if args.folded:
+        with open(args.folded, "w", encoding="utf-8") as f:
+            for name, stats in ranked:
+                for path, ms in stats.self_ms.items():
+                    if ms > 0:
+                        f.write(f"{';'.join(path)} {int(ms * 1000)}\n")
+        print(f"свёрнутые стеки записаны в {args.folded}")
+
+
+if __name__ == "__main__":
+    main()
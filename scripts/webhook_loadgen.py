@@ -0,0 +1,138 @@
+"""
+Нагрузочный генератор для webhook-режима.
+
+Шлёт синтетические апдейты POST-запросами и печатает пропускную способность
+и задержки подтверждения при растущей конкурентности.
+
+    python scripts/webhook_loadgen.py                       # локальный сервер с пулом воркеров
+    python scripts/webhook_loadgen.py --url http://host:8080/webhook --secret S
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import ClientSession, web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot.webhook import SECRET_HEADER, UpdateWorkerPool, create_webhook_app  # noqa: E402
+
+_update_ids = itertools.count(1)
+
+
+def synthetic_update(chat_id: int, text: str = "ping") -> dict:
+    update_id = next(_update_ids)
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Load"},
+            "text": text,
+        },
+    }
+
+
+def percentile(values: list[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    k = min(int(len(values) * p), len(values) - 1)
+    return values[k]
+
+
+async def run_level(session: ClientSession, url: str, secret: str | None, concurrency: int, total: int, chats: int):
+    latencies: list[float] = []
+    statuses: dict[int, int] = {}
+    sent = itertools.count()
+
+    async def client():
+        headers = {SECRET_HEADER: secret} if secret else {}
+        while next(sent) < total:
+            update = synthetic_update(chat_id=1_000_000 + next(_update_ids) % chats)
+            start = time.perf_counter()
+            async with session.post(url, json=update, headers=headers) as resp:
+                await resp.read()
+                statuses[resp.status] = statuses.get(resp.status, 0) + 1
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "concurrency": concurrency,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000 if latencies else 0.0,
+        "statuses": statuses,
+    }
+
+
+async def start_local_server(args):
+    """Поднимает пул воркеров с диспетчером, имитирующим работу хендлера."""
+    from aiogram import Bot, Dispatcher, F
+    from aiogram.types import Message
+
+    dp = Dispatcher()
+
+    @dp.message(F.text)
+    async def fake_handler(message: Message):
+        await asyncio.sleep(args.work_ms / 1000)
+
+    bot = Bot(token="123456:LOADTEST")
+    pool = UpdateWorkerPool(dp, bot, workers=args.workers, queue_size=args.queue_size)
+    app = create_webhook_app(pool, path="/webhook", secret=args.secret)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", args.port)
+    pool.start()
+    await site.start()
+    return runner, pool, bot
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", help="адрес вебхука; без него поднимается локальный сервер")
+    parser.add_argument("--secret", default="loadtest-secret")
+    parser.add_argument("--levels", default="1,8,32,128,256", help="уровни конкурентности через запятую")
+    parser.add_argument("--requests", type=int, default=5000, help="запросов на уровень")
+    parser.add_argument("--chats", type=int, default=500, help="число различных чатов")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--queue-size", type=int, default=1000)
+    parser.add_argument("--work-ms", type=float, default=2.0, help="имитация работы хендлера, мс")
+    parser.add_argument("--port", type=int, default=8089)
+    args = parser.parse_args()
+
+    local = None
+    url = args.url
+    if not url:
+        local = await start_local_server(args)
+        url = f"http://127.0.0.1:{args.port}/webhook"
+
+    print(f"{'conc':>5} {'rps':>9} {'p50ms':>7} {'p95ms':>7} {'p99ms':>7}  statuses")
+    async with ClientSession() as session:
+        for level in (int(x) for x in args.levels.split(",")):
+            r = await run_level(session, url, args.secret, level, args.requests, args.chats)
+            print(
+                f"{r['concurrency']:>5} {r['rps']:>9.0f} {r['p50_ms']:>7.2f} "
+                f"{r['p95_ms']:>7.2f} {r['p99_ms']:>7.2f}  {r['statuses']}"
+            )
+
+    if local:
+        runner, pool, bot = local
+        await runner.cleanup()
+        await pool.stop()
+        await bot.session.close()
+        print(f"\nпринято: {pool.accepted}, отброшено (503): {pool.shed}, обработано: {pool.processed}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,94 @@
+"""
+Тесты ChatLaneIsolation на реальном Dispatcher: апдейты запускаются задачами,
+как при polling с handle_as_tasks=True.
+
+    python -m unittest tests.test_chat_lanes
+"""
+
+import asyncio
+import itertools
+import time
+import unittest
+
+from aiogram import Bot, Dispatcher, F
+from aiogram.fsm.context import FSMContext
+from aiogram.types import Message, Update
+
+from bot.middlewares import ChatLaneIsolation
+
+_ids = itertools.count(1)
+
+
+def make_update(bot: Bot, chat_id: int, seq: int) -> Update:
+    update_id = next(_ids)
+    return Update.model_validate({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "U"},
+            "text": str(seq),
+        },
+    }, context={"bot": bot})
+
+
+class ChatLaneIsolationTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.isolation = ChatLaneIsolation()
+        self.dp = Dispatcher(events_isolation=self.isolation)
+        self.bot = Bot(token="123456:LANES")
+        self.seen: dict[int, list[int]] = {}
+        self.delays: dict[int, float] = {}
+
+        @self.dp.message(F.text)
+        async def handler(message: Message, state: FSMContext):
+            seq = int(message.text)
+            data = await state.get_data()
+            await asyncio.sleep(self.delays.get(seq, 0.01))
+            await state.update_data(counter=data.get("counter", 0) + 1)
+            self.seen.setdefault(message.chat.id, []).append(seq)
+
+    async def asyncTearDown(self):
+        await self.bot.session.close()
+
+    async def feed(self, updates: list[Update]) -> float:
+        started = time.perf_counter()
+        await asyncio.gather(*(asyncio.create_task(self.dp.feed_update(self.bot, u)) for u in updates))
+        return time.perf_counter() - started
+
+    async def counter(self, chat_id: int) -> int:
+        data = await self.dp.fsm.storage.get_data(self.dp.fsm.get_context(self.bot, chat_id, chat_id).key)
+        return data.get("counter", 0)
+
+    async def test_same_chat_runs_in_order(self):
+        # ранние апдейты спят дольше поздних: без полосы поздние обогнали бы их
+        per_chat = 10
+        self.delays = {seq: 0.005 * (per_chat - seq) for seq in range(per_chat)}
+        chats = [100, 200, 300]
+        # апдейты чатов перемешаны между собой, у каждого чата идут по порядку
+        await self.feed([make_update(self.bot, chat, seq) for seq in range(per_chat) for chat in chats])
+
+        for chat in chats:
+            self.assertEqual(self.seen[chat], list(range(per_chat)))
+            self.assertEqual(await self.counter(chat), per_chat)
+        self.assertEqual(self.isolation.active_lanes, 0)
+
+    async def test_chats_run_concurrently(self):
+        # хендлер только ждёт: время прогона не должно расти с числом чатов.
+        # Задержка заметно больше накладных расходов диспетчера (~1 мс на апдейт)
+        per_chat, delay = 2, 0.2
+        self.delays = dict.fromkeys(range(per_chat), delay)
+        elapsed = {}
+        for chats in (1, 8, 32):
+            updates = [make_update(self.bot, 10_000 * chats + c, seq) for seq in range(per_chat) for c in range(chats)]
+            elapsed[chats] = await self.feed(updates)
+
+        # полоса одного чата последовательна, 32 чата последовательно заняли бы 32 × elapsed[1]
+        self.assertGreaterEqual(elapsed[1], per_chat * delay * 0.9)
+        self.assertLess(elapsed[8], elapsed[1] * 1.5)
+        self.assertLess(elapsed[32], elapsed[1] * 1.5)
+
+
+if __name__ == "__main__":
+    unittest.main()